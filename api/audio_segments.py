@@ -17,6 +17,7 @@ from database.models import Session, AnalysisResult
 from auth.jwt_handler import get_current_user_id
 from pydantic import BaseModel
 from utils.audio_storage import get_session_audio_local_path, upload_segment_bytes, cut_audio_segment
+from utils.transcript_codec import row_dialogues
 
 logger = logging.getLogger(__name__)
 
@@ -76,12 +77,12 @@ async def get_audio_segments(
     )
     analysis = result.scalar_one_or_none()
     
-    if not analysis or not analysis.dialogues:
+    dialogues = row_dialogues(analysis) if analysis else []
+    if not dialogues:
         return AudioSegmentListResponse(segments=[])
     
     # 从dialogues中提取音频片段
     segments = []
-    dialogues = analysis.dialogues if isinstance(analysis.dialogues, list) else []
     
     for index, dialogue in enumerate(dialogues):
         # 解析时间戳
@@ -0,0 +1,324 @@
+"""
+客户端直传 OSS API 路由
+两步上传：init 创建会话并签发 OSS 预签名 PUT（大文件为分片上传，每片一个预签名 URL）→
+客户端直接把音频 PUT 到 OSS → complete 校验对象并入队分析（worker 经共享 OSS 连接池读取）。
+录音字节不再经过 Nginx / uvicorn；原 /api/v1/audio/upload 流式上传保留为回退。
+后台清理：init 后超过 URL 有效期 + 宽限仍未 complete 的会话（status=uploading）连同 OSS 上未完成的分片上传、
+残留对象一并删除（短事务认领为 upload_expired 后在事务外清理 OSS，多 worker 不重复）。
+"""
+import asyncio
+import logging
+import os
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends, HTTPException
+from pydantic import BaseModel
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from auth.jwt_handler import get_current_user_id
+from database.connection import get_db
+from database.models import Session
+from utils.audio_storage import get_oss_bucket, oss_object_url
+
+logger = logging.getLogger(__name__)
+
+DIRECT_UPLOAD_URL_EXPIRES_SEC = int(os.getenv("DIRECT_UPLOAD_URL_EXPIRES_SEC", "3600"))
+DIRECT_UPLOAD_MAX_MB = int(os.getenv("DIRECT_UPLOAD_MAX_MB", "500"))
+# 超过该大小走分片上传；分片大小需 ≥ 100KB（OSS 限制），最多 10000 片
+DIRECT_UPLOAD_MULTIPART_MB = int(os.getenv("DIRECT_UPLOAD_MULTIPART_MB", "32"))
+DIRECT_UPLOAD_PART_MB = int(os.getenv("DIRECT_UPLOAD_PART_MB", "8"))
+# 上传 URL 过期后再等多久（秒）仍未 complete 即视为放弃；complete 可能在 URL 过期前最后一刻才发起
+DIRECT_UPLOAD_STALE_GRACE_SEC = int(os.getenv("DIRECT_UPLOAD_STALE_GRACE_SEC", "3600"))
+DIRECT_UPLOAD_SWEEP_SEC = int(os.getenv("DIRECT_UPLOAD_SWEEP_SEC", "900"))
+DIRECT_UPLOAD_SWEEP_BATCH = int(os.getenv("DIRECT_UPLOAD_SWEEP_BATCH", "50"))
+
+_ALLOWED_EXTS = {".m4a", ".mp3", ".wav", ".aac", ".ogg", ".opus", ".flac", ".webm", ".mp4", ".amr"}
+
+router = APIRouter(prefix="/api/v1/audio/direct-upload", tags=["direct-upload"])
+
+_sweeper_task: Optional[asyncio.Task] = None
+
+
+# Pydantic模型
+class DirectUploadInitRequest(BaseModel):
+    filename: str
+    size: int
+    content_type: Optional[str] = None
+    title: Optional[str] = None
+    sha256: Optional[str] = None  # 可选：客户端计算的内容哈希，用于重复上传去重
+
+
+class PresignedPart(BaseModel):
+    part_number: int
+    url: str
+
+
+class DirectUploadInitResponse(BaseModel):
+    session_id: str
+    oss_key: str
+    method: str = "PUT"
+    headers: dict = {}
+    expires_in: int
+    url: Optional[str] = None  # 单次 PUT
+    upload_id: Optional[str] = None  # 分片上传
+    part_size: Optional[int] = None
+    parts: Optional[List[PresignedPart]] = None
+    deduplicated: bool = False
+    status: Optional[str] = None
+
+
+class CompletedPart(BaseModel):
+    part_number: int
+    etag: str
+
+
+class DirectUploadCompleteRequest(BaseModel):
+    oss_key: str  # init 返回的 oss_key
+    upload_id: Optional[str] = None
+    parts: Optional[List[CompletedPart]] = None
+
+
+class DirectUploadCompleteResponse(BaseModel):
+    session_id: str
+    status: str
+    audio_url: str
+    size: int
+
+
+def _require_bucket():
+    bucket = get_oss_bucket()
+    if bucket is None:
+        raise HTTPException(status_code=503, detail="OSS 未启用或配置不完整，请使用 /api/v1/audio/upload 上传")
+    return bucket
+
+
+def _oss_key(user_id: str, session_id: str, ext: str) -> str:
+    return f"sessions/{user_id}/{session_id}/original{ext}"
+
+
+def _purge_oss(bucket, prefix: str) -> None:
+    """中止该会话目录下未完成的分片上传（已传分片同时释放），删除已 PUT 但未 complete 的对象"""
+    import oss2
+    for upload in oss2.MultipartUploadIterator(bucket, prefix=prefix):
+        bucket.abort_multipart_upload(upload.key, upload.upload_id)
+    for obj in oss2.ObjectIterator(bucket, prefix=prefix):
+        bucket.delete_object(obj.key)
+
+
+async def sweep_stale_uploads() -> int:
+    """
+    删除一批超时未 complete 的直传会话及其 OSS 残留，返回删除条数。
+    先用一个短事务把会话认领为 upload_expired（updated_at 作租约），OSS 清理在事务外进行，成功后再删行；
+    清理失败的会话保持 upload_expired，租约（DIRECT_UPLOAD_SWEEP_SEC）过后由任一 worker 重新认领
+    """
+    from sqlalchemy import bindparam, text
+    from database.connection import engine
+
+    async with engine.begin() as conn:
+        rows = (await conn.execute(
+            text("""
+                UPDATE sessions SET status = 'upload_expired', updated_at = now()
+                WHERE id IN (
+                    SELECT id FROM sessions
+                    WHERE (status = 'uploading' AND created_at < now() - make_interval(secs => :age))
+                       OR (status = 'upload_expired' AND updated_at < now() - make_interval(secs => :lease))
+                    ORDER BY created_at LIMIT :batch FOR UPDATE SKIP LOCKED
+                )
+                RETURNING id, user_id
+            """),
+            {"age": DIRECT_UPLOAD_URL_EXPIRES_SEC + DIRECT_UPLOAD_STALE_GRACE_SEC,
+             "lease": DIRECT_UPLOAD_SWEEP_SEC, "batch": DIRECT_UPLOAD_SWEEP_BATCH},
+        )).all()
+    if not rows:
+        return 0
+
+    bucket = get_oss_bucket()
+
+    async def _purge(row) -> Optional[uuid.UUID]:
+        if bucket is None:
+            return row.id
+        try:
+            await asyncio.to_thread(_purge_oss, bucket, f"sessions/{row.user_id}/{row.id}/")
+            return row.id
+        except Exception as e:
+            logger.warning(f"[直传] 清理 OSS 残留失败，下次重试 session_id={row.id}: {e}")
+            return None
+
+    purged = [sid for sid in await asyncio.gather(*[_purge(r) for r in rows]) if sid is not None]
+    if purged:
+        async with engine.begin() as conn:
+            await conn.execute(
+                text("DELETE FROM sessions WHERE id IN :ids AND status = 'upload_expired'")
+                .bindparams(bindparam("ids", expanding=True)),
+                {"ids": purged},
+            )
+        logger.info(f"[直传] 已清理 {len(purged)} 个超时未完成的上传会话")
+    return len(purged)
+
+
+async def _sweep_loop() -> None:
+    while True:
+        try:
+            # 一批删满说明积压，立即继续下一批
+            while await sweep_stale_uploads() >= DIRECT_UPLOAD_SWEEP_BATCH:
+                pass
+        except Exception as e:
+            logger.warning(f"[直传] 清理超时上传失败，下次重试: {e}")
+        await asyncio.sleep(DIRECT_UPLOAD_SWEEP_SEC)
+
+
+def start_sweeper() -> None:
+    global _sweeper_task
+    if _sweeper_task is None or _sweeper_task.done():
+        _sweeper_task = asyncio.create_task(_sweep_loop())
+
+
+def stop_sweeper() -> None:
+    if _sweeper_task is not None:
+        _sweeper_task.cancel()
+
+
+@router.post("/init", response_model=DirectUploadInitResponse)
+async def init_direct_upload(
+    request: DirectUploadInitRequest,
+    user_id: str = Depends(get_current_user_id),
+    db: AsyncSession = Depends(get_db)
+):
+    """创建会话（status=uploading）并签发预签名上传 URL"""
+    bucket = _require_bucket()
+    ext = Path(request.filename or "").suffix.lower() or ".m4a"
+    if ext not in _ALLOWED_EXTS:
+        raise HTTPException(status_code=400, detail=f"不支持的音频格式: {ext}")
+    if request.size <= 0 or request.size > DIRECT_UPLOAD_MAX_MB * 1024 * 1024:
+        raise HTTPException(status_code=400, detail=f"文件大小需在 0 ~ {DIRECT_UPLOAD_MAX_MB} MB 之间")
+
+    sha = (request.sha256 or "").lower() or None
+    if sha:
+        from services.upload_dedup import find_recent_duplicate
+        duplicate = await find_recent_duplicate(db, user_id, sha)
+        if duplicate is not None:
+            logger.info(f"[直传] 内容哈希命中近期 session={duplicate.id}，无需上传")
+            return DirectUploadInitResponse(
+                session_id=str(duplicate.id), oss_key="", expires_in=0,
+                deduplicated=True, status=duplicate.status,
+            )
+
+    session_id = str(uuid.uuid4())
+    oss_key = _oss_key(user_id, session_id, ext)
+    content_type = request.content_type or ("audio/mp4" if ext == ".m4a" else "application/octet-stream")
+    headers = {"Content-Type": content_type}
+    resp = DirectUploadInitResponse(
+        session_id=session_id, oss_key=oss_key, expires_in=DIRECT_UPLOAD_URL_EXPIRES_SEC,
+    )
+    if request.size > DIRECT_UPLOAD_MULTIPART_MB * 1024 * 1024:
+        part_size = max(DIRECT_UPLOAD_PART_MB * 1024 * 1024, -(-request.size // 10000))
+        init = await asyncio.to_thread(bucket.init_multipart_upload, oss_key, headers=headers)
+        resp.upload_id = init.upload_id
+        resp.part_size = part_size
+        resp.parts = [
+            PresignedPart(
+                part_number=n,
+                url=bucket.sign_url(
+                    "PUT", oss_key, DIRECT_UPLOAD_URL_EXPIRES_SEC,
+                    params={"partNumber": str(n), "uploadId": init.upload_id},
+                ),
+            )
+            for n in range(1, -(-request.size // part_size) + 1)
+        ]
+    else:
+        resp.url = bucket.sign_url("PUT", oss_key, DIRECT_UPLOAD_URL_EXPIRES_SEC, headers=headers)
+        resp.headers = headers
+
+    db.add(Session(
+        id=uuid.UUID(session_id),
+        user_id=uuid.UUID(user_id),
+        title=request.title or f"录音 {datetime.now().strftime('%H:%M')}",
+        start_time=datetime.now(),
+        duration=0,
+        status="uploading",
+        analysis_stage="uploading",
+        tags=[],
+        audio_size_bytes=request.size,  # 声明的大小，complete 时与 OSS 对象实际大小核对
+        # 客户端哈希只用于上面的去重查找；audio_sha256 由 worker 按实际下载的内容计算后写入（见 _record_audio_sha256）
+    ))
+    await db.commit()
+    logger.info(f"[直传] 已签发上传 URL session_id={session_id} size={request.size} "
+                f"multipart={resp.upload_id is not None} parts={len(resp.parts or [])}")
+    return resp
+
+
+@router.post("/{session_id}/complete", response_model=DirectUploadCompleteResponse)
+async def complete_direct_upload(
+    session_id: str,
+    request: DirectUploadCompleteRequest,
+    user_id: str = Depends(get_current_user_id),
+    db: AsyncSession = Depends(get_db)
+):
+    """客户端上传完成回调：合并分片（如有）、校验 OSS 对象，并入队分析"""
+    import oss2
+    from main import JOB_ANALYZE, _run_analyze_job, dispatch_pipeline_job
+
+    bucket = _require_bucket()
+    result = await db.execute(
+        select(Session).where(
+            Session.id == uuid.UUID(session_id),
+            Session.user_id == uuid.UUID(user_id)
+        )
+    )
+    session = result.scalar_one_or_none()
+    if not session:
+        raise HTTPException(status_code=404, detail="对话不存在")
+    if session.status != "uploading":
+        # 重复回调（客户端重试）：已入队则直接返回当前状态
+        return DirectUploadCompleteResponse(
+            session_id=session_id, status=session.status, audio_url=session.audio_url or "", size=0,
+        )
+
+    oss_key = request.oss_key
+    ext = Path(oss_key).suffix.lower()
+    if ext not in _ALLOWED_EXTS or oss_key != _oss_key(user_id, session_id, ext):
+        raise HTTPException(status_code=400, detail="oss_key 与会话不匹配")
+    if request.upload_id:
+        if not request.parts:
+            raise HTTPException(status_code=400, detail="分片上传需提供 parts")
+        parts = [oss2.models.PartInfo(p.part_number, p.etag) for p in sorted(request.parts, key=lambda p: p.part_number)]
+        try:
+            await asyncio.to_thread(bucket.complete_multipart_upload, oss_key, request.upload_id, parts)
+        except oss2.exceptions.OssError as e:
+            logger.warning(f"[直传] 合并分片失败 session_id={session_id}: {e}")
+            raise HTTPException(status_code=400, detail=f"合并分片失败: {e.message}")
+    try:
+        head = await asyncio.to_thread(bucket.head_object, oss_key)
+    except oss2.exceptions.NotFound:
+        raise HTTPException(status_code=409, detail="OSS 上未找到已上传的音频，请先完成上传")
+    # 预签名 PUT 不限制请求体大小：按实际对象大小核对上限与 init 时声明的大小，不符则删除对象（会话保持 uploading，可重传）
+    declared = session.audio_size_bytes
+    if head.content_length > DIRECT_UPLOAD_MAX_MB * 1024 * 1024 or (declared and head.content_length != declared):
+        logger.warning(f"[直传] 对象大小不符 session_id={session_id} 实际={head.content_length} 声明={declared}，已删除")
+        await asyncio.to_thread(bucket.delete_object, oss_key)
+        raise HTTPException(
+            status_code=400,
+            detail=f"上传的文件大小（{head.content_length} 字节）与声明不符或超过 {DIRECT_UPLOAD_MAX_MB} MB 上限",
+        )
+
+    audio_url = oss_object_url(oss_key)
+    session.audio_url = audio_url
+    session.audio_path = None
+    session.audio_size_bytes = head.content_length
+    session.status = "analyzing"
+    session.analysis_stage = "upload_done"
+    session.analysis_stage_started_at = datetime.now(timezone.utc)
+    session.analysis_stage_detail = None
+    await db.commit()
+
+    payload = {"oss_key": oss_key, "file_filename": Path(oss_key).name}
+    job = {"session_id": session_id, "user_id": user_id, "payload": payload}
+    await dispatch_pipeline_job(JOB_ANALYZE, session_id, user_id, payload, lambda: _run_analyze_job(job))
+    logger.info(f"[直传] 上传完成并已入队分析 session_id={session_id} key={oss_key} size={head.content_length}")
+    return DirectUploadCompleteResponse(
+        session_id=session_id, status="analyzing", audio_url=audio_url, size=head.content_length,
+    )
@@ -0,0 +1,455 @@
+"""
+实时录音 WebSocket 路由：边录边转写
+客户端录音时持续推送 PCM 帧，服务端追加写入 WAV 文件，每满 LIVE_WINDOW_SEC 切出一个滚动窗口
+（带 LIVE_WINDOW_OVERLAP_SEC 重叠）内联送 Gemini 转写，结果按全局时间合并写入部分分析结果
+（analysis_results.is_partial，详情接口可见）。录音结束后只剩最后一个窗口 + reduce（总结）+ 策略。
+
+协议:
+  连接: ws(s)://host/api/v1/audio/live?token=<JWT>
+  1. 客户端 → {"type": "start", "title": "...", "sample_rate": 16000, "channels": 1}   （PCM s16le）
+     服务端 → {"type": "started", "session_id": "..."}
+  2. 客户端 → 二进制帧（PCM 数据，任意长度）
+     服务端 → {"type": "partial", "window": i, "start_sec": .., "end_sec": .., "transcript": [...]}
+  3. 客户端 → {"type": "stop"}
+     服务端 → {"type": "completed", "session_id": "...", "duration_sec": ..}，随后关闭连接
+  连接意外断开时按 stop 处理（已录部分照常分析）。
+后台清理：进程在录音中途退出时会话停在 status=recording、WAV 头部未回填。超过空闲超时 + 宽限
+（spool 文件不在本机时为最长录音时长 + 宽限）仍未结束的会话：WAV 补全头部后按整段转写入队分析，
+无可用音频时标记失败（多 worker 以 UPDATE ... WHERE status='recording' 认领，不重复）。
+"""
+import asyncio
+import io
+import json
+import logging
+import os
+import struct
+import time
+import uuid
+import wave
+from datetime import datetime, timezone
+from typing import List, Optional
+
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect
+from sqlalchemy import select
+
+from auth.jwt_handler import decode_token
+from database.connection import AsyncSessionLocal
+from database.models import AnalysisResult, Session
+from services import stage_timing
+from services.progress import transition_stage
+
+logger = logging.getLogger(__name__)
+
+LIVE_WINDOW_SEC = float(os.getenv("LIVE_WINDOW_SEC", "60"))
+LIVE_WINDOW_OVERLAP_SEC = float(os.getenv("LIVE_WINDOW_OVERLAP_SEC", "2"))
+LIVE_MAX_SEC = float(os.getenv("LIVE_MAX_SEC", "14400"))
+# 超过该时长（秒）未收到任何帧视为客户端已掉线
+LIVE_IDLE_TIMEOUT_SEC = float(os.getenv("LIVE_IDLE_TIMEOUT_SEC", "60"))
+LIVE_STALE_GRACE_SEC = float(os.getenv("LIVE_STALE_GRACE_SEC", "300"))
+LIVE_SWEEP_SEC = float(os.getenv("LIVE_SWEEP_SEC", "300"))
+_ALLOWED_RATES = {8000, 16000, 22050, 24000, 32000, 44100, 48000}
+_WAV_HEADER_BYTES = 44
+
+router = APIRouter(prefix="/api/v1/audio", tags=["live-audio"])
+
+_active: set = set()  # 本进程正在录音的 session_id，清理时跳过
+_sweeper_task: Optional[asyncio.Task] = None
+
+
+def _wav_header(sample_rate: int, channels: int, data_len: int) -> bytes:
+    byte_rate = sample_rate * channels * 2
+    return (
+        b"RIFF" + struct.pack("<I", 36 + data_len) + b"WAVE"
+        + b"fmt " + struct.pack("<IHHIIHH", 16, 1, channels, sample_rate, byte_rate, channels * 2, 16)
+        + b"data" + struct.pack("<I", data_len)
+    )
+
+
+class _LiveRecording:
+    """单次实时录音：PCM 追加写入 WAV（结束时回填头部长度），按窗口切出并顺序转写"""
+
+    def __init__(self, session_id: str, user_id: str, sample_rate: int, channels: int, spool_dir: str):
+        self.session_id = session_id
+        self.user_id = user_id
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.bytes_per_sec = sample_rate * channels * 2
+        os.makedirs(spool_dir, exist_ok=True)
+        self.path = os.path.join(spool_dir, f"live_{session_id}.wav")
+        self._fh = open(self.path, "wb")
+        self._fh.write(_wav_header(sample_rate, channels, 0))
+        self.pcm_bytes = 0
+        self._carry = b""  # 不足一个采样帧的尾部字节
+        self._next_window_sec = 0.0
+        self.windows: List[dict] = []
+        self.failed: List[tuple] = []
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._worker: Optional[asyncio.Task] = None
+
+    @property
+    def duration_sec(self) -> float:
+        return self.pcm_bytes / self.bytes_per_sec
+
+    def append(self, data: bytes) -> None:
+        data = self._carry + data
+        usable = len(data) - len(data) % (self.channels * 2)
+        self._carry = data[usable:]
+        if usable:
+            self._fh.write(data[:usable])
+            self.pcm_bytes += usable
+
+    def due_windows(self) -> List[tuple]:
+        """已录满的窗口 [(start_sec, end_sec), ...]"""
+        out = []
+        while self.duration_sec >= self._next_window_sec + LIVE_WINDOW_SEC:
+            end = self._next_window_sec + LIVE_WINDOW_SEC
+            out.append((max(0.0, self._next_window_sec - LIVE_WINDOW_OVERLAP_SEC), end))
+            self._next_window_sec = end
+        return out
+
+    def tail_window(self) -> Optional[tuple]:
+        if self.duration_sec - self._next_window_sec < 0.5:
+            return None
+        start = max(0.0, self._next_window_sec - LIVE_WINDOW_OVERLAP_SEC)
+        self._next_window_sec = self.duration_sec
+        return start, self.duration_sec
+
+    def read_window_wav(self, start_sec: float, end_sec: float) -> bytes:
+        """从 WAV 文件读出 [start, end) 并包成独立 WAV（内联送 Gemini）"""
+        frame = self.channels * 2
+        start = int(start_sec * self.sample_rate) * frame
+        end = min(self.pcm_bytes, int(end_sec * self.sample_rate) * frame)
+        with open(self.path, "rb") as f:
+            f.seek(_WAV_HEADER_BYTES + start)
+            pcm = f.read(end - start)
+        buf = io.BytesIO()
+        with wave.open(buf, "wb") as w:
+            w.setnchannels(self.channels)
+            w.setsampwidth(2)
+            w.setframerate(self.sample_rate)
+            w.writeframes(pcm)
+        return buf.getvalue()
+
+    def finalize_file(self) -> None:
+        """回填 RIFF / data 长度，得到完整可播放的 WAV"""
+        self._fh.seek(0)
+        self._fh.write(_wav_header(self.sample_rate, self.channels, self.pcm_bytes))
+        self._fh.close()
+
+    def discard(self) -> None:
+        if not self._fh.closed:
+            self._fh.close()
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
+
+    # ── 窗口转写 ──────────────────────────────────────────────────────────
+    def start_worker(self, websocket: WebSocket) -> None:
+        self._worker = asyncio.create_task(self._run(websocket))
+
+    def submit(self, window: tuple) -> None:
+        self._fh.flush()  # 窗口数据落盘后再交给转写（读取在线程池中另开文件句柄）
+        self._queue.put_nowait(window)
+
+    async def drain(self) -> None:
+        """等待已提交窗口全部转写完，再补转一次失败的窗口"""
+        self._queue.put_nowait(None)
+        if self._worker is not None:
+            await self._worker
+        retry, self.failed = self.failed, []
+        for start_sec, end_sec in retry:
+            await self._transcribe(start_sec, end_sec, None)
+
+    async def _run(self, websocket: WebSocket) -> None:
+        while True:
+            window = await self._queue.get()
+            if window is None:
+                return
+            await self._transcribe(window[0], window[1], websocket)
+
+    async def _transcribe(self, start_sec: float, end_sec: float, websocket: Optional[WebSocket]) -> None:
+        from main import GEMINI_FLASH_MODEL, _transcribe_window, gemini_gateway
+        sid = self.session_id
+        t0 = time.time()
+        try:
+            audio = {"mime_type": "audio/wav", "data": await asyncio.to_thread(self.read_window_wav, start_sec, end_sec)}
+            model = gemini_gateway.get_model(GEMINI_FLASH_MODEL)
+            window = await _transcribe_window(model, audio, start_sec, end_sec, purpose="transcribe_live")
+        except Exception as e:
+            logger.warning(f"[实时-{sid}] 窗口 [{start_sec:.0f}s-{end_sec:.0f}s] 转写失败，结束时重试: {type(e).__name__}: {e}")
+            self.failed.append((start_sec, end_sec))
+            return
+        self.windows.append(window)
+        self.windows.sort(key=lambda w: w["start_sec"])
+        logger.info(f"[实时-{sid}] 窗口 {len(self.windows)} [{start_sec:.0f}s-{end_sec:.0f}s] "
+                    f"转写 {len(window['transcript'])} 条 耗时={time.time() - t0:.1f}s")
+        try:
+            await self._save_partial()
+        except Exception as e:
+            logger.warning(f"[实时-{sid}] 部分转写写库失败: {e}")
+        if websocket is not None:
+            try:
+                await websocket.send_json({
+                    "type": "partial",
+                    "window": len(self.windows) - 1,
+                    "start_sec": round(start_sec, 2),
+                    "end_sec": round(end_sec, 2),
+                    "transcript": window["transcript"],
+                })
+            except Exception:
+                pass  # 客户端已断开：转写照常继续
+
+    async def _save_partial(self) -> None:
+        """合并全部窗口写入 analysis_results（is_partial=True），详情接口即可看到已转写部分"""
+        from main import _merge_window_results, build_analysis_results
+        merged = _merge_window_results(self.windows)
+        from utils import transcript_codec
+        result, _ = build_analysis_results(merged)
+        stats = {"sigh": merged["sigh_count"], "laugh": merged["laugh_count"]}
+        async with AsyncSessionLocal() as db:
+            q = await db.execute(select(AnalysisResult).where(AnalysisResult.session_id == uuid.UUID(self.session_id)))
+            ar = q.scalar_one_or_none()
+            if ar is None:
+                ar = AnalysisResult(session_id=uuid.UUID(self.session_id), is_partial=True)
+                db.add(ar)
+            elif not ar.is_partial:
+                return
+            transcript_codec.store(ar, merged["transcript"], [d.dict() for d in result.dialogues])
+            ar.risks = merged["risks"]
+            ar.stats = stats
+            await db.commit()
+
+
+async def _authenticate(websocket: WebSocket) -> Optional[str]:
+    token = websocket.query_params.get("token")
+    if not token:
+        auth = websocket.headers.get("authorization") or ""
+        token = auth[7:] if auth.lower().startswith("bearer ") else None
+    return decode_token(token) if token else None
+
+
+async def _create_session(session_id: str, user_id: str, title: str) -> None:
+    async with AsyncSessionLocal() as db:
+        db.add(Session(
+            id=uuid.UUID(session_id),
+            user_id=uuid.UUID(user_id),
+            title=title,
+            start_time=datetime.now(),
+            duration=0,
+            status="recording",
+            analysis_stage="recording",
+            tags=[],
+        ))
+        await db.commit()
+
+
+async def _finish(rec: _LiveRecording) -> bool:
+    """
+    录音结束：转完剩余窗口，WAV 落盘并入队分析（reduce + 声纹 + 策略）。不足 1 秒时删除会话。
+    有窗口补转后仍失败（或一个窗口都没转出来，如 Gemini 故障）时，部分转写有缺口，不作为 Call1 输入：
+    入队时不带 live，由分析任务对整段 WAV 重新转写
+    """
+    from main import JOB_ANALYZE, _run_analyze_job, dispatch_pipeline_job
+    sid = rec.session_id
+    tail = rec.tail_window()
+    if tail is not None:
+        rec.submit(tail)
+    await rec.drain()
+    rec.finalize_file()
+    async with AsyncSessionLocal() as db:
+        q = await db.execute(select(Session).where(Session.id == uuid.UUID(sid)))
+        db_session = q.scalar_one_or_none()
+        if db_session is None:
+            rec.discard()
+            return False
+        if rec.duration_sec < 1:
+            logger.info(f"[实时-{sid}] 无有效音频（{rec.duration_sec:.1f}s），删除会话")
+            await db.delete(db_session)
+            await db.commit()
+            rec.discard()
+            return False
+        db_session.status = "analyzing"
+        db_session.analysis_stage = "upload_done"
+        db_session.analysis_stage_started_at = datetime.now(timezone.utc)
+        db_session.analysis_stage_detail = None
+        db_session.audio_size_bytes = os.path.getsize(rec.path)
+        await db.commit()
+    live_complete = bool(rec.windows) and not rec.failed
+    payload = {"file_path": rec.path, "file_filename": "live.wav"}
+    if live_complete:
+        payload["live"] = True
+    else:
+        gaps = ", ".join(f"{s:.0f}s-{e:.0f}s" for s, e in rec.failed) or "全部"
+        logger.warning(f"[实时-{sid}] 窗口转写不完整（失败: {gaps}），改为整段重新转写")
+    job = {"session_id": sid, "user_id": rec.user_id, "payload": payload}
+    await dispatch_pipeline_job(JOB_ANALYZE, sid, rec.user_id, payload, lambda: _run_analyze_job(job))
+    logger.info(f"[实时-{sid}] 录音结束 {rec.duration_sec:.1f}s，{len(rec.windows)} 个窗口已转写，已入队后续分析")
+    return True
+
+
+def _repair_spool_wav(path: str) -> float:
+    """按文件实际长度回填中断录音的 WAV 头部（采样率 / 声道取自开头写入的头部），返回时长秒数"""
+    with open(path, "r+b") as f:
+        header = f.read(_WAV_HEADER_BYTES)
+        if len(header) < _WAV_HEADER_BYTES or header[:4] != b"RIFF":
+            return 0.0
+        channels, sample_rate = struct.unpack("<HI", header[22:28])
+        if sample_rate not in _ALLOWED_RATES or channels not in (1, 2):
+            return 0.0
+        frame = channels * 2
+        data_len = (os.fstat(f.fileno()).st_size - _WAV_HEADER_BYTES) // frame * frame
+        f.truncate(_WAV_HEADER_BYTES + data_len)
+        f.seek(0)
+        f.write(_wav_header(sample_rate, channels, data_len))
+    return data_len / (sample_rate * frame)
+
+
+async def sweep_stale_recordings() -> int:
+    """接管中断的实时录音会话：有音频则整段转写入队，否则标记失败；返回处理条数"""
+    from sqlalchemy import text
+    from main import JOB_ANALYZE, UPLOAD_SPOOL_DIR, _run_analyze_job, dispatch_pipeline_job
+
+    idle_cutoff = LIVE_IDLE_TIMEOUT_SEC + LIVE_STALE_GRACE_SEC
+    async with AsyncSessionLocal() as db:
+        rows = (await db.execute(
+            text("""
+                SELECT id, user_id, extract(epoch FROM now() - created_at) AS age FROM sessions
+                WHERE status = 'recording' AND created_at < now() - make_interval(secs => :age)
+                ORDER BY created_at LIMIT 50
+            """),
+            {"age": idle_cutoff},
+        )).all()
+
+    handled = 0
+    now = time.time()
+    for row in rows:
+        sid = str(row.id)
+        if sid in _active:
+            continue
+        path = os.path.join(UPLOAD_SPOOL_DIR, f"live_{sid}.wav")
+        if os.path.exists(path):
+            # 录音中每个空闲超时内至少追加一帧；文件仍在增长说明其他 worker 正在录
+            if now - os.path.getmtime(path) < idle_cutoff:
+                continue
+        elif row.age < LIVE_MAX_SEC + idle_cutoff:
+            continue  # spool 不在本机：等到超过最长录音时长再判定中断
+
+        duration = await asyncio.to_thread(_repair_spool_wav, path) if os.path.exists(path) else 0.0
+        async with AsyncSessionLocal() as db:
+            if duration < 1:
+                claimed = await transition_stage(db, sid, "failed", status="failed", only_if_status="recording",
+                                                 error_message="实时录音中断，未保存到可分析的音频", timing=False)
+                if claimed:
+                    logger.warning(f"[实时-{sid}] 中断的录音无可用音频，已标记失败")
+                    if os.path.exists(path):
+                        os.unlink(path)
+                    handled += 1
+                continue
+            claimed = await transition_stage(db, sid, "upload_done", status="analyzing", only_if_status="recording",
+                                             timing=False, commit=False)
+            if not claimed:
+                continue
+            await db.execute(text("UPDATE sessions SET audio_size_bytes = :size WHERE id = :id"),
+                             {"size": os.path.getsize(path), "id": row.id})
+            await db.commit()
+        # 进程中断时最后的窗口未转写，部分转写不完整：不带 live，整段重新转写
+        payload = {"file_path": path, "file_filename": "live.wav"}
+        job = {"session_id": sid, "user_id": str(row.user_id), "payload": payload}
+        await dispatch_pipeline_job(JOB_ANALYZE, sid, job["user_id"], payload, lambda job=job: _run_analyze_job(job))
+        logger.warning(f"[实时-{sid}] 接管中断的录音 {duration:.1f}s，已入队整段分析")
+        handled += 1
+    return handled
+
+
+async def _sweep_loop() -> None:
+    while True:
+        try:
+            await sweep_stale_recordings()
+        except Exception as e:
+            logger.warning(f"[实时] 清理中断录音失败，下次重试: {e}")
+        await asyncio.sleep(LIVE_SWEEP_SEC)
+
+
+def start_sweeper() -> None:
+    global _sweeper_task
+    if _sweeper_task is None or _sweeper_task.done():
+        _sweeper_task = asyncio.create_task(_sweep_loop())
+
+
+def stop_sweeper() -> None:
+    if _sweeper_task is not None:
+        _sweeper_task.cancel()
+
+
+@router.websocket("/live")
+async def live_audio(websocket: WebSocket):
+    """实时录音：边录边转写（协议见模块文档）"""
+    from main import UPLOAD_SPOOL_DIR
+    user_id = await _authenticate(websocket)
+    if not user_id:
+        await websocket.close(code=4401)
+        return
+    await websocket.accept()
+    rec: Optional[_LiveRecording] = None
+    try:
+        start = await asyncio.wait_for(websocket.receive_json(), timeout=LIVE_IDLE_TIMEOUT_SEC)
+        sample_rate = int(start.get("sample_rate") or 16000)
+        channels = int(start.get("channels") or 1)
+        if start.get("type") != "start" or sample_rate not in _ALLOWED_RATES or channels not in (1, 2):
+            await websocket.send_json({"type": "error", "message": "首帧需为 start，且 sample_rate / channels 合法"})
+            await websocket.close(code=4400)
+            return
+        session_id = str(uuid.uuid4())
+        title = start.get("title") or f"录音 {datetime.now().strftime('%H:%M')}"
+        await _create_session(session_id, user_id, title)
+        stage_timing.bind_session(session_id)  # 窗口转写 worker 任务继承，transcribe_live 耗时带上 session
+        rec = _LiveRecording(session_id, user_id, sample_rate, channels, UPLOAD_SPOOL_DIR)
+        _active.add(session_id)
+        rec.start_worker(websocket)
+        await websocket.send_json({"type": "started", "session_id": session_id})
+        logger.info(f"[实时-{session_id}] 开始录音 user={user_id[:8]} {sample_rate}Hz x{channels}")
+
+        while True:
+            msg = await asyncio.wait_for(websocket.receive(), timeout=LIVE_IDLE_TIMEOUT_SEC)
+            if msg["type"] == "websocket.disconnect":
+                break
+            if msg.get("bytes"):
+                rec.append(msg["bytes"])
+                for window in rec.due_windows():
+                    rec.submit(window)
+                if rec.duration_sec >= LIVE_MAX_SEC:
+                    logger.warning(f"[实时-{session_id}] 达到最长录音 {LIVE_MAX_SEC:.0f}s，自动结束")
+                    break
+            elif msg.get("text"):
+                try:
+                    control = json.loads(msg["text"])
+                except ValueError:
+                    continue
+                if control.get("type") == "stop":
+                    break
+    except (WebSocketDisconnect, asyncio.TimeoutError):
+        pass
+    except Exception as e:
+        logger.error(f"[实时] 连接异常: {type(e).__name__}: {e}")
+    if rec is None:
+        return
+    try:
+        ok = await _finish(rec)
+    except Exception as e:
+        logger.error(f"[实时-{rec.session_id}] 收尾失败: {type(e).__name__}: {e}")
+        ok = False
+        async with AsyncSessionLocal() as db:
+            await transition_stage(db, rec.session_id, "failed", status="failed",
+                                   error_message=f"实时录音收尾失败: {e}"[:500])
+    finally:
+        _active.discard(rec.session_id)
+    try:
+        await websocket.send_json({
+            "type": "completed" if ok else "discarded",
+            "session_id": rec.session_id,
+            "duration_sec": round(rec.duration_sec, 2),
+        })
+        await websocket.close()
+    except Exception:
+        pass
@@ -7,14 +7,14 @@ from typing import List, Optional, Dict, Tuple, Any
 
 from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Query
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy import select, update
 import uuid
 from datetime import datetime
 import logging
 import traceback
 
 from database.connection import get_db
-from database.models import Profile, Session, AnalysisResult
+from database.models import Profile, Session, AnalysisResult, User
 from auth.jwt_handler import get_current_user_id
 from pydantic import BaseModel
 
@@ -31,6 +31,13 @@ def _invalidate_profiles_cache(user_id: str):
         logger.debug("档案列表缓存已失效: %s", user_id)
 
 
+async def _bump_profiles_version(db: AsyncSession, user_id: str):
+    """档案增删改时与改动同一事务 +1，任务详情的预渲染（说话人 → 档案名）随之失效"""
+    await db.execute(
+        update(User).where(User.id == uuid.UUID(user_id)).values(profiles_version=User.profiles_version + 1)
+    )
+
+
 router = APIRouter(prefix="/api/v1/profiles", tags=["profiles"])
 
 
@@ -148,6 +155,7 @@ async def create_profile(
     )
     
     db.add(profile)
+    await _bump_profiles_version(db, user_id)
     await db.commit()
     _invalidate_profiles_cache(user_id)
     # 移除不必要的refresh，created_at和updated_at由数据库自动生成，但对象中已有值
@@ -210,6 +218,7 @@ async def update_profile(
     if profile_data.audio_url is not None:
         profile.audio_url = profile_data.audio_url
     
+    await _bump_profiles_version(db, user_id)
     await db.commit()
     _invalidate_profiles_cache(user_id)
     logger.info(f"[档案更新] ✅ 成功 profile_id={profile_id} photo_url={profile.photo_url}")
@@ -251,6 +260,7 @@ async def delete_profile(
         raise HTTPException(status_code=404, detail="档案不存在")
     
     await db.delete(profile)
+    await _bump_profiles_version(db, user_id)
     await db.commit()
     _invalidate_profiles_cache(user_id)
     return None
@@ -0,0 +1,2 @@
+-- 实时录音：边录边转写期间写入的部分转写标记为 is_partial，录音结束的完整分析写入时替换
+ALTER TABLE analysis_results ADD COLUMN IF NOT EXISTS is_partial BOOLEAN NOT NULL DEFAULT false;
@@ -0,0 +1,6 @@
+-- 任务详情预渲染：展示字段渲染一次后压缩存储，按渲染版本 / 档案版本 / 分析结果 updated_at 失效（services/detail_render.py）
+-- 无需回填：首次打开详情时渲染并写入
+ALTER TABLE users ADD COLUMN IF NOT EXISTS profiles_version INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE analysis_results ADD COLUMN IF NOT EXISTS detail_payload BYTEA;
+ALTER TABLE analysis_results ADD COLUMN IF NOT EXISTS detail_stamp VARCHAR(80);
+ALTER TABLE analysis_results ADD COLUMN IF NOT EXISTS detail_hash VARCHAR(64);
@@ -0,0 +1,14 @@
+-- Gemini 文件句柄缓存：按内容 SHA-256 复用 Files API 上已上传的音频，过期条目由后台批量清理
+CREATE TABLE IF NOT EXISTS gemini_file_cache (
+    sha256 VARCHAR(64) PRIMARY KEY,
+    file_name VARCHAR(200) NOT NULL,
+    mime_type VARCHAR(100),
+    size_bytes BIGINT,
+    hits INTEGER NOT NULL DEFAULT 0,
+    expires_at TIMESTAMPTZ NOT NULL,
+    created_at TIMESTAMPTZ DEFAULT now(),
+    last_used_at TIMESTAMPTZ DEFAULT now()
+);
+
+-- 清理按 expires_at 扫描
+CREATE INDEX IF NOT EXISTS ix_gemini_file_cache_expires_at ON gemini_file_cache (expires_at);
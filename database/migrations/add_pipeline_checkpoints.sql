@@ -0,0 +1,13 @@
+-- 流水线阶段检查点：每个已完成阶段的产物一行，POST /api/v1/tasks/sessions/{id}/retry 从第一个未完成阶段继续
+CREATE TABLE IF NOT EXISTS pipeline_checkpoints (
+    session_id UUID NOT NULL REFERENCES sessions(id) ON DELETE CASCADE,
+    stage VARCHAR(64) NOT NULL,
+    data JSONB NOT NULL,
+    expires_at TIMESTAMPTZ NOT NULL,
+    created_at TIMESTAMPTZ DEFAULT now(),
+    updated_at TIMESTAMPTZ DEFAULT now(),
+    PRIMARY KEY (session_id, stage)
+);
+
+-- 过期清理
+CREATE INDEX IF NOT EXISTS ix_pipeline_checkpoints_expires_at ON pipeline_checkpoints (expires_at);
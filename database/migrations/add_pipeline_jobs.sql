@@ -0,0 +1,32 @@
+-- 持久化流水线任务队列：上传 → 分析 → 策略 不再只存在于某个 uvicorn worker 的内存中
+-- worker 以 SELECT ... FOR UPDATE SKIP LOCKED 认领任务，持有租约并定期心跳；租约过期的任务被自动回收重试
+CREATE TABLE IF NOT EXISTS pipeline_jobs (
+    id UUID PRIMARY KEY,
+    job_type VARCHAR(50) NOT NULL,
+    session_id UUID REFERENCES sessions(id) ON DELETE CASCADE,
+    user_id UUID,
+    payload JSONB NOT NULL DEFAULT '{}'::jsonb,
+    status VARCHAR(20) NOT NULL DEFAULT 'queued',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL DEFAULT 3,
+    run_after TIMESTAMPTZ NOT NULL DEFAULT now(),
+    lease_owner VARCHAR(100),
+    lease_expires_at TIMESTAMPTZ,
+    heartbeat_at TIMESTAMPTZ,
+    last_error TEXT,
+    started_at TIMESTAMPTZ,
+    finished_at TIMESTAMPTZ,
+    created_at TIMESTAMPTZ DEFAULT now(),
+    updated_at TIMESTAMPTZ DEFAULT now()
+);
+
+CREATE INDEX IF NOT EXISTS ix_pipeline_jobs_session_id ON pipeline_jobs (session_id);
+
+-- 认领：只扫 queued 的部分索引
+CREATE INDEX IF NOT EXISTS idx_pipeline_jobs_claim ON pipeline_jobs (run_after, created_at) WHERE status = 'queued';
+
+-- 回收：只扫 running 的部分索引
+CREATE INDEX IF NOT EXISTS idx_pipeline_jobs_lease ON pipeline_jobs (lease_expires_at) WHERE status = 'running';
+
+-- 同一 session 同一类型只允许一个未完成任务（重复入队被忽略）
+CREATE UNIQUE INDEX IF NOT EXISTS uq_pipeline_jobs_active ON pipeline_jobs (job_type, session_id) WHERE status IN ('queued', 'running');
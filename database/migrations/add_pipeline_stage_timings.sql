@@ -0,0 +1,18 @@
+-- 流水线分阶段耗时：每个阶段一行，管理接口 /api/v1/admin/stage-latency 按阶段 × 文件大小汇总 p50/p95/p99
+CREATE TABLE IF NOT EXISTS pipeline_stage_timings (
+    id BIGSERIAL PRIMARY KEY,
+    session_id UUID,
+    stage VARCHAR(64) NOT NULL,
+    started_at TIMESTAMPTZ NOT NULL,
+    duration_ms INTEGER NOT NULL,
+    file_size BIGINT,
+    chunk_count INTEGER,
+    retries INTEGER NOT NULL DEFAULT 0,
+    model VARCHAR(100),
+    outcome VARCHAR(16) NOT NULL DEFAULT 'ok'
+);
+
+CREATE INDEX IF NOT EXISTS ix_pipeline_stage_timings_session_id ON pipeline_stage_timings (session_id);
+
+-- 报表按阶段 + 时间窗口扫描
+CREATE INDEX IF NOT EXISTS idx_pipeline_stage_timings_stage_time ON pipeline_stage_timings (stage, started_at);
@@ -0,0 +1,12 @@
+-- 进度 ETA：按文件大小预测各阶段耗时，sessions 记录原音频字节数
+ALTER TABLE sessions ADD COLUMN IF NOT EXISTS audio_size_bytes BIGINT;
+
+-- 回填：历史会话取 ingest 阶段记录的文件大小（需已执行 add_pipeline_stage_timings）
+UPDATE sessions s SET audio_size_bytes = t.file_size
+FROM (
+    SELECT session_id, max(file_size) AS file_size
+    FROM pipeline_stage_timings
+    WHERE session_id IS NOT NULL AND file_size IS NOT NULL
+    GROUP BY session_id
+) t
+WHERE s.id = t.session_id AND s.audio_size_bytes IS NULL;
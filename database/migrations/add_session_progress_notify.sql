@@ -0,0 +1,24 @@
+-- 会话进度推送：status / analysis_stage / image_status 变化时 pg_notify('session_progress')
+-- 载荷只含 id 与状态字段（NOTIFY 上限 8000 字节），订阅端按需回查 analysis_stage_detail
+CREATE OR REPLACE FUNCTION notify_session_progress() RETURNS trigger AS $$
+BEGIN
+    IF NEW.status IS DISTINCT FROM OLD.status
+       OR NEW.analysis_stage IS DISTINCT FROM OLD.analysis_stage
+       OR NEW.image_status IS DISTINCT FROM OLD.image_status
+       OR NEW.analysis_stage_detail IS DISTINCT FROM OLD.analysis_stage_detail THEN
+        PERFORM pg_notify('session_progress', json_build_object(
+            'type', 'stage',
+            'session_id', NEW.id,
+            'status', NEW.status,
+            'analysis_stage', NEW.analysis_stage,
+            'image_status', NEW.image_status
+        )::text);
+    END IF;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_sessions_progress_notify ON sessions;
+CREATE TRIGGER trg_sessions_progress_notify
+    AFTER UPDATE ON sessions
+    FOR EACH ROW EXECUTE FUNCTION notify_session_progress();
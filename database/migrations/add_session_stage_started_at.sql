@@ -0,0 +1,6 @@
+-- 进度 ETA：记录当前分析阶段的开始时间，仅在阶段切换时写入
+-- updated_at 会被无关写入（audio_url、逐张配图进度等）刷新，不能作为阶段开始时间
+ALTER TABLE sessions ADD COLUMN IF NOT EXISTS analysis_stage_started_at TIMESTAMPTZ;
+
+-- 仅对新插入的会话生效（不回填存量行，存量行读取时回退 updated_at）
+ALTER TABLE sessions ALTER COLUMN analysis_stage_started_at SET DEFAULT now();
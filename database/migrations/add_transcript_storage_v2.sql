@@ -0,0 +1,6 @@
+-- 转写存储格式 v2：每个会话只存一份压缩列式转写（transcript_blob），dialogues / call1_result.transcript 读取时派生
+-- 存量数据由 run_add_transcript_storage_v2.py 分批回填
+ALTER TABLE analysis_results ADD COLUMN IF NOT EXISTS storage_version SMALLINT NOT NULL DEFAULT 1;
+ALTER TABLE analysis_results ADD COLUMN IF NOT EXISTS transcript_blob BYTEA;
+ALTER TABLE analysis_results ADD COLUMN IF NOT EXISTS transcript_chars INTEGER;
+ALTER TABLE analysis_results ALTER COLUMN dialogues DROP NOT NULL;
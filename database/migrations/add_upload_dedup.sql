@@ -0,0 +1,17 @@
+-- 上传去重：sessions 记录上传内容 SHA-256；幂等键表供多 worker 共享，客户端超时重试时返回已有 session
+ALTER TABLE sessions ADD COLUMN IF NOT EXISTS audio_sha256 VARCHAR(64);
+
+-- 同一用户按内容哈希查找近期会话 / 可复用的分析结果
+CREATE INDEX IF NOT EXISTS idx_sessions_user_audio_sha256 ON sessions (user_id, audio_sha256) WHERE audio_sha256 IS NOT NULL;
+
+CREATE TABLE IF NOT EXISTS upload_idempotency_keys (
+    user_id UUID NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    idem_key VARCHAR(200) NOT NULL,
+    session_id UUID NOT NULL REFERENCES sessions(id) ON DELETE CASCADE,
+    audio_sha256 VARCHAR(64),
+    created_at TIMESTAMPTZ DEFAULT now(),
+    expires_at TIMESTAMPTZ NOT NULL,
+    PRIMARY KEY (user_id, idem_key)
+);
+
+CREATE INDEX IF NOT EXISTS ix_upload_idempotency_keys_expires_at ON upload_idempotency_keys (expires_at);
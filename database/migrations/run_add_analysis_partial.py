@@ -0,0 +1,38 @@
+#!/usr/bin/env python3
+"""
+在服务器上执行：为 analysis_results 增加 is_partial 列
+实时录音边录边转写（/api/v1/audio/live）依赖此迁移
+"""
+import asyncio
+import sys
+from pathlib import Path
+
+root = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(root))
+_env = root / ".env"
+if _env.exists():
+    from dotenv import load_dotenv
+    load_dotenv(_env)
+
+
+async def main():
+    from sqlalchemy import text
+    from database.connection import engine
+
+    sql_file = Path(__file__).parent / "add_analysis_partial.sql"
+    lines = [l for l in sql_file.read_text(encoding="utf-8").splitlines() if not l.strip().startswith("--")]
+    statements = [s.strip() for s in "\n".join(lines).split(";") if s.strip()]
+    try:
+        async with engine.begin() as conn:
+            for stmt in statements:
+                await conn.execute(text(stmt))
+                print(f"✅ 已执行: {stmt.splitlines()[0][:70]}...")
+        print("✅ analysis_results.is_partial 迁移已完成")
+    except Exception as e:
+        print(f"❌ 迁移失败: {e}")
+        raise
+    finally:
+        await engine.dispose()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,38 @@
+#!/usr/bin/env python3
+"""
+在服务器上执行：创建 gemini_file_cache 表
+GEMINI_FILE_CACHE_ENABLED=true 时 Gemini 文件句柄缓存依赖此迁移
+"""
+import asyncio
+import sys
+from pathlib import Path
+
+root = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(root))
+_env = root / ".env"
+if _env.exists():
+    from dotenv import load_dotenv
+    load_dotenv(_env)
+
+
+async def main():
+    from sqlalchemy import text
+    from database.connection import engine
+
+    sql_file = Path(__file__).parent / "add_gemini_file_cache.sql"
+    lines = [l for l in sql_file.read_text(encoding="utf-8").splitlines() if not l.strip().startswith("--")]
+    statements = [s.strip() for s in "\n".join(lines).split(";") if s.strip()]
+    try:
+        async with engine.begin() as conn:
+            for stmt in statements:
+                await conn.execute(text(stmt))
+                print(f"✅ 已执行: {stmt.splitlines()[0][:70]}...")
+        print("✅ gemini_file_cache 迁移已完成")
+    except Exception as e:
+        print(f"❌ 迁移失败: {e}")
+        raise
+    finally:
+        await engine.dispose()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,37 @@
+#!/usr/bin/env python3
+"""
+在服务器上执行：为 sessions 表创建进度 NOTIFY 触发器
+进度推送（GET /api/v1/tasks/sessions/{id}/events）依赖此迁移；未执行时 SSE 退化为定期回查
+"""
+import asyncio
+import sys
+from pathlib import Path
+
+root = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(root))
+_env = root / ".env"
+if _env.exists():
+    from dotenv import load_dotenv
+    load_dotenv(_env)
+
+
+async def main():
+    from database.connection import engine
+
+    sql_file = Path(__file__).parent / "add_session_progress_notify.sql"
+    # 函数体内含分号，整段交给 asyncpg 作为简单查询执行，不按分号拆分
+    sql = sql_file.read_text(encoding="utf-8")
+    try:
+        async with engine.begin() as conn:
+            raw = await conn.get_raw_connection()
+            await raw.driver_connection.execute(sql)
+            print("✅ 已执行: add_session_progress_notify.sql")
+        print("✅ sessions 进度 NOTIFY 触发器迁移已完成")
+    except Exception as e:
+        print(f"❌ 迁移失败: {e}")
+        raise
+    finally:
+        await engine.dispose()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+在服务器上执行：analysis_results 增加 storage_version / transcript_blob / transcript_chars，dialogues 改为可空，
+并把存量 v1 行（三份 JSON）分批回填为 v2（一份压缩列式转写），输出每行节省的字节数
+- 回填逐行校验：由 blob 派生的 transcript / dialogues 与原数据完全一致才转换，否则保留 v1
+- 只处理完整结果（is_partial=false），部分转写会被完整结果替换
+- 表文件空间在 VACUUM（autovacuum）后才能复用，VACUUM FULL 才会归还操作系统
+
+用法:
+  python database/migrations/run_add_transcript_storage_v2.py [--batch 200] [--dry-run] [--no-backfill]
+"""
+import argparse
+import asyncio
+import json
+import sys
+import uuid
+from pathlib import Path
+
+root = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(root))
+_env = root / ".env"
+if _env.exists():
+    from dotenv import load_dotenv
+    load_dotenv(_env)
+
+_SIZE_SQL = ("COALESCE(pg_column_size(transcript), 0) + COALESCE(pg_column_size(dialogues), 0) "
+             "+ COALESCE(pg_column_size(call1_result), 0) + COALESCE(pg_column_size(transcript_blob), 0)")
+
+
+async def _migrate(engine) -> None:
+    from sqlalchemy import text
+
+    sql_file = Path(__file__).parent / "add_transcript_storage_v2.sql"
+    lines = [l for l in sql_file.read_text(encoding="utf-8").splitlines() if not l.strip().startswith("--")]
+    statements = [s.strip() for s in "\n".join(lines).split(";") if s.strip()]
+    async with engine.begin() as conn:
+        for stmt in statements:
+            await conn.execute(text(stmt))
+            print(f"✅ 已执行: {stmt.splitlines()[0][:70]}...")
+
+
+async def _backfill(engine, batch: int, dry_run: bool) -> None:
+    from sqlalchemy import bindparam, text
+    from sqlalchemy.dialects.postgresql import JSONB
+    from utils import transcript_codec
+
+    select_sql = text(f"""
+        SELECT id, transcript, dialogues, call1_result, {_SIZE_SQL} AS bytes_before
+        FROM analysis_results
+        WHERE storage_version = 1 AND is_partial = false AND id > :after
+        ORDER BY id LIMIT :batch
+    """)
+    update_sql = text(f"""
+        UPDATE analysis_results
+        SET storage_version = 2, transcript_blob = :blob, transcript_chars = :chars,
+            transcript = NULL, dialogues = NULL, call1_result = :call1
+        WHERE id = :id AND storage_version = 1
+        RETURNING {_SIZE_SQL} AS bytes_after
+    """).bindparams(bindparam("call1", type_=JSONB))
+
+    after = uuid.UUID(int=0)
+    converted = skipped = 0
+    bytes_before = bytes_after = 0
+    while True:
+        async with engine.begin() as conn:
+            rows = (await conn.execute(select_sql, {"after": after, "batch": batch})).all()
+            if not rows:
+                break
+            after = rows[-1].id
+            for row in rows:
+                try:
+                    transcript = json.loads(row.transcript) if row.transcript else []
+                except ValueError:
+                    transcript = []
+                call1 = row.call1_result if isinstance(row.call1_result, dict) else None
+                if not transcript and call1:
+                    transcript = call1.get("transcript") or []
+                dialogues = row.dialogues if isinstance(row.dialogues, list) else []
+                cols = transcript_codec.storage_columns(transcript, dialogues, call1, version=transcript_codec.STORAGE_V2)
+                # v1 中 call1_result.transcript 与 transcript 列不一致时，丢弃内嵌副本会丢数据
+                if cols["storage_version"] != transcript_codec.STORAGE_V2 or (
+                        call1 and "transcript" in call1 and call1["transcript"] != transcript):
+                    skipped += 1
+                    continue
+                if dry_run:
+                    # 未压缩长度估算（实际落库后 TOAST 可能更小）
+                    size = len(cols["transcript_blob"]) + len(json.dumps(cols["call1_result"] or {}, ensure_ascii=False).encode())
+                else:
+                    size = (await conn.execute(update_sql, {
+                        "id": row.id, "blob": cols["transcript_blob"], "chars": cols["transcript_chars"],
+                        "call1": cols["call1_result"],
+                    })).scalar()
+                    if size is None:
+                        continue  # 期间已被重写
+                converted += 1
+                bytes_before += row.bytes_before
+                bytes_after += size
+        print(f"  … 已处理至 {after}：转换 {converted} 行，保留 v1 {skipped} 行")
+
+    print(f"✅ 回填{'（dry-run，未写入）' if dry_run else ''}完成：转换 {converted} 行，保留 v1 {skipped} 行")
+    if converted:
+        saved = bytes_before - bytes_after
+        print(f"   转写相关列合计 {bytes_before / 1024 / 1024:.2f} MB → {bytes_after / 1024 / 1024:.2f} MB，"
+              f"节省 {saved / 1024 / 1024:.2f} MB（{saved / bytes_before * 100:.1f}%）")
+        print(f"   平均每行 {bytes_before / converted:.0f} B → {bytes_after / converted:.0f} B，"
+              f"节省 {saved / converted:.0f} B")
+        if not dry_run:
+            print("   提示：空间在 VACUUM 后复用，如需归还磁盘请在低峰期执行 VACUUM FULL analysis_results")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--batch", type=int, default=200)
+    parser.add_argument("--dry-run", action="store_true", help="只统计可节省的字节数，不写入（仍会执行建列）")
+    parser.add_argument("--no-backfill", action="store_true", help="只建列，不回填存量数据")
+    args = parser.parse_args()
+
+    from database.connection import engine
+
+    try:
+        await _migrate(engine)
+        print("✅ 转写存储 v2 迁移已完成")
+        if not args.no_backfill:
+            await _backfill(engine, args.batch, args.dry_run)
+    except Exception as e:
+        print(f"❌ 迁移失败: {e}")
+        raise
+    finally:
+        await engine.dispose()
+
+if __name__ == "__main__":
+    asyncio.run(main())
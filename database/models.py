@@ -2,7 +2,7 @@
 数据库模型定义
 使用SQLAlchemy ORM定义所有表结构
 """
-from sqlalchemy import Column, String, Integer, Boolean, DateTime, ForeignKey, Text, ARRAY, JSON, Float, UniqueConstraint
+from sqlalchemy import Column, String, Integer, SmallInteger, Boolean, DateTime, ForeignKey, Text, ARRAY, JSON, Float, BigInteger, LargeBinary, UniqueConstraint, Index, text
 from sqlalchemy.dialects.postgresql import UUID, JSONB
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
@@ -23,6 +23,7 @@ class User(Base):
     updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
     last_login_at = Column(DateTime(timezone=True))
     is_active = Column(Boolean, default=True)
+    profiles_version = Column(Integer, nullable=False, default=0, server_default=text("0"))  # 档案增删改时 +1，任务详情预渲染按此失效
 
     # 关系
     sessions = relationship("Session", back_populates="user", cascade="all, delete-orphan")
@@ -42,11 +43,14 @@ class Session(Base):
     error_message = Column(Text)  # 分析失败时的错误信息，供客户端展示
     analysis_stage = Column(String(100))  # 分析各阶段
     analysis_stage_detail = Column(JSONB, nullable=True)  # 阶段详情，如 {"skills_matched": 3, "skill_names": ["职场丛林"]}
+    analysis_stage_started_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=True)  # 当前阶段开始时间，仅阶段切换时写入
     emotion_score = Column(Integer)
     speaker_count = Column(Integer)
     tags = Column(ARRAY(String))
     audio_url = Column(String(500), nullable=True)   # 原音频 OSS URL，供剪切与声纹使用
     audio_path = Column(String(500), nullable=True)  # 原音频本地路径（无 OSS 时使用）
+    audio_sha256 = Column(String(64), nullable=True)  # 上传内容 SHA-256，用于重复上传去重与分析结果复用
+    audio_size_bytes = Column(BigInteger, nullable=True)  # 原音频字节数，供进度 ETA 模型预测
     image_status = Column(String(20), default="pending")  # pending|generating|completed|failed
     created_at = Column(DateTime(timezone=True), server_default=func.now(), index=True)
     updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
@@ -56,6 +60,10 @@ class Session(Base):
     analysis_result = relationship("AnalysisResult", back_populates="session", uselist=False, cascade="all, delete-orphan")
     strategy_analysis = relationship("StrategyAnalysis", back_populates="session", uselist=False, cascade="all, delete-orphan")
 
+    __table_args__ = (
+        Index("idx_sessions_user_audio_sha256", "user_id", "audio_sha256", postgresql_where=text("audio_sha256 IS NOT NULL")),
+    )
+
 
 class AnalysisResult(Base):
     """分析结果表"""
@@ -63,16 +71,23 @@ class AnalysisResult(Base):
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     session_id = Column(UUID(as_uuid=True), ForeignKey("sessions.id", ondelete="CASCADE"), nullable=False, unique=True, index=True)
-    dialogues = Column(JSONB, nullable=False)  # 对话内容数组
+    dialogues = Column(JSONB, nullable=True)  # 对话内容数组（v1；v2 为空，由 transcript_blob 派生）
     risks = Column(ARRAY(String))  # 风险点数组
     summary = Column(Text)
     mood_score = Column(Integer)
     stats = Column(JSONB)  # 统计数据
-    transcript = Column(Text)
-    call1_result = Column(JSONB)  # Call #1 分析结果
+    transcript = Column(Text)  # 转写 JSON 字符串（v1；v2 为空）
+    call1_result = Column(JSONB)  # Call #1 分析结果（v2 不内嵌 transcript）
+    storage_version = Column(SmallInteger, nullable=False, default=1, server_default=text("1"))  # 转写存储格式，见 utils/transcript_codec.py
+    transcript_blob = Column(LargeBinary, nullable=True)  # v2：唯一一份压缩列式转写
+    transcript_chars = Column(Integer, nullable=True)  # 转写 JSON 字符数（ETA 特征，v2 无需解码即可取）
+    detail_payload = Column(LargeBinary, nullable=True)  # 任务详情展示字段预渲染（压缩 JSON），见 services/detail_render.py
+    detail_stamp = Column(String(80), nullable=True)  # 渲染版本:档案版本:updated_at，不一致即过期
+    detail_hash = Column(String(64), nullable=True)  # 预渲染内容摘要（ETag）
     speaker_mapping = Column(JSONB, nullable=True)  # Speaker_0/Speaker_1 -> profile_id 映射
     card_title = Column(String(100), nullable=True)  # 对话核心主题短标题（≤30字）
     conversation_summary = Column(Text, nullable=True)  # 「谁和谁对话」总结（第二次 Gemini）
+    is_partial = Column(Boolean, nullable=False, default=False, server_default=text("false"))  # 实时录音中的部分转写
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
 
@@ -189,3 +204,92 @@ class UserSkillPreference(Base):
     )
 
     user = relationship("User", backref="skill_preferences")
+
+
+class PipelineJob(Base):
+    """流水线任务表（持久化队列：分析 / 策略生成）"""
+    __tablename__ = "pipeline_jobs"
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    job_type = Column(String(50), nullable=False)  # analyze | strategy
+    session_id = Column(UUID(as_uuid=True), ForeignKey("sessions.id", ondelete="CASCADE"), nullable=True, index=True)
+    user_id = Column(UUID(as_uuid=True), nullable=True)
+    payload = Column(JSONB, nullable=False, default={})  # 任务参数，如 {"file_path": ..., "file_filename": ...}
+    status = Column(String(20), nullable=False, default="queued")  # queued|running|done|failed
+    attempts = Column(Integer, nullable=False, default=0)  # 已认领次数（含被回收的）
+    max_attempts = Column(Integer, nullable=False, default=3)
+    run_after = Column(DateTime(timezone=True), nullable=False, server_default=func.now())  # 最早可执行时间（重试退避）
+    lease_owner = Column(String(100))  # 持有租约的 worker 标识
+    lease_expires_at = Column(DateTime(timezone=True))  # 租约到期时间，过期未续约则被回收
+    heartbeat_at = Column(DateTime(timezone=True))
+    last_error = Column(Text)
+    started_at = Column(DateTime(timezone=True))
+    finished_at = Column(DateTime(timezone=True))
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+    __table_args__ = (
+        Index("idx_pipeline_jobs_claim", "run_after", "created_at", postgresql_where=text("status = 'queued'")),
+        Index("idx_pipeline_jobs_lease", "lease_expires_at", postgresql_where=text("status = 'running'")),
+        # 同一 session 同一类型只允许一个未完成任务（入队 ON CONFLICT DO NOTHING 依赖此索引）
+        Index("uq_pipeline_jobs_active", "job_type", "session_id", unique=True,
+              postgresql_where=text("status IN ('queued', 'running')")),
+    )
+
+
+class UploadIdempotencyKey(Base):
+    """上传幂等键：客户端超时重试携带同一 Idempotency-Key 时返回已创建的 session（多 worker 共享）"""
+    __tablename__ = "upload_idempotency_keys"
+
+    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    idem_key = Column(String(200), primary_key=True)
+    session_id = Column(UUID(as_uuid=True), ForeignKey("sessions.id", ondelete="CASCADE"), nullable=False)
+    audio_sha256 = Column(String(64), nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    expires_at = Column(DateTime(timezone=True), nullable=False, index=True)
+
+
+class PipelineStageTiming(Base):
+    """流水线分阶段耗时（ingest / gemini_upload / generate / skill:<id> ...），供分位数统计"""
+    __tablename__ = "pipeline_stage_timings"
+
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    session_id = Column(UUID(as_uuid=True), nullable=True, index=True)  # 不设外键：会话删除后统计仍保留
+    stage = Column(String(64), nullable=False)
+    started_at = Column(DateTime(timezone=True), nullable=False)
+    duration_ms = Column(Integer, nullable=False)
+    file_size = Column(BigInteger, nullable=True)
+    chunk_count = Column(Integer, nullable=True)
+    retries = Column(Integer, nullable=False, default=0)
+    model = Column(String(100), nullable=True)
+    outcome = Column(String(16), nullable=False, default="ok")  # ok | error | skipped
+
+    __table_args__ = (
+        Index("idx_pipeline_stage_timings_stage_time", "stage", "started_at"),
+    )
+
+
+class PipelineCheckpoint(Base):
+    """流水线阶段检查点：已完成阶段的产物（Gemini 文件 / Call1 / speaker_mapping / 技能结果 ...），供失败后断点续跑"""
+    __tablename__ = "pipeline_checkpoints"
+
+    session_id = Column(UUID(as_uuid=True), ForeignKey("sessions.id", ondelete="CASCADE"), primary_key=True)
+    stage = Column(String(64), primary_key=True)  # gemini_files | call1 | speaker_mapping | skill:<id> ...
+    data = Column(JSONB, nullable=False)
+    expires_at = Column(DateTime(timezone=True), nullable=False, index=True)  # Gemini 文件 48h；其余默认 7 天
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+
+class GeminiFileCache(Base):
+    """Gemini 文件句柄缓存：按内容 SHA-256 复用 Files API 上已上传的音频（文件 48 小时后由 Gemini 删除）"""
+    __tablename__ = "gemini_file_cache"
+
+    sha256 = Column(String(64), primary_key=True)
+    file_name = Column(String(200), nullable=False)  # files/xxx
+    mime_type = Column(String(100), nullable=True)
+    size_bytes = Column(BigInteger, nullable=True)
+    hits = Column(Integer, nullable=False, default=0, server_default=text("0"))
+    expires_at = Column(DateTime(timezone=True), nullable=False, index=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    last_used_at = Column(DateTime(timezone=True), server_default=func.now())
@@ -7,6 +7,7 @@ import os
 import re
 import json
 import time
+import math
 import tempfile
 import traceback
 import logging
@@ -21,7 +22,7 @@ from datetime import datetime
 import google.generativeai as genai
 from google import genai as genai_new  # 新的 SDK 用于图片生成
 from google.genai import types as genai_types
-from fastapi import FastAPI, UploadFile, File, HTTPException, Query, Depends, Request
+from fastapi import FastAPI, UploadFile, File, HTTPException, Query, Depends, Request, Header
 from fastapi.responses import JSONResponse, Response
 from pydantic import BaseModel
 from dotenv import load_dotenv
@@ -102,8 +103,50 @@ async def lifespan(app: FastAPI):
     except Exception as e:
         logger.error(f"❌ 数据库初始化失败: {e}")
         logger.error(traceback.format_exc())
+    try:
+        from utils.audio_ingest import sweep_orphan_blobs
+        await asyncio.to_thread(sweep_orphan_blobs)
+    except Exception as e:
+        logger.warning(f"[落盘] 孤儿 blob 清理失败: {e}")
+    # 内嵌任务 worker（部署独立 worker 时设 PIPELINE_EMBEDDED_WORKER=false）
+    pipeline_worker = None
+    pipeline_worker_task = None
+    if JOB_QUEUE_ENABLED and JOB_EMBEDDED_WORKER:
+        pipeline_worker = create_pipeline_worker()
+        pipeline_worker_task = asyncio.create_task(pipeline_worker.run())
+    # 进度 ETA 模型：后台定期用历史阶段耗时重新拟合
+    eta_model.start_refresher()
+    # Gemini 文件句柄缓存：后台批量清理过期文件（GEMINI_FILE_CACHE_ENABLED=true 时）
+    gemini_file_cache.start_sweeper()
+    # 客户端直传：后台清理超时未 complete 的 uploading 会话及 OSS 未完成分片
+    direct_upload.start_sweeper()
+    # 实时录音：后台接管进程中断后停在 recording 的会话
+    live_audio.start_sweeper()
     yield
     # === shutdown ===
+    if pipeline_worker is not None:
+        pipeline_worker.stop()
+        try:
+            await asyncio.wait_for(pipeline_worker_task, timeout=30)
+        except Exception as e:
+            logger.warning(f"[队列] 内嵌 worker 退出异常: {e}")
+    eta_model.stop_refresher()
+    gemini_file_cache.stop_sweeper()
+    direct_upload.stop_sweeper()
+    live_audio.stop_sweeper()
+    try:
+        await stage_timing.shutdown()
+    except Exception as e:
+        logger.warning(f"[耗时] 落库剩余阶段耗时出错: {e}")
+    try:
+        from services.progress import progress_hub
+        await progress_hub.close()
+    except Exception as e:
+        logger.warning(f"[进度] 关闭进度订阅出错: {e}")
+    try:
+        await gemini_client.aclose()
+    except Exception as e:
+        logger.warning(f"关闭 Gemini 连接池时出错: {e}")
     try:
         await close_db()
         logger.info("✅ 数据库连接已关闭")
@@ -160,13 +203,33 @@ app.include_router(profiles_router)
 from api.audio_segments import router as audio_segments_router
 app.include_router(audio_segments_router)
 
+# 注册客户端直传 OSS 路由
+from api import direct_upload
+from api.direct_upload import router as direct_upload_router
+app.include_router(direct_upload_router)
+
+# 注册实时录音（边录边转写）路由
+from api import live_audio
+from api.live_audio import router as live_audio_router
+app.include_router(live_audio_router)
+
 # 导入数据库相关
 from database.connection import get_db, init_db, close_db
 from database.models import User, Session, AnalysisResult, StrategyAnalysis, Skill, SkillExecution, Profile
 from auth.jwt_handler import get_current_user_id, get_current_user
-from sqlalchemy import select, func, text
+from sqlalchemy import select, func, text, delete
 from sqlalchemy.ext.asyncio import AsyncSession
 
+# Gemini REST 异步客户端（分析流水线使用）
+from services import checkpoints, eta_model, gemini_client, gemini_file_cache, gemini_gateway, stage_timing
+from services.progress import transition_stage
+from utils import transcript_codec
+
+# 导入持久化任务队列
+from services.job_queue import (
+    JOB_ANALYZE, JOB_STRATEGY, JOB_QUEUE_ENABLED, JOB_EMBEDDED_WORKER, JobWorker, enqueue_job,
+)
+
 # 导入技能模块
 from skills.router import classify_scene, match_skills
 from skills.registry import get_skill, initialize_skills
@@ -295,100 +358,6 @@ except Exception as e:
     logger.error(f"配置 Gemini API 时出错: {e}")
     raise
 
-# ── Monkey-patch FileServiceClient.create_file 绕过 Discovery API ─────────────
-# 根本原因：SDK 在上传文件前必须调用 $discovery/rest 获取 API schema，
-# 但该端点不接受 AI Studio API key（AQ.xxx 格式），导致 400 API_KEY_INVALID。
-# 修复：直接 HTTP 上传到 /upload/v1beta/files，绕过 Discovery，再用 gRPC get_file 取元数据。
-def _patch_gemini_file_upload():
-    try:
-        import mimetypes
-        import pathlib
-        from io import IOBase
-        import httpx
-        import google.generativeai.client as _genai_client
-
-        original_create_file = _genai_client.FileServiceClient.create_file
-
-        def _patched_create_file(self, path, *, mime_type=None, name=None, display_name=None, resumable=True, metadata=()):
-            api_key = getattr(self._client_options, "api_key", None)
-            if not api_key:
-                logger.warning("[直传] 无 api_key，回退到原始 create_file")
-                return original_create_file(self, path=path, mime_type=mime_type, name=name,
-                                            display_name=display_name, resumable=resumable, metadata=metadata)
-
-            # 读取文件内容
-            if isinstance(path, IOBase):
-                file_data = path.read()
-            else:
-                path = pathlib.Path(path)
-                with open(path, "rb") as f:
-                    file_data = f.read()
-                if display_name is None:
-                    display_name = path.name
-                if mime_type is None:
-                    mime_type, _ = mimetypes.guess_type(str(path))
-            if mime_type is None:
-                mime_type = "application/octet-stream"
-
-            file_size = len(file_data)
-            base_url = "https://generativelanguage.googleapis.com"
-            file_meta = {}
-            if name:
-                file_meta["name"] = name
-            if display_name:
-                file_meta["displayName"] = display_name
-
-            logger.info(f"[直传] 开始上传文件: {display_name} ({file_size / 1024 / 1024:.2f} MB) 绕过 Discovery API")
-
-            with httpx.Client(timeout=300) as client:
-                # Step 1: 初始化 resumable 上传
-                init_resp = client.post(
-                    f"{base_url}/upload/v1beta/files?key={api_key}&uploadType=resumable",
-                    headers={
-                        "X-Goog-Upload-Protocol": "resumable",
-                        "X-Goog-Upload-Command": "start",
-                        "X-Goog-Upload-Header-Content-Length": str(file_size),
-                        "X-Goog-Upload-Header-Content-Type": mime_type,
-                        "Content-Type": "application/json",
-                    },
-                    json={"file": file_meta},
-                )
-                if init_resp.status_code not in (200, 201):
-                    raise Exception(f"[直传] 初始化上传失败: {init_resp.status_code}: {init_resp.text[:300]}")
-
-                upload_url = init_resp.headers.get("X-Goog-Upload-URL")
-                if not upload_url:
-                    raise Exception(f"[直传] 未获取到 upload URL，响应: {init_resp.text[:200]}")
-
-                # Step 2: 上传文件内容
-                upload_resp = client.post(
-                    upload_url,
-                    headers={
-                        "Content-Length": str(file_size),
-                        "X-Goog-Upload-Offset": "0",
-                        "X-Goog-Upload-Command": "upload, finalize",
-                    },
-                    content=file_data,
-                )
-                if upload_resp.status_code not in (200, 201):
-                    raise Exception(f"[直传] 文件上传失败: {upload_resp.status_code}: {upload_resp.text[:300]}")
-
-                file_info = upload_resp.json().get("file", {})
-                file_name = file_info.get("name", "")
-                if not file_name:
-                    raise Exception(f"[直传] 上传成功但未返回 file name: {upload_resp.text[:200]}")
-
-            logger.info(f"[直传] ✅ 文件上传成功，name={file_name}，通过 gRPC 获取元数据")
-            # Step 3: 通过 gRPC 获取 File 对象（不需要 Discovery API）
-            return self.get_file({"name": file_name})
-
-        _genai_client.FileServiceClient.create_file = _patched_create_file
-        logger.info("✅ [直传] 已 patch FileServiceClient.create_file，绕过 $discovery/rest")
-    except Exception as _pe:
-        logger.warning(f"⚠️ [直传] patch 失败，将使用原始上传（可能遇到 Discovery API 问题）: {_pe}")
-
-_patch_gemini_file_upload()
-
 # 配置阿里云 OSS
 OSS_ACCESS_KEY_ID = os.getenv("OSS_ACCESS_KEY_ID")
 OSS_ACCESS_KEY_SECRET = os.getenv("OSS_ACCESS_KEY_SECRET")
@@ -454,43 +423,14 @@ class Call1Response(BaseModel):
     summary: str  # 对话总结
     card_title: Optional[str] = None  # 对话核心主题短标题（≤30字）
     transcript: List[TranscriptItem]  # 转录列表
+    conversation_summary: Optional[str] = None  # 单次分析模式：「谁和谁对话」总结（说话人为 Speaker_X，落库前本地替换为档案名）
 
 # Call #2 数据模型（策略分析）- 从 schemas 导入，避免与 skills 循环依赖
 from schemas.strategy_schemas import StrategyItem, VisualData, Call2Response, parse_gemini_response
-
-
-def wait_for_file_active(file: Any, max_wait_time=300) -> Any:
-    """
-    等待文件状态变为 ACTIVE
-    
-    Args:
-        file: Gemini 文件对象
-        max_wait_time: 最大等待时间（秒），默认 5 分钟
-        
-    Returns:
-        状态为 ACTIVE 的文件对象
-    """
-    start_time = time.time()
-    logger.info(f"[wait_for_file_active] 等待文件处理，当前状态: {file.state}")
-    
-    while file.state.name == "PROCESSING":
-        elapsed = time.time() - start_time
-        if elapsed > max_wait_time:
-            raise Exception(f"文件处理超时（超过 {max_wait_time} 秒），当前状态: {file.state}")
-        
-        time.sleep(2)
-        try:
-            file = genai.get_file(file.name)
-            logger.info(f"[wait_for_file_active] 文件状态: {file.state} (已等待 {int(elapsed)} 秒)")
-        except Exception as e:
-            logger.warning(f"[wait_for_file_active] 获取文件状态时出错: {e}")
-            time.sleep(2)
-            continue
-    
-    if file.state.name != "ACTIVE":
-        raise Exception(f"文件处理失败，状态: {file.state}")
-    
-    return file
+from schemas.gemini_schemas import (
+    CALL1_MAP_SCHEMA, CALL1_REDUCE_SCHEMA, CALL1_REDUCE_SINGLE_PASS_SCHEMA, CALL1_SCHEMA, CALL1_SINGLE_PASS_SCHEMA,
+    json_config,
+)
 
 
 def upload_image_to_oss(image_bytes: bytes, user_id: str, session_id: str, image_index: int,
@@ -554,6 +494,10 @@ def upload_image_to_oss(image_bytes: bytes, user_id: str, session_id: str, image
 
 # 原音频是否上传阿里云 OSS（默认 false：仅本地，直接走 Gemini）
 USE_OSS_FOR_ORIGINAL_AUDIO = os.getenv("USE_OSS_FOR_ORIGINAL_AUDIO", "false").lower() == "true"
+# 原音频上传 OSS：超过阈值走分片上传（字节）
+OSS_MULTIPART_THRESHOLD = int(os.getenv("OSS_MULTIPART_THRESHOLD_MB", "10")) * 1024 * 1024
+OSS_MULTIPART_PART_SIZE = int(os.getenv("OSS_MULTIPART_PART_MB", "5")) * 1024 * 1024
+OSS_MULTIPART_THREADS = int(os.getenv("OSS_MULTIPART_THREADS", "4"))
 
 
 def persist_original_audio(
@@ -576,11 +520,16 @@ def persist_original_audio(
 
     if USE_OSS_FOR_ORIGINAL_AUDIO and USE_OSS and oss_bucket is not None:
         try:
+            import oss2
             oss_key = f"sessions/{user_id}/{session_id}/original{file_ext}"
-            with open(temp_file_path, "rb") as f:
-                content = f.read()
             headers = {"Content-Type": "audio/mp4" if file_ext == ".m4a" else "application/octet-stream"}
-            oss_bucket.put_object(oss_key, content, headers=headers)
+            # 从文件流式上传：超过阈值走分片（多线程），内存占用与文件大小无关
+            oss2.resumable_upload(
+                oss_bucket, oss_key, temp_file_path, headers=headers,
+                multipart_threshold=OSS_MULTIPART_THRESHOLD,
+                part_size=OSS_MULTIPART_PART_SIZE,
+                num_threads=OSS_MULTIPART_THREADS,
+            )
             if OSS_CDN_DOMAIN:
                 audio_url = f"https://{OSS_CDN_DOMAIN}/{oss_key}"
             else:
@@ -603,8 +552,9 @@ def persist_original_audio(
         local_name = f"{session_id}{file_ext}"
         dest_path = os.path.join(storage_dir, local_name)
         try:
-            import shutil
-            shutil.copy2(temp_file_path, dest_path)
+            from utils.audio_ingest import link_file
+            # 与上传文件同一 inode（硬链接），不再复制整份音频
+            link_file(temp_file_path, dest_path)
             audio_path = dest_path
             logger.info(f"[分析-{session_id}] 原音频已保存到本地: {audio_path}")
         except Exception as e:
@@ -837,12 +787,10 @@ def generate_image_from_prompt(
     Returns:
         图片 URL 或 Base64，失败返回 None
     """
-    from google.generativeai.types import HarmCategory, HarmBlockThreshold
-
     # ── 图片生成模型：gemini-2.5-flash-image（支持多模态：风格参考图 + 档案参考图）──
     IMAGE_GEN_MODEL = "gemini-3.1-flash-image-preview"  # Nano Banana 2
 
-    model = genai.GenerativeModel(IMAGE_GEN_MODEL)
+    model = gemini_gateway.get_model(IMAGE_GEN_MODEL)
 
     # 构建 prompt：风格前缀 + 主体描述
     key = (style_key or "ghibli").strip().lower()
@@ -899,260 +847,67 @@ def generate_image_from_prompt(
         logger.info(f"[图片生成] 使用 {len(reference_images)} 张档案照片作为人物参考图")
     contents_list.append(full_prompt)
 
-    for attempt in range(max_retries):
-        try:
-            if attempt > 0:
-                logger.info(f"========== 重试生成图片 (第 {attempt + 1}/{max_retries} 次) ==========")
-            else:
-                logger.info(f"========== 开始生成图片 ==========")
+    logger.info(f"========== 开始生成图片 ==========")
+    logger.info(f"提示词长度: {len(full_prompt)} 字符 参考图数={len(contents_list)-1}")
+    logger.debug(f"提示词内容: {full_prompt[:200]}...")
+    logger.info(f"调用模型: {IMAGE_GEN_MODEL} (4:3) 风格={key}")
+    try:
+        # 重试（含 429 retryDelay 等待）由网关统一处理
+        start_time = time.time()
+        response = model.generate_content(contents_list, purpose="image", max_attempts=max_retries)
+        generate_time = time.time() - start_time
+        logger.info(f"✅ 图片生成成功，耗时: {generate_time:.2f} 秒（重试 {response.retries} 次）")
+    except Exception as e:
+        error_code = getattr(e, 'status_code', None)
+        error_message = str(e)
+        logger.error(f"❌ 生成图片失败: {type(e).__name__} {error_code or ''} - {error_message[:500]}")
+        if error_code == 429 and ('limit: 0' in error_message or 'free_tier' in error_message.lower()):
+            logger.error("❌ 检测到免费层配额限制 (limit: 0)")
+            logger.error("💡 建议检查:")
+            logger.error("   1. 确认 API Key 是否关联到付费项目")
+            logger.error("   2. 在 Google Cloud Console 检查配额设置")
+            logger.error("   3. 确认已启用图片生成 API 的付费配额")
+            logger.error("   4. 可能需要等待几分钟让配额刷新")
+        logger.error(traceback.format_exc())
+        return None
 
-            logger.info(f"提示词长度: {len(full_prompt)} 字符 参考图数={len(contents_list)-1}")
-            logger.debug(f"提示词内容: {full_prompt[:200]}...")
-            logger.info(f"调用模型: {IMAGE_GEN_MODEL} (4:3) 风格={key}")
+    # 提取图片数据（响应 parts 中的 inline_data）
+    images = response.images
+    if not images:
+        logger.warning("⚠️ 响应中没有找到图片数据")
+        return None
+    image_bytes = images[0][0]
+    logger.info(f"✅ 图片数据提取成功，大小: {len(image_bytes)} 字节")
+
+    # 尝试上传到 OSS
+    if USE_OSS and oss_bucket is not None:
+        logger.info(f"尝试上传图片到 OSS...")
+        image_url = upload_image_to_oss(image_bytes, user_id, session_id, image_index)
+        if image_url:
+            logger.info(f"✅ 图片已上传到 OSS，URL: {image_url}")
+            return image_url
+        else:
+            logger.warning("⚠️ OSS 上传失败，降级到 Base64")
 
-            start_time = time.time()
-            response = model.generate_content(contents_list)
-            generate_time = time.time() - start_time
-
-            logger.info(f"✅ 图片生成成功，耗时: {generate_time:.2f} 秒")
-
-            # 提取图片数据（从 response.parts 中找 inline_data）
-            image_bytes = None
-            for part in response.parts:
-                if part.inline_data is not None:
-                    image_bytes = part.inline_data.data
-                    logger.info(f"✅ 图片数据提取成功，大小: {len(image_bytes)} 字节")
-                    break
-            if not image_bytes:
-                logger.warning("⚠️ 响应中没有找到图片数据")
-                return None
-            
-            # 尝试上传到 OSS
-            if USE_OSS and oss_bucket is not None:
-                logger.info(f"尝试上传图片到 OSS...")
-                image_url = upload_image_to_oss(image_bytes, user_id, session_id, image_index)
-                if image_url:
-                    logger.info(f"✅ 图片已上传到 OSS，URL: {image_url}")
-                    return image_url
-                else:
-                    logger.warning("⚠️ OSS 上传失败，降级到 Base64")
-            
-            # 如果 OSS 未启用或上传失败，降级到 Base64
-            logger.info("使用 Base64 编码返回图片")
-            image_base64 = base64.b64encode(image_bytes).decode('utf-8')
-            logger.info(f"✅ 图片 Base64 编码完成，大小: {len(image_base64)} 字符")
-            return image_base64
-            
-        except ClientError as e:
-            error_code = getattr(e, 'status_code', None)
-            error_message = str(e)
-            
-            # 处理 429 配额超限错误
-            if error_code == 429 or '429' in error_message or 'RESOURCE_EXHAUSTED' in error_message:
-                # 尝试从错误信息中提取重试延迟（re 已在文件顶部 import）
-                retry_delay = 15  # 默认延迟 15 秒
-                if 'retry in' in error_message.lower() or 'retryDelay' in error_message:
-                    delay_match = re.search(r'retry in ([\d.]+)s', error_message, re.IGNORECASE)
-                    if delay_match:
-                        retry_delay = max(15, int(float(delay_match.group(1))) + 2)  # 至少等待 15 秒，多加 2 秒缓冲
-                
-                logger.warning(f"⚠️ 配额超限 (429)，等待 {retry_delay} 秒后重试...")
-                logger.warning(f"错误详情: {error_message[:500]}")
-                
-                # 检查是否是免费层配额为 0 的问题
-                if 'limit: 0' in error_message or 'free_tier' in error_message.lower():
-                    logger.error("❌ 检测到免费层配额限制 (limit: 0)")
-                    logger.error("💡 建议检查:")
-                    logger.error("   1. 确认 API Key 是否关联到付费项目")
-                    logger.error("   2. 在 Google Cloud Console 检查配额设置")
-                    logger.error("   3. 确认已启用图片生成 API 的付费配额")
-                    logger.error("   4. 可能需要等待几分钟让配额刷新")
-                
-                if attempt < max_retries - 1:
-                    logger.info(f"等待 {retry_delay} 秒后重试...")
-                    time.sleep(retry_delay)
-                    continue
-                else:
-                    logger.error(f"❌ 重试 {max_retries} 次后仍然失败，放弃生成图片")
-                    logger.error(f"最终错误: {error_message[:500]}")
-                    return None
-            else:
-                # 其他类型的 ClientError
-                logger.error(f"❌ 生成图片失败 (ClientError): {error_code} - {error_message[:500]}")
-                if attempt < max_retries - 1:
-                    wait_time = (attempt + 1) * 5  # 指数退避：5秒、10秒、15秒
-                    logger.info(f"等待 {wait_time} 秒后重试...")
-                    time.sleep(wait_time)
-                    continue
-                else:
-                    logger.error(traceback.format_exc())
-                    return None
-                    
-        except Exception as e:
-            logger.error(f"❌ 生成图片失败: {e}")
-            logger.error(f"错误类型: {type(e).__name__}")
-            if attempt < max_retries - 1:
-                wait_time = (attempt + 1) * 5  # 指数退避
-                logger.info(f"等待 {wait_time} 秒后重试...")
-                time.sleep(wait_time)
-                continue
-            else:
-                logger.error(f"完整错误堆栈:")
-                logger.error(traceback.format_exc())
-                return None
-    
-    return None
+    # 如果 OSS 未启用或上传失败，降级到 Base64
+    logger.info("使用 Base64 编码返回图片")
+    image_base64 = base64.b64encode(image_bytes).decode('utf-8')
+    logger.info(f"✅ 图片 Base64 编码完成，大小: {len(image_base64)} 字符")
+    return image_base64
 
 
 # 大文件分片阈值：超过此大小时切分为多个 ≤18MB 片段分别上传 Gemini
 CHUNK_SIZE_MB = 18.0
+# 内联阈值：不超过此大小的录音以 inline_data 随 generateContent 请求发送，跳过 Files API
+# （上传 / 轮询 ACTIVE / 删除）往返。请求体上限 20MB，base64 膨胀约 4/3，故默认 14MB；设为 0 关闭
+GEMINI_INLINE_MAX_MB = float(os.getenv("GEMINI_INLINE_MAX_MB", "14"))
+# Call1（整段与分片 map）走流式 generateContent：边生成边增量解析（utils.json_stream），
+# 已完成的转写条目按批写入部分结果（services.partial_transcript），响应截断时保留已生成部分
+GEMINI_STREAM_CALL1 = os.getenv("GEMINI_STREAM_CALL1", "true").lower() in ("true", "1", "yes")
 
 
-def _upload_single_file_to_gemini(
-    path: str,
-    display_name: str,
-    _sid: str,
-    no_proxy: bool,
-    use_resumable: bool,
-    upload_timeout: int,
-    max_retries: int = 3,
-):
-    """上传单个文件到 Gemini，带重试。返回 uploaded_file 对象。"""
-    import concurrent.futures
-    retry_count = 0
-    current_resumable = use_resumable
-    while retry_count < max_retries:
-        try:
-            logger.info(f"[分析-{_sid}-step3] 尝试上传（第 {retry_count + 1}/{max_retries} 次，resumable={current_resumable}，超时={upload_timeout}s）...")
-            start_upload = time.time()
-            with concurrent.futures.ThreadPoolExecutor(max_workers=1) as ex:
-                fut = ex.submit(
-                    genai.upload_file,
-                    path=path,
-                    display_name=display_name,
-                    resumable=current_resumable,
-                )
-                try:
-                    uploaded_file = fut.result(timeout=upload_timeout)
-                except concurrent.futures.TimeoutError:
-                    raise Exception(f"Gemini 文件上传超时（{upload_timeout}秒）")
-            logger.info(f"[分析-{_sid}-step4] ✅ 文件上传成功！name={uploaded_file.name} 耗时={time.time()-start_upload:.2f}s")
-            return uploaded_file
-        except Exception as e:
-            retry_count += 1
-            error_msg = str(e)
-            logger.error(f"[分析-{_sid}-step3] ❌ 上传失败（第 {retry_count}/{max_retries}）{error_msg}")
-            if ("string indices must be integers" in error_msg or "not 'str'" in error_msg) and current_resumable:
-                current_resumable = False
-                retry_count -= 1
-            if retry_count >= max_retries:
-                raise Exception(f"上传文件失败（已重试 {max_retries} 次）: {error_msg}")
-            time.sleep(5)
-
-
-async def analyze_audio_from_path(temp_file_path: str, file_filename: str, session_id: Optional[str] = None) -> Tuple[AudioAnalysisResponse, Optional[Call1Response]]:
-    """
-    从文件路径分析音频文件（内部函数）
-    若文件 > 18MB，自动切分为多个 ≤18MB 片段，分别上传 Gemini 后合并分析。
-    
-    Args:
-        temp_file_path: 临时文件路径
-        file_filename: 文件名
-        
-    Returns:
-        元组：(AudioAnalysisResponse, Optional[Call1Response])
-    """
-    uploaded_file = None
-    uploaded_files_list: List[Any] = []
-    chunk_paths_to_clean: List[str] = []
-    _sid = session_id or "?"
-    
-    try:
-        logger.info(f"[分析-{_sid}-step1] ========== 文件上传处理开始 ==========")
-        logger.info(f"[分析-{_sid}-step1] 文件已保存到临时路径: {temp_file_path}")
-        
-        file_size = os.path.getsize(temp_file_path)
-        file_size_mb = file_size / 1024 / 1024
-        logger.info(f"[分析-{_sid}-step2] 文件名: {file_filename} 大小: {file_size} 字节 ({file_size_mb:.2f} MB)")
-        
-        no_proxy = os.getenv("GEMINI_FILE_UPLOAD_NO_PROXY", "").lower() == "true"
-        use_resumable = False if no_proxy else True
-        _genai_client = None
-        _old_discovery_url = None
-        if no_proxy:
-            try:
-                import google.generativeai.client as _genai_client
-                _old_discovery_url = getattr(_genai_client, "GENAI_API_DISCOVERY_URL", None)
-                _genai_client.GENAI_API_DISCOVERY_URL = "https://generativelanguage.googleapis.com/$discovery/rest"
-                logger.info("文件上传已切换为直连 Gemini（GEMINI_FILE_UPLOAD_NO_PROXY=true）")
-            except Exception as e:
-                logger.warning(f"切换直连失败: {e}，将继续使用代理")
-        
-        upload_timeout = int(os.getenv("GEMINI_UPLOAD_TIMEOUT", "90"))
-        
-        try:
-            if file_size > CHUNK_SIZE_MB * 1024 * 1024:
-                # 大文件：切分为多个 ≤18MB 片段，分别上传后一起传给 Gemini
-                from utils.audio_storage import split_audio_into_chunks
-                logger.info(f"[分析-{_sid}] 大文件（{file_size_mb:.1f} MB > {CHUNK_SIZE_MB} MB），切分后多文件上传")
-                chunks = split_audio_into_chunks(
-                    temp_file_path,
-                    max_chunk_mb=CHUNK_SIZE_MB,
-                    base_name=f"gemini_{_sid[:8]}",
-                )
-                chunk_paths_to_clean = [c[2] for c in chunks]
-
-                # ── 并行上传所有分片（asyncio.gather + asyncio.to_thread）──────
-                logger.info(f"[分析-{_sid}] 并行上传 {len(chunks)} 个分片（串行改并行）...")
-
-                async def _upload_one_chunk(idx, chunk_path):
-                    cname = f"{file_filename}_片段{idx + 1}"
-                    uf = await asyncio.to_thread(
-                        _upload_single_file_to_gemini,
-                        chunk_path, cname, _sid, no_proxy, use_resumable, upload_timeout,
-                    )
-                    uf = await asyncio.to_thread(wait_for_file_active, uf, 600)
-                    logger.info(f"[分析-{_sid}] 分片{idx + 1} 已就绪: {uf.name}")
-                    return (idx, uf)
-
-                _upload_results = await asyncio.gather(
-                    *[_upload_one_chunk(i, cp) for i, (_, _, cp) in enumerate(chunks)],
-                    return_exceptions=True,
-                )
-                # 检查是否有上传失败
-                for _r in _upload_results:
-                    if isinstance(_r, Exception):
-                        raise _r
-                # 按原始顺序排列
-                for _, uf in sorted(_upload_results, key=lambda x: x[0]):
-                    uploaded_files_list.append(uf)
-                # ────────────────────────────────────────────────────────────
-
-                # 多文件时用统一变量，后续 generate_content 用 contents
-                uploaded_file = uploaded_files_list[0] if uploaded_files_list else None
-            else:
-                # 小文件：单文件上传
-                logger.info(f"[分析-{_sid}-step2] ========== 开始上传文件到 Gemini ==========")
-                uploaded_file = _upload_single_file_to_gemini(
-                    temp_file_path, file_filename, _sid, no_proxy, use_resumable, upload_timeout
-                )
-                logger.info(f"[分析-{_sid}-step5] 等待文件处理完成，当前状态: {uploaded_file.state}")
-                uploaded_file = wait_for_file_active(uploaded_file, max_wait_time=600)
-        finally:
-            if no_proxy and _genai_client is not None and _old_discovery_url is not None:
-                try:
-                    _genai_client.GENAI_API_DISCOVERY_URL = _old_discovery_url
-                    logger.info("已恢复文件服务 discovery URL")
-                except Exception:
-                    pass
-        
-        logger.info(f"[分析-{_sid}-step6] ✅ 文件 ACTIVE，即将调用 generate_content")
-        
-        model_name = GEMINI_FLASH_MODEL
-        model = genai.GenerativeModel(model_name)
-        
-        # 单文件 / 多文件 共用基础提示词
-        prompt_base = """角色: 你是一个专业的语音分析与行为观察专家。
+# Call1 基础提示词（整段 / 多片段合并分析共用）
+CALL1_PROMPT = """角色: 你是一个专业的语音分析与行为观察专家。
 
 任务: 请深入解析上传的音频文件，并输出严格格式化的 JSON 数据。
 
@@ -1205,114 +960,565 @@ async def analyze_audio_from_path(temp_file_path: str, file_filename: str, sessi
 注意：transcript 数组必须包含所有对话，按时间顺序排列，不要遗漏任何对话。
 
 IMPORTANT: The "summary" and "card_title" fields must be written in English."""
+
+# 单次分析模式：Call1（整段）/ reduce（分片）同时输出「谁和谁对话」总结，省去转写后的第二次 Gemini 调用；
+# 档案名在声纹匹配后按 speaker_mapping 本地替换。模型未返回该字段时回退第二次调用
+CALL1_SINGLE_PASS = os.getenv("CALL1_SINGLE_PASS", "true").lower() in ("true", "1", "yes")
+
+CALL1_CONVERSATION_SUMMARY_INSTRUCTION = """
+
+附加字段（放在 JSON 最后，risks 之后）：
+**conversation_summary**: (String) 用中文一两段话总结这是谁和谁的对话（角色关系、对话主题、双方立场等），不要列点。
+说话人一律用 transcript 中的标识（Speaker_0、Speaker_1 ...）指代，不要写「用户」，也不要猜测真实姓名。"""
+
+# 非单次分析（或 Call1 未返回总结）时的第二次调用；对话格式为 说话人: 内容（已映射档案的说话人为档案名）
+CONVERSATION_SUMMARY_PROMPT = """根据以下对话，总结这是谁和谁的对话（角色关系、对话主题、双方立场等）。对话格式为 说话人: 内容。请用一两段话概括，不要列点。
+
+对话：
+{display_text}
+
+总结："""
+
+# ── 分片 map-reduce 转写 ──────────────────────────────────────────────────────
+# 大文件每个分片独立转写（map，时间戳由服务端按分片起点平移），再用一次纯文本调用（reduce）
+# 基于合并后的转写生成 mood_score / summary / card_title / risks；单个分片失败不拖垮整体
+GEMINI_MAP_REDUCE = os.getenv("GEMINI_MAP_REDUCE", "true").lower() == "true"
+GEMINI_MAP_CONCURRENCY = max(1, int(os.getenv("GEMINI_MAP_CONCURRENCY", "4")))
+
+CALL1_MAP_PROMPT = """角色: 你是一个专业的语音分析与行为观察专家。
+
+任务: 你收到的是一段长录音中的一个片段，请只转写并统计这个片段，输出严格格式化的 JSON 数据。
+
+参数定义:
+
+1. **sigh_count**: (Integer) 识别并统计 Speaker_1 (用户) 在本片段中产生的长呼气或叹气次数。
+
+2. **laugh_count**: (Integer) 识别并统计本片段中出现的所有类型笑声。
+
+3. **transcript**: (Array) 按时间顺序包含本片段所有对话，每个对话包含：
+   - speaker: 说话人标识（如：Speaker_0, Speaker_1，其中Speaker_1为用户）
+   - text: 对话内容（完整原话）
+   - timestamp: 时间戳，相对于本片段开始（格式："MM:SS"，如"00:01"）
+   - is_me: (Boolean) 是否为用户说的（Speaker_1为true，其他为false）
+
+4. **risks**: (Array) 本片段中的关键风险点列表
+
+请务必以纯 JSON 格式返回，不要包含 Markdown 标记：
+{
+  "sigh_count": 0,
+  "laugh_count": 0,
+  "transcript": [{"speaker": "Speaker_0", "text": "具体说话内容", "timestamp": "00:01", "is_me": false}],
+  "risks": []
+}
+
+注意：transcript 必须包含本片段所有对话，不要遗漏。"""
+
+CALL1_REDUCE_PROMPT = """角色: 你是一个专业的对话分析专家。
+
+以下是一段录音的完整转写（格式：[MM:SS] 说话人: 内容，Speaker_1 为用户），以及各片段初步识别的风险点。
+请基于整段对话输出严格格式化的 JSON：
+
+1. **mood_score**: (Integer, 0-100) 根据语义冲突程度与情绪变化对对话氛围评分，越高越轻松愉快。
+2. **summary**: (String) A concise English summary of the conversation content, key conflicts, and emotional turning points (50-100 words).
+3. **card_title**: (String) A short English title (max 8 words) that captures the core topic or key conflict.
+4. **risks**: (Array) 合并去重后的关键风险点列表
+
+只返回纯 JSON，不要包含 Markdown 标记：
+{{"mood_score": 75, "summary": "...", "card_title": "...", "risks": ["风险点1"]}}
+
+各片段风险点：
+{risks}
+
+完整转写：
+{transcript}
+
+IMPORTANT: The "summary" and "card_title" fields must be written in English."""
+
+
+def _transcript_to_lines(items: List[dict]) -> str:
+    """转写 → 紧凑文本（reduce 只需文本，比 JSON 省 token）"""
+    return "\n".join(
+        f"[{t.get('timestamp') or '--:--'}] {t.get('speaker', '未知')}: {(t.get('text') or '').strip()}"
+        for t in items
+    )
+
+
+def _localize_speaker_labels(text: str, speaker_mapping: dict, profile_names: dict) -> str:
+    """
+    Speaker_X → 档案展示名（名字（关系））；未映射档案的说话人保持原标识（与第二次调用的对话格式一致）。
+    单个正则一遍替换（同 detail_render）：替换出的名字不会被二次改写，Speaker_1 不会命中 Speaker_10
+    """
+    table = {sp: profile_names.get(pid) for sp, pid in (speaker_mapping or {}).items()}
+    table = {sp: name for sp, name in table.items() if sp and name}
+    if not text or not table:
+        return text
+    keys = sorted(table, key=len, reverse=True)
+    pattern = re.compile("(?:" + "|".join(map(re.escape, keys)) + r")(?!\d)")
+    return pattern.sub(lambda m: table[m.group(0)], text)
+
+
+async def _transcribe_window(model, audio: dict, start_sec: float, end_sec: float, purpose: str = "transcribe_map",
+                             partial_writer=None, window: Any = None) -> dict:
+    """
+    单个分片 / 实时窗口转写（map）：时间戳按窗口起点平移为全局时间。
+    传入 partial_writer 时已完成的条目写入部分结果（流式时逐批，否则本窗口完成时一次）
+    """
+    from utils.transcript_time import shift_transcript
+    on_items = on_restart = None
+    if partial_writer is not None:
+        on_items = lambda items: partial_writer.add(window, start_sec, end_sec, shift_transcript(items, start_sec))
+        on_restart = lambda: partial_writer.reset(window)
+    with stage_timing.timed(purpose, model=model.model_name) as _t:
+        if GEMINI_STREAM_CALL1 and on_items is not None:
+            data, _, _t.retries = await _stream_json(model, [audio, CALL1_MAP_PROMPT], purpose=purpose,
+                                                     schema=CALL1_MAP_SCHEMA, on_items=on_items, on_restart=on_restart)
+        else:
+            response = await model.generate_content_async([audio, CALL1_MAP_PROMPT], purpose=purpose,
+                                                          generation_config=json_config(CALL1_MAP_SCHEMA))
+            _t.retries = response.retries
+            data = parse_gemini_response(response.text)
+            if on_items is not None:
+                on_items(data.get("transcript") or [])
+    return {
+        "start_sec": start_sec,
+        "end_sec": end_sec,
+        "transcript": shift_transcript(data.get("transcript") or [], start_sec),
+        "sigh_count": int(data.get("sigh_count") or 0),
+        "laugh_count": int(data.get("laugh_count") or 0),
+        "risks": data.get("risks") or [],
+    }
+
+
+def _merge_window_results(windows: List[dict]) -> dict:
+    """合并各分片 map 结果（重叠区按中点去重，sigh / laugh 求和），mood / summary 等待 reduce 填充"""
+    from utils.transcript_time import merge_chunk_transcripts
+    transcript = merge_chunk_transcripts([(w["start_sec"], w["end_sec"], w["transcript"]) for w in windows])
+    return {
+        "transcript": transcript,
+        "sigh_count": sum(w["sigh_count"] for w in windows),
+        "laugh_count": sum(w["laugh_count"] for w in windows),
+        "risks": list(dict.fromkeys(x for w in windows for x in w["risks"])),
+        "mood_score": 70,
+        "summary": "",
+        "card_title": None,
+        "conversation_summary": None,
+    }
+
+
+async def _reduce_transcript(model, merged: dict, _sid: str) -> dict:
+    """reduce：基于合并后的转写生成 mood_score / summary / card_title / risks（单次分析模式另含 conversation_summary）；失败保留默认值"""
+    t0 = time.time()
+    try:
+        prompt = CALL1_REDUCE_PROMPT.format(
+            risks=json.dumps(merged["risks"], ensure_ascii=False),
+            transcript=_transcript_to_lines(merged["transcript"]),
+        )
+        schema = CALL1_REDUCE_SCHEMA
+        if CALL1_SINGLE_PASS:
+            prompt += CALL1_CONVERSATION_SUMMARY_INSTRUCTION
+            schema = CALL1_REDUCE_SINGLE_PASS_SCHEMA
+        with stage_timing.timed("transcribe_reduce", model=model.model_name) as _t:
+            response = await model.generate_content_async(prompt, purpose="transcribe_reduce",
+                                                          generation_config=json_config(schema))
+            _t.retries = response.retries
+        reduced = parse_gemini_response(response.text)
+        for key in ("mood_score", "summary", "card_title", "risks", "conversation_summary"):
+            if reduced.get(key) not in (None, ""):
+                merged[key] = reduced[key]
+        logger.info(f"[分析-{_sid}] reduce 完成 耗时={time.time() - t0:.1f}s")
+    except Exception as e:
+        # reduce 失败不丢弃已完成的转写，整体指标用默认值
+        logger.warning(f"[分析-{_sid}] reduce 失败，使用默认 mood/summary: {type(e).__name__}: {e}")
+    return merged
+
+
+async def _analyze_chunks_map_reduce(
+    chunks: List[Tuple[float, float, str]],
+    file_filename: str,
+    _sid: str,
+    upload_timeout: int,
+    uploaded_files_list: List[dict],
+    partial_writer=None,
+) -> dict:
+    """
+    分片 map-reduce 转写。
+    map：每片独立调用（信号量限并发），时间戳按分片起点本地平移；
+    reduce：纯文本调用生成整体 mood_score / summary / card_title / risks；sigh / laugh 为各片求和。
+    上传到 Files API 的分片登记进 uploaded_files_list，由调用方 finally 统一删除。
+    任一分片在网关重试后仍失败即整体失败（不把缺段的转写当作完整结果落库），会话标记 failed 后可经重试接口续跑。
+    传入 partial_writer 时各分片已转写的条目随时写入部分结果，map 全部结束后（reduce 前）再写一次完整转写。
+    """
+    from utils.transcript_time import format_timestamp
+    model = gemini_gateway.get_model(GEMINI_FLASH_MODEL)
+    sem = asyncio.Semaphore(GEMINI_MAP_CONCURRENCY)
+
+    async def _map_one(idx: int, start_sec: float, end_sec: float, chunk_path: str) -> dict:
+        async with sem:
+            t0 = time.time()
+            if os.path.getsize(chunk_path) <= GEMINI_INLINE_MAX_MB * 1024 * 1024:
+                audio = {
+                    "mime_type": gemini_client.guess_mime_type(chunk_path),
+                    "data": await asyncio.to_thread(Path(chunk_path).read_bytes),
+                }
+            else:
+                audio = await _upload_file_to_gemini(chunk_path, f"{file_filename}_片段{idx + 1}", _sid, upload_timeout)
+                uploaded_files_list.append(audio)
+            window = await _transcribe_window(model, audio, start_sec, end_sec,
+                                              partial_writer=partial_writer, window=idx)
+            logger.info(f"[分析-{_sid}] map 分片{idx + 1}/{len(chunks)} [{start_sec:.0f}s-{end_sec:.0f}s] "
+                        f"完成 {len(window['transcript'])} 条 耗时={time.time() - t0:.1f}s")
+            return window
+
+    results = await asyncio.gather(
+        *[_map_one(i, st, et, cp) for i, (st, et, cp) in enumerate(chunks)],
+        return_exceptions=True,
+    )
+    ok = [r for r in results if not isinstance(r, BaseException)]
+    missing = []
+    for i, r in enumerate(results):
+        if isinstance(r, BaseException):
+            logger.error(f"[分析-{_sid}] ❌ map 分片{i + 1} 失败: {type(r).__name__}: {r}")
+            missing.append(f"{format_timestamp(chunks[i][0])}-{format_timestamp(chunks[i][1])}")
+    if missing:
+        first_error = next(r for r in results if isinstance(r, BaseException))
+        raise Exception(f"{len(missing)}/{len(chunks)} 个分片转写失败（缺失 {', '.join(missing)}）: {first_error}")
+    logger.info(f"[分析-{_sid}] map 分片全部成功 {len(ok)}/{len(chunks)}")
+    if partial_writer is not None:
+        await partial_writer.flush()
+
+    return await _reduce_transcript(model, _merge_window_results(ok), _sid)
+
+
+async def _stream_json(model, contents: list, *, purpose: str, schema: Optional[dict] = None,
+                       on_items=None, on_restart=None) -> Tuple[dict, str, int]:
+    """
+    流式生成 + 增量解析（与生成重叠）：transcript 条目每完成一批交给 on_items（部分结果落库），
+    返回 (解析结果, 原始响应文本, 重试次数)。
+    已产出部分文本后流中断（网关不重试）时按退避整体重启：先调用 on_restart 丢弃已登记的部分结果，
+    再用新的解析器从头解析，次数与 deadline 受网关重试上限约束
+    """
+    from utils.json_stream import IncrementalJSONParser
+    retries, restarts = 0, 0
+    while True:
+        parser = IncrementalJSONParser()
+        stream = model.generate_content_stream(contents, purpose=purpose, generation_config=json_config(schema))
+        t0 = time.time()
+        first_at = None
+        try:
+            async for chunk in stream:
+                if first_at is None:
+                    first_at = time.time()
+                    logger.info(f"[Gemini] purpose={purpose} 流式首块到达 {first_at - t0:.2f}s")
+                parser.feed(chunk)
+                items = parser.pop_items("transcript")
+                if items and on_items is not None:
+                    on_items(items)
+        except Exception as e:
+            retries += stream.retries
+            # 首块之前的失败网关已按常规重试过；仅处理已产出文本后的中断
+            delay = gemini_gateway.mid_stream_retry_delay(restarts + 1, e) if stream.text else None
+            if delay is None:
+                raise
+            restarts += 1
+            retries += 1
+            logger.warning(f"[Gemini] purpose={purpose} 流式第 {restarts} 次中断（已收 {len(stream.text)} 字符），"
+                           f"{delay:.1f}s 后重新生成: {type(e).__name__}: {str(e)[:300]}")
+            if on_restart is not None:
+                on_restart()
+            await asyncio.sleep(delay)
+            continue
+        return parser.close(dict), stream.text, retries + stream.retries
+
+
+async def _upload_file_to_gemini(
+    path: str,
+    display_name: str,
+    _sid: str,
+    upload_timeout: int,
+    max_retries: int = 3,
+) -> dict:
+    """
+    异步上传单个文件到 Gemini 并等待 ACTIVE（重试与 deadline 由网关处理）。返回 File 资源 dict。
+    启用文件句柄缓存时先按内容哈希查找仍有效的同内容文件，命中则跳过上传；新上传的文件登记进缓存（归缓存所有，调用方不删除）
+    """
+    sha256 = None
+    if gemini_file_cache.GEMINI_FILE_CACHE_ENABLED:
+        sha256 = await asyncio.to_thread(gemini_file_cache.file_sha256, path)
+        cached = await gemini_file_cache.lookup(sha256)
+        if cached is not None:
+            logger.info(f"[分析-{_sid}-step3] [文件缓存] 命中 sha256={sha256[:12]} name={cached.get('name')}，跳过上传")
+            return cached
+    logger.info(f"[分析-{_sid}-step3] 上传文件（单次超时={upload_timeout}s，最多 {max_retries} 次）...")
+    start_upload = time.time()
+    try:
+        with stage_timing.timed("gemini_upload", file_size=os.path.getsize(path)):
+            uploaded = await gemini_gateway.upload_file(
+                path, display_name, purpose="transcribe", timeout=upload_timeout, max_attempts=max_retries,
+            )
+    except Exception as e:
+        logger.error(f"[分析-{_sid}-step3] ❌ 上传失败: {type(e).__name__}: {e}")
+        raise Exception(f"上传文件失败: {e}")
+    logger.info(f"[分析-{_sid}-step4] ✅ 文件上传成功！name={uploaded.get('name')} 耗时={time.time()-start_upload:.2f}s")
+    logger.info(f"[分析-{_sid}-step5] 等待文件处理完成，当前状态: {uploaded.get('state')}")
+    with stage_timing.timed("wait_active", file_size=os.path.getsize(path)):
+        active = await gemini_gateway.wait_for_file_active(uploaded, purpose="transcribe", max_wait_time=600)
+    if sha256 is not None:
+        active = await gemini_file_cache.store(sha256, active, os.path.getsize(path))
+    return active
+
+
+async def _checkpointed_gemini_files(ckpt: Optional[dict], _sid: str) -> Optional[List[dict]]:
+    """gemini_files 检查点中的文件仍全部 ACTIVE 时返回（断点续跑复用），否则返回 None（重新上传）"""
+    if not ckpt or not ckpt.get("files"):
+        return None
+    try:
+        files = await asyncio.gather(*[gemini_gateway.get_file(f["name"]) for f in ckpt["files"]])
+    except Exception as e:
+        logger.info(f"[分析-{_sid}] 检查点中的 Gemini 文件已不可用，重新上传: {e}")
+        return None
+    if any(f.get("state") != "ACTIVE" for f in files):
+        logger.info(f"[分析-{_sid}] 检查点中的 Gemini 文件状态异常，重新上传")
+        return None
+    return list(files)
+
+
+def build_analysis_results(analysis_data: dict) -> Tuple[AudioAnalysisResponse, Optional[Call1Response]]:
+    """Gemini 返回的 JSON → (AudioAnalysisResponse, Call1Response)；新格式解析失败时回退旧格式（call1 为 None）"""
+    # 尝试解析新的Call1格式，如果失败则使用旧格式
+    call1_result = None
+    try:
+        # 解析转录列表
+        transcript_list = []
+        if "transcript" in analysis_data:
+            for item in analysis_data["transcript"]:
+                transcript_list.append(TranscriptItem(
+                    speaker=item.get("speaker", "未知"),
+                    text=item.get("text", ""),
+                    timestamp=item.get("timestamp"),
+                    is_me=item.get("is_me", False)
+                ))
+        
+        # 构建Call1Response
+        call1_result = Call1Response(
+            mood_score=analysis_data.get("mood_score", 70),
+            stats={
+                "sigh": analysis_data.get("sigh_count", 0),
+                "laugh": analysis_data.get("laugh_count", 0)
+            },
+            summary=analysis_data.get("summary", ""),
+            card_title=analysis_data.get("card_title"),
+            transcript=transcript_list,
+            conversation_summary=(analysis_data.get("conversation_summary") or "").strip() or None,
+        )
+        
+        # 转换为旧格式以保持兼容性
+        dialogues_list = []
+        for item in transcript_list:
+            dialogues_list.append(DialogueItem(
+                speaker=item.speaker,
+                content=item.text,
+                tone="未知",  # 新格式不包含tone，保留默认值
+                timestamp=item.timestamp,
+                is_me=item.is_me
+            ))
+        
+        speaker_count = len(set(item.speaker for item in transcript_list)) if transcript_list else 0
+        
+    except Exception as e:
+        logger.warning(f"解析新格式失败，使用旧格式: {e}")
+        # 兼容旧格式
+        dialogues_list = []
+        if "dialogues" in analysis_data:
+            for dialogue in analysis_data["dialogues"]:
+                dialogues_list.append(DialogueItem(
+                    speaker=dialogue.get("speaker", "未知"),
+                    content=dialogue.get("content", ""),
+                    tone=dialogue.get("tone", "未知"),
+                    timestamp=dialogue.get("timestamp"),
+                    is_me=dialogue.get("is_me", False)
+                ))
+        speaker_count = analysis_data.get("speaker_count", 0)
+    
+    # 验证并构建返回数据
+    result = AudioAnalysisResponse(
+        speaker_count=speaker_count,
+        dialogues=dialogues_list,
+        risks=analysis_data.get("risks", [])
+    )
+    
+    # 返回结果和Call1数据（如果存在）
+    return result, call1_result
+
+
+async def analyze_audio_from_path(
+    temp_file_path: str,
+    file_filename: str,
+    session_id: Optional[str] = None,
+    reuse_files: Optional[List[dict]] = None,
+    checkpoint_extra: Optional[dict] = None,
+    partial_writer=None,
+) -> Tuple[AudioAnalysisResponse, Optional[Call1Response]]:
+    """
+    从文件路径分析音频文件（内部函数）
+    若文件 ≤ GEMINI_INLINE_MAX_MB，音频内联进 generateContent 请求；
+    若文件 > 18MB，自动切分为多个 ≤18MB 片段，分别上传 Gemini 后合并分析；其余走 Files API 单文件上传。
+    
+    Args:
+        temp_file_path: 临时文件路径
+        file_filename: 文件名
+        reuse_files: 检查点中仍有效的 Gemini 文件（断点续跑），传入时跳过上传直接 generate_content
+        checkpoint_extra: 非 None 时 Files API 上传完成即写 gemini_files 检查点（附带该 dict，如 VAD 偏移），
+            失败时保留远端文件供重试复用
+        partial_writer: services.partial_transcript.PartialTranscriptWriter，转写途中按批写入部分结果（调用方负责 close）
+        
+    Returns:
+        元组：(AudioAnalysisResponse, Optional[Call1Response])
+    """
+    uploaded_files_list: List[dict] = []
+    inline_audio: Optional[dict] = None
+    analysis_data: Optional[dict] = None
+    chunk_paths_to_clean: List[str] = []
+    _sid = session_id or "?"
+    files_checkpointed = False
+    succeeded = False
+    
+    try:
+        logger.info(f"[分析-{_sid}-step1] ========== 文件上传处理开始 ==========")
+        logger.info(f"[分析-{_sid}-step1] 文件已保存到临时路径: {temp_file_path}")
+        
+        file_size = os.path.getsize(temp_file_path)
+        file_size_mb = file_size / 1024 / 1024
+        logger.info(f"[分析-{_sid}-step2] 文件名: {file_filename} 大小: {file_size} 字节 ({file_size_mb:.2f} MB)")
+        
+        upload_timeout = int(os.getenv("GEMINI_UPLOAD_TIMEOUT", "90"))
+        
+        if reuse_files:
+            # 断点续跑：上次已上传且仍 ACTIVE 的 Gemini 文件，直接进入 generate_content
+            logger.info(f"[分析-{_sid}-step2] 复用检查点中的 {len(reuse_files)} 个 Gemini 文件，跳过上传")
+            uploaded_files_list.extend(reuse_files)
+            files_checkpointed = True
+        elif file_size > CHUNK_SIZE_MB * 1024 * 1024:
+            # 大文件：切分为多个 ≤18MB 片段（map-reduce 逐片转写，或分别上传后一起传给 Gemini）
+            from utils.audio_storage import split_audio_into_chunks
+            logger.info(f"[分析-{_sid}] 大文件（{file_size_mb:.1f} MB > {CHUNK_SIZE_MB} MB），切分处理")
+            with stage_timing.timed("split", file_size=file_size) as _t:
+                chunks = await asyncio.to_thread(
+                    split_audio_into_chunks,
+                    temp_file_path,
+                    max_chunk_mb=CHUNK_SIZE_MB,
+                    base_name=f"gemini_{_sid[:8]}",
+                )
+                _t.chunk_count = len(chunks)
+            chunk_paths_to_clean = [c[2] for c in chunks]
+
+            if GEMINI_MAP_REDUCE:
+                logger.info(f"[分析-{_sid}] map-reduce 模式：{len(chunks)} 个分片独立转写，并发={GEMINI_MAP_CONCURRENCY}")
+                analysis_data = await _analyze_chunks_map_reduce(
+                    chunks, file_filename, _sid, upload_timeout, uploaded_files_list, partial_writer=partial_writer,
+                )
+            else:
+                # ── 并行上传所有分片（同一事件循环上 asyncio.gather，共享连接池）──────
+                logger.info(f"[分析-{_sid}] 并行上传 {len(chunks)} 个分片...")
+
+                async def _upload_one_chunk(idx, chunk_path):
+                    uf = await _upload_file_to_gemini(chunk_path, f"{file_filename}_片段{idx + 1}", _sid, upload_timeout)
+                    logger.info(f"[分析-{_sid}] 分片{idx + 1} 已就绪: {uf.get('name')}")
+                    return uf
+
+                _upload_results = await asyncio.gather(
+                    *[_upload_one_chunk(i, cp) for i, (_, _, cp) in enumerate(chunks)],
+                    return_exceptions=True,
+                )
+                # 先登记成功的分片（finally 中统一删除），再检查失败
+                uploaded_files_list.extend(r for r in _upload_results if not isinstance(r, BaseException))
+                for _r in _upload_results:
+                    if isinstance(_r, BaseException):
+                        raise _r
+                # ────────────────────────────────────────────────────────────
+        elif file_size <= GEMINI_INLINE_MAX_MB * 1024 * 1024:
+            # 小文件：内联发送，无需 Files API
+            logger.info(f"[分析-{_sid}-step2] 小文件（{file_size_mb:.2f} MB ≤ {GEMINI_INLINE_MAX_MB} MB），内联发送")
+            inline_audio = {
+                "mime_type": gemini_client.guess_mime_type(file_filename or temp_file_path),
+                "data": await asyncio.to_thread(Path(temp_file_path).read_bytes),
+            }
+        else:
+            # 中等文件：单文件上传
+            logger.info(f"[分析-{_sid}-step2] ========== 开始上传文件到 Gemini ==========")
+            uploaded_files_list.append(await _upload_file_to_gemini(temp_file_path, file_filename, _sid, upload_timeout))
+        
+        if analysis_data is None and uploaded_files_list and checkpoint_extra is not None and not files_checkpointed:
+            # 上传完成即记检查点：之后 generate_content 失败，重试可直接复用远端文件
+            from services import checkpoints
+            await checkpoints.save(
+                session_id, checkpoints.CKPT_GEMINI_FILES,
+                {"files": uploaded_files_list, "display_name": file_filename, **checkpoint_extra},
+                expires_at=checkpoints.gemini_files_expiry(uploaded_files_list),
+            )
+            files_checkpointed = True
+
+        if analysis_data is None:
+            audio_contents = [inline_audio] if inline_audio else uploaded_files_list
+            logger.info(f"[分析-{_sid}-step6] ✅ 音频就绪（{'内联' if inline_audio else 'Files API'}），即将调用 generate_content")
+        
+            model_name = GEMINI_FLASH_MODEL
+        
+            # 单文件 / 多文件 共用基础提示词
+            prompt_base = CALL1_PROMPT
         
-        if len(uploaded_files_list) > 1:
-            # 多文件时附加说明
-            multi_instruction = f"""
+            if len(uploaded_files_list) > 1:
+                # 多文件时附加说明
+                multi_instruction = f"""
 重要：你收到的是同一段录音按时间顺序切分的 {len(uploaded_files_list)} 个连续片段（片段1、2、...、{len(uploaded_files_list)}）。
 请将全部片段作为整体分析，合并输出一个完整的 JSON。
 transcript 中的 timestamp 必须使用相对于整段录音开始的全局时间。
 例如，若片段2对应原录音的 20:00–40:00，则片段2中「00:05」的对话应记为「20:05」。"""
-            prompt = prompt_base + multi_instruction
-        else:
-            prompt = prompt_base
-        
-        # 调用模型进行分析（添加重试机制）
-        logger.info(f"========== 开始调用 Gemini 模型分析音频 ==========")
-        logger.info(f"模型: {model_name} 文件数: {len(uploaded_files_list) or 1}")
-        max_retries = 3
-        retry_count = 0
-        response = None
-        contents = (uploaded_files_list if uploaded_files_list else [uploaded_file]) + [prompt]
+                prompt = prompt_base + multi_instruction
+            else:
+                prompt = prompt_base
+            call1_schema = CALL1_SCHEMA
+            if CALL1_SINGLE_PASS:
+                prompt += CALL1_CONVERSATION_SUMMARY_INSTRUCTION
+                call1_schema = CALL1_SINGLE_PASS_SCHEMA
         
-        while retry_count < max_retries:
+            # 调用模型进行分析（重试 / 退避 / deadline 由网关统一处理）
+            logger.info(f"========== 开始调用 Gemini 模型分析音频 ==========")
+            logger.info(f"模型: {model_name} 文件数: {len(audio_contents)}")
+            model = gemini_gateway.get_model(model_name)
+            logger.info(f"[分析-{_sid}-step7] 调用 generate_content...")
+            start_generate = time.time()
             try:
-                logger.info(f"[分析-{_sid}-step7] 调用 generate_content（第 {retry_count + 1}/{max_retries} 次）...")
-                start_generate = time.time()
-                response = model.generate_content(contents)
-                generate_time = time.time() - start_generate
-                logger.info(f"[分析-{_sid}-step8] ✅ generate_content 成功，耗时: {generate_time:.2f}s 响应长度: {len(response.text)}")
-                break
+                with stage_timing.timed("generate", file_size=file_size, model=model_name,
+                                        chunk_count=len(audio_contents)) as _t:
+                    if GEMINI_STREAM_CALL1:
+                        on_items = (lambda items: partial_writer.add(0, 0.0, float("inf"), items)) if partial_writer else None
+                        on_restart = (lambda: partial_writer.reset(0)) if partial_writer else None
+                        streamed, response_text, _t.retries = await _stream_json(
+                            model, audio_contents + [prompt], purpose="transcribe", schema=call1_schema,
+                            on_items=on_items, on_restart=on_restart,
+                        )
+                    else:
+                        streamed = None
+                        response = await model.generate_content_async(
+                            audio_contents + [prompt], purpose="transcribe", generation_config=json_config(call1_schema),
+                        )
+                        _t.retries = response.retries
+                        response_text = response.text
             except Exception as e:
-                retry_count += 1
-                error_msg = str(e)
-                error_type = type(e).__name__
-                logger.error(f"[分析-{_sid}-step7] ❌ generate_content 失败（第 {retry_count}/{max_retries}）{error_type}: {error_msg}")
-                logger.error(f"完整错误堆栈:")
-                logger.error(traceback.format_exc())
-                if retry_count >= max_retries:
-                    raise Exception(f"调用模型失败（重试 {max_retries} 次）: {error_msg}")
-                logger.info(f"等待 5 秒后重试...")
-                time.sleep(5)
+                logger.error(f"[分析-{_sid}-step7] ❌ generate_content 失败 {type(e).__name__}: {e}")
+                raise Exception(f"调用模型失败: {e}")
+            logger.info(f"[分析-{_sid}-step8] ✅ generate_content 成功，耗时: {time.time() - start_generate:.2f}s "
+                        f"重试: {_t.retries} 响应长度: {len(response_text)}")
         
-        logger.info(f"Gemini 响应长度: {len(response.text)} 字符")
-        logger.debug(f"Gemini 响应内容: {response.text[:500]}...")  # 只记录前500字符
+            logger.info(f"Gemini 响应长度: {len(response_text)} 字符")
+            logger.debug(f"Gemini 响应内容: {response_text[:500]}...")  # 只记录前500字符
         
-        # 解析响应
-        analysis_data = parse_gemini_response(response.text)
+            # 解析响应（流式时已边生成边解析完成）
+            analysis_data = streamed if streamed is not None else parse_gemini_response(response_text)
         
-        # 尝试解析新的Call1格式，如果失败则使用旧格式
-        call1_result = None
-        try:
-            # 解析转录列表
-            transcript_list = []
-            if "transcript" in analysis_data:
-                for item in analysis_data["transcript"]:
-                    transcript_list.append(TranscriptItem(
-                        speaker=item.get("speaker", "未知"),
-                        text=item.get("text", ""),
-                        timestamp=item.get("timestamp"),
-                        is_me=item.get("is_me", False)
-                    ))
-            
-            # 构建Call1Response
-            call1_result = Call1Response(
-                mood_score=analysis_data.get("mood_score", 70),
-                stats={
-                    "sigh": analysis_data.get("sigh_count", 0),
-                    "laugh": analysis_data.get("laugh_count", 0)
-                },
-                summary=analysis_data.get("summary", ""),
-                transcript=transcript_list
-            )
-            
-            # 转换为旧格式以保持兼容性
-            dialogues_list = []
-            for item in transcript_list:
-                dialogues_list.append(DialogueItem(
-                    speaker=item.speaker,
-                    content=item.text,
-                    tone="未知",  # 新格式不包含tone，保留默认值
-                    timestamp=item.timestamp,
-                    is_me=item.is_me
-                ))
-            
-            speaker_count = len(set(item.speaker for item in transcript_list)) if transcript_list else 0
-            
-        except Exception as e:
-            logger.warning(f"解析新格式失败，使用旧格式: {e}")
-            # 兼容旧格式
-            dialogues_list = []
-            if "dialogues" in analysis_data:
-                for dialogue in analysis_data["dialogues"]:
-                    dialogues_list.append(DialogueItem(
-                        speaker=dialogue.get("speaker", "未知"),
-                        content=dialogue.get("content", ""),
-                        tone=dialogue.get("tone", "未知"),
-                        timestamp=dialogue.get("timestamp"),
-                        is_me=dialogue.get("is_me", False)
-                    ))
-            speaker_count = analysis_data.get("speaker_count", 0)
-        
-        # 验证并构建返回数据
-        result = AudioAnalysisResponse(
-            speaker_count=speaker_count,
-            dialogues=dialogues_list,
-            risks=analysis_data.get("risks", [])
-        )
-        
-        # 返回结果和Call1数据（如果存在）
-        return result, call1_result
+        results = build_analysis_results(analysis_data)
+        succeeded = True
+        return results
         
     except Exception as e:
         error_msg = str(e)
@@ -1322,15 +1528,20 @@ transcript 中的 timestamp 必须使用相对于整段录音开始的全局时
         raise HTTPException(status_code=500, detail=f"音频分析失败: {error_msg}")
     
     finally:
-        # 删除 Gemini 上的文件
-        to_delete = uploaded_files_list if uploaded_files_list else ([uploaded_file] if uploaded_file else [])
-        for uf in to_delete:
-            if uf:
-                try:
-                    genai.delete_file(uf.name)
-                    logger.info(f"已删除 Gemini 文件: {uf.name}")
-                except Exception as e:
-                    logger.error(f"删除 Gemini 文件失败: {e}")
+        # 删除 Gemini 上的文件（并发）
+        async def _delete_remote(uf):
+            try:
+                await gemini_gateway.delete_file(uf["name"], purpose="transcribe")
+                logger.info(f"已删除 Gemini 文件: {uf['name']}")
+            except Exception as e:
+                logger.error(f"删除 Gemini 文件失败: {e}")
+        # 已登记进文件句柄缓存的文件由缓存到期批量清理，这里不删
+        owned_files = [uf for uf in uploaded_files_list if not gemini_file_cache.is_cached(uf)]
+        if owned_files and files_checkpointed and not succeeded:
+            # 已记检查点：保留远端文件（Gemini 48 小时后自动删除），重试时复用
+            logger.info(f"[分析-{_sid}] 保留 {len(owned_files)} 个 Gemini 文件供重试复用")
+        elif owned_files:
+            await asyncio.gather(*[_delete_remote(uf) for uf in owned_files])
         # 删除分片临时文件
         for p in chunk_paths_to_clean:
             try:
@@ -1444,6 +1655,9 @@ async def update_user_preferences(
 tasks_storage: dict = {}
 analysis_storage: dict = {}
 
+# 上传文件落盘目录（队列任务的输入；分析结束后删除）
+UPLOAD_SPOOL_DIR = os.getenv("UPLOAD_SPOOL_DIR", "data/audio/incoming")
+
 
 class TaskItem(BaseModel):
     """任务项数据模型"""
@@ -1486,6 +1700,7 @@ class TaskDetailResponse(BaseModel):
     speaker_names: Optional[dict] = None  # Speaker_0/1 -> 档案名（关系），如 张三（自己），便于前端展示
     conversation_summary: Optional[str] = None  # 「谁和谁对话」总结
     audio_url: Optional[str] = None  # 原始录音播放 URL（OSS 直链 或 /audio-file 代理）
+    partial: bool = False  # 实时录音 / 转写进行中：dialogues 为已转写部分，summary 等尚未生成，完成后由完整结果替换
     created_at: str
     updated_at: str
 
@@ -1544,14 +1759,39 @@ def generate_tags(result: AudioAnalysisResponse) -> List[str]:
     return tags if tags else ["#正常"]
 
 
+def _duplicate_upload_response(existing: Session, reason: str) -> JSONResponse:
+    """重复上传：返回已有 session（与正常上传响应结构一致，附 deduplicated 标记）"""
+    from datetime import datetime
+    created = existing.start_time or existing.created_at
+    response_data = {
+        "session_id": str(existing.id),
+        "user_id": str(existing.user_id),
+        "audio_id": str(existing.id),
+        "title": existing.title,
+        "status": existing.status or "analyzing",
+        "estimated_duration": 300,
+        "created_at": created.isoformat() if created else None,
+        "deduplicated": True,
+        "dedup_reason": reason,
+    }
+    api_response = APIResponse(
+        code=200,
+        message="重复上传，返回已有会话",
+        data=response_data,
+        timestamp=datetime.now().isoformat()
+    )
+    return JSONResponse(content=api_response.dict(), status_code=200)
+
+
 @app.post("/api/v1/audio/upload", response_model=APIResponse)
 async def upload_audio_api(
     file: UploadFile = File(...),
     title: Optional[str] = None,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
     user_id: str = Depends(get_current_user_id),
     db: AsyncSession = Depends(get_db)
 ):
-    """上传音频文件并开始分析（需要JWT认证）"""
+    """上传音频文件并开始分析（需要JWT认证）；支持 Idempotency-Key 与内容哈希去重"""
     import asyncio
     from datetime import datetime
     
@@ -1559,8 +1799,45 @@ async def upload_audio_api(
     logger.info("========== [upload] 进入 handler ==========")
     logger.info(f"文件名: {file.filename} Content-Type: {file.content_type} Title: {title} User: {user_id[:8]}...")
     
+    from services.upload_dedup import (
+        claim_idempotency_key, find_idempotent_session, find_recent_duplicate, purge_expired_keys,
+    )
+
+    temp_file_path = None
     try:
+        idem_key = (idempotency_key or "").strip()[:200] or None
+        # 幂等键命中：客户端超时重试，直接返回首次创建的 session，不再写文件 / 建会话
+        if idem_key:
+            existing = await find_idempotent_session(db, user_id, idem_key)
+            if existing is not None:
+                logger.info(f"[upload] Idempotency-Key 命中，返回已有 session={existing.id}")
+                return _duplicate_upload_response(existing, "idempotency_key")
+
+        # 异步流式写入内容寻址存储（aiofiles 分块写，不阻塞事件循环），同时计算内容 SHA-256
+        file_filename = file.filename or "audio.m4a"
+        file_ext = Path(file_filename).suffix.lower() if file_filename else '.m4a'
+
+        from utils.audio_ingest import ingest_upload, link_into
         session_id = str(uuid.uuid4())
+        t_before_read = time.time()
+        logger.info("[upload] 开始流式写入（aiofiles 分块 1MB）...")
+        with stage_timing.timed("ingest", session_id=session_id) as _t:
+            blob_file_path, file_size, audio_sha256 = await ingest_upload(file, file_ext)
+            _t.file_size = file_size
+        t_read_elapsed = time.time() - t_before_read
+        logger.info(f"[upload] 文件写入完成 size={file_size} bytes ({file_size / 1024 / 1024:.2f} MB) "
+                    f"sha256={audio_sha256[:12]} 耗时={t_read_elapsed:.2f}s")
+
+        # 窗口期内相同内容的重复上传（无幂等键的重试）：返回已有 session
+        duplicate = await find_recent_duplicate(db, user_id, audio_sha256)
+        if duplicate is not None:
+            logger.info(f"[upload] 内容哈希命中近期 session={duplicate.id}，跳过重复分析")
+            return _duplicate_upload_response(duplicate, "content_hash")
+
+        # 队列输入文件：硬链接到持久化 spool 目录（而非 /tmp），进程重启后回收重试时仍能找到
+        temp_file_path = await asyncio.to_thread(link_into, blob_file_path, UPLOAD_SPOOL_DIR, file_ext)
+        logger.info(f"[upload] 队列输入文件已创建: {temp_file_path}")
+
         logger.info(f"生成 session_id: {session_id}")
         
         if not title:
@@ -1577,9 +1854,22 @@ async def upload_audio_api(
             start_time=start_time,
             duration=0,
             status="analyzing",
-            tags=[]
+            tags=[],
+            audio_sha256=audio_sha256,
+            audio_size_bytes=file_size,
         )
         db.add(db_session)
+        if idem_key:
+            # 与 session 同一事务登记幂等键；并发重试抢先登记时放弃本次创建，返回对方的 session
+            await db.flush()
+            owner_sid = await claim_idempotency_key(db, user_id, idem_key, session_id, audio_sha256)
+            if owner_sid is not None:
+                await db.rollback()
+                os.unlink(temp_file_path)
+                owner = await db.get(Session, owner_sid)
+                logger.info(f"[upload] Idempotency-Key 并发命中，返回 session={owner_sid}")
+                return _duplicate_upload_response(owner, "idempotency_key")
+            await purge_expired_keys(db, user_id)
         await db.commit()
         await db.refresh(db_session)
         t_after_db = time.time() - t_enter
@@ -1603,40 +1893,17 @@ async def upload_audio_api(
         tasks_storage[session_id] = task_data
         logger.info(f"任务数据已存储: {session_id}")
         
-        # 流式写入临时文件（分块读取，避免大文件一次性加载进内存导致 OOM）
-        file_filename = file.filename or "audio.m4a"
-        file_ext = Path(file_filename).suffix.lower() if file_filename else '.m4a'
-
-        import tempfile
-        t_before_read = time.time()
-        logger.info("[upload] 开始流式写入临时文件（分块 1MB，避免 OOM）...")
-        tmp_fd = tempfile.NamedTemporaryFile(delete=False, suffix=file_ext)
-        temp_file_path = tmp_fd.name
-        file_size = 0
-        CHUNK = 1024 * 1024  # 1 MB per chunk
-        while True:
-            chunk = await file.read(CHUNK)
-            if not chunk:
-                break
-            tmp_fd.write(chunk)
-            file_size += len(chunk)
-        tmp_fd.close()
-        t_read_elapsed = time.time() - t_before_read
-        logger.info(f"[upload] 文件写入完成 size={file_size} bytes ({file_size / 1024 / 1024:.2f} MB) 耗时={t_read_elapsed:.2f}s")
-        logger.info(f"[upload] 临时文件已创建: {temp_file_path}")
-        
         # 进度：上传完成
-        _uq = await db.execute(select(Session).where(Session.id == uuid.UUID(session_id)))
-        _us = _uq.scalar_one_or_none()
-        if _us:
-            _us.analysis_stage = "upload_done"
-            _us.analysis_stage_detail = None
-            await db.commit()
+        await transition_stage(db, session_id, "upload_done")
 
-        # 异步分析（传递临时文件路径和文件名，确保所有参数都正确传递）
+        # 异步分析：写入持久化队列，由 worker 认领执行（进程重启不丢任务）
         # 注意：不传递db会话，在异步任务中创建新的会话
         logger.info(f"创建异步分析任务: session_id={session_id}, file_path={temp_file_path}, filename={file_filename}")
-        asyncio.create_task(analyze_audio_async(session_id, temp_file_path, file_filename, task_data, user_id))
+        await dispatch_pipeline_job(
+            JOB_ANALYZE, session_id, user_id,
+            {"file_path": temp_file_path, "file_filename": file_filename},
+            lambda: analyze_audio_async(session_id, temp_file_path, file_filename, task_data, user_id),
+        )
         
         # 构建响应数据
         response_data = {
@@ -1667,6 +1934,11 @@ async def upload_audio_api(
             headers={"Content-Type": "application/json"}
         )
     except Exception as e:
+        if temp_file_path and os.path.exists(temp_file_path):
+            try:
+                os.unlink(temp_file_path)
+            except OSError:
+                pass
         logger.error(f"========== 上传音频失败 ==========")
         logger.error(f"错误类型: {type(e).__name__}")
         logger.error(f"错误信息: {str(e)}")
@@ -1675,11 +1947,24 @@ async def upload_audio_api(
         raise HTTPException(status_code=500, detail=f"上传失败: {str(e)}")
 
 
-async def analyze_audio_async(session_id: str, temp_file_path: str, file_filename: str, task_data: dict, user_id: str):
-    """异步分析音频文件（保存到数据库）"""
-    from datetime import datetime
+async def analyze_audio_async(
+    session_id: str,
+    temp_file_path: str,
+    file_filename: str,
+    task_data: dict,
+    user_id: str,
+    precomputed: Optional[Tuple[AudioAnalysisResponse, Optional[Call1Response]]] = None,
+    resume: bool = False,
+):
+    """
+    异步分析音频文件（保存到数据库）
+    precomputed 为已完成的转写结果（实时录音边录边转写）时跳过 Gemini 转写，仅做后续流程
+    resume=True（失败重试）时读取阶段检查点，已完成的阶段（Gemini 上传 / 转写 / 声纹 / 总结 / 记忆）直接复用
+    """
+    from datetime import datetime, timezone
     from database.connection import AsyncSessionLocal
     
+    gemini_input_path, gemini_input_is_temp = None, False
     # 创建新的数据库会话（因为原会话可能已关闭）
     async with AsyncSessionLocal() as db:
         try:
@@ -1703,20 +1988,29 @@ async def analyze_audio_async(session_id: str, temp_file_path: str, file_filenam
                 raise FileNotFoundError(f"临时文件不存在: {temp_file_path}")
             
             logger.info(f"[分析-{session_id}] step_async1: 分析任务开始，文件大小: {os.path.getsize(temp_file_path)} 字节")
+            stage_timing.bind_session(session_id, os.path.getsize(temp_file_path))
+            ckpts = await checkpoints.load_all(session_id) if resume else {}
+            if resume:
+                logger.info(f"[分析-{session_id}] 断点续跑，起点: {checkpoints.analyze_resume_point(ckpts)}")
             # 进度：保存音频
-            _uq = await db.execute(select(Session).where(Session.id == uuid.UUID(session_id)))
-            _us = _uq.scalar_one_or_none()
-            if _us:
-                _us.analysis_stage = "saving_audio"
-                _us.analysis_stage_detail = None
-                await db.commit()
+            await transition_stage(db, session_id, "saving_audio")
 
-            # 原音频持久化到本地（秒级，供剪切与声纹使用；默认不上传 OSS）
-            audio_url, audio_path = await asyncio.to_thread(
-                persist_original_audio, session_id, temp_file_path, file_filename or "audio.m4a", user_id
-            )
             result_query = await db.execute(select(Session).where(Session.id == uuid.UUID(session_id)))
             db_session_audio = result_query.scalar_one_or_none()
+            if resume and db_session_audio and db_session_audio.audio_path and os.path.isfile(db_session_audio.audio_path):
+                # 重试：原音频已持久化（输入文件即由其恢复），无需再写一次
+                audio_url, audio_path = db_session_audio.audio_url, db_session_audio.audio_path
+                logger.info(f"[分析-{session_id}] 断点续跑，原音频已持久化，跳过")
+            elif db_session_audio and db_session_audio.audio_url and not db_session_audio.audio_path:
+                # 客户端直传 OSS：原音频已在 sessions/{user_id}/{session_id}/original.ext，无需再持久化
+                audio_url, audio_path = db_session_audio.audio_url, None
+                logger.info(f"[分析-{session_id}] 原音频已由客户端直传 OSS，跳过持久化")
+            else:
+                # 原音频持久化到本地（秒级，供剪切与声纹使用；默认不上传 OSS）
+                with stage_timing.timed("persist"):
+                    audio_url, audio_path = await asyncio.to_thread(
+                        persist_original_audio, session_id, temp_file_path, file_filename or "audio.m4a", user_id
+                    )
             if db_session_audio:
                 db_session_audio.audio_url = audio_url
                 db_session_audio.audio_path = audio_path
@@ -1725,33 +2019,113 @@ async def analyze_audio_async(session_id: str, temp_file_path: str, file_filenam
             
             logger.info(f"[分析-{session_id}] step_async2: 本地存储完成，即将调用 Gemini")
             # 进度：转写音频
-            _tq = await db.execute(select(Session).where(Session.id == uuid.UUID(session_id)))
-            _ts = _tq.scalar_one_or_none()
-            if _ts:
-                _ts.analysis_stage = "transcribing"
-                _ts.analysis_stage_detail = None
-                await db.commit()
-
-            # 在 executor 中运行 Gemini 分析（避免阻塞事件循环）
-            # 超时时间按文件大小动态计算：基础 8 分钟 + 每 10 MB 额外 1 分钟，上限 30 分钟
-            _file_size_mb = os.path.getsize(temp_file_path) / (1024 * 1024)
-            _analysis_timeout = min(1800.0, 480.0 + max(0, _file_size_mb - 10) / 10 * 60)
-            logger.info(f"[分析-{session_id}] step_async3: 即将调用 analyze_audio_from_path（executor）"
-                        f"，文件 {_file_size_mb:.1f} MB，超时 {_analysis_timeout/60:.1f} 分钟")
-            def _run_analysis():
-                return asyncio.run(analyze_audio_from_path(temp_file_path, file_filename or "audio.m4a", session_id=session_id))
-            try:
-                result, call1_result = await asyncio.wait_for(
-                    asyncio.get_event_loop().run_in_executor(None, _run_analysis),
-                    timeout=_analysis_timeout
+            await transition_stage(db, session_id, "transcribing")
+
+            # 相同音频此前已分析过（超出去重窗口的重复上传）：复用已存的 Call1 结果，不再调用 Gemini 转写
+            from services.upload_dedup import find_reusable_analysis
+            call1_ckpt = ckpts.get(checkpoints.CKPT_CALL1)
+            reused = None if precomputed is not None or call1_ckpt else await find_reusable_analysis(db, session_id)
+            if call1_ckpt:
+                logger.info(f"[分析-{session_id}] 检查点已有转写结果，跳过 Gemini 转写")
+                call1_result = Call1Response(**call1_ckpt["call1"]) if call1_ckpt.get("call1") else None
+                result = AudioAnalysisResponse(
+                    speaker_count=call1_ckpt.get("speaker_count", 0),
+                    dialogues=[DialogueItem(**d) for d in call1_ckpt.get("dialogues") or []],
+                    risks=call1_ckpt.get("risks") or [],
                 )
-                logger.info(f"[分析-{session_id}] step_async4: analyze_audio_from_path 返回成功")
-            except asyncio.TimeoutError:
-                logger.error(f"[分析-{session_id}] step_async4: {_analysis_timeout/60:.0f} 分钟超时！"
-                             f"文件 {_file_size_mb:.1f} MB，Gemini 分析未在限时内完成")
-                raise Exception(f"分析超时（{_analysis_timeout/60:.0f} 分钟），文件 {_file_size_mb:.1f} MB，"
-                                "可能因 Gemini 文件上传失败或代理不可达，请检查网络/代理配置")
-            
+            elif precomputed is not None:
+                logger.info(f"[分析-{session_id}] 实时转写已完成，跳过 Gemini 转写")
+                result, call1_result = precomputed
+            elif reused is not None and reused.call1_result:
+                logger.info(f"[分析-{session_id}] 内容哈希命中历史分析 session={reused.session_id}，复用 Call1 结果")
+                call1_result = Call1Response(**transcript_codec.row_call1(reused))
+                _reused_dialogues = transcript_codec.row_dialogues(reused)
+                result = AudioAnalysisResponse(
+                    speaker_count=len({d.get("speaker") for d in _reused_dialogues if d.get("speaker")}),
+                    dialogues=[DialogueItem(**d) for d in _reused_dialogues],
+                    risks=reused.risks or [],
+                )
+            else:
+                vad_offset_map = None
+                from utils.vad import VAD_ENABLED, OffsetMap, compact_silence
+                files_ckpt = ckpts.get(checkpoints.CKPT_GEMINI_FILES)
+                reuse_files = await _checkpointed_gemini_files(files_ckpt, session_id) if files_ckpt else None
+                if reuse_files:
+                    # 断点续跑：远端文件即上次规整 / VAD 后的音频，只需恢复偏移映射
+                    gemini_input_path = temp_file_path
+                    gemini_input_name = files_ckpt.get("display_name") or file_filename or "audio.m4a"
+                    if files_ckpt.get("vad_segments"):
+                        vad_offset_map = OffsetMap([tuple(s) for s in files_ckpt["vad_segments"]])
+                else:
+                    # 可选规整：单声道 16kHz 低码率后再送 Gemini（原音频已在上方持久化，用于回放）
+                    from utils.audio_normalize import normalize_for_gemini
+                    with stage_timing.timed("normalize"):
+                        gemini_input_path, gemini_input_name, gemini_input_is_temp = await normalize_for_gemini(
+                            temp_file_path, file_filename or "audio.m4a", session_id
+                        )
+                    # 可选 VAD：剔除长静音后再转写，时间戳稍后按偏移映射换算回原音频时间
+                    if VAD_ENABLED:
+                        try:
+                            with stage_timing.timed("vad"):
+                                _vad = await asyncio.to_thread(compact_silence, gemini_input_path, session_id)
+                        except Exception as e:
+                            logger.warning(f"[VAD-{session_id}] 失败，使用未裁剪音频: {e}")
+                            _vad = None
+                        if _vad:
+                            if gemini_input_is_temp:
+                                os.unlink(gemini_input_path)
+                            gemini_input_path, vad_offset_map, _ = _vad
+                            gemini_input_name = os.path.splitext(gemini_input_name)[0] + ".aac"
+                            gemini_input_is_temp = True
+
+                # Gemini 分析全程异步（上传 / 轮询 / generate_content 均在主事件循环，共享连接池）
+                # 超时时间按文件大小动态计算：基础 8 分钟 + 每 10 MB 额外 1 分钟，上限 30 分钟
+                _file_size_mb = os.path.getsize(gemini_input_path) / (1024 * 1024)
+                _analysis_timeout = min(1800.0, 480.0 + max(0, _file_size_mb - 10) / 10 * 60)
+                logger.info(f"[分析-{session_id}] step_async3: 即将调用 analyze_audio_from_path"
+                            f"，文件 {_file_size_mb:.1f} MB，超时 {_analysis_timeout/60:.1f} 分钟")
+                # 转写途中已完成的条目按批写入部分结果，详情接口可先展示（partial=true）
+                from services import partial_transcript
+                partial_writer = (partial_transcript.PartialTranscriptWriter(session_id, vad_offset_map)
+                                  if partial_transcript.TRANSCRIPT_PARTIAL_ENABLED else None)
+                try:
+                    # deadline 传入网关：剩余预算不足以再退避一次时不再重试，直接失败
+                    with gemini_gateway.deadline(_analysis_timeout):
+                        result, call1_result = await asyncio.wait_for(
+                            analyze_audio_from_path(
+                                gemini_input_path, gemini_input_name, session_id=session_id,
+                                reuse_files=reuse_files,
+                                checkpoint_extra={"vad_segments": vad_offset_map.to_dict()["segments"] if vad_offset_map else None},
+                                partial_writer=partial_writer,
+                            ),
+                            timeout=_analysis_timeout
+                        )
+                    logger.info(f"[分析-{session_id}] step_async4: analyze_audio_from_path 返回成功")
+                    if vad_offset_map is not None:
+                        # 紧凑音频时间 → 原音频时间（剪切 / 回放 / 声纹均基于原音频）
+                        for _item in (call1_result.transcript if call1_result else []):
+                            _item.timestamp = vad_offset_map.remap_timestamp(_item.timestamp)
+                        for _d in result.dialogues:
+                            _d.timestamp = vad_offset_map.remap_timestamp(_d.timestamp)
+                except asyncio.TimeoutError:
+                    logger.error(f"[分析-{session_id}] step_async4: {_analysis_timeout/60:.0f} 分钟超时！"
+                                 f"文件 {_file_size_mb:.1f} MB，Gemini 分析未在限时内完成")
+                    raise Exception(f"分析超时（{_analysis_timeout/60:.0f} 分钟），文件 {_file_size_mb:.1f} MB，"
+                                    "可能因 Gemini 文件上传失败或代理不可达，请检查网络/代理配置")
+                finally:
+                    if partial_writer is not None:
+                        await partial_writer.close()
+
+            if not call1_ckpt:
+                # 转写检查点（时间戳已换算回原音频）；Gemini 文件随之失效
+                await checkpoints.save(session_id, checkpoints.CKPT_CALL1, {
+                    "call1": call1_result.dict() if call1_result else None,
+                    "dialogues": [d.dict() for d in result.dialogues],
+                    "risks": result.risks,
+                    "speaker_count": result.speaker_count,
+                })
+                await checkpoints.clear(session_id, [checkpoints.CKPT_GEMINI_FILES])
+
             # 使用Call1结果或旧结果
             if call1_result:
                 emotion_score = call1_result.mood_score
@@ -1791,6 +2165,7 @@ async def analyze_audio_async(session_id: str, temp_file_path: str, file_filenam
                 db_session.duration = duration
                 db_session.status = "analyzing"  # 延后：策略完成后再设 archived，实现「列表完成=点进即看」
                 db_session.analysis_stage = None  # 即将进入 matching_profiles 阶段
+                db_session.analysis_stage_started_at = datetime.now(timezone.utc)
                 db_session.error_message = None  # 成功时清除旧失败原因
                 db_session.emotion_score = emotion_score
                 db_session.speaker_count = result.speaker_count
@@ -1798,39 +2173,47 @@ async def analyze_audio_async(session_id: str, temp_file_path: str, file_filenam
                 await db.commit()
                 logger.info(f"数据库Session已更新: {session_id}")
             
-            # 保存分析结果到数据库
+            # 保存分析结果到数据库（替换实时录音期间写入的部分转写；断点续跑时替换上次已写入的结果）
+            _ar_cond = AnalysisResult.session_id == uuid.UUID(session_id)
+            if not resume:
+                _ar_cond = _ar_cond & AnalysisResult.is_partial.is_(True)
+            await db.execute(delete(AnalysisResult).where(_ar_cond))
+            _mapping_ckpt = ckpts.get(checkpoints.CKPT_SPEAKER_MAPPING)
+            _summary_ckpt = ckpts.get(checkpoints.CKPT_CONVERSATION_SUMMARY)
             analysis_result = AnalysisResult(
                 session_id=uuid.UUID(session_id),
-                dialogues=[d.dict() for d in result.dialogues],
                 risks=result.risks,
                 summary=summary,
                 card_title=card_title or None,
                 mood_score=emotion_score,
                 stats=stats,
-                transcript=json.dumps(transcript, ensure_ascii=False) if transcript else None,
-                call1_result=call1_result.dict() if call1_result else None
+                speaker_mapping=(_mapping_ckpt.get("mapping") or None) if _mapping_ckpt else None,
+                conversation_summary=_summary_ckpt.get("text") if _summary_ckpt else None,
+                **transcript_codec.storage_columns(
+                    transcript, [d.dict() for d in result.dialogues], call1_result.dict() if call1_result else None
+                ),
             )
             db.add(analysis_result)
-            await db.commit()
+            with stage_timing.timed("db_write_analysis"):
+                await db.commit()
             logger.info(f"分析结果已保存到数据库: {session_id}")
             
             # 进度：匹配档案
-            _vq = await db.execute(select(Session).where(Session.id == uuid.UUID(session_id)))
-            _vs = _vq.scalar_one_or_none()
-            if _vs:
-                _vs.analysis_stage = "matching_profiles"
-                _vs.analysis_stage_detail = None
-                await db.commit()
+            await transition_stage(db, session_id, "matching_profiles")
             
             # 分析后流程：按说话人选代表片段 → 声纹识别 → 写 speaker_mapping
             speaker_mapping = {}
             has_audio = bool(audio_url or audio_path)
+            if _mapping_ckpt is not None:
+                speaker_mapping = dict(_mapping_ckpt.get("mapping") or {})
+                logger.info(f"[声纹] session_id={session_id} 检查点已有 speaker_mapping，跳过声纹匹配: {speaker_mapping}")
             logger.info(f"[声纹] session_id={session_id} transcript_len={len(transcript) if transcript else 0} has_audio={has_audio} audio_url={bool(audio_url)} audio_path={bool(audio_path)}")
             if not transcript:
                 logger.info(f"[声纹] session_id={session_id} 无 transcript，跳过声纹匹配")
             elif not has_audio:
                 logger.info(f"[声纹] session_id={session_id} 无原音频 URL/路径，跳过声纹匹配")
-            if transcript and has_audio:
+            if transcript and has_audio and _mapping_ckpt is None:
+                _vp_timer = stage_timing.start("voiceprint")
                 try:
                     from utils.audio_storage import get_session_audio_local_path
                     def _ts_to_sec(ts):
@@ -1907,14 +2290,17 @@ async def analyze_audio_async(session_id: str, temp_file_path: str, file_filenam
                             logger.warning(f"[声纹] session_id={session_id} 未找到 AnalysisResult，无法写入 speaker_mapping")
                     else:
                         logger.info(f"[声纹] session_id={session_id} speaker_mapping 为空，未写入")
+                    await checkpoints.save(session_id, checkpoints.CKPT_SPEAKER_MAPPING, {"mapping": speaker_mapping})
                 except Exception as e:
+                    _vp_timer.outcome = "error"
                     logger.warning(f"[声纹] session_id={session_id} 分析后声纹匹配失败: {e}", exc_info=True)
+                _vp_timer.finish()
             
-            # 第二次 Gemini：总结「谁和谁对话」
+            # 「谁和谁对话」总结：单次分析模式取 Call1 输出并本地替换档案名，否则（或 Call1 未返回）第二次 Gemini
             conversation_summary = None
+            profile_names = {}
             if transcript:
                 try:
-                    profile_names = {}
                     if speaker_mapping:
                         profile_ids_in_mapping = list(speaker_mapping.values())
                         if profile_ids_in_mapping:
@@ -1928,34 +2314,48 @@ async def analyze_audio_async(session_id: str, temp_file_path: str, file_filenam
                                 name = row.name or "未知"
                                 rel = getattr(row, "relationship_type", None) or "未知"
                                 profile_names[str(row.id)] = f"{name}（{rel}）"
-                    lines = []
-                    for t in transcript:
-                        sp = t.get("speaker") or "未知"
-                        name = profile_names.get(speaker_mapping.get(sp, ""), sp)
-                        text = (t.get("text") or "").strip()
-                        lines.append(f"{name}: {text}")
-                    display_text = "\n".join(lines)
-                    prompt = f"""根据以下对话，总结这是谁和谁的对话（角色关系、对话主题、双方立场等）。对话格式为 说话人: 内容。请用一两段话概括，不要列点。
-
-对话：
-{display_text}
-
-总结："""
-                    model = genai.GenerativeModel(GEMINI_FLASH_MODEL)
-                    resp = model.generate_content(prompt)
-                    if resp and resp.text:
-                        conversation_summary = resp.text.strip()
-                        ar_res = await db.execute(select(AnalysisResult).where(AnalysisResult.session_id == uuid.UUID(session_id)))
-                        ar = ar_res.scalar_one_or_none()
-                        if ar:
-                            ar.conversation_summary = conversation_summary
-                            await db.commit()
-                            logger.info(f"conversation_summary 已写入: {session_id}")
+                    if _summary_ckpt is not None:
+                        conversation_summary = _summary_ckpt.get("text")
+                        logger.info(f"检查点已有 conversation_summary，跳过第二次 Gemini: {session_id}")
+                    else:
+                        if call1_result and call1_result.conversation_summary:
+                            conversation_summary = _localize_speaker_labels(
+                                call1_result.conversation_summary, speaker_mapping, profile_names
+                            )
+                            logger.info(f"conversation_summary 取自 Call1（单次分析），已本地替换档案名: {session_id}")
+                        else:
+                            lines = []
+                            for t in transcript:
+                                sp = t.get("speaker") or "未知"
+                                name = profile_names.get(speaker_mapping.get(sp, ""), sp)
+                                text = (t.get("text") or "").strip()
+                                lines.append(f"{name}: {text}")
+                            prompt = CONVERSATION_SUMMARY_PROMPT.format(display_text="\n".join(lines))
+                            model = gemini_gateway.get_model(GEMINI_FLASH_MODEL)
+                            with stage_timing.timed("conversation_summary", model=GEMINI_FLASH_MODEL) as _t:
+                                resp = await model.generate_content_async(prompt, purpose="summary")
+                                _t.retries = resp.retries
+                            if resp and resp.text:
+                                conversation_summary = resp.text.strip()
+                        if conversation_summary:
+                            ar_res = await db.execute(select(AnalysisResult).where(AnalysisResult.session_id == uuid.UUID(session_id)))
+                            ar = ar_res.scalar_one_or_none()
+                            if ar:
+                                ar.conversation_summary = conversation_summary
+                                await db.commit()
+                                logger.info(f"conversation_summary 已写入: {session_id}")
+                            await checkpoints.save(session_id, checkpoints.CKPT_CONVERSATION_SUMMARY, {"text": conversation_summary})
                 except Exception as e:
-                    logger.warning(f"第二次 Gemini 总结失败: {e}", exc_info=True)
+                    logger.warning(f"conversation_summary 生成失败: {e}", exc_info=True)
+
+            # 详情展示字段预渲染（speaker_mapping / conversation_summary 均已落库），首次打开详情即命中
+            from services import detail_render
+            await detail_render.refresh(db, session_id, user_id)
             
-            # v0.6 记忆提取（B 钩子）：档案匹配完成后写入 Mem0
-            if speaker_mapping and conversation_summary and profile_names:
+            # v0.6 记忆提取（B 钩子）：档案匹配完成后写入 Mem0（检查点记录已写入时不再重复写）
+            if checkpoints.CKPT_MEMORY_WRITE in ckpts:
+                logger.info(f"[记忆] B 钩子跳过: session_id={session_id} 检查点记录已写入")
+            elif speaker_mapping and conversation_summary and profile_names:
                 logger.info(f"[记忆] B 钩子触发: session_id={session_id} speaker_mapping={speaker_mapping} profile_names_keys={list(profile_names.keys())}")
                 try:
                     from services.memory_service import build_memory_payload, add_memory
@@ -1968,14 +2368,18 @@ async def analyze_audio_async(session_id: str, temp_file_path: str, file_filenam
                     }
                     logger.info(f"[记忆] B 钩子调用 add_memory: session_id={session_id} payload_len={len(payload)}")
                     # 同步 add_memory 在线程中执行，避免阻塞事件循环
-                    ok = await asyncio.to_thread(
-                        add_memory,
-                        payload,
-                        user_id,
-                        metadata=metadata,
-                        enable_graph=True,
-                    )
+                    with stage_timing.timed("memory_write") as _t:
+                        ok = await asyncio.to_thread(
+                            add_memory,
+                            payload,
+                            user_id,
+                            metadata=metadata,
+                            enable_graph=True,
+                        )
+                        _t.outcome = "ok" if ok else "error"
                     logger.info(f"[记忆] B 钩子 add_memory 结果: session_id={session_id} success={ok}")
+                    if ok:
+                        await checkpoints.save(session_id, checkpoints.CKPT_MEMORY_WRITE, {"ok": True})
                 except Exception as mem_err:
                     logger.warning(f"[记忆] B 钩子写入失败: session_id={session_id} error={mem_err}", exc_info=True)
             else:
@@ -1994,9 +2398,12 @@ async def analyze_audio_async(session_id: str, temp_file_path: str, file_filenam
             
             logger.info(f"任务 {session_id} 分析完成")
             
-            # 异步生成策略分析（不阻塞主流程）
+            # 异步生成策略分析（不阻塞主流程）：同样走持久化队列
             logger.info(f"开始异步生成策略分析: {session_id}")
-            asyncio.create_task(generate_strategies_async(session_id, user_id))
+            await dispatch_pipeline_job(
+                JOB_STRATEGY, session_id, user_id, {"resume": True} if resume else {},
+                lambda: generate_strategies_async(session_id, user_id, resume=resume),
+            )
             
         except Exception as e:
             logger.error(f"[分析-{session_id}] ❌ 分析音频失败: {type(e).__name__}: {str(e)}")
@@ -2010,26 +2417,24 @@ async def analyze_audio_async(session_id: str, temp_file_path: str, file_filenam
 
             # 更新数据库状态
             try:
-                result_query = await db.execute(select(Session).where(Session.id == uuid.UUID(session_id)))
-                db_session = result_query.scalar_one_or_none()
-                if db_session:
-                    db_session.status = "failed"
-                    db_session.analysis_stage = "failed"
-                    db_session.error_message = err_msg
-                    await db.commit()
+                if await transition_stage(db, session_id, "failed", status="failed", error_message=err_msg):
                     logger.info(f"数据库Session状态已更新为 failed: {session_id}")
                 else:
                     logger.warning(f"未找到数据库Session: {session_id}")
             except Exception as db_error:
                 logger.error(f"更新数据库状态失败: {db_error}")
         finally:
-            # 清理临时文件
-            if temp_file_path and os.path.exists(temp_file_path):
-                try:
-                    os.unlink(temp_file_path)
-                    logger.info(f"已删除临时文件: {temp_file_path}")
-                except Exception as e:
-                    logger.error(f"删除临时文件失败: {e}")
+            # 清理临时文件（含规整产物）
+            _to_clean = [temp_file_path]
+            if gemini_input_is_temp:
+                _to_clean.append(gemini_input_path)
+            for _p in _to_clean:
+                if _p and os.path.exists(_p):
+                    try:
+                        os.unlink(_p)
+                        logger.info(f"已删除临时文件: {_p}")
+                    except Exception as e:
+                        logger.error(f"删除临时文件失败: {e}")
 
 
 @app.get("/api/v1/tasks/sessions")
@@ -2152,10 +2557,12 @@ async def get_task_list(
 @app.get("/api/v1/tasks/sessions/{session_id}")
 async def get_task_detail(
     session_id: str,
+    response: Response,
+    if_none_match: Optional[str] = Header(None),
     user_id: str = Depends(get_current_user_id),
     db: AsyncSession = Depends(get_db)
 ):
-    """获取任务详情（需要JWT认证，仅能访问自己的任务）"""
+    """获取任务详情（需要JWT认证，仅能访问自己的任务）；带强 ETag，If-None-Match 命中时返回 304"""
     from datetime import datetime
     
     try:
@@ -2177,143 +2584,9 @@ async def get_task_detail(
         )
         analysis_result = analysis_result_query.scalar_one_or_none()
         
-        dialogues = []
-        risks = []
-        summary = None
-        speaker_mapping = None
-        speaker_names = None
-        conversation_summary = None
-        
-        if analysis_result:
-            dialogues = analysis_result.dialogues if isinstance(analysis_result.dialogues, list) else []
-            risks = analysis_result.risks or []
-            summary = analysis_result.summary
-            speaker_mapping = analysis_result.speaker_mapping if isinstance(analysis_result.speaker_mapping, dict) else None
-            conversation_summary = getattr(analysis_result, "conversation_summary", None) or None
-            name_to_display = {}  # 档案名/角色名 -> 展示格式，用于替换 Gemini 直接写出的角色名（如梁致远）
-            speaker_names = None
-
-            # 解析 transcript（来自 transcript 字段或 call1_result）
-            transcript = []
-            if getattr(analysis_result, "transcript", None):
-                try:
-                    transcript = json.loads(analysis_result.transcript) if isinstance(analysis_result.transcript, str) else (analysis_result.transcript or [])
-                except Exception:
-                    transcript = []
-            if not transcript and getattr(analysis_result, "call1_result", None):
-                call1 = analysis_result.call1_result
-                if isinstance(call1, dict) and "transcript" in call1:
-                    transcript = call1.get("transcript") or []
-
-            # 优先使用 transcript + is_me 计算正确的 speaker_names（修复旧任务错误映射）
-            self_profile_id = None
-            self_display = None
-            profile_rows = await db.execute(
-                select(Profile.id, Profile.name, Profile.relationship_type).where(Profile.user_id == uuid.UUID(user_id))
-            )
-            for row in profile_rows.all():
-                rel = getattr(row, "relationship_type", None) or (row[2] if len(row) > 2 else None)
-                if rel in ("自己", "Self", "self"):
-                    self_profile_id = str(getattr(row, "id", row[0]))
-                    name = getattr(row, "name", None) or (row[1] if len(row) > 1 else None) or "未知"
-                    self_display = f"{name}（自己）"
-                    if name and name.strip():
-                        name_to_display[name.strip()] = self_display
-                        if "志" in name or "致" in name:
-                            alt = name.replace("志", "致") if "志" in name else name.replace("致", "志")
-                            if alt != name:
-                                name_to_display[alt.strip()] = self_display
-                    break
-
-            if transcript and self_profile_id and self_display:
-                # 从 transcript 找 is_me=true 的 speaker，仅映射「自己」，其余保持 Speaker_X
-                speaker_with_is_me = None
-                for t in transcript:
-                    if t.get("is_me") is True:
-                        speaker_with_is_me = t.get("speaker")
-                        break
-                if speaker_with_is_me:
-                    speaker_names = {speaker_with_is_me: self_display}
-                    # 非 is_me 的说话人不映射，_speaker_to_display 会返回原 speaker_val（如 Speaker_0）
-                    logger.info(f"[任务详情] session={session_id} 使用 transcript+is_me 计算 speaker_names: {speaker_names}，未映射者显示为 Speaker_X")
-            elif speaker_mapping and not speaker_names:
-                # 无 transcript/is_me 时回退到 speaker_mapping（兼容旧逻辑）
-                profile_ids_in_mapping = list(speaker_mapping.values())
-                if profile_ids_in_mapping:
-                    try:
-                        profile_res = await db.execute(
-                            select(Profile.id, Profile.name, Profile.relationship_type).where(
-                                Profile.user_id == uuid.UUID(user_id),
-                                Profile.id.in_([uuid.UUID(pid) for pid in profile_ids_in_mapping])
-                            )
-                        )
-                        id_to_display = {}
-                        for row in profile_res.all():
-                            name = row.name or "未知"
-                            rel = getattr(row, "relationship_type", None) or "未知"
-                            display = f"{name}（{rel}）"
-                            id_to_display[str(row.id)] = display
-                            if name and name.strip():
-                                name_to_display[name.strip()] = display
-                                if "志" in name or "致" in name:
-                                    alt = name.replace("志", "致") if "志" in name else name.replace("致", "志")
-                                    if alt != name:
-                                        name_to_display[alt.strip()] = display
-                        speaker_names = {sp: id_to_display.get(pid, sp) for sp, pid in speaker_mapping.items()}
-                    except Exception:
-                        speaker_names = None
-            
-            # 若已有 speaker_names，返回前在 summary / conversation_summary / dialogues 中把 Speaker_0/Speaker_1 替换为档案名
-            def _replace_speaker_labels(text: Optional[str], names: dict) -> Optional[str]:
-                if not text or not names:
-                    return text
-                for sp in sorted(names.keys(), key=len, reverse=True):
-                    text = text.replace(sp, names[sp])
-                # Call #1 约定 Speaker_1 为用户，Gemini 总结常写「用户」而非 Speaker_1，一并替换为档案名
-                if "Speaker_1" in names:
-                    text = text.replace("用户", names["Speaker_1"])
-                # 兼容其他写法：说话人0/1、Speaker0/1（无下划线）
-                alias_map = [("说话人0", "Speaker_0"), ("说话人1", "Speaker_1"), ("Speaker0", "Speaker_0"), ("Speaker1", "Speaker_1")]
-                for alias, canonical in alias_map:
-                    if canonical in names and alias in text:
-                        text = text.replace(alias, names[canonical])
-                return text
-
-            def _replace_profile_names(text: Optional[str], name_map: dict) -> Optional[str]:
-                """替换 Gemini 在总结中直接写出的档案名/角色名（如 梁致远）为 档案名（关系）"""
-                if not text or not name_map:
-                    return text
-                for name in sorted(name_map.keys(), key=len, reverse=True):
-                    # 仅替换作为独立词出现的档案名，避免误替换（如「梁致远说」中的梁致远）
-                    text = text.replace(name, name_map[name])
-                return text
-
-            def _speaker_to_display(speaker_val: str, names: dict) -> str:
-                """将说话人标签转为档案名展示"""
-                if not names or not speaker_val:
-                    return speaker_val
-                if speaker_val in names:
-                    return names[speaker_val]
-                alias_map = {"说话人0": "Speaker_0", "说话人1": "Speaker_1", "Speaker0": "Speaker_0", "Speaker1": "Speaker_1"}
-                canonical = alias_map.get(speaker_val)
-                return names.get(canonical, speaker_val) if canonical else speaker_val
-
-            if speaker_names:
-                summary = _replace_speaker_labels(summary, speaker_names)
-                conversation_summary = _replace_speaker_labels(conversation_summary, speaker_names)
-                # 额外替换：Gemini 可能在总结中直接写出角色名（如梁致远），需替换为 档案名（关系）
-                summary = _replace_profile_names(summary, name_to_display)
-                conversation_summary = _replace_profile_names(conversation_summary, name_to_display)
-                # 每条 dialogue 的 speaker 字段也替换为档案名，便于前端直接展示
-                if dialogues:
-                    new_dialogues = []
-                    for d in dialogues:
-                        if isinstance(d, dict) and "speaker" in d:
-                            d = dict(d)  # 深拷贝一层，避免改原始数据
-                            d["speaker"] = _speaker_to_display(d.get("speaker", ""), speaker_names)
-                        new_dialogues.append(d)
-                    dialogues = new_dialogues
-                logger.info(f"[任务详情] session={session_id} 已对 summary/conversation_summary/dialogues 做档案名替换 speaker_names={list(speaker_names.keys())}")
+        # 展示字段（档案名替换后的 dialogues / summary 等）取流水线预渲染结果，过期时现场渲染并回写
+        from services import detail_render
+        rendered = await detail_render.prepare(db, analysis_result, user_id)
         
         # 原始录音 URL：OSS 直链 > 本地代理
         _audio_url: Optional[str] = None
@@ -2323,7 +2596,7 @@ async def get_task_detail(
             _api_base = os.getenv("API_PUBLIC_URL", "http://47.79.254.213").rstrip("/")
             _audio_url = f"{_api_base}/api/v1/tasks/sessions/{session_id}/audio-file"
 
-        detail = TaskDetailResponse(
+        fields = dict(
             session_id=str(db_session.id),
             title=db_session.title or "",
             start_time=db_session.start_time.isoformat() if db_session.start_time else "",
@@ -2334,16 +2607,19 @@ async def get_task_detail(
             error_message=getattr(db_session, "error_message", None) or None,
             emotion_score=db_session.emotion_score,
             speaker_count=db_session.speaker_count,
-            dialogues=dialogues,
-            risks=risks,
-            summary=summary,
-            speaker_mapping=speaker_mapping,
-            speaker_names=speaker_names,
-            conversation_summary=conversation_summary,
             audio_url=_audio_url,
+            partial=bool(analysis_result is not None and analysis_result.is_partial),
             created_at=db_session.created_at.isoformat() if db_session.created_at else "",
             updated_at=db_session.updated_at.isoformat() if db_session.updated_at else ""
         )
+        # 强 ETag = 会话字段 + 展示字段摘要；客户端反复打开同一会话时 304，不解压、不序列化 dialogues
+        etag = detail_render.etag(fields, rendered.digest)
+        if detail_render.etag_matches(if_none_match, etag):
+            return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "private, no-cache"})
+        response.headers["ETag"] = etag
+        response.headers["Cache-Control"] = "private, no-cache"
+
+        detail = TaskDetailResponse(**fields, **rendered.data)
 
         return APIResponse(
             code=200,
@@ -2398,6 +2674,91 @@ async def serve_session_audio(
         raise HTTPException(status_code=500, detail=f"音频服务失败: {str(e)}")
 
 
+async def _status_transcript_chars(db: AsyncSession, db_session) -> Optional[int]:
+    """转写完成后的阶段才查询转写长度（ETA 模型特征），之前的阶段返回 None 由模型按文件大小估算"""
+    if db_session.status not in ("analyzing", "archived"):
+        return None
+    if (db_session.analysis_stage or "") in ("upload_done", "saving_audio", "transcribing", "strategy_done", "failed"):
+        return None
+    res = await db.execute(
+        select(func.coalesce(AnalysisResult.transcript_chars, func.length(AnalysisResult.transcript))).where(
+            AnalysisResult.session_id == db_session.id, AnalysisResult.is_partial.is_(False)
+        )
+    )
+    return res.scalar()
+
+
+def build_task_status_payload(db_session, transcript_chars: Optional[int] = None) -> dict:
+    """
+    会话进度快照（/status 轮询与 /events 推送共用）
+    进度与剩余时间优先取 ETA 模型（历史阶段耗时按文件大小 / 分片数 / 转写长度回归），模型未就绪时回退 stage_map；
+    retry_after_ms 为建议的下次轮询间隔（终态为 None，客户端停止轮询）
+    """
+    status_value = db_session.status or "unknown"
+    analysis_stage = getattr(db_session, "analysis_stage", None) or ""
+    analysis_stage_detail = getattr(db_session, "analysis_stage_detail", None)
+    if analysis_stage_detail is not None and not isinstance(analysis_stage_detail, dict):
+        analysis_stage_detail = None  # JSONB 可能返回 dict，确保可序列化
+
+    # 根据阶段估算进度与剩余时间
+    stage_map = {
+        "upload_done": (0.05, 170),
+        "saving_audio": (0.10, 165),
+        "transcribing": (0.20, 120),
+        "matching_profiles": (0.90, 15),
+        "strategy_scene": (0.92, 60),
+        "strategy_matching": (0.94, 55),
+        "strategy_matched_n": (0.96, 50),
+        "strategy_executing": (0.97, 40),
+        "strategy_images": (0.98, 25),
+        "strategy_done": (1.0, 0),
+        "gemini_analysis": (0.50, 45),  # 兼容旧值
+        "voiceprint": (0.90, 10),  # 兼容旧值
+    }
+    learned = None
+    if status_value in ("analyzing", "archived") and analysis_stage not in ("strategy_done", "failed"):
+        size_bytes = getattr(db_session, "audio_size_bytes", None)
+        # 阶段开始时间只在阶段切换时写入；updated_at 会被 audio_url、逐张配图进度等无关写入刷新，仅作存量会话回退
+        stage_started_at = getattr(db_session, "analysis_stage_started_at", None) or db_session.updated_at
+        elapsed = (datetime.now(stage_started_at.tzinfo) - stage_started_at).total_seconds() if stage_started_at else 0.0
+        chunk_count = math.ceil(size_bytes / (CHUNK_SIZE_MB * 1024 * 1024)) if size_bytes else None
+        learned = eta_model.estimate(analysis_stage, elapsed, size_bytes, chunk_count, transcript_chars)
+
+    stage_remaining = None
+    if status_value == "failed":
+        progress_val, eta = 0.0, 0
+    elif status_value == "archived" and analysis_stage == "strategy_done":
+        progress_val, eta = 1.0, 0  # 策略就绪，客户端可停止轮询
+    elif status_value == "archived" and analysis_stage == "failed":
+        progress_val, eta = 1.0, 0  # 分析结果已就绪、策略生成失败（可重试）：终态，客户端停止轮询
+    elif learned is not None:
+        progress_val, eta, stage_remaining = learned
+    elif status_value == "archived":
+        progress_val, eta = stage_map.get(analysis_stage, (0.95, 30))  # 策略进行中
+        stage_remaining = eta
+    elif status_value in ("uploading", "recording"):
+        progress_val, eta = 0.0, 0  # 客户端仍在上传 / 录音，进度由客户端自己掌握
+        stage_remaining = eta_model.ETA_POLL_MAX_MS / 1000 * 3
+    else:
+        progress_val, eta = stage_map.get(analysis_stage, (0.30, 60))
+        stage_remaining = eta
+
+    payload = {
+        "session_id": str(db_session.id),
+        "status": status_value,
+        "progress": progress_val,
+        "estimated_time_remaining": eta,
+        "analysis_stage": analysis_stage,
+        "analysis_stage_detail": analysis_stage_detail,
+        "updated_at": db_session.updated_at.isoformat() if db_session.updated_at else "",
+        "eta_source": "model" if learned is not None else "static",
+        "retry_after_ms": eta_model.retry_after_ms(stage_remaining),
+    }
+    if status_value == "failed" and getattr(db_session, "error_message", None):
+        payload["failure_reason"] = db_session.error_message
+    return payload
+
+
 @app.get("/api/v1/tasks/sessions/{session_id}/status")
 async def get_task_status(
     session_id: str,
@@ -2420,47 +2781,7 @@ async def get_task_status(
         if not db_session:
             raise HTTPException(status_code=404, detail="任务不存在")
         
-        status_value = db_session.status or "unknown"
-        analysis_stage = getattr(db_session, "analysis_stage", None) or ""
-        analysis_stage_detail = getattr(db_session, "analysis_stage_detail", None)
-        if analysis_stage_detail is not None and not isinstance(analysis_stage_detail, dict):
-            analysis_stage_detail = None  # JSONB 可能返回 dict，确保可序列化
-
-        # 根据阶段估算进度与剩余时间
-        stage_map = {
-            "upload_done": (0.05, 170),
-            "saving_audio": (0.10, 165),
-            "transcribing": (0.20, 120),
-            "matching_profiles": (0.90, 15),
-            "strategy_scene": (0.92, 60),
-            "strategy_matching": (0.94, 55),
-            "strategy_matched_n": (0.96, 50),
-            "strategy_executing": (0.97, 40),
-            "strategy_images": (0.98, 25),
-            "strategy_done": (1.0, 0),
-            "gemini_analysis": (0.50, 45),  # 兼容旧值
-            "voiceprint": (0.90, 10),  # 兼容旧值
-        }
-        if status_value == "failed":
-            progress_val, eta = 0.0, 0
-        elif status_value == "archived" and analysis_stage == "strategy_done":
-            progress_val, eta = 1.0, 0  # 策略就绪，客户端可停止轮询
-        elif status_value == "archived":
-            progress_val, eta = stage_map.get(analysis_stage, (0.95, 30))  # 策略进行中
-        else:
-            progress_val, eta = stage_map.get(analysis_stage, (0.30, 60))
-
-        payload = {
-            "session_id": session_id,
-            "status": status_value,
-            "progress": progress_val,
-            "estimated_time_remaining": eta,
-            "analysis_stage": analysis_stage,
-            "analysis_stage_detail": analysis_stage_detail,
-            "updated_at": db_session.updated_at.isoformat() if db_session.updated_at else ""
-        }
-        if status_value == "failed" and getattr(db_session, "error_message", None):
-            payload["failure_reason"] = db_session.error_message
+        payload = build_task_status_payload(db_session, await _status_transcript_chars(db, db_session))
         return APIResponse(
             code=200,
             message="success",
@@ -2475,8 +2796,161 @@ async def get_task_status(
         raise HTTPException(status_code=500, detail=f"获取状态失败: {str(e)}")
 
 
-async def generate_strategies_async(session_id: str, user_id: str):
-    """异步生成策略分析（在音频分析完成后自动调用）"""
+# 进度推送：每次回查 / 心跳间隔（秒）；NOTIFY 丢失或触发器未安装时靠回查兜底
+PROGRESS_SSE_RECHECK_SEC = float(os.getenv("PROGRESS_SSE_RECHECK_SEC", "15"))
+# 单条 SSE 连接最长保持时间（秒），超时后客户端按 retry 自动重连
+PROGRESS_SSE_MAX_SEC = int(os.getenv("PROGRESS_SSE_MAX_SEC", "900"))
+
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+
+
+def _progress_finished(payload: dict, image_status: Optional[str]) -> bool:
+    # 分析失败（status=failed）或策略失败（status=archived, analysis_stage=failed）均为终态
+    if payload["status"] == "failed" or payload["analysis_stage"] == "failed":
+        return True
+    return payload["analysis_stage"] == "strategy_done" and image_status != "generating"
+
+
+@app.get("/api/v1/tasks/sessions/{session_id}/events")
+async def stream_task_events(
+    session_id: str,
+    user_id: str = Depends(get_current_user_id)
+):
+    """
+    任务进度推送（SSE，替代 /status 轮询）：
+    progress 事件 = /status 同结构快照（额外带 image_status），阶段变化时推送；
+    image 事件 = 单张场景图完成；transcript 事件 = 部分转写已更新（count 条，详情接口 partial=true 可取）；done 事件 = 策略与场景图均结束或失败，随后服务端关闭连接。
+    """
+    from fastapi.responses import StreamingResponse
+    from database.connection import AsyncSessionLocal
+    from services.progress import progress_hub
+
+    try:
+        sid = uuid.UUID(session_id)
+    except ValueError:
+        raise HTTPException(status_code=404, detail="任务不存在")
+
+    async def _snapshot():
+        # 每次使用短会话，避免长连接期间占用连接池
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                select(Session).where(Session.id == sid, Session.user_id == uuid.UUID(user_id))
+            )
+            db_session = result.scalar_one_or_none()
+            if not db_session:
+                return None, None
+            payload = build_task_status_payload(db_session, await _status_transcript_chars(db, db_session))
+            payload["image_status"] = db_session.image_status
+            return payload, db_session.image_status
+
+    first, _ = await _snapshot()
+    if first is None:
+        raise HTTPException(status_code=404, detail="任务不存在")
+
+    async def _stream():
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        last = None
+        async with progress_hub.subscribe(session_id) as queue:
+            yield f"retry: {int(PROGRESS_SSE_RECHECK_SEC * 1000)}\n\n"
+            refresh = True
+            while loop.time() - started < PROGRESS_SSE_MAX_SEC:
+                if refresh:
+                    payload, image_status = await _snapshot()
+                    if payload is None:
+                        yield _sse("done", {"session_id": session_id, "status": "deleted"})
+                        return
+                    if payload != last:
+                        last = payload
+                        yield _sse("progress", payload)
+                    if _progress_finished(payload, image_status):
+                        yield _sse("done", payload)
+                        return
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=PROGRESS_SSE_RECHECK_SEC)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    refresh = True
+                    continue
+                if event.get("type") in ("image", "transcript"):
+                    yield _sse(event["type"], event)
+                    refresh = False
+                else:
+                    refresh = True
+
+    logger.info(f"[进度] SSE 订阅 session_id={session_id}")
+    return StreamingResponse(
+        _stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.post("/api/v1/tasks/sessions/{session_id}/retry")
+async def retry_task(
+    session_id: str,
+    user_id: str = Depends(get_current_user_id),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    失败任务断点续跑（需要JWT认证，仅能重试自己的任务），无需重新上传：
+    - 分析失败（status=failed）：重新派发分析任务，已完成阶段（Gemini 上传 / 转写 / 声纹 / 总结 / 记忆）读检查点跳过
+    - 策略失败（status=archived 且 analysis_stage=failed）：重新派发策略任务，场景识别与已成功的技能复用检查点
+    """
+    from datetime import datetime
+
+    try:
+        result = await db.execute(
+            select(Session).where(
+                Session.id == uuid.UUID(session_id),
+                Session.user_id == uuid.UUID(user_id)
+            )
+        )
+        db_session = result.scalar_one_or_none()
+        if not db_session:
+            raise HTTPException(status_code=404, detail="任务不存在")
+
+        ckpts = await checkpoints.load_all(session_id)
+        if db_session.status == "failed":
+            if not (db_session.audio_url or db_session.audio_path):
+                raise HTTPException(status_code=400, detail="原音频不存在，请重新上传")
+            job_type, stage, resume_from = JOB_ANALYZE, "upload_done", checkpoints.analyze_resume_point(ckpts)
+            run_inline = lambda: _run_analyze_job(
+                {"session_id": session_id, "user_id": user_id, "payload": {"resume": True}}
+            )
+        elif db_session.status == "archived" and db_session.analysis_stage == "failed":
+            job_type, stage = JOB_STRATEGY, "strategy_scene"
+            resume_from = "strategy_matching" if checkpoints.CKPT_SCENE in ckpts else "strategy_scene"
+            run_inline = lambda: generate_strategies_async(session_id, user_id, resume=True)
+        else:
+            raise HTTPException(status_code=409, detail="任务未失败，无需重试")
+
+        await transition_stage(db, session_id, stage, status="analyzing", error_message=None)
+        await dispatch_pipeline_job(job_type, session_id, user_id, {"resume": True}, run_inline)
+        logger.info(f"[分析-{session_id}] 断点续跑已派发 type={job_type} 起点={resume_from} 检查点={sorted(ckpts)}")
+        return APIResponse(
+            code=200,
+            message="success",
+            data={
+                "session_id": session_id,
+                "status": "analyzing",
+                "resume_from": resume_from,
+                "checkpoints": sorted(ckpts),
+            },
+            timestamp=datetime.now().isoformat()
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"重试任务失败: {e}")
+        logger.error(traceback.format_exc())
+        raise HTTPException(status_code=500, detail=f"重试失败: {str(e)}")
+
+
+async def generate_strategies_async(session_id: str, user_id: str, resume: bool = False):
+    """异步生成策略分析（在音频分析完成后自动调用；resume=True 时复用策略阶段检查点）"""
     from datetime import datetime
     from database.connection import AsyncSessionLocal
     
@@ -2510,12 +2984,7 @@ async def generate_strategies_async(session_id: str, user_id: str):
                 return
             
             # 获取transcript
-            transcript = []
-            if analysis_result_db.transcript:
-                try:
-                    transcript = json.loads(analysis_result_db.transcript) if isinstance(analysis_result_db.transcript, str) else analysis_result_db.transcript
-                except:
-                    transcript = []
+            transcript = transcript_codec.row_transcript(analysis_result_db)
             
             # 向后兼容：从内存存储获取（如果数据库中没有）
             analysis_result = analysis_storage.get(session_id, {})
@@ -2531,44 +3000,189 @@ async def generate_strategies_async(session_id: str, user_id: str):
             image_style = get_user_image_style(user_id)
             logger.info(f"[策略流程] 自动生成 image_style={image_style} (来自用户偏好)")
 
-            # 场景生图：AFC disabled，与技能分析并行
-            from scene_image_generator import generate_scene_images as _gen_scene_images
-            asyncio.create_task(_gen_scene_images(
-                transcript=transcript,
-                style_key=image_style,
-                session_id=session_id,
-                user_id=user_id,
-                gemini_flash_model=GEMINI_FLASH_MODEL,
-                generate_image_fn=generate_image_from_prompt,
-                get_profile_refs_fn=_get_profile_reference_images,
-            ))
-            logger.info(f"[策略流程] 场景生图任务已并行启动 session_id={session_id}")
+            # 场景生图：AFC disabled，与技能分析并行（断点续跑且上次已生成完成时不再重复生成）
+            if resume and db_session.image_status == "completed":
+                logger.info(f"[策略流程] 断点续跑，场景图片已生成，跳过 session_id={session_id}")
+            else:
+                from scene_image_generator import generate_scene_images as _gen_scene_images
+                asyncio.create_task(_gen_scene_images(
+                    transcript=transcript,
+                    style_key=image_style,
+                    session_id=session_id,
+                    user_id=user_id,
+                    gemini_flash_model=GEMINI_FLASH_MODEL,
+                    generate_image_fn=generate_image_from_prompt,
+                    get_profile_refs_fn=_get_profile_reference_images,
+                ))
+                logger.info(f"[策略流程] 场景生图任务已并行启动 session_id={session_id}")
 
             # 调用核心策略生成逻辑
-            await _generate_strategies_core(session_id, user_id, transcript, db, image_style=image_style)
+            await _generate_strategies_core(session_id, user_id, transcript, db, image_style=image_style, resume=resume)
             
         except Exception as e:
             logger.error(f"异步生成策略分析失败: {e}")
             logger.error(traceback.format_exc())
             # 策略失败时仍设为 archived，让用户可查看对话并手动重试策略
             try:
-                result = await db.execute(
-                    select(Session).where(
-                        Session.id == uuid.UUID(session_id),
-                        Session.user_id == uuid.UUID(user_id)
-                    )
-                )
-                db_session = result.scalar_one_or_none()
-                if db_session and db_session.status == "analyzing":
-                    db_session.status = "archived"
-                    db_session.analysis_stage = "failed"
-                    db_session.error_message = str(e)[:500]
-                    await db.commit()
+                if await transition_stage(db, session_id, "failed", status="archived",
+                                          error_message=str(e)[:500], only_if_status="analyzing"):
                     logger.info(f"策略失败，已将 {session_id} 设为 archived，用户可查看对话并重试")
             except Exception as db_err:
                 logger.warning(f"策略失败后更新 status 失败: {db_err}")
 
 
+# ==================== 持久化任务队列 ====================
+
+async def dispatch_pipeline_job(job_type: str, session_id: str, user_id: str, payload: dict, run_inline):
+    """
+    流水线任务派发：默认写入 pipeline_jobs 由 worker 认领；
+    队列关闭（PIPELINE_QUEUE_ENABLED=false）或入队失败（如未执行迁移）时回退为进程内 create_task
+    """
+    if JOB_QUEUE_ENABLED:
+        try:
+            await enqueue_job(job_type, session_id, user_id, payload)
+            return
+        except Exception as e:
+            logger.error(f"[队列] 入队失败，回退为进程内执行 type={job_type} session_id={session_id}: {e}")
+    asyncio.create_task(run_inline())
+
+
+async def _resolve_job_input_file(session_id: str, payload: dict) -> Tuple[Optional[str], str]:
+    """
+    分析任务的输入文件：优先用上传时落盘的 spool 文件；
+    重试时若 spool 文件已被清理，则从已持久化的原音频硬链接一份（分析结束会删除输入文件，不能直接用持久化路径）
+    """
+    from database.connection import AsyncSessionLocal
+    from utils.audio_storage import get_session_audio_local_path
+    file_path = payload.get("file_path")
+    file_filename = payload.get("file_filename") or "audio.m4a"
+    if file_path and os.path.exists(file_path):
+        return file_path, file_filename
+    async with AsyncSessionLocal() as db:
+        res = await db.execute(select(Session.audio_url, Session.audio_path).where(Session.id == uuid.UUID(session_id)))
+        row = res.first()
+    if not row or not (row.audio_url or row.audio_path):
+        return None, file_filename
+    local_path, is_temp = await asyncio.to_thread(get_session_audio_local_path, row.audio_url, row.audio_path)
+    if not local_path:
+        return None, file_filename
+    if is_temp:
+        return local_path, file_filename
+    from utils.audio_ingest import link_into
+    suffix = Path(local_path).suffix or Path(file_filename).suffix or ".m4a"
+    spool_path = await asyncio.to_thread(link_into, local_path, UPLOAD_SPOOL_DIR, suffix)
+    logger.info(f"[队列] session_id={session_id} spool 文件不存在，已从持久化原音频恢复输入: {spool_path}")
+    return spool_path, file_filename
+
+
+async def _record_audio_sha256(session_id: str, file_path: str) -> None:
+    """直传会话：按 worker 实际取到的音频内容计算 SHA-256 写入 audio_sha256（客户端声明的哈希不可信，不落库）"""
+    from database.connection import AsyncSessionLocal
+    from sqlalchemy import update
+    sha256 = await asyncio.to_thread(gemini_file_cache.file_sha256, file_path)
+    async with AsyncSessionLocal() as db:
+        await db.execute(
+            update(Session).where(Session.id == uuid.UUID(session_id), Session.audio_sha256.is_(None))
+            .values(audio_sha256=sha256, updated_at=Session.updated_at)
+        )
+        await db.commit()
+
+
+async def _load_live_transcript(session_id: str) -> Optional[Tuple[AudioAnalysisResponse, Optional[Call1Response]]]:
+    """实时录音：读取边录边转写的部分结果，做一次 reduce 得到完整 Call1；无部分结果时返回 None（回退整段转写）"""
+    from database.connection import AsyncSessionLocal
+    async with AsyncSessionLocal() as db:
+        res = await db.execute(
+            select(AnalysisResult).where(
+                AnalysisResult.session_id == uuid.UUID(session_id), AnalysisResult.is_partial.is_(True)
+            )
+        )
+        partial = res.scalar_one_or_none()
+    transcript = transcript_codec.row_transcript(partial) if partial is not None else []
+    if not transcript:
+        return None
+    stats = partial.stats or {}
+    merged = {
+        "transcript": transcript,
+        "sigh_count": int(stats.get("sigh") or 0),
+        "laugh_count": int(stats.get("laugh") or 0),
+        "risks": list(partial.risks or []),
+        "mood_score": 70,
+        "summary": "",
+        "card_title": None,
+    }
+    model = gemini_gateway.get_model(GEMINI_FLASH_MODEL)
+    return build_analysis_results(await _reduce_transcript(model, merged, session_id))
+
+
+async def _run_analyze_job(job: dict):
+    """队列任务：音频分析（analyze_audio_async 自行处理失败并标记 session）"""
+    from database.connection import AsyncSessionLocal
+    session_id, user_id = job["session_id"], job["user_id"]
+    file_path, file_filename = await _resolve_job_input_file(session_id, job["payload"])
+    task_data = tasks_storage.get(session_id)
+    if task_data is None:
+        async with AsyncSessionLocal() as db:
+            res = await db.execute(select(Session).where(Session.id == uuid.UUID(session_id)))
+            db_session = res.scalar_one_or_none()
+        if not db_session:
+            logger.warning(f"[队列] session 已不存在，跳过分析任务: {session_id}")
+            return
+        start_time = db_session.start_time or db_session.created_at or datetime.now()
+        task_data = {
+            "session_id": session_id,
+            "user_id": user_id,
+            "title": db_session.title,
+            "start_time": start_time.astimezone().replace(tzinfo=None).isoformat(),
+            "status": "analyzing",
+        }
+        tasks_storage[session_id] = task_data
+    if not file_path:
+        raise FileNotFoundError(f"分析输入文件不存在且无持久化原音频: session_id={session_id}")
+    if job["payload"].get("oss_key"):
+        await _record_audio_sha256(session_id, file_path)  # 须在 find_reusable_analysis 之前
+    precomputed = await _load_live_transcript(session_id) if job["payload"].get("live") else None
+    await analyze_audio_async(session_id, file_path, file_filename, task_data, user_id, precomputed=precomputed,
+                              resume=bool(job["payload"].get("resume")))
+
+
+async def _run_strategy_job(job: dict):
+    """队列任务：策略生成"""
+    await generate_strategies_async(job["session_id"], job["user_id"], resume=bool(job["payload"].get("resume")))
+
+
+async def _on_analyze_job_dead(job: dict):
+    """分析任务重试耗尽（多次执行中断）：标记 session 失败，避免客户端一直看到 analyzing"""
+    from database.connection import AsyncSessionLocal
+    async with AsyncSessionLocal() as db:
+        if await transition_stage(db, job["session_id"], "failed", status="failed",
+                                  error_message="分析任务多次中断，请重新上传", only_if_status="analyzing"):
+            logger.warning(f"[队列] 分析任务重试耗尽，session 已标记 failed: {job['session_id']}")
+
+
+async def _on_strategy_job_dead(job: dict):
+    """策略任务重试耗尽：与 generate_strategies_async 失败处理一致，设为 archived 让用户可查看对话并手动重试"""
+    from database.connection import AsyncSessionLocal
+    async with AsyncSessionLocal() as db:
+        await transition_stage(db, job["session_id"], "failed", status="archived",
+                               error_message="策略生成多次中断，可手动重试", only_if_status="analyzing")
+
+
+PIPELINE_JOB_HANDLERS = {
+    JOB_ANALYZE: _run_analyze_job,
+    JOB_STRATEGY: _run_strategy_job,
+}
+PIPELINE_JOB_DEAD_HANDLERS = {
+    JOB_ANALYZE: _on_analyze_job_dead,
+    JOB_STRATEGY: _on_strategy_job_dead,
+}
+
+
+def create_pipeline_worker(**kwargs) -> JobWorker:
+    """API 进程内嵌 worker 与独立 worker（pipeline_worker.py）共用"""
+    return JobWorker(PIPELINE_JOB_HANDLERS, PIPELINE_JOB_DEAD_HANDLERS, **kwargs)
+
+
 @app.get("/api/v1/sessions/{session_id}/image-status")
 async def get_image_status(
     session_id: str,
@@ -2653,44 +3267,60 @@ def _build_legacy_skill_cards(visual_data: list, strategies: list, applied_skill
     }]
 
 
+def _skill_result_to_checkpoint(skill_result: dict) -> dict:
+    """技能执行结果 → 可 JSON 序列化的检查点（Call2Response 转 dict）"""
+    data = dict(skill_result)
+    if data.get("result") is not None and hasattr(data["result"], "dict"):
+        data["result"] = data["result"].dict()
+    return data
+
+
+def _skill_result_from_checkpoint(data: dict) -> dict:
+    """检查点 → 技能执行结果（与 execute_skill 返回结构一致，额外标记 resumed）"""
+    skill_result = dict(data)
+    if isinstance(skill_result.get("result"), dict):
+        skill_result["result"] = Call2Response(**skill_result["result"])
+    skill_result["resumed"] = True
+    return skill_result
+
+
 async def _generate_strategies_core(
     session_id: str,
     user_id: str,
     transcript: list,
     db: AsyncSession,
     image_style: Optional[str] = None,
+    resume: bool = False,
 ):
-    """策略生成核心逻辑（v0.4 技能化架构）"""
+    """策略生成核心逻辑（v0.4 技能化架构）；resume=True 时场景识别 / 已成功的技能 / C 钩子复用检查点"""
     from datetime import datetime
     import asyncio
     
     try:
         logger.info(f"========== 开始生成策略分析（v0.4 技能化架构） ==========")
         logger.info(f"session_id: {session_id}")
+        stage_timing.bind_session(session_id)
+        ckpts = await checkpoints.load_all(session_id) if resume else {}
         # 进度：识别场景
-        _sq = await db.execute(select(Session).where(Session.id == uuid.UUID(session_id)))
-        _ss = _sq.scalar_one_or_none()
-        if _ss:
-            _ss.analysis_stage = "strategy_scene"
-            _ss.analysis_stage_detail = None
-            await db.commit()
+        await transition_stage(db, session_id, "strategy_scene")
 
         # 2.1 场景识别（Router Agent）
         logger.info("[策略流程] 步骤2.1: 场景识别(Gemini classify_scene)...")
-        model = genai.GenerativeModel(GEMINI_FLASH_MODEL)
-        scene_result = classify_scene(transcript, model)
+        model = gemini_gateway.get_model(GEMINI_FLASH_MODEL)
+        if checkpoints.CKPT_SCENE in ckpts:
+            scene_result = ckpts[checkpoints.CKPT_SCENE]
+            logger.info("[策略流程] 步骤2.1: 检查点已有场景识别结果，跳过 Gemini")
+        else:
+            with stage_timing.timed("scene_classify", model=GEMINI_FLASH_MODEL):
+                scene_result = await asyncio.to_thread(classify_scene, transcript, model)
+            await checkpoints.save(session_id, checkpoints.CKPT_SCENE, scene_result)
         primary_scene = scene_result.get("primary_scene", "other")
         scenes = scene_result.get("scenes", [])
         logger.info(f"[策略流程] 步骤2.1: 完成 primary_scene={primary_scene}")
         for scene in scenes:
             logger.info(f"  - {scene.get('category')}: {scene.get('confidence', 0):.2f}")
         # 进度：匹配技能
-        _mq = await db.execute(select(Session).where(Session.id == uuid.UUID(session_id)))
-        _ms = _mq.scalar_one_or_none()
-        if _ms:
-            _ms.analysis_stage = "strategy_matching"
-            _ms.analysis_stage_detail = None
-            await db.commit()
+        await transition_stage(db, session_id, "strategy_matching")
 
         # 2.2 前置：通过 speaker_mapping 查询参与者档案，用于场景强制
         _participant_profiles: list = []
@@ -2784,12 +3414,9 @@ async def _generate_strategies_core(
             logger.info(f"  ✅ 技能: {skill['skill_id']} (名称: {skill.get('name', 'N/A')}, priority={skill['priority']}, confidence={skill['confidence']:.2f})")
         # 进度：匹配了 N 个技能
         skill_names = [s.get("name") or s.get("skill_id", "") for s in matched_skills]
-        _nq = await db.execute(select(Session).where(Session.id == uuid.UUID(session_id)))
-        _ns = _nq.scalar_one_or_none()
-        if _ns:
-            _ns.analysis_stage = "strategy_matched_n"
-            _ns.analysis_stage_detail = {"skills_matched": len(matched_skills), "skill_names": skill_names}
-            await db.commit()
+        await transition_stage(
+            db, session_id, "strategy_matched_n", {"skills_matched": len(matched_skills), "skill_names": skill_names}
+        )
 
         # 2.2b v0.6 记忆检索：为技能注入相关记忆
         memory_context = ""
@@ -2827,12 +3454,7 @@ async def _generate_strategies_core(
         }
         
         # 进度：技能加工中
-        _eq = await db.execute(select(Session).where(Session.id == uuid.UUID(session_id)))
-        _es = _eq.scalar_one_or_none()
-        if _es:
-            _es.analysis_stage = "strategy_executing"
-            _es.analysis_stage_detail = None
-            await db.commit()
+        await transition_stage(db, session_id, "strategy_executing")
 
         # 2.3 技能执行：transcript + 技能 prompt -> Gemini -> 策略与视觉描述
         logger.info("[策略流程] 步骤2.3: 技能执行(transcript+技能prompt->Gemini)...")
@@ -2842,6 +3464,11 @@ async def _generate_strategies_core(
         execution_tasks = []
         for matched_skill in matched_skills:
             skill_id = matched_skill["skill_id"]
+            _skill_ckpt = ckpts.get(f"{checkpoints.CKPT_SKILL_PREFIX}{skill_id}")
+            if _skill_ckpt:
+                logger.info(f"[策略流程] 技能 {skill_id} 检查点已有结果，跳过执行")
+                skill_results.append(_skill_result_from_checkpoint(_skill_ckpt))
+                continue
             try:
                 skill = await get_skill(skill_id, db)
                 if not skill:
@@ -2876,12 +3503,18 @@ async def _generate_strategies_core(
 
         async def _run_one_skill(skill_id, matched_skill_info, coro):
             try:
-                result = await coro
+                with stage_timing.timed(f"skill:{skill_id}", model=GEMINI_FLASH_MODEL) as _t:
+                    result = await coro
+                    _t.outcome = "ok" if result.get("success") else "error"
                 result["name"] = matched_skill_info.get("name", skill_id)
                 result["dimension"] = matched_skill_info.get("dimension", "")
                 result["matched_sub_skill"] = matched_skill_info.get("matched_sub_skill", "")
                 result["matched_sub_skill_id"] = matched_skill_info.get("matched_sub_skill_id", "")
                 result["category"] = matched_skill_info.get("category", "")
+                if result.get("success"):
+                    await checkpoints.save(
+                        session_id, f"{checkpoints.CKPT_SKILL_PREFIX}{skill_id}", _skill_result_to_checkpoint(result)
+                    )
                 return result
             except Exception as e:
                 logger.error(f"执行技能失败: {skill_id}, 错误: {e}")
@@ -2907,8 +3540,10 @@ async def _generate_strategies_core(
                 skill_results.append(_r)
         # ────────────────────────────────────────────────────────────────────
         
-        # 记录技能执行到数据库
+        # 记录技能执行到数据库（检查点复用的技能上次已记录）
         for skill_result in skill_results:
+            if skill_result.get("resumed"):
+                continue
             try:
                 skill_execution = SkillExecution(
                     session_id=uuid.UUID(session_id),
@@ -3014,8 +3649,10 @@ async def _generate_strategies_core(
             call2_result = Call2Response(visual=[], strategies=[])
         logger.info(f"[策略流程] 步骤2.3a: 完成 skill_cards={len(skill_cards)} 兼容visual={len(call2_result.visual)} 兼容strategies={len(call2_result.strategies)}")
         
-        # v0.6 记忆补充（C 钩子）：策略文本写入 Mem0
-        if call2_result.strategies:
+        # v0.6 记忆补充（C 钩子）：策略文本写入 Mem0（检查点记录已写入时不再重复写）
+        if checkpoints.CKPT_MEMORY_WRITE_STRATEGY in ckpts:
+            logger.info(f"[记忆] C 钩子跳过: session_id={session_id} 检查点记录已写入")
+        elif call2_result.strategies:
             logger.info(f"[记忆] C 钩子触发: session_id={session_id} 策略数={len(call2_result.strategies)}")
             try:
                 from services.memory_service import add_memory
@@ -3034,10 +3671,14 @@ async def _generate_strategies_core(
                 if skill_ids:
                     metadata["skill_ids"] = skill_ids
                 logger.info(f"[记忆] C 钩子调用 add_memory: session_id={session_id} strategy_text_len={len(strategy_text)} metadata={metadata}")
-                ok = await asyncio.to_thread(
-                    add_memory, strategy_text, user_id, metadata=metadata, enable_graph=True
-                )
+                with stage_timing.timed("memory_write") as _t:
+                    ok = await asyncio.to_thread(
+                        add_memory, strategy_text, user_id, metadata=metadata, enable_graph=True
+                    )
+                    _t.outcome = "ok" if ok else "error"
                 logger.info(f"[记忆] C 钩子 add_memory 结果: session_id={session_id} success={ok}")
+                if ok:
+                    await checkpoints.save(session_id, checkpoints.CKPT_MEMORY_WRITE_STRATEGY, {"ok": True})
             except Exception as mem_err:
                 logger.warning(f"[记忆] C 钩子写入失败: session_id={session_id} error={mem_err}", exc_info=True)
         else:
@@ -3092,6 +3733,7 @@ async def _generate_strategies_core(
         )
 
         # 如果已存在则更新，否则创建
+        _db_timer = stage_timing.start("db_write_strategy")
         existing_query = await db.execute(
             select(StrategyAnalysis).where(StrategyAnalysis.session_id == uuid.UUID(session_id))
         )
@@ -3111,17 +3753,10 @@ async def _generate_strategies_core(
             db.add(strategy_analysis)
             await db.commit()
             logger.info(f"[策略流程] 步骤2.4: 已保存到数据库: {session_id}")
+        _db_timer.finish()
 
         # 进度：策略就绪，此时才将 status 设为 archived，确保列表「分析完成」时用户点进即能看见全部内容
-        _dq = await db.execute(
-            select(Session).where(Session.id == uuid.UUID(session_id)).execution_options(populate_existing=True)
-        )
-        _ds = _dq.scalar_one_or_none()
-        if _ds:
-            _ds.analysis_stage = "strategy_done"
-            _ds.analysis_stage_detail = None
-            _ds.status = "archived"  # 策略完成后再归档，实现「列表完成=点进即看」
-            await db.commit()
+        await transition_stage(db, session_id, "strategy_done", status="archived")  # 策略完成后再归档，实现「列表完成=点进即看」
 
         # 存储策略结果到内存（向后兼容）
         if session_id not in analysis_storage:
@@ -3187,19 +3822,14 @@ async def classify_scene_endpoint(
             raise HTTPException(status_code=400, detail="分析结果不存在，请先完成音频分析")
         
         # 获取transcript
-        transcript = []
-        if analysis_result_db.transcript:
-            try:
-                transcript = json.loads(analysis_result_db.transcript) if isinstance(analysis_result_db.transcript, str) else analysis_result_db.transcript
-            except:
-                transcript = []
+        transcript = transcript_codec.row_transcript(analysis_result_db)
         
         if not transcript:
             raise HTTPException(status_code=400, detail="对话转录数据不存在，请先完成音频分析")
         
         # 场景识别
-        model = genai.GenerativeModel(GEMINI_FLASH_MODEL)
-        scene_result = classify_scene(transcript, model)
+        model = gemini_gateway.get_model(GEMINI_FLASH_MODEL)
+        scene_result = await asyncio.to_thread(classify_scene, transcript, model)
 
         # 档案查询（通过 speaker_mapping 获取参与者关系）
         _reclassify_profiles: list = []
@@ -3363,12 +3993,7 @@ async def generate_strategies(
             raise HTTPException(status_code=400, detail="分析结果不存在，请先完成音频分析")
         
         # 获取transcript
-        transcript = []
-        if analysis_result_db.transcript:
-            try:
-                transcript = json.loads(analysis_result_db.transcript) if isinstance(analysis_result_db.transcript, str) else analysis_result_db.transcript
-            except:
-                transcript = []
+        transcript = transcript_codec.row_transcript(analysis_result_db)
         
         # 向后兼容：从内存存储获取（如果数据库中没有）
         analysis_result = analysis_storage.get(session_id, {})
@@ -3796,6 +4421,38 @@ async def cleanup_images_endpoint(days: int = Query(7, ge=1, le=30)):
         raise HTTPException(status_code=500, detail=f"清理失败: {str(e)}")
 
 
+@app.get("/api/v1/admin/gemini-metrics")
+async def gemini_metrics_endpoint():
+    """Gemini 网关指标（当前 worker 进程内）：按用途统计调用数、重试、延迟分位与 token 用量"""
+    return {"pid": os.getpid(), "metrics": gemini_gateway.metrics_snapshot()}
+
+
+@app.get("/api/v1/admin/gemini-file-cache")
+async def gemini_file_cache_endpoint(db: AsyncSession = Depends(get_db)):
+    """Gemini 文件句柄缓存：当前 worker 进程内命中率 / 清理计数，以及缓存表现状（全部 worker 共享）"""
+    data = {"pid": os.getpid(), "metrics": gemini_file_cache.metrics_snapshot()}
+    try:
+        data["table"] = await gemini_file_cache.stats(db)
+    except Exception as e:
+        data["table"] = {"error": str(e)}
+    return data
+
+
+@app.get("/api/v1/admin/stage-latency")
+async def stage_latency_endpoint(
+    days: int = Query(7, ge=1, le=90),
+    stage: Optional[str] = None,
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    流水线分阶段耗时报表（全部 worker，来自 pipeline_stage_timings）：
+    每个阶段一行 size_bucket=all 汇总，另按文件大小分桶给出 p50 / p95 / p99、错误数与平均重试
+    """
+    await stage_timing.flush()  # 先落库本进程缓冲，报表包含最新记录
+    rows = await stage_timing.latency_report(db, days=days, stage=stage)
+    return {"days": days, "size_buckets_mb": stage_timing.STAGE_TIMING_SIZE_BUCKETS_MB, "stages": rows}
+
+
 @app.get("/test-gemini")
 async def test_gemini():
     """测试 Gemini 3 Flash API 连接"""
@@ -3803,8 +4460,8 @@ async def test_gemini():
         print("测试 Gemini 3 Flash API 连接...")
         model_name = GEMINI_FLASH_MODEL
         print(f"使用模型: {model_name}")
-        model = genai.GenerativeModel(model_name)
-        response = model.generate_content("请回复'连接成功'")
+        model = gemini_gateway.get_model(model_name)
+        response = await model.generate_content_async("请回复'连接成功'", purpose="test")
         return {
             "status": "success",
             "message": "Gemini 3 Flash API 连接正常",
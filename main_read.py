@@ -5,7 +5,6 @@
 """
 import os
 import re
-import json
 import time
 import traceback
 import logging
@@ -120,6 +119,7 @@ from database.connection import get_db, init_db, close_db
 from database.models import Session, AnalysisResult, StrategyAnalysis, Profile
 from auth.jwt_handler import get_current_user_id
 from schemas.strategy_schemas import StrategyItem, VisualData, Call2Response
+from utils import transcript_codec
 
 # OSS 配置（用于图片代理）
 OSS_ACCESS_KEY_ID = os.getenv("OSS_ACCESS_KEY_ID")
@@ -348,7 +348,7 @@ async def get_task_detail(
         conversation_summary = None
 
         if analysis_result:
-            dialogues = analysis_result.dialogues if isinstance(analysis_result.dialogues, list) else []
+            transcript, dialogues = transcript_codec.load_views(analysis_result)
             risks = analysis_result.risks or []
             summary = analysis_result.summary
             speaker_mapping = (
@@ -358,21 +358,6 @@ async def get_task_detail(
             )
             conversation_summary = getattr(analysis_result, "conversation_summary", None)
 
-            transcript = []
-            if getattr(analysis_result, "transcript", None):
-                try:
-                    transcript = (
-                        json.loads(analysis_result.transcript)
-                        if isinstance(analysis_result.transcript, str)
-                        else (analysis_result.transcript or [])
-                    )
-                except Exception:
-                    transcript = []
-            if not transcript and getattr(analysis_result, "call1_result", None):
-                call1 = analysis_result.call1_result
-                if isinstance(call1, dict) and "transcript" in call1:
-                    transcript = call1.get("transcript") or []
-
             name_to_display = {}
             self_profile_id = None
             self_display = None
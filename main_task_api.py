@@ -21,7 +21,6 @@ from main import (
     analyze_audio,
     AudioAnalysisResponse,
     DialogueItem,
-    wait_for_file_active,
     parse_gemini_response,
     logger,
     genai
@@ -0,0 +1,51 @@
+"""
+流水线独立 Worker 进程
+从 pipeline_jobs 队列认领「分析 / 策略生成」任务执行，让 API 进程只处理请求。
+
+用法:
+    python pipeline_worker.py
+部署独立 worker 时，API 服务需设置 PIPELINE_EMBEDDED_WORKER=false（见 systemd/gemini-audio-worker.service）。
+并发数: PIPELINE_WORKER_CONCURRENCY（默认 2）；可起多个进程，SKIP LOCKED 保证同一任务只被一个 worker 执行。
+"""
+import asyncio
+import logging
+import os
+import signal
+import sys
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# 复用 main 中的 Gemini / 代理配置与流水线实现（导入不会启动 HTTP 服务）
+import main  # noqa: E402
+from database.connection import close_db  # noqa: E402
+from services import gemini_file_cache, stage_timing  # noqa: E402
+
+logger = logging.getLogger("pipeline_worker")
+
+
+async def run_worker():
+    worker = main.create_pipeline_worker()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        try:
+            loop.add_signal_handler(sig, worker.stop)
+        except NotImplementedError:
+            pass
+    logger.info(f"[worker] 启动 pid={os.getpid()} id={worker.worker_id}")
+    gemini_file_cache.start_sweeper()
+    try:
+        await worker.run()
+    finally:
+        gemini_file_cache.stop_sweeper()
+        await stage_timing.shutdown()
+        await close_db()
+        logger.info("[worker] 已退出")
+
+
+if __name__ == "__main__":
+    if not main.JOB_QUEUE_ENABLED:
+        print("PIPELINE_QUEUE_ENABLED=false，队列未启用，worker 无需运行")
+        sys.exit(0)
+    asyncio.run(run_worker())
@@ -5,12 +5,14 @@ import logging
 import re
 import uuid as _uuid
 
-import google.generativeai as genai
-
 from database.connection import AsyncSessionLocal
 from database.models import Session, StrategyAnalysis
 from sqlalchemy import select
 
+from services import stage_timing
+from services.gemini_gateway import get_model
+from services.progress import publish_event
+
 logger = logging.getLogger(__name__)
 
 
@@ -55,8 +57,8 @@ async def _analyze_character_profiles(
         "}"
     )
     try:
-        model = genai.GenerativeModel(gemini_flash_model)
-        response = await asyncio.to_thread(model.generate_content, prompt)
+        model = get_model(gemini_flash_model)
+        response = await model.generate_content_async(prompt, purpose="scene")
         raw = response.text.strip()
         m = re.search(r'\{.*\}', raw, re.DOTALL)
         if m:
@@ -127,8 +129,8 @@ async def generate_scene_images(
 - 描述格式示例："用户正在向对方汇报工作进展，表情认真"、"对方向用户提出质疑，用户在解释"
 - 只返回JSON：{{"scene_count": 2, "scenes": ["场景1", "场景2"]}}"""
 
-            model = genai.GenerativeModel(gemini_flash_model)
-            response = await asyncio.to_thread(model.generate_content, scene_prompt)
+            model = get_model(gemini_flash_model)
+            response = await model.generate_content_async(scene_prompt, purpose="scene")
             text = response.text.strip()
 
             # 解析 JSON
@@ -182,18 +184,32 @@ async def generate_scene_images(
                 # generate_image_fn is sync (old SDK), call via asyncio.to_thread
                 # 每张图最多等 120 秒，超时返回 None（视为失败）
                 try:
-                    return await asyncio.wait_for(
-                        asyncio.to_thread(
-                            generate_image_fn,
-                            scene_with_profile,
-                            user_id, session_id, 1000 + i,  # index 1000+ 避免与技能图片冲突
-                            profile_refs if profile_refs else None, 3, style_key
-                        ),
-                        timeout=120.0,
-                    )
+                    with stage_timing.timed("scene_image", session_id=session_id) as _t:
+                        img = await asyncio.wait_for(
+                            asyncio.to_thread(
+                                generate_image_fn,
+                                scene_with_profile,
+                                user_id, session_id, 1000 + i,  # index 1000+ 避免与技能图片冲突
+                                profile_refs if profile_refs else None, 3, style_key
+                            ),
+                            timeout=120.0,
+                        )
+                        _t.outcome = "ok" if img else "error"
                 except asyncio.TimeoutError:
                     logger.error(f"[场景生图] 图{i} 生成超时(120s)，跳过")
-                    return None
+                    img = None
+                except Exception:
+                    await publish_event(session_id, {"type": "image", "index": 1000 + i, "ok": False, "total": len(scenes)})
+                    raise
+                # 单图完成即推送（base64 超出 NOTIFY 载荷上限，只推 URL，客户端按需拉取详情）
+                await publish_event(session_id, {
+                    "type": "image",
+                    "index": 1000 + i,
+                    "ok": img is not None,
+                    "image_url": img if img and img.startswith("http") else None,
+                    "total": len(scenes),
+                })
+                return img
 
             results = await asyncio.gather(
                 *[gen_one(i, scene) for i, scene in enumerate(scenes)],
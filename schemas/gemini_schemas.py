@@ -0,0 +1,93 @@
+"""
+Gemini 结构化输出（JSON mode / responseSchema）配置
+- GEMINI_JSON_MODE=true 时相关调用带 responseMimeType=application/json：模型只输出 JSON，不再包 Markdown 代码块或说明文字
+- 字段固定的调用（Call1 整段 / 分片 / reduce、场景分类打分）同时带 responseSchema，字段与类型由服务端约束
+- 技能输出结构各异，只开 JSON mode、不带 schema
+解析仍统一走 utils.json_stream 的容错解析（截断、旧模型或代理不支持 schema 时兜底）
+"""
+import os
+from typing import Any, Dict, List, Optional
+
+GEMINI_JSON_MODE = os.getenv("GEMINI_JSON_MODE", "true").lower() in ("true", "1", "yes")
+
+_STRING = {"type": "STRING"}
+_INTEGER = {"type": "INTEGER"}
+_STRING_LIST = {"type": "ARRAY", "items": _STRING}
+
+
+def _object(properties: Dict[str, Any], required: Optional[List[str]] = None) -> Dict[str, Any]:
+    # propertyOrdering 与提示词示例的字段顺序一致（流式解析时 transcript 之前的字段先到）
+    return {
+        "type": "OBJECT",
+        "properties": properties,
+        "required": list(properties) if required is None else required,
+        "propertyOrdering": list(properties),
+    }
+
+
+TRANSCRIPT_ITEM_SCHEMA = _object({
+    "speaker": _STRING,
+    "text": _STRING,
+    "timestamp": _STRING,
+    "is_me": {"type": "BOOLEAN"},
+})
+
+_TRANSCRIPT = {"type": "ARRAY", "items": TRANSCRIPT_ITEM_SCHEMA}
+
+CALL1_SCHEMA = _object({
+    "mood_score": _INTEGER,
+    "sigh_count": _INTEGER,
+    "laugh_count": _INTEGER,
+    "summary": _STRING,
+    "card_title": _STRING,
+    "transcript": _TRANSCRIPT,
+    "risks": _STRING_LIST,
+})
+
+# 单次分析模式：Call1 / reduce 同时输出「谁和谁对话」总结，放在最后（不推迟流式转写的首批条目）
+CALL1_SINGLE_PASS_SCHEMA = _object({**CALL1_SCHEMA["properties"], "conversation_summary": _STRING})
+
+CALL1_MAP_SCHEMA = _object({
+    "sigh_count": _INTEGER,
+    "laugh_count": _INTEGER,
+    "transcript": _TRANSCRIPT,
+    "risks": _STRING_LIST,
+})
+
+CALL1_REDUCE_SCHEMA = _object({
+    "mood_score": _INTEGER,
+    "summary": _STRING,
+    "card_title": _STRING,
+    "risks": _STRING_LIST,
+})
+
+CALL1_REDUCE_SINGLE_PASS_SCHEMA = _object({**CALL1_REDUCE_SCHEMA["properties"], "conversation_summary": _STRING})
+
+OTHER_PERSON_TYPES = [
+    "boss_or_superior", "coworker_or_peer", "subordinate", "romantic_partner", "parent_or_inlaw",
+    "child_or_teen", "other_family", "professor_or_teacher", "classmate_or_roommate", "close_friend",
+    "stranger_or_service", "self_reflection", "unknown",
+]
+
+
+def classify_schema(categories: List[str], skill_ids: List[str]) -> Dict[str, Any]:
+    """场景分类 + 技能打分：分类取值用枚举约束，skill_scores 按本次待打分技能逐个列出"""
+    properties: Dict[str, Any] = {
+        "other_person_type": {"type": "STRING", "enum": OTHER_PERSON_TYPES},
+        "primary_category": {"type": "STRING", "enum": list(categories)},
+        "scene_description": _STRING,
+    }
+    if skill_ids:
+        # OBJECT 的 properties 不能为空，无待打分技能时不带 skill_scores
+        properties["skill_scores"] = _object({sid: _INTEGER for sid in skill_ids})
+    return _object(properties)
+
+
+def json_config(schema: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+    """generation_config 覆盖项：JSON mode（及可选 responseSchema）；GEMINI_JSON_MODE 关闭时返回 None"""
+    if not GEMINI_JSON_MODE:
+        return None
+    config: Dict[str, Any] = {"responseMimeType": "application/json"}
+    if schema:
+        config["responseSchema"] = schema
+    return config
@@ -2,11 +2,12 @@
 Call #2 策略分析相关数据模型与解析函数
 供 main 与 skills 模块共用，避免循环导入
 """
-import json
 from typing import List, Optional
 from pydantic import BaseModel
 from fastapi import HTTPException
 
+from utils.json_stream import loads_tolerant
+
 
 class StrategyItem(BaseModel):
     """策略项数据模型"""
@@ -40,6 +41,7 @@ class Call2Response(BaseModel):
 def parse_gemini_response(response_text: str) -> dict:
     """
     解析 Gemini 返回的文本，提取 JSON 数据
+    容错：Markdown 代码块、前后说明文字、尾随逗号、截断的字符串 / 数组 / 对象（见 utils.json_stream）
 
     Args:
         response_text: Gemini 返回的文本
@@ -47,21 +49,7 @@ def parse_gemini_response(response_text: str) -> dict:
     Returns:
         解析后的字典数据
     """
-    text = response_text.strip()
-
-    if "```json" in text:
-        start = text.find("```json") + 7
-        end = text.find("```", start)
-        if end != -1:
-            text = text[start:end].strip()
-    elif "```" in text:
-        start = text.find("```") + 3
-        end = text.find("```", start)
-        if end != -1:
-            text = text[start:end].strip()
-
     try:
-        data = json.loads(text)
-        return data
-    except json.JSONDecodeError as e:
+        return loads_tolerant(response_text, dict)
+    except ValueError as e:
         raise HTTPException(status_code=500, detail=f"无法解析 Gemini 返回的 JSON: {str(e)}")
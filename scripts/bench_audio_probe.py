@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+对比 utils.audio_probe（纯 Python 解析容器头）与 ffprobe 获取音频时长的耗时与精度
+
+用法:
+  python scripts/bench_audio_probe.py a.m4a b.mp3 c.wav [--runs 5]
+  未给文件时用 ffmpeg 生成 5 / 30 / 90 分钟的 m4a、mp3、wav、aac 测试音频（需 ffmpeg）
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from utils.audio_probe import probe_audio  # noqa: E402
+
+_SAMPLE_CODECS = {
+    ".m4a": ["-c:a", "aac", "-b:a", "64k"],
+    ".mp3": ["-c:a", "libmp3lame", "-b:a", "64k"],
+    ".wav": ["-ac", "1", "-ar", "16000", "-c:a", "pcm_s16le"],
+    ".aac": ["-c:a", "aac", "-b:a", "64k", "-f", "adts"],
+}
+
+
+def _make_samples(out_dir: str):
+    paths = []
+    for minutes in (5, 30, 90):
+        for ext, codec in _SAMPLE_CODECS.items():
+            path = os.path.join(out_dir, f"bench_{minutes}min{ext}")
+            subprocess.run(
+                ["ffmpeg", "-y", "-loglevel", "error", "-f", "lavfi",
+                 "-i", f"sine=frequency=300:duration={minutes * 60}", *codec, path],
+                check=True,
+            )
+            paths.append(path)
+    return paths
+
+
+def _ffprobe_duration(path: str) -> float:
+    out = subprocess.run(
+        ["ffprobe", "-v", "error", "-show_entries", "format=duration",
+         "-of", "default=noprint_wrappers=1:nokey=1", path],
+        capture_output=True, check=True,
+    ).stdout
+    return float(out.decode().strip())
+
+
+def _time(fn, path: str, runs: int):
+    times, value = [], None
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        value = fn(path)
+        times.append((time.perf_counter() - t0) * 1000)
+    return statistics.median(times), value
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("files", nargs="*")
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    tmp_dir = None
+    files = args.files
+    if not files:
+        tmp_dir = tempfile.mkdtemp(prefix="bench_probe_")
+        print("生成测试音频...")
+        files = _make_samples(tmp_dir)
+
+    print(f"{'文件':32s} {'大小MB':>8s} {'probe ms':>9s} {'ffprobe ms':>11s} {'加速':>7s} "
+          f"{'probe 时长':>11s} {'ffprobe 时长':>12s} {'误差s':>7s}  编码")
+    try:
+        for path in files:
+            size_mb = os.path.getsize(path) / 1024 / 1024
+            p_ms, info = _time(probe_audio, path, args.runs)
+            f_ms, f_dur = _time(_ffprobe_duration, path, args.runs)
+            if info is None:
+                print(f"{Path(path).name:32s} {size_mb:8.2f} {p_ms:9.2f} {f_ms:11.2f} {'-':>7s} "
+                      f"{'未识别':>11s} {f_dur:12.2f} {'-':>7s}")
+                continue
+            print(f"{Path(path).name:32s} {size_mb:8.2f} {p_ms:9.2f} {f_ms:11.2f} {f_ms / max(p_ms, 1e-3):6.0f}x "
+                  f"{info['duration_sec']:11.2f} {f_dur:12.2f} {info['duration_sec'] - f_dur:7.2f}  "
+                  f"{info['container']}/{info['codec']} {info['sample_rate']}Hz ch={info['channels']}")
+    finally:
+        if tmp_dir:
+            for p in Path(tmp_dir).glob("*"):
+                p.unlink()
+            os.rmdir(tmp_dir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+对比「谁和谁对话」总结的两种生成方式（延迟与 token）
+- two-pass   ：Call1（转写 + 指标）→ 第二次纯文本调用（重发整段转写）生成 conversation_summary
+- single-pass：Call1 同时输出 conversation_summary（CALL1_SINGLE_PASS），无第二次调用
+音频每个文件只上传一次（两种方式共用），每种方式各跑 N 次，交替执行抵消网络波动；
+输出 p50 延迟、prompt / output token 合计，以及最后一次的总结样例
+
+用法:
+  python scripts/bench_conversation_summary.py a.m4a [b.m4a ...] [--runs 3]
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+env_path = ROOT / ".env"
+if env_path.exists():
+    with open(env_path) as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith("#") and "=" in line:
+                k, v = line.split("=", 1)
+                os.environ.setdefault(k.strip(), v.strip().strip('"').strip("'"))
+
+from schemas.gemini_schemas import CALL1_SCHEMA, CALL1_SINGLE_PASS_SCHEMA, json_config  # noqa: E402
+from services import gemini_client, gemini_gateway  # noqa: E402
+from utils.json_stream import loads_tolerant  # noqa: E402
+
+DEFAULT_MODEL = os.getenv("GEMINI_FLASH_MODEL", "gemini-3-flash-preview")
+
+
+def _tokens(resp) -> tuple:
+    usage = resp.usage
+    return int(usage.get("promptTokenCount") or 0), int(usage.get("candidatesTokenCount") or 0) + int(
+        usage.get("thoughtsTokenCount") or 0)
+
+
+async def _run_two_pass(model, audio: dict) -> dict:
+    from main import CALL1_PROMPT, CONVERSATION_SUMMARY_PROMPT
+    t0 = time.monotonic()
+    call1 = await model.generate_content_async([audio, CALL1_PROMPT], purpose="bench_call1",
+                                               generation_config=json_config(CALL1_SCHEMA))
+    t_call1 = time.monotonic()
+    transcript = loads_tolerant(call1.text, dict).get("transcript") or []
+    lines = "\n".join(f"{t.get('speaker') or '未知'}: {(t.get('text') or '').strip()}" for t in transcript)
+    second = await model.generate_content_async(CONVERSATION_SUMMARY_PROMPT.format(display_text=lines),
+                                                purpose="bench_summary")
+    t_end = time.monotonic()
+    p1, o1 = _tokens(call1)
+    p2, o2 = _tokens(second)
+    return {"total": t_end - t0, "call1": t_call1 - t0, "summary": t_end - t_call1,
+            "prompt_tokens": p1 + p2, "output_tokens": o1 + o2, "text": second.text.strip()}
+
+
+async def _run_single_pass(model, audio: dict) -> dict:
+    from main import CALL1_CONVERSATION_SUMMARY_INSTRUCTION, CALL1_PROMPT
+    t0 = time.monotonic()
+    call1 = await model.generate_content_async([audio, CALL1_PROMPT + CALL1_CONVERSATION_SUMMARY_INSTRUCTION],
+                                               purpose="bench_call1",
+                                               generation_config=json_config(CALL1_SINGLE_PASS_SCHEMA))
+    t_end = time.monotonic()
+    data = loads_tolerant(call1.text, dict)
+    p, o = _tokens(call1)
+    return {"total": t_end - t0, "call1": t_end - t0, "summary": 0.0,
+            "prompt_tokens": p, "output_tokens": o, "text": (data.get("conversation_summary") or "").strip()}
+
+
+def _fmt(vals):
+    return f"p50={statistics.median(vals):6.2f}s min={min(vals):6.2f}s max={max(vals):6.2f}s"
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("files", nargs="+")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--model", default=DEFAULT_MODEL)
+    args = parser.parse_args()
+
+    if not os.getenv("GEMINI_API_KEY"):
+        print("❌ GEMINI_API_KEY 未设置")
+        sys.exit(1)
+
+    model = gemini_gateway.get_model(args.model)
+    print(f"API_BASE_URL={gemini_client.API_BASE_URL} model={args.model} runs={args.runs}")
+    try:
+        for path in args.files:
+            size_mb = os.path.getsize(path) / 1024 / 1024
+            print(f"\n== {Path(path).name} ({size_mb:.2f} MB) ==")
+            results = {"two-pass": [], "single-pass": []}
+            audio = await gemini_client.upload_file(path)
+            try:
+                audio = await gemini_client.wait_for_file_active(audio, max_wait_time=600)
+                for i in range(args.runs):
+                    for mode, fn in (("two-pass", _run_two_pass), ("single-pass", _run_single_pass)):
+                        try:
+                            results[mode].append(await fn(model, audio))
+                        except Exception as e:
+                            print(f"  [{mode}] 第 {i + 1} 次失败: {type(e).__name__}: {str(e)[:200]}")
+            finally:
+                await gemini_client.delete_file(audio["name"])
+            for mode, runs in results.items():
+                if not runs:
+                    continue
+                print(f"  {mode:11s} total   {_fmt([r['total'] for r in runs])}")
+                if mode == "two-pass":
+                    print(f"              call1   {_fmt([r['call1'] for r in runs])}")
+                    print(f"              summary {_fmt([r['summary'] for r in runs])}")
+                print(f"              tokens  prompt={statistics.median(r['prompt_tokens'] for r in runs):.0f} "
+                      f"output={statistics.median(r['output_tokens'] for r in runs):.0f}（p50）")
+                print(f"              样例: {runs[-1]['text'][:200] or '（未返回）'}")
+            if results["two-pass"] and results["single-pass"]:
+                saved = statistics.median(r["total"] for r in results["two-pass"]) - statistics.median(
+                    r["total"] for r in results["single-pass"])
+                print(f"  单次分析节省 p50: {saved:.2f}s")
+    finally:
+        await gemini_client.aclose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+对比 Gemini 内联音频 与 Files API 两条路径的端到端延迟（按文件大小）
+- inline：音频 base64 内联进 generateContent 请求
+- files ：上传 → 轮询 ACTIVE → generateContent → 删除
+每个文件两条路径各跑 N 次，输出 p50 / min / max（秒），以及 Files API 各阶段耗时
+
+用法:
+  python scripts/bench_gemini_inline_vs_files.py a.m4a b.m4a c.m4a [--runs 3] [--prompt "..."]
+  未给文件时用 ffmpeg 生成 1 / 4 / 8 / 12 MB 的测试音频（静音 + 正弦，需 ffmpeg）
+"""
+import argparse
+import asyncio
+import base64
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+env_path = ROOT / ".env"
+if env_path.exists():
+    with open(env_path) as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith("#") and "=" in line:
+                k, v = line.split("=", 1)
+                os.environ.setdefault(k.strip(), v.strip().strip('"').strip("'"))
+
+from services import gemini_client  # noqa: E402
+
+DEFAULT_PROMPT = "请用一句话概括这段音频的内容，只返回纯文本。"
+DEFAULT_MODEL = os.getenv("GEMINI_FLASH_MODEL", "gemini-3-flash-preview")
+
+
+def _make_sample(target_mb: float, out_dir: str) -> str:
+    """生成约 target_mb 大小的 m4a（128kbps AAC 约 1MB/分钟）"""
+    seconds = max(5, int(target_mb * 60))
+    path = os.path.join(out_dir, f"bench_{target_mb:g}mb.m4a")
+    subprocess.run(
+        ["ffmpeg", "-y", "-loglevel", "error", "-f", "lavfi", "-i", f"sine=frequency=440:duration={seconds}",
+         "-c:a", "aac", "-b:a", "128k", path],
+        check=True,
+    )
+    return path
+
+
+async def _run_inline(path: str, model: str, prompt: str) -> dict:
+    t0 = time.monotonic()
+    data = await asyncio.to_thread(Path(path).read_bytes)
+    part = {"inline_data": {"mime_type": gemini_client.guess_mime_type(path),
+                            "data": base64.b64encode(data).decode("ascii")}}
+    resp = await gemini_client.generate_content(model, [part, gemini_client.text_part(prompt)])
+    gemini_client.response_text(resp)
+    return {"total": time.monotonic() - t0}
+
+
+async def _run_files(path: str, model: str, prompt: str) -> dict:
+    t0 = time.monotonic()
+    f = await gemini_client.upload_file(path)
+    t_upload = time.monotonic()
+    f = await gemini_client.wait_for_file_active(f, max_wait_time=600)
+    t_active = time.monotonic()
+    try:
+        resp = await gemini_client.generate_content(model, [gemini_client.file_part(f), gemini_client.text_part(prompt)])
+        gemini_client.response_text(resp)
+        t_gen = time.monotonic()
+    finally:
+        await gemini_client.delete_file(f["name"])
+    t_end = time.monotonic()
+    return {
+        "total": t_end - t0,
+        "upload": t_upload - t0,
+        "active": t_active - t_upload,
+        "generate": t_gen - t_active,
+        "delete": t_end - t_gen,
+    }
+
+
+def _fmt(vals):
+    return f"p50={statistics.median(vals):6.2f}s min={min(vals):6.2f}s max={max(vals):6.2f}s"
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("files", nargs="*")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--model", default=DEFAULT_MODEL)
+    parser.add_argument("--prompt", default=DEFAULT_PROMPT)
+    args = parser.parse_args()
+
+    if not os.getenv("GEMINI_API_KEY"):
+        print("❌ GEMINI_API_KEY 未设置")
+        sys.exit(1)
+
+    tmp_dir = None
+    files = args.files
+    if not files:
+        tmp_dir = tempfile.mkdtemp(prefix="bench_inline_")
+        files = [_make_sample(mb, tmp_dir) for mb in (1, 4, 8, 12)]
+
+    print(f"API_BASE_URL={gemini_client.API_BASE_URL} model={args.model} runs={args.runs}")
+    try:
+        for path in files:
+            size_mb = os.path.getsize(path) / 1024 / 1024
+            print(f"\n== {Path(path).name} ({size_mb:.2f} MB) ==")
+            if size_mb > 14:
+                print("  ⚠️ 超过内联上限（请求体 20MB，base64 后约 14MB 原始数据），inline 可能被拒")
+            results = {"inline": [], "files": []}
+            for i in range(args.runs):
+                # 交替执行，抵消网络波动
+                for mode, fn in (("inline", _run_inline), ("files", _run_files)):
+                    try:
+                        results[mode].append(await fn(path, args.model, args.prompt))
+                    except Exception as e:
+                        print(f"  [{mode}] 第 {i + 1} 次失败: {type(e).__name__}: {str(e)[:200]}")
+            for mode, runs in results.items():
+                if not runs:
+                    continue
+                print(f"  {mode:6s} total  {_fmt([r['total'] for r in runs])}")
+                if mode == "files":
+                    for stage in ("upload", "active", "generate", "delete"):
+                        print(f"         {stage:8s}{_fmt([r[stage] for r in runs])}")
+            if results["inline"] and results["files"]:
+                saved = statistics.median(r["total"] for r in results["files"]) - statistics.median(
+                    r["total"] for r in results["inline"])
+                print(f"  内联节省 p50: {saved:.2f}s")
+    finally:
+        await gemini_client.aclose()
+        if tmp_dir:
+            for p in Path(tmp_dir).glob("*"):
+                p.unlink()
+            os.rmdir(tmp_dir)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
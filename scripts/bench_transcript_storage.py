@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+对比转写存储 v1（transcript / dialogues / call1_result 三份 JSON）与 v2（一份压缩列式 blob）的行大小与读取耗时
+- 合成模式（默认）：按给定条数生成转写，统计三列原始 / 压缩后字节数，
+  以及详情接口取出 transcript + dialogues 的解析耗时（v1：驱动解码三列 JSON；v2：解码 blob 并派生 dialogues）
+- 数据库模式（--db N）：抽取最近 N 个完整结果，按存储格式分组统计列大小与「查询整行 + 取出两种形态」的耗时；
+  回填前后各跑一次即可对比
+
+用法:
+  python scripts/bench_transcript_storage.py [--lines 50 200 1000] [--repeat 200]
+  python scripts/bench_transcript_storage.py --db 200
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import sys
+import time
+import zlib
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+env_path = ROOT / ".env"
+if env_path.exists():
+    with open(env_path) as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith("#") and "=" in line:
+                k, v = line.split("=", 1)
+                os.environ.setdefault(k.strip(), v.strip().strip('"').strip("'"))
+
+from utils import transcript_codec  # noqa: E402
+from utils.transcript_time import format_timestamp  # noqa: E402
+
+_PHRASES = ["我觉得这个方案还可以再讨论一下", "你上次说的那件事后来怎么样了", "嗯", "对对对", "不是这个意思",
+            "周末要不要一起去吃饭", "这个项目的截止时间是下周三", "我有点担心预算不够", "好的没问题", "你先别急，听我说完"]
+
+
+def _synthetic(lines: int) -> list:
+    rnd = random.Random(lines)
+    transcript, sec = [], 0
+    for _ in range(lines):
+        speaker = rnd.choice(["Speaker_0", "Speaker_1", "Speaker_2"])
+        text = "，".join(rnd.choice(_PHRASES) for _ in range(rnd.randint(1, 3)))
+        transcript.append({"speaker": speaker, "text": text, "timestamp": format_timestamp(sec),
+                           "is_me": speaker == "Speaker_1"})
+        sec += rnd.randint(2, 12)
+    return transcript
+
+
+def _timeit(fn, repeat: int) -> float:
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - t0)
+    return statistics.median(samples) * 1000
+
+
+def _bench_synthetic(lines_list, repeat: int) -> None:
+    print(f"{'条数':>6} | {'v1 原始':>10} {'v1 压缩':>10} | {'v2':>9} | {'节省/行':>10} | "
+          f"{'v1 解析':>9} {'v2 解码':>9} {'加速':>6}")
+    for lines in lines_list:
+        transcript = _synthetic(lines)
+        call1 = {"mood_score": 70, "stats": {"sigh": 0, "laugh": 1}, "summary": "摘要" * 40,
+                 "card_title": "标题", "transcript": transcript, "conversation_summary": None}
+        dialogues = transcript_codec.to_dialogues(transcript)
+        v1_cols = [json.dumps(transcript, ensure_ascii=False), json.dumps(dialogues, ensure_ascii=False),
+                   json.dumps(call1, ensure_ascii=False)]
+        v1_raw = sum(len(c.encode()) for c in v1_cols)
+        v1_packed = sum(len(zlib.compress(c.encode())) for c in v1_cols)  # 近似 TOAST 压缩后大小
+        cols = transcript_codec.storage_columns(transcript, dialogues, call1, version=transcript_codec.STORAGE_V2)
+        slim_call1 = json.dumps(cols["call1_result"], ensure_ascii=False)
+        v2 = len(cols["transcript_blob"]) + len(slim_call1.encode())
+
+        class _Row:
+            storage_version = transcript_codec.STORAGE_V2
+            transcript_blob = cols["transcript_blob"]
+
+        def _read_v1():
+            json.loads(v1_cols[0]), json.loads(v1_cols[1]), json.loads(v1_cols[2])
+
+        def _read_v2():
+            json.loads(slim_call1)
+            transcript_codec.load_views(_Row)
+
+        t1, t2 = _timeit(_read_v1, repeat), _timeit(_read_v2, repeat)
+        print(f"{lines:>6} | {v1_raw:>9}B {v1_packed:>9}B | {v2:>8}B | {v1_packed - v2:>9}B | "
+              f"{t1:>7.3f}ms {t2:>7.3f}ms {t1 / t2:>5.1f}x")
+
+
+async def _bench_db(limit: int, repeat: int) -> None:
+    from sqlalchemy import select, text
+    from database.connection import AsyncSessionLocal, engine
+    from database.models import AnalysisResult
+
+    try:
+        async with engine.connect() as conn:
+            rows = (await conn.execute(text("""
+                SELECT session_id, storage_version,
+                       COALESCE(pg_column_size(transcript), 0) + COALESCE(pg_column_size(dialogues), 0)
+                       + COALESCE(pg_column_size(call1_result), 0) + COALESCE(pg_column_size(transcript_blob), 0) AS bytes
+                FROM analysis_results WHERE is_partial = false
+                ORDER BY created_at DESC LIMIT :limit
+            """), {"limit": limit})).all()
+        by_version = {}
+        for row in rows:
+            by_version.setdefault(row.storage_version, []).append(row)
+        for version, group in sorted(by_version.items()):
+            latencies = []
+            for row in group[:max(1, repeat // 10)]:
+                async with AsyncSessionLocal() as db:
+                    t0 = time.perf_counter()
+                    ar = (await db.execute(
+                        select(AnalysisResult).where(AnalysisResult.session_id == row.session_id)
+                    )).scalar_one()
+                    transcript_codec.load_views(ar)
+                    latencies.append((time.perf_counter() - t0) * 1000)
+            print(f"v{version}: {len(group)} 行，转写相关列平均 {statistics.mean(r.bytes for r in group):.0f} B/行，"
+                  f"查询整行 + 取 transcript/dialogues p50 {statistics.median(latencies):.2f}ms")
+    finally:
+        await engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--lines", type=int, nargs="+", default=[50, 200, 1000])
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--db", type=int, default=0, help="从数据库抽取最近 N 个结果（需 DATABASE_URL）")
+    args = parser.parse_args()
+    if args.db:
+        asyncio.run(_bench_db(args.db, args.repeat))
+    else:
+        _bench_synthetic(args.lines, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
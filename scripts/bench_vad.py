@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+VAD 静音剔除收益评估：剔除的音频秒数 vs 转写延迟
+对每个文件：运行 utils.vad.compact_silence，再分别把原音频与紧凑音频送 Gemini 转写（Files API），
+输出剔除时长、VAD 自身耗时、两次转写耗时与节省比例
+
+用法:
+  VAD_MIN_REMOVED_SEC=0 python scripts/bench_vad.py a.m4a b.m4a [--runs 2] [--no-gemini]
+  --no-gemini 只跑 VAD，统计剔除时长与处理耗时
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+env_path = ROOT / ".env"
+if env_path.exists():
+    with open(env_path) as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith("#") and "=" in line:
+                k, v = line.split("=", 1)
+                os.environ.setdefault(k.strip(), v.strip().strip('"').strip("'"))
+
+from services import gemini_client  # noqa: E402
+from utils.vad import compact_silence  # noqa: E402
+
+PROMPT = "请逐句转写这段音频，每行格式为 [MM:SS] 说话人: 内容，只返回纯文本。"
+MODEL = os.getenv("GEMINI_FLASH_MODEL", "gemini-3-flash-preview")
+
+
+async def _transcribe(path: str) -> float:
+    t0 = time.monotonic()
+    f = await gemini_client.upload_file(path)
+    try:
+        f = await gemini_client.wait_for_file_active(f)
+        resp = await gemini_client.generate_content(MODEL, [gemini_client.file_part(f), gemini_client.text_part(PROMPT)])
+        gemini_client.response_text(resp)
+    finally:
+        await gemini_client.delete_file(f["name"])
+    return time.monotonic() - t0
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("files", nargs="+")
+    parser.add_argument("--runs", type=int, default=2)
+    parser.add_argument("--no-gemini", action="store_true")
+    args = parser.parse_args()
+
+    rows = []
+    try:
+        for path in args.files:
+            t0 = time.monotonic()
+            res = await asyncio.to_thread(compact_silence, path, "bench")
+            vad_sec = time.monotonic() - t0
+            if res is None:
+                print(f"{Path(path).name}: 无可剔除静音（或低于 VAD_MIN_REMOVED_SEC），跳过")
+                continue
+            compact_path, offset_map, stats = res
+            try:
+                row = {"name": Path(path).name, "vad_sec": vad_sec, **stats}
+                if not args.no_gemini:
+                    orig = [await _transcribe(path) for _ in range(args.runs)]
+                    comp = [await _transcribe(compact_path) for _ in range(args.runs)]
+                    row["orig_p50"] = statistics.median(orig)
+                    row["compact_p50"] = statistics.median(comp)
+                rows.append(row)
+            finally:
+                os.unlink(compact_path)
+    finally:
+        await gemini_client.aclose()
+
+    print(f"\n{'文件':28s} {'时长s':>8s} {'剔除s':>8s} {'剔除%':>6s} {'段数':>5s} {'VAD s':>7s} "
+          f"{'原转写s':>8s} {'紧凑转写s':>9s} {'节省s':>7s}")
+    for r in rows:
+        pct = r["removed_sec"] * 100 / max(r["duration_sec"], 1e-6)
+        line = (f"{r['name']:28s} {r['duration_sec']:8.1f} {r['removed_sec']:8.1f} {pct:5.0f}% {r['segments']:5d} "
+                f"{r['vad_sec']:7.2f}")
+        if "orig_p50" in r:
+            saved = r["orig_p50"] - r["compact_p50"] - r["vad_sec"]
+            line += f" {r['orig_p50']:8.1f} {r['compact_p50']:9.1f} {saved:7.1f}"
+        print(line)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,7 +1,6 @@
 #!/usr/bin/env python3
 """诊断指定 session 的策略分析和技能卡片状态"""
 import asyncio
-import json
 import sys
 import uuid
 from pathlib import Path
@@ -63,14 +62,10 @@ async def main():
         ar_r = await db.execute(select(AnalysisResult).where(AnalysisResult.session_id == sid))
         ar = ar_r.scalar_one_or_none()
         if ar:
-            tr = ar.transcript
-            if isinstance(tr, str):
-                try:
-                    tr = json.loads(tr)
-                except:
-                    tr = []
+            from utils.transcript_codec import row_transcript
+            tr = row_transcript(ar)
             print(f"\n=== analysis_result ===")
-            print(f"transcript 条数: {len(tr) if isinstance(tr, list) else 0}")
+            print(f"transcript 条数: {len(tr)}（存储格式 v{ar.storage_version}）")
         else:
             print("\n❌ 未找到 analysis_result (无 transcript)")
         
@@ -1,11 +1,21 @@
 #!/usr/bin/env python3
 """
-删除指定 session 的策略分析记录，使下次 App 请求时重新生成（使用最新宫崎骏风格）。
-用法: python3 scripts/force_regenerate_strategy.py <session_id>
+删除指定 session 的策略分析记录并重新生成（宫崎骏风格等最新配置生效）。
+与 POST /api/v1/tasks/sessions/{id}/retry 共用断点续跑机制：转写 / 档案匹配 / 总结沿用检查点与已存结果，
+只清除策略阶段检查点，然后派发 resume 策略任务（由 pipeline worker 执行）。
+
+用法:
+  python3 scripts/force_regenerate_strategy.py <session_id> [--from scene|skills] [--inline] [--lazy]
+  --from scene   清除场景识别与全部技能检查点，从场景识别开始（默认）
+  --from skills  保留场景识别结果，只重新执行技能
+  --inline       不入队，在本进程内直接生成（未运行 pipeline worker 时使用）
+  --lazy         仅删除策略记录，由 App 打开任务详情时按需重新生成（旧行为）
+示例: python3 scripts/force_regenerate_strategy.py a85878d1-e792-42bc-a348-952754430ba7
 """
 import os
 import sys
 import asyncio
+import argparse
 
 # 添加项目根目录到 path
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -16,35 +26,69 @@ load_dotenv()
 
 
 async def main():
-    session_id = sys.argv[1] if len(sys.argv) > 1 else None
-    if not session_id:
-        print("用法: python3 scripts/force_regenerate_strategy.py <session_id>")
-        print("示例: python3 scripts/force_regenerate_strategy.py a85878d1-e792-42bc-a348-952754430ba7")
-        sys.exit(1)
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("session_id")
+    parser.add_argument("--from", dest="start", choices=["scene", "skills"], default="scene")
+    parser.add_argument("--inline", action="store_true")
+    parser.add_argument("--lazy", action="store_true")
+    args = parser.parse_args()
 
-    from sqlalchemy import delete, select, text
-    from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
-    from sqlalchemy.orm import sessionmaker
-    from database.connection import engine
-    from database.models import StrategyAnalysis
+    from sqlalchemy import delete, select
+    from database.connection import engine, AsyncSessionLocal
+    from database.models import Session, StrategyAnalysis
+    from services import checkpoints
+    from services.progress import transition_stage
     import uuid
 
     try:
-        uid = uuid.UUID(session_id)
+        uid = uuid.UUID(args.session_id)
     except ValueError:
-        print(f"❌ 无效的 session_id: {session_id}")
+        print(f"❌ 无效的 session_id: {args.session_id}")
         sys.exit(1)
+    session_id = str(uid)
 
-    async with engine.begin() as conn:
-        r = await conn.execute(delete(StrategyAnalysis).where(StrategyAnalysis.session_id == uid))
-        n = r.rowcount if hasattr(r, 'rowcount') else 0
-        if n == 0:
-            print(f"⚠️ session {session_id} 没有策略分析记录，无需删除")
-        else:
-            print(f"✅ 已删除 session {session_id} 的策略分析记录 (共 {n} 条)")
-        print("请在 App 中打开该任务详情并刷新，将自动重新生成（宫崎骏风格）")
+    try:
+        async with AsyncSessionLocal() as db:
+            sess = await db.get(Session, uid)
+            if sess is None:
+                print(f"❌ session {session_id} 不存在")
+                sys.exit(1)
+            user_id = str(sess.user_id)
+            r = await db.execute(delete(StrategyAnalysis).where(StrategyAnalysis.session_id == uid))
+            await db.commit()
+            n = r.rowcount if hasattr(r, 'rowcount') else 0
+            if n == 0:
+                print(f"⚠️ session {session_id} 没有策略分析记录，无需删除")
+            else:
+                print(f"✅ 已删除 session {session_id} 的策略分析记录 (共 {n} 条)")
 
-    await engine.dispose()
+            cleared = await checkpoints.clear_strategy(session_id, keep_scene=args.start == "skills")
+            print(f"✅ 已清除策略检查点 {cleared} 条（起点: {args.start}）")
+
+            if args.lazy:
+                print("请在 App 中打开该任务详情并刷新，将自动重新生成（宫崎骏风格）")
+                return
+
+            await transition_stage(db, session_id, "strategy_scene", status="analyzing", error_message=None)
+
+        if args.inline:
+            from main import generate_strategies_async
+            print("⏳ 本进程内重新生成策略...")
+            await generate_strategies_async(session_id, user_id, resume=True)
+            async with AsyncSessionLocal() as db:
+                row = (await db.execute(
+                    select(Session.status, Session.analysis_stage, Session.error_message).where(Session.id == uid)
+                )).first()
+            print(f"✅ 完成: status={row.status} analysis_stage={row.analysis_stage} error={row.error_message or '-'}")
+        else:
+            from services.job_queue import JOB_STRATEGY, enqueue_job
+            job_id = await enqueue_job(JOB_STRATEGY, session_id, user_id, {"resume": True})
+            if job_id:
+                print(f"✅ 已入队策略任务 job_id={job_id}，由 pipeline worker 执行")
+            else:
+                print("⚠️ 该 session 已有未完成的策略任务，未重复入队")
+    finally:
+        await engine.dispose()
 
 
 if __name__ == "__main__":
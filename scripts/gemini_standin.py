@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+"""
+本地 Gemini REST 替身（离线联调转写链路，返回按提示词类型构造的固定格式 JSON）
+支持 services/gemini_client 用到的接口：
+  POST {prefix}/v1beta/models/{model}:generateContent
+  POST {prefix}/v1beta/models/{model}:streamGenerateContent?alt=sse（同一结果按 --stream-chunks 块以 SSE 分段返回）
+  POST {prefix}/upload/v1beta/files（resumable：start / upload / finalize / query）
+  GET / DELETE {prefix}/v1beta/files/{id}
+prefix 任意（如 /secret-channel），服务端只看 /v1beta、/upload 之后的路径。
+
+转写类提示词按音频时长每 10 秒生成一句（WAV 读头部时长，其余格式按 32 kbps 估算）；
+reduce 提示词返回 mood_score / summary / card_title；其他提示词返回 "OK"。
+
+用法:
+  python scripts/gemini_standin.py --port 9200 [--latency 0.5]
+  服务端 .env: GEMINI_BASE_URL=http://127.0.0.1:9200
+"""
+import argparse
+import base64
+import io
+import json
+import re
+import struct
+import threading
+import time
+import uuid
+import wave
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+LATENCY = 0.0
+STREAM_CHUNKS = 8
+SENTENCE_SEC = 10
+_files = {}  # id -> {"size", "mime", "data": bytearray, "state"}
+_lock = threading.Lock()
+
+
+def _audio_duration(data: bytes, mime: str) -> float:
+    if data[:4] == b"RIFF" or "wav" in (mime or ""):
+        try:
+            with wave.open(io.BytesIO(data)) as w:
+                return w.getnframes() / float(w.getframerate())
+        except (wave.Error, EOFError, struct.error):
+            pass
+    return len(data) / 4000.0
+
+
+def _fmt(sec: float) -> str:
+    sec = int(sec)
+    return f"{sec // 60:02d}:{sec % 60:02d}"
+
+
+def _fake_transcript(duration: float) -> list:
+    items = []
+    t = 0.0
+    n = 0
+    while t < max(duration, 1):
+        speaker = "Speaker_1" if n % 2 else "Speaker_0"
+        items.append({"speaker": speaker, "text": f"（替身转写）第 {n + 1} 句", "timestamp": _fmt(t), "is_me": speaker == "Speaker_1"})
+        t += SENTENCE_SEC
+        n += 1
+    return items
+
+
+def _answer(body: dict) -> str:
+    parts = [p for c in body.get("contents") or [] for p in c.get("parts") or []]
+    prompt = "\n".join(p.get("text") or "" for p in parts)
+    duration = 0.0
+    has_audio = False
+    for p in parts:
+        inline = p.get("inline_data") or p.get("inlineData")
+        if inline:
+            has_audio = True
+            duration += _audio_duration(base64.b64decode(inline.get("data") or ""), inline.get("mime_type") or inline.get("mimeType"))
+        fd = p.get("file_data") or p.get("fileData")
+        if fd:
+            has_audio = True
+            fid = (fd.get("file_uri") or fd.get("fileUri") or "").rsplit("/", 1)[-1]
+            f = _files.get(fid)
+            if f:
+                duration += _audio_duration(bytes(f["data"]), f["mime"])
+    if "完整转写" in prompt:
+        return json.dumps({"mood_score": 72, "summary": "Stand-in summary of the conversation.",
+                           "card_title": "Stand-in conversation", "risks": []}, ensure_ascii=False)
+    if has_audio and "transcript" in prompt:
+        data = {"sigh_count": 0, "laugh_count": 0, "transcript": _fake_transcript(duration), "risks": []}
+        if "mood_score" in prompt:
+            data.update({"mood_score": 72, "summary": "Stand-in summary.", "card_title": "Stand-in conversation"})
+        return json.dumps(data, ensure_ascii=False)
+    return "OK"
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def _route(self) -> str:
+        path = urlparse(self.path).path
+        m = re.search(r"/(v1beta|upload)/.*$", path)
+        return m.group(0) if m else path
+
+    def _json(self, status: int, payload: dict, headers: dict = None):
+        body = json.dumps(payload, ensure_ascii=False).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _sse(self, text: str):
+        """按 STREAM_CHUNKS 段切分文本，逐段作为 SSE 事件发送（LATENCY 均摊到各段之间）"""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        step = max(1, -(-len(text) // STREAM_CHUNKS))
+        pieces = [text[i:i + step] for i in range(0, len(text), step)] or [""]
+        for i, piece in enumerate(pieces):
+            if LATENCY:
+                time.sleep(LATENCY / len(pieces))
+            chunk = {"candidates": [{"content": {"role": "model", "parts": [{"text": piece}]}}]}
+            if i == len(pieces) - 1:
+                chunk["candidates"][0]["finishReason"] = "STOP"
+                chunk["usageMetadata"] = {"promptTokenCount": 100, "candidatesTokenCount": len(text) // 4,
+                                          "totalTokenCount": 100 + len(text) // 4}
+            self.wfile.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\r\n\r\n".encode())
+            self.wfile.flush()
+
+    def _body(self) -> bytes:
+        return self.rfile.read(int(self.headers.get("Content-Length") or 0))
+
+    def _file_resource(self, fid: str) -> dict:
+        f = _files[fid]
+        host = self.headers.get("Host") or "127.0.0.1"
+        return {"name": f"files/{fid}", "uri": f"http://{host}/v1beta/files/{fid}", "mimeType": f["mime"],
+                "sizeBytes": str(f["size"]), "state": f["state"]}
+
+    def do_POST(self):
+        route = self._route()
+        if route.startswith("/v1beta/models/") and route.endswith(":generateContent"):
+            body = json.loads(self._body() or b"{}")
+            if LATENCY:
+                time.sleep(LATENCY)
+            text = _answer(body)
+            return self._json(200, {
+                "candidates": [{"content": {"role": "model", "parts": [{"text": text}]}, "finishReason": "STOP"}],
+                "usageMetadata": {"promptTokenCount": 100, "candidatesTokenCount": len(text) // 4, "totalTokenCount": 100 + len(text) // 4},
+            })
+        if route.startswith("/v1beta/models/") and route.endswith(":streamGenerateContent"):
+            return self._sse(_answer(json.loads(self._body() or b"{}")))
+        if route.startswith("/upload/v1beta/files"):
+            command = (self.headers.get("X-Goog-Upload-Command") or "").lower()
+            if command == "start":
+                self._body()
+                fid = uuid.uuid4().hex[:12]
+                with _lock:
+                    _files[fid] = {
+                        "size": int(self.headers.get("X-Goog-Upload-Header-Content-Length") or 0),
+                        "mime": self.headers.get("X-Goog-Upload-Header-Content-Type") or "application/octet-stream",
+                        "data": bytearray(), "state": "PROCESSING",
+                    }
+                host = self.headers.get("Host") or "127.0.0.1"
+                return self._json(200, {}, {"X-Goog-Upload-URL": f"http://{host}/upload/v1beta/files?upload_id={fid}",
+                                            "X-Goog-Upload-Status": "active"})
+            fid = parse_qs(urlparse(self.path).query).get("upload_id", [""])[0]
+            f = _files.get(fid)
+            if f is None:
+                return self._json(404, {"error": {"code": 404, "message": "upload not found"}})
+            if command == "query":
+                self._body()
+                status = "final" if f["state"] == "ACTIVE" else "active"
+                return self._json(200, {}, {"X-Goog-Upload-Status": status, "X-Goog-Upload-Size-Received": str(len(f["data"]))})
+            offset = int(self.headers.get("X-Goog-Upload-Offset") or 0)
+            chunk = self._body()
+            with _lock:
+                del f["data"][offset:]
+                f["data"].extend(chunk)
+            if "finalize" in command:
+                f["state"] = "ACTIVE"
+                return self._json(200, {"file": self._file_resource(fid)}, {"X-Goog-Upload-Status": "final"})
+            return self._json(200, {}, {"X-Goog-Upload-Status": "active"})
+        self._json(404, {"error": {"code": 404, "message": f"unsupported {route}"}})
+
+    def do_GET(self):
+        route = self._route()
+        m = re.match(r"/v1beta/files/(\w+)$", route)
+        if m and m.group(1) in _files:
+            return self._json(200, self._file_resource(m.group(1)))
+        self._json(404, {"error": {"code": 404, "message": "not found"}})
+
+    def do_DELETE(self):
+        m = re.match(r"/v1beta/files/(\w+)$", self._route())
+        if m:
+            with _lock:
+                _files.pop(m.group(1), None)
+        self._json(200, {})
+
+    def log_message(self, fmt, *args):
+        print(f"[gemini-standin] {self.command} {self._route()[:100]} -> {args[1] if len(args) > 1 else ''}")
+
+
+def main():
+    global LATENCY, STREAM_CHUNKS
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9200)
+    parser.add_argument("--latency", type=float, default=0.0, help="每次 generateContent 额外延迟（秒）")
+    parser.add_argument("--stream-chunks", type=int, default=8, help="streamGenerateContent 分段数")
+    args = parser.parse_args()
+    LATENCY = args.latency
+    STREAM_CHUNKS = max(1, args.stream_chunks)
+    print(f"Gemini 替身已启动: http://{args.host}:{args.port}（GEMINI_BASE_URL 指向此地址）")
+    ThreadingHTTPServer((args.host, args.port), Handler).serve_forever()
+
+
+if __name__ == "__main__":
+    main()
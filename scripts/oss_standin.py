@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+"""
+本地 OSS 兼容替身（仅用于联调客户端直传 / 分片上传，不校验签名）
+支持 oss2 直传链路用到的接口：PUT / GET / HEAD / DELETE 对象，
+分片上传 POST ?uploads、PUT ?partNumber&uploadId、POST ?uploadId、DELETE ?uploadId（中止），
+以及 GET /?prefix= 列举对象、GET /?uploads&prefix= 列举未完成的分片上传（直传超时清理使用）。
+对象以 path 风格存储在 --root 目录下。
+
+用法:
+  python scripts/oss_standin.py --port 9100 --root /tmp/oss-standin
+  服务端 .env:
+    OSS_ENDPOINT=http://127.0.0.1:9100
+    OSS_IS_CNAME=true
+    OSS_BUCKET_NAME=local  OSS_ACCESS_KEY_ID=x  OSS_ACCESS_KEY_SECRET=x
+"""
+import argparse
+import hashlib
+import os
+import shutil
+import threading
+import uuid
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlparse
+from xml.etree import ElementTree
+from xml.sax.saxutils import escape
+
+ROOT = "/tmp/oss-standin"
+_uploads = {}  # upload_id -> key
+_lock = threading.Lock()
+
+
+def _obj_path(key: str) -> str:
+    path = os.path.normpath(os.path.join(ROOT, key))
+    if not path.startswith(os.path.abspath(ROOT) + os.sep):
+        raise ValueError("非法 key")
+    return path
+
+
+def _part_dir(upload_id: str) -> str:
+    return os.path.join(ROOT, ".multipart", upload_id)
+
+
+def _md5_file(path: str) -> str:
+    h = hashlib.md5()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(chunk)
+    return h.hexdigest().upper()
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def _parse(self):
+        u = urlparse(self.path)
+        return unquote(u.path.lstrip("/")), parse_qs(u.query, keep_blank_values=True)
+
+    def _send(self, status: int, body: bytes = b"", headers: dict = None):
+        self.send_response(status)
+        self.send_header("x-oss-request-id", uuid.uuid4().hex)
+        self.send_header("Content-Length", str(len(body)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        if body and self.command != "HEAD":
+            self.wfile.write(body)
+
+    def _error(self, status: int, code: str, message: str):
+        body = (f"<?xml version=\"1.0\" encoding=\"UTF-8\"?><Error><Code>{code}</Code>"
+                f"<Message>{escape(message)}</Message><RequestId>{uuid.uuid4().hex}</RequestId></Error>").encode()
+        self._send(status, body, {"Content-Type": "application/xml"})
+
+    def _read_body_to(self, path: str) -> str:
+        remaining = int(self.headers.get("Content-Length") or 0)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        h = hashlib.md5()
+        with open(path, "wb") as f:
+            while remaining > 0:
+                data = self.rfile.read(min(1024 * 1024, remaining))
+                if not data:
+                    break
+                f.write(data)
+                h.update(data)
+                remaining -= len(data)
+        return h.hexdigest().upper()
+
+    def do_PUT(self):
+        key, qs = self._parse()
+        if "uploadId" in qs:
+            upload_id = qs["uploadId"][0]
+            if upload_id not in _uploads:
+                return self._error(404, "NoSuchUpload", "upload id 不存在")
+            etag = self._read_body_to(os.path.join(_part_dir(upload_id), f"{int(qs['partNumber'][0]):05d}"))
+        else:
+            etag = self._read_body_to(_obj_path(key))
+        self._send(200, headers={"ETag": f'"{etag}"'})
+
+    def do_POST(self):
+        key, qs = self._parse()
+        if "uploads" in qs:
+            upload_id = uuid.uuid4().hex
+            with _lock:
+                _uploads[upload_id] = key
+            os.makedirs(_part_dir(upload_id), exist_ok=True)
+            body = (f"<?xml version=\"1.0\" encoding=\"UTF-8\"?><InitiateMultipartUploadResult>"
+                    f"<Bucket>local</Bucket><Key>{escape(key)}</Key><UploadId>{upload_id}</UploadId>"
+                    f"</InitiateMultipartUploadResult>").encode()
+            return self._send(200, body, {"Content-Type": "application/xml"})
+        if "uploadId" in qs:
+            upload_id = qs["uploadId"][0]
+            with _lock:
+                owner = _uploads.pop(upload_id, None)
+            if owner != key:
+                return self._error(404, "NoSuchUpload", "upload id 不存在")
+            req = ElementTree.fromstring(self.rfile.read(int(self.headers.get("Content-Length") or 0)))
+            numbers = sorted(int(p.findtext("PartNumber")) for p in req.iter("Part"))
+            dest = _obj_path(key)
+            os.makedirs(os.path.dirname(dest), exist_ok=True)
+            with open(dest, "wb") as out:
+                for n in numbers:
+                    with open(os.path.join(_part_dir(upload_id), f"{n:05d}"), "rb") as part:
+                        shutil.copyfileobj(part, out)
+            shutil.rmtree(_part_dir(upload_id), ignore_errors=True)
+            etag = _md5_file(dest)
+            body = (f"<?xml version=\"1.0\" encoding=\"UTF-8\"?><CompleteMultipartUploadResult>"
+                    f"<Bucket>local</Bucket><Key>{escape(key)}</Key><ETag>\"{etag}\"</ETag>"
+                    f"</CompleteMultipartUploadResult>").encode()
+            return self._send(200, body, {"Content-Type": "application/xml", "ETag": f'"{etag}"'})
+        self._error(400, "InvalidArgument", "不支持的 POST")
+
+    def _object_headers(self, path: str) -> dict:
+        st = os.stat(path)
+        return {
+            "Content-Type": "application/octet-stream",
+            "Last-Modified": formatdate(st.st_mtime, usegmt=True),
+            "ETag": f'"{_md5_file(path)}"',
+            "x-oss-object-type": "Normal",
+        }
+
+    def do_HEAD(self):
+        key, _ = self._parse()
+        path = _obj_path(key)
+        if not os.path.isfile(path):
+            return self._send(404)
+        headers = self._object_headers(path)
+        self.send_response(200)
+        self.send_header("x-oss-request-id", uuid.uuid4().hex)
+        self.send_header("Content-Length", str(os.path.getsize(path)))
+        for k, v in headers.items():
+            self.send_header(k, v)
+        self.end_headers()
+
+    def do_GET(self):
+        key, qs = self._parse()
+        if not key:
+            if "uploads" in qs:
+                return self._list_uploads(qs.get("prefix", [""])[0])
+            return self._list(qs.get("prefix", [""])[0])
+        path = _obj_path(key)
+        if not os.path.isfile(path):
+            return self._error(404, "NoSuchKey", "对象不存在")
+        self.send_response(200)
+        self.send_header("x-oss-request-id", uuid.uuid4().hex)
+        self.send_header("Content-Length", str(os.path.getsize(path)))
+        for k, v in self._object_headers(path).items():
+            self.send_header(k, v)
+        self.end_headers()
+        with open(path, "rb") as f:
+            shutil.copyfileobj(f, self.wfile)
+
+    def do_DELETE(self):
+        key, qs = self._parse()
+        if "uploadId" in qs:
+            upload_id = qs["uploadId"][0]
+            with _lock:
+                owner = _uploads.pop(upload_id, None)
+            if owner != key:
+                return self._error(404, "NoSuchUpload", "upload id 不存在")
+            shutil.rmtree(_part_dir(upload_id), ignore_errors=True)
+            return self._send(204)
+        try:
+            os.unlink(_obj_path(key))
+        except FileNotFoundError:
+            pass
+        self._send(204)
+
+    def _list(self, prefix: str):
+        items = []
+        for root, dirs, files in os.walk(ROOT):
+            dirs[:] = [d for d in dirs if d != ".multipart"]
+            for name in files:
+                key = os.path.relpath(os.path.join(root, name), ROOT).replace(os.sep, "/")
+                if key.startswith(prefix):
+                    p = os.path.join(root, name)
+                    items.append(
+                        f"<Contents><Key>{escape(key)}</Key><LastModified>2000-01-01T00:00:00.000Z</LastModified>"
+                        f"<ETag>\"{_md5_file(p)}\"</ETag><Type>Normal</Type><Size>{os.path.getsize(p)}</Size>"
+                        f"<StorageClass>Standard</StorageClass></Contents>"
+                    )
+        body = (f"<?xml version=\"1.0\" encoding=\"UTF-8\"?><ListBucketResult><Name>local</Name>"
+                f"<Prefix>{escape(prefix)}</Prefix><Marker></Marker><MaxKeys>1000</MaxKeys><Delimiter></Delimiter>"
+                f"<IsTruncated>false</IsTruncated>{''.join(items)}</ListBucketResult>").encode()
+        self._send(200, body, {"Content-Type": "application/xml"})
+
+    def _list_uploads(self, prefix: str):
+        with _lock:
+            uploads = sorted((k, u) for u, k in _uploads.items() if k.startswith(prefix))
+        items = "".join(
+            f"<Upload><Key>{escape(k)}</Key><UploadId>{u}</UploadId>"
+            f"<Initiated>2000-01-01T00:00:00.000Z</Initiated></Upload>"
+            for k, u in uploads
+        )
+        body = (f"<?xml version=\"1.0\" encoding=\"UTF-8\"?><ListMultipartUploadsResult><Bucket>local</Bucket>"
+                f"<KeyMarker></KeyMarker><UploadIdMarker></UploadIdMarker><NextKeyMarker></NextKeyMarker>"
+                f"<NextUploadIdMarker></NextUploadIdMarker><Delimiter></Delimiter><Prefix>{escape(prefix)}</Prefix>"
+                f"<MaxUploads>1000</MaxUploads><IsTruncated>false</IsTruncated>{items}</ListMultipartUploadsResult>").encode()
+        self._send(200, body, {"Content-Type": "application/xml"})
+
+    def log_message(self, fmt, *args):
+        print(f"[oss-standin] {self.command} {self.path[:120]} -> {args[1] if len(args) > 1 else ''}")
+
+
+def main():
+    global ROOT
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--root", default=ROOT)
+    args = parser.parse_args()
+    ROOT = os.path.abspath(args.root)
+    os.makedirs(ROOT, exist_ok=True)
+    print(f"OSS 替身已启动: http://{args.host}:{args.port}  存储目录: {ROOT}")
+    ThreadingHTTPServer((args.host, args.port), Handler).serve_forever()
+
+
+if __name__ == "__main__":
+    main()
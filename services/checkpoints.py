@@ -0,0 +1,154 @@
+"""
+流水线阶段检查点：每个已完成阶段的产物写入 pipeline_checkpoints，失败后重试从第一个未完成阶段继续
+- 分析：gemini_files（已上传的 Gemini 文件，48 小时内有效）→ call1（转写结果，已换算回原音频时间）
+  → speaker_mapping → conversation_summary → memory_write（B 钩子已写入，避免重复记忆）
+- 策略：scene_classify → skill:<id>（每个成功技能的结果）→ memory_write_strategy（C 钩子）
+检查点在独立短事务中写入，不受调用方事务回滚影响；写入失败只记日志，不影响流水线。
+"""
+import json
+import logging
+import os
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+PIPELINE_CHECKPOINT_ENABLED = os.getenv("PIPELINE_CHECKPOINT_ENABLED", "true").lower() in ("true", "1", "yes")
+PIPELINE_CHECKPOINT_TTL_DAYS = int(os.getenv("PIPELINE_CHECKPOINT_TTL_DAYS", "7"))
+# Gemini Files API 文件 48 小时后自动删除，留 1 小时余量
+GEMINI_FILE_TTL_SEC = int(os.getenv("GEMINI_FILE_TTL_SEC", str(47 * 3600)))
+
+CKPT_GEMINI_FILES = "gemini_files"
+CKPT_CALL1 = "call1"
+CKPT_SPEAKER_MAPPING = "speaker_mapping"
+CKPT_CONVERSATION_SUMMARY = "conversation_summary"
+CKPT_MEMORY_WRITE = "memory_write"
+CKPT_SCENE = "scene_classify"
+CKPT_SKILL_PREFIX = "skill:"
+CKPT_MEMORY_WRITE_STRATEGY = "memory_write_strategy"
+
+# 重试时按此顺序找第一个未完成的分析阶段（memory_write 可能因无档案被正常跳过，不参与判断）
+ANALYZE_RESUME_ORDER = [
+    ("transcribing", CKPT_CALL1),
+    ("matching_profiles", CKPT_SPEAKER_MAPPING),
+    ("conversation_summary", CKPT_CONVERSATION_SUMMARY),
+]
+
+_PURGE_INTERVAL_SEC = 3600
+_last_purge = 0.0
+
+_UPSERT_SQL = """
+    INSERT INTO pipeline_checkpoints (session_id, stage, data, expires_at, updated_at)
+    VALUES (:sid, :stage, :data, :expires_at, now())
+    ON CONFLICT (session_id, stage) DO UPDATE
+    SET data = EXCLUDED.data, expires_at = EXCLUDED.expires_at, updated_at = now()
+"""
+
+
+async def save(session_id: str, stage: str, data: Any, expires_at: Optional[datetime] = None) -> None:
+    """写入 / 覆盖一个阶段检查点（data 需可 JSON 序列化；expires_at 默认 PIPELINE_CHECKPOINT_TTL_DAYS 天后）"""
+    global _last_purge
+    if not PIPELINE_CHECKPOINT_ENABLED or not session_id:
+        return
+    from sqlalchemy import bindparam, text
+    from sqlalchemy.dialects.postgresql import JSONB
+    from database.connection import engine
+
+    if expires_at is None:
+        expires_at = datetime.now(timezone.utc) + timedelta(days=PIPELINE_CHECKPOINT_TTL_DAYS)
+    try:
+        payload = json.loads(json.dumps(data, ensure_ascii=False, default=str))
+        async with engine.begin() as conn:
+            await conn.execute(
+                text(_UPSERT_SQL).bindparams(bindparam("data", type_=JSONB)),
+                {"sid": uuid.UUID(str(session_id)), "stage": stage[:64], "data": payload, "expires_at": expires_at},
+            )
+            if time.monotonic() - _last_purge > _PURGE_INTERVAL_SEC:
+                _last_purge = time.monotonic()
+                await conn.execute(text("DELETE FROM pipeline_checkpoints WHERE expires_at <= now()"))
+        logger.info(f"[检查点-{session_id}] 已保存 {stage}")
+    except Exception as e:
+        logger.warning(f"[检查点-{session_id}] 保存 {stage} 失败: {e}")
+
+
+async def load_all(session_id: str) -> Dict[str, Any]:
+    """该会话未过期的全部检查点 {stage: data}；读取失败时返回空（按全新执行）"""
+    if not PIPELINE_CHECKPOINT_ENABLED:
+        return {}
+    from sqlalchemy import text
+    from database.connection import engine
+
+    try:
+        async with engine.connect() as conn:
+            rows = (await conn.execute(
+                text("SELECT stage, data FROM pipeline_checkpoints WHERE session_id = :sid AND expires_at > now()"),
+                {"sid": uuid.UUID(str(session_id))},
+            )).all()
+    except Exception as e:
+        logger.warning(f"[检查点-{session_id}] 读取失败，按全新执行: {e}")
+        return {}
+    ckpts = {r.stage: r.data for r in rows}
+    if ckpts:
+        logger.info(f"[检查点-{session_id}] 已加载: {sorted(ckpts)}")
+    return ckpts
+
+
+async def clear(session_id: str, stages: Optional[Iterable[str]] = None, prefix: Optional[str] = None) -> int:
+    """删除检查点：stages / prefix 均为空时删除该会话全部，返回删除行数（失败只记日志）"""
+    if not PIPELINE_CHECKPOINT_ENABLED:
+        return 0
+    from sqlalchemy import text
+    from database.connection import engine
+
+    sql = "DELETE FROM pipeline_checkpoints WHERE session_id = :sid"
+    params: Dict[str, Any] = {"sid": uuid.UUID(str(session_id))}
+    conds = []
+    if stages is not None:
+        conds.append("stage = ANY(:stages)")
+        params["stages"] = list(stages)
+    if prefix is not None:
+        conds.append("stage LIKE :prefix")
+        params["prefix"] = prefix + "%"
+    if conds:
+        sql += " AND (" + " OR ".join(conds) + ")"
+    try:
+        async with engine.begin() as conn:
+            result = await conn.execute(text(sql), params)
+    except Exception as e:
+        logger.warning(f"[检查点-{session_id}] 删除失败: {e}")
+        return 0
+    return result.rowcount or 0
+
+
+async def clear_strategy(session_id: str, keep_scene: bool = False) -> int:
+    """
+    删除策略阶段检查点，使下次续跑重新生成策略：各技能结果（及 keep_scene=False 时的场景识别）。
+    分析阶段与 C 钩子记录保留（避免重复转写 / 重复写入记忆）。
+    """
+    return await clear(session_id, stages=[] if keep_scene else [CKPT_SCENE], prefix=CKPT_SKILL_PREFIX)
+
+
+def gemini_files_expiry(files: list) -> datetime:
+    """已上传 Gemini 文件的最早过期时间（优先取 File 资源的 expirationTime）"""
+    fallback = datetime.now(timezone.utc) + timedelta(seconds=GEMINI_FILE_TTL_SEC)
+    expiry = fallback
+    for f in files:
+        raw = f.get("expirationTime") if isinstance(f, dict) else None
+        if not raw:
+            continue
+        try:
+            ts = datetime.fromisoformat(str(raw).replace("Z", "+00:00")) - timedelta(hours=1)
+        except ValueError:
+            continue
+        expiry = min(expiry, ts)
+    return expiry
+
+
+def analyze_resume_point(ckpts: Dict[str, Any]) -> str:
+    """分析任务重试的起点：第一个缺少检查点的阶段；全部完成时为 strategy"""
+    for stage, key in ANALYZE_RESUME_ORDER:
+        if key not in ckpts:
+            return stage
+    return "strategy"
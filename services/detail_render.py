@@ -0,0 +1,249 @@
+"""
+任务详情展示层预渲染：说话人 → 档案名替换（dialogues / summary / conversation_summary）在流水线写完分析结果后渲染一次，
+压缩存入 analysis_results.detail_payload，详情接口直接取用，不再每次请求解析转写、查档案、逐个 str.replace
+- 版本戳 detail_stamp = 渲染逻辑版本 : 用户档案版本（users.profiles_version，档案增删改时 +1）: 分析结果 updated_at，
+  任一变化即过期，读取时重新渲染并回写（回写不改 updated_at，且仅在期间分析结果未被改写时生效）
+- 替换表一次构建（说话人标签、「用户」、别名、档案名及志/致变体），单个正则一遍扫描完成替换，
+  已替换出的「张三（自己）」不会再被档案名规则二次替换
+- detail_hash：渲染结果摘要；详情接口与会话字段一起拼出强 ETag，If-None-Match 命中时直接 304，无需解压 payload
+- 部分转写（is_partial）随转写推进不断变化，不预渲染
+"""
+import hashlib
+import json
+import logging
+import os
+import re
+import uuid
+import zlib
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+DETAIL_PRECOMPUTE_ENABLED = os.getenv("DETAIL_PRECOMPUTE_ENABLED", "true").lower() in ("true", "1", "yes")
+# 渲染逻辑变更时 +1，已存的预渲染结果随之失效
+RENDER_VERSION = 1
+
+_SELF_RELATIONS = ("自己", "Self", "self")
+_LABEL_ALIASES = {"说话人0": "Speaker_0", "说话人1": "Speaker_1", "Speaker0": "Speaker_0", "Speaker1": "Speaker_1"}
+
+
+class ProfileDirectory:
+    """用户全部档案的展示名：profile_id → 「名（关系）」，以及「自己」档案"""
+    __slots__ = ("self_id", "self_name", "self_display", "displays", "names")
+
+    def __init__(self):
+        self.self_id: Optional[str] = None
+        self.self_name: Optional[str] = None
+        self.self_display: Optional[str] = None
+        self.displays: Dict[str, str] = {}
+        self.names: Dict[str, str] = {}
+
+
+class RenderedDetail:
+    """渲染结果；data 在首次访问时才解压（304 路径只用 digest）"""
+    __slots__ = ("digest", "_blob", "_data")
+
+    def __init__(self, digest: str, blob: Optional[bytes] = None, data: Optional[dict] = None):
+        self.digest = digest
+        self._blob = blob
+        self._data = data
+
+    @property
+    def data(self) -> dict:
+        if self._data is None:
+            self._data = json.loads(zlib.decompress(self._blob).decode("utf-8"))
+        return self._data
+
+
+async def profiles_version(db, user_id: str) -> int:
+    from sqlalchemy import select
+    from database.models import User
+    res = await db.execute(select(User.profiles_version).where(User.id == uuid.UUID(user_id)))
+    return res.scalar() or 0
+
+
+async def load_profiles(db, user_id: str) -> ProfileDirectory:
+    from sqlalchemy import select
+    from database.models import Profile
+    directory = ProfileDirectory()
+    rows = await db.execute(
+        select(Profile.id, Profile.name, Profile.relationship_type).where(Profile.user_id == uuid.UUID(user_id))
+    )
+    for row in rows.all():
+        pid = str(row.id)
+        name = row.name or "未知"
+        directory.displays[pid] = f"{name}（{row.relationship_type or '未知'}）"
+        directory.names[pid] = name
+        if directory.self_id is None and row.relationship_type in _SELF_RELATIONS:
+            directory.self_id = pid
+            directory.self_name = name
+            directory.self_display = f"{name}（自己）"
+    return directory
+
+
+def _name_variants(name: Optional[str]) -> List[str]:
+    """档案名及其志/致互换写法（Gemini 常把同音字写错）"""
+    name = (name or "").strip()
+    if not name:
+        return []
+    variants = [name]
+    if "志" in name or "致" in name:
+        alt = name.replace("志", "致") if "志" in name else name.replace("致", "志")
+        if alt != name:
+            variants.append(alt.strip())
+    return variants
+
+
+def _substitute(text: Optional[str], table: Dict[str, str], pattern) -> Optional[str]:
+    if not text or pattern is None:
+        return text
+    return pattern.sub(lambda m: table[m.group(0)], text)
+
+
+def render(ar, profiles: ProfileDirectory) -> dict:
+    """分析结果 → 详情展示字段（dialogues / risks / summary / speaker_mapping / speaker_names / conversation_summary）"""
+    from utils import transcript_codec
+
+    transcript, dialogues = transcript_codec.load_views(ar)
+    summary = ar.summary
+    conversation_summary = ar.conversation_summary or None
+    speaker_mapping = ar.speaker_mapping if isinstance(ar.speaker_mapping, dict) else None
+    speaker_names = None
+    name_to_display: Dict[str, str] = {}  # Gemini 直接写出的档案名 → 「名（关系）」
+    for variant in _name_variants(profiles.self_name):
+        name_to_display[variant] = profiles.self_display
+
+    if transcript and profiles.self_id:
+        # 优先用 transcript 的 is_me 只映射「自己」，其余保持 Speaker_X（修复旧任务错误映射）
+        me = next((t.get("speaker") for t in transcript if t.get("is_me") is True), None)
+        if me:
+            speaker_names = {me: profiles.self_display}
+    elif speaker_mapping:
+        # 无 transcript/is_me 时回退到 speaker_mapping（兼容旧逻辑）
+        speaker_names = {sp: profiles.displays.get(pid, sp) for sp, pid in speaker_mapping.items()}
+        for pid in speaker_mapping.values():
+            if pid in profiles.displays:
+                for variant in _name_variants(profiles.names[pid]):
+                    name_to_display[variant] = profiles.displays[pid]
+
+    if speaker_names:
+        table = dict(speaker_names)
+        if "Speaker_1" in speaker_names:
+            # Call #1 约定 Speaker_1 为用户，Gemini 总结常写「用户」而非 Speaker_1
+            table.setdefault("用户", speaker_names["Speaker_1"])
+        for alias, canonical in _LABEL_ALIASES.items():
+            if canonical in speaker_names:
+                table.setdefault(alias, speaker_names[canonical])
+        for name, display in name_to_display.items():
+            table.setdefault(name, display)
+        keys = sorted((k for k in table if k), key=len, reverse=True)
+        pattern = re.compile("|".join(map(re.escape, keys))) if keys else None
+        summary = _substitute(summary, table, pattern)
+        conversation_summary = _substitute(conversation_summary, table, pattern)
+
+        def _speaker_to_display(speaker_val):
+            if not speaker_val:
+                return speaker_val
+            if speaker_val in speaker_names:
+                return speaker_names[speaker_val]
+            canonical = _LABEL_ALIASES.get(speaker_val)
+            return speaker_names.get(canonical, speaker_val) if canonical else speaker_val
+
+        dialogues = [
+            {**d, "speaker": _speaker_to_display(d.get("speaker", ""))} if isinstance(d, dict) and "speaker" in d else d
+            for d in dialogues
+        ]
+
+    return {
+        "dialogues": dialogues,
+        "risks": ar.risks or [],
+        "summary": summary,
+        "speaker_mapping": speaker_mapping,
+        "speaker_names": speaker_names,
+        "conversation_summary": conversation_summary,
+    }
+
+
+def _stamp(ar, version: int) -> Optional[str]:
+    if ar.updated_at is None:
+        return None
+    return f"{RENDER_VERSION}:{version}:{ar.updated_at.isoformat()}"
+
+
+def _pack(data: dict) -> tuple:
+    payload = json.dumps(data, ensure_ascii=False, sort_keys=True, separators=(",", ":")).encode("utf-8")
+    return zlib.compress(payload, 6), hashlib.sha256(payload).hexdigest()
+
+
+async def _save(ar, stamp: str, blob: bytes, digest: str) -> None:
+    """
+    回写预渲染结果：独立连接执行，不影响调用方会话中已加载的对象；
+    显式保留 updated_at（不触发 onupdate），期间分析结果已被改写时不覆盖
+    """
+    from sqlalchemy import update
+    from database.connection import engine
+    from database.models import AnalysisResult
+    try:
+        async with engine.begin() as conn:
+            await conn.execute(
+                update(AnalysisResult)
+                .where(AnalysisResult.id == ar.id, AnalysisResult.updated_at == ar.updated_at)
+                .values(detail_payload=blob, detail_stamp=stamp, detail_hash=digest, updated_at=AnalysisResult.updated_at)
+            )
+    except Exception as e:
+        logger.warning(f"[详情渲染-{ar.session_id}] 预渲染结果写入失败（不影响本次返回）: {e}")
+
+
+async def prepare(db, ar, user_id: str) -> RenderedDetail:
+    """取详情展示字段：预渲染有效时直接使用（不解压），否则现场渲染并回写"""
+    if ar is None:
+        data = {"dialogues": [], "risks": [], "summary": None, "speaker_mapping": None, "speaker_names": None,
+                "conversation_summary": None}
+        return RenderedDetail(_pack(data)[1], data=data)
+    stamp = _stamp(ar, await profiles_version(db, user_id))
+    if DETAIL_PRECOMPUTE_ENABLED and stamp and ar.detail_payload and ar.detail_stamp == stamp and ar.detail_hash:
+        return RenderedDetail(ar.detail_hash, blob=ar.detail_payload)
+    data = render(ar, await load_profiles(db, user_id))
+    blob, digest = _pack(data)
+    if DETAIL_PRECOMPUTE_ENABLED and stamp and not ar.is_partial:
+        await _save(ar, stamp, blob, digest)
+    return RenderedDetail(digest, data=data)
+
+
+async def refresh(db, session_id: str, user_id: str) -> None:
+    """流水线写完分析结果（含 speaker_mapping / conversation_summary）后预渲染，首次打开详情即可命中"""
+    if not DETAIL_PRECOMPUTE_ENABLED:
+        return
+    from sqlalchemy import select
+    from database.models import AnalysisResult
+    try:
+        res = await db.execute(
+            select(AnalysisResult).where(AnalysisResult.session_id == uuid.UUID(session_id))
+            .execution_options(populate_existing=True)
+        )
+        ar = res.scalar_one_or_none()
+        if ar is not None and not ar.is_partial:
+            await prepare(db, ar, user_id)
+    except Exception as e:
+        logger.warning(f"[详情渲染-{session_id}] 预渲染失败（详情接口读取时再渲染）: {e}")
+
+
+def etag(fields: Dict[str, Any], digest: str) -> str:
+    """强 ETag：会话字段 + 渲染结果摘要"""
+    raw = json.dumps(fields, ensure_ascii=False, sort_keys=True, default=str) + digest
+    return '"' + hashlib.sha256(raw.encode("utf-8")).hexdigest()[:32] + '"'
+
+
+def etag_matches(if_none_match: Optional[str], current: str) -> bool:
+    """If-None-Match 按弱比较（RFC 9110）：忽略 W/ 前缀，支持逗号分隔的多个值与 *"""
+    if not if_none_match:
+        return False
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag == "*":
+            return True
+        if tag.startswith("W/"):
+            tag = tag[2:]
+        if tag == current:
+            return True
+    return False
@@ -0,0 +1,217 @@
+"""
+分析进度 ETA 模型：用 pipeline_stage_timings 的历史耗时替代 /status 中写死的 stage_map
+- 按进度阶段分组（保存音频 / 转写 / 档案匹配 / 场景识别 / 技能执行），每个会话取组内首个阶段开始到最后一个阶段结束的墙钟时间
+- 每组以 [1, 文件 MB, 分片数, 转写千字] 做最小二乘回归（numpy lstsq）；样本不足时退化为中位数
+- 后台每 ETA_REFRESH_SEC 秒重新拟合一次（各 worker 独立拟合，数据共享）
+- 预测时未知转写长度按历史「千字 / MB」比例估算
+- retry_after_ms：按当前阶段剩余时间给出客户端下次轮询间隔
+"""
+import asyncio
+import logging
+import math
+import os
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+ETA_ENABLED = os.getenv("ETA_MODEL_ENABLED", "true").lower() in ("true", "1", "yes")
+ETA_REFRESH_SEC = int(os.getenv("ETA_REFRESH_SEC", "600"))
+ETA_TRAIN_DAYS = int(os.getenv("ETA_TRAIN_DAYS", "14"))
+# 每组至少多少个会话样本才做回归（更少时用中位数，完全没有时回退 stage_map）
+ETA_MIN_SAMPLES = int(os.getenv("ETA_MIN_SAMPLES", "20"))
+ETA_POLL_MIN_MS = int(os.getenv("ETA_POLL_MIN_MS", "1000"))
+ETA_POLL_MAX_MS = int(os.getenv("ETA_POLL_MAX_MS", "10000"))
+
+# 进度阶段组（按流水线顺序）→ 组内的 stage_timing 阶段名；skill:* 用前缀匹配
+ETA_GROUPS: List[Tuple[str, Tuple[str, ...]]] = [
+    ("persist", ("persist",)),
+    ("transcribe", ("normalize", "vad", "split", "gemini_upload", "wait_active", "generate",
+                    "transcribe_map", "transcribe_reduce")),
+    ("profiles", ("db_write_analysis", "voiceprint", "conversation_summary")),
+    ("scene", ("scene_classify",)),
+    ("skills", ("skill:*", "db_write_strategy")),
+]
+_GROUP_NAMES = [g for g, _ in ETA_GROUPS]
+
+# sessions.analysis_stage → 当前所处的组（None 表示处于组间的短暂过渡 / 排队）
+STAGE_TO_GROUP = {
+    "upload_done": None,
+    "saving_audio": "persist",
+    "transcribing": "transcribe",
+    "": "profiles",  # 转写结果已写入、即将进入 matching_profiles
+    "matching_profiles": "profiles",
+    "strategy_scene": "scene",
+    "strategy_matching": None,
+    "strategy_matched_n": None,
+    "strategy_executing": "skills",
+    "strategy_images": "skills",
+}
+# 过渡阶段位于哪个组之前
+_TRANSITION_BEFORE = {"upload_done": "persist", "strategy_matching": "skills", "strategy_matched_n": "skills"}
+
+
+class _GroupFit:
+    __slots__ = ("coef", "median", "samples")
+
+    def __init__(self, coef, median: float, samples: int):
+        self.coef = coef  # None 表示仅用中位数
+        self.median = median
+        self.samples = samples
+
+
+_fits: Dict[str, _GroupFit] = {}
+_kchars_per_mb: Optional[float] = None
+_fitted_at: Optional[float] = None
+_refresher_task: Optional[asyncio.Task] = None
+
+
+def _group_case_sql() -> str:
+    cases = []
+    for group, stages in ETA_GROUPS:
+        for st in stages:
+            if st.endswith("*"):
+                cases.append(f"WHEN stage LIKE '{st[:-1]}%' THEN '{group}'")
+            else:
+                cases.append(f"WHEN stage = '{st}' THEN '{group}'")
+    return f"CASE {' '.join(cases)} END"
+
+
+_TRAIN_SQL = """
+    WITH t AS (
+        SELECT session_id, started_at, duration_ms, file_size, chunk_count, {group_case} AS grp
+        FROM pipeline_stage_timings
+        WHERE started_at >= :since AND session_id IS NOT NULL
+    ), s AS (
+        SELECT session_id, max(file_size) AS file_size, max(chunk_count) AS chunk_count
+        FROM t GROUP BY session_id
+    ), g AS (
+        SELECT session_id, grp,
+               extract(epoch FROM max(started_at + duration_ms * interval '1 millisecond') - min(started_at)) AS sec
+        FROM t WHERE grp IS NOT NULL
+        GROUP BY session_id, grp
+    )
+    SELECT g.grp, g.sec, s.file_size, s.chunk_count, COALESCE(ar.transcript_chars, length(ar.transcript)) AS transcript_chars
+    FROM g
+    JOIN s ON s.session_id = g.session_id
+    LEFT JOIN analysis_results ar ON ar.session_id = g.session_id AND ar.is_partial = false
+"""
+
+
+def _features(size_mb: float, chunk_count: float, kchars: float) -> List[float]:
+    return [1.0, size_mb, chunk_count, kchars]
+
+
+async def refresh() -> None:
+    """从最近 ETA_TRAIN_DAYS 天的阶段耗时重新拟合各组模型"""
+    global _fits, _kchars_per_mb, _fitted_at
+    import numpy as np
+    from sqlalchemy import text
+    from database.connection import AsyncSessionLocal
+
+    since = datetime.now(timezone.utc) - timedelta(days=ETA_TRAIN_DAYS)
+    async with AsyncSessionLocal() as db:
+        rows = (await db.execute(text(_TRAIN_SQL.format(group_case=_group_case_sql())), {"since": since})).all()
+
+    ratios = [r.transcript_chars / 1000 / (r.file_size / 1048576)
+              for r in rows if r.transcript_chars and r.file_size]
+    kchars_per_mb = float(np.median(ratios)) if ratios else None
+
+    fits: Dict[str, _GroupFit] = {}
+    for group in _GROUP_NAMES:
+        samples = [r for r in rows if r.grp == group and r.sec is not None and r.file_size]
+        if not samples:
+            continue
+        y = np.array([float(r.sec) for r in samples])
+        median = float(np.median(y))
+        coef = None
+        if len(samples) >= ETA_MIN_SAMPLES:
+            x = np.array([
+                _features(
+                    r.file_size / 1048576,
+                    float(r.chunk_count or 1),
+                    (r.transcript_chars / 1000) if r.transcript_chars
+                    else (r.file_size / 1048576) * (kchars_per_mb or 0.0),
+                )
+                for r in samples
+            ])
+            coef, *_ = np.linalg.lstsq(x, y, rcond=None)
+            coef = [float(c) for c in coef]
+        fits[group] = _GroupFit(coef, median, len(samples))
+
+    _fits, _kchars_per_mb, _fitted_at = fits, kchars_per_mb, time.time()
+    logger.info("[ETA] 模型已刷新: " + ", ".join(
+        f"{g}={f.samples}{'(lstsq)' if f.coef else '(median)'}" for g, f in fits.items()
+    ) + f" kchars/MB={kchars_per_mb}")
+
+
+async def _refresh_loop() -> None:
+    while True:
+        try:
+            await refresh()
+        except Exception as e:
+            logger.warning(f"[ETA] 模型刷新失败，沿用上次结果: {e}")
+        await asyncio.sleep(ETA_REFRESH_SEC)
+
+
+def start_refresher() -> None:
+    global _refresher_task
+    if ETA_ENABLED and (_refresher_task is None or _refresher_task.done()):
+        _refresher_task = asyncio.create_task(_refresh_loop())
+
+
+def stop_refresher() -> None:
+    if _refresher_task is not None:
+        _refresher_task.cancel()
+
+
+def _predict(group: str, size_mb: float, chunk_count: int, kchars: float) -> float:
+    fit = _fits[group]
+    if fit.coef is None:
+        return fit.median
+    pred = sum(c * f for c, f in zip(fit.coef, _features(size_mb, chunk_count, kchars)))
+    # 外推过远时（极小 / 极大文件）回归可能给出离谱值，限制在中位数的 0.2 ~ 10 倍
+    return min(max(pred, fit.median * 0.2), fit.median * 10)
+
+
+def retry_after_ms(stage_remaining_sec: Optional[float]) -> Optional[int]:
+    """建议的下次轮询间隔：当前阶段剩余时间的 1/3，限制在 [ETA_POLL_MIN_MS, ETA_POLL_MAX_MS]"""
+    if stage_remaining_sec is None:
+        return None
+    return int(min(max(stage_remaining_sec * 1000 / 3, ETA_POLL_MIN_MS), ETA_POLL_MAX_MS))
+
+
+def estimate(
+    analysis_stage: str,
+    elapsed_in_stage: float,
+    size_bytes: Optional[int],
+    chunk_count: Optional[int],
+    transcript_chars: Optional[int],
+) -> Optional[Tuple[float, int, float]]:
+    """
+    返回 (progress, 剩余秒数, 当前阶段剩余秒数)；模型未就绪、阶段未知或缺少文件大小时返回 None（调用方回退 stage_map）
+    """
+    if not ETA_ENABLED or not size_bytes or analysis_stage not in STAGE_TO_GROUP:
+        return None
+    if any(g not in _fits for g in _GROUP_NAMES):
+        return None
+    size_mb = size_bytes / 1048576
+    kchars = transcript_chars / 1000 if transcript_chars else size_mb * (_kchars_per_mb or 0.0)
+    preds = {g: _predict(g, size_mb, chunk_count or 1, kchars) for g in _GROUP_NAMES}
+
+    current = STAGE_TO_GROUP[analysis_stage]
+    pivot = current or _TRANSITION_BEFORE[analysis_stage]
+    idx = _GROUP_NAMES.index(pivot)
+    done = sum(preds[g] for g in _GROUP_NAMES[:idx])
+    if current is None:
+        # 组间过渡（排队 / 技能匹配）：预计很快进入下一组
+        stage_remaining = 2.0
+        remaining = stage_remaining + sum(preds[g] for g in _GROUP_NAMES[idx:])
+    else:
+        # 超出预测仍未完成时，假定还需该组预测值的 10%
+        stage_remaining = max(preds[current] - elapsed_in_stage, preds[current] * 0.1)
+        done += min(elapsed_in_stage, preds[current])
+        remaining = stage_remaining + sum(preds[g] for g in _GROUP_NAMES[idx + 1:])
+    progress = min(max(done / (done + remaining), 0.01), 0.99) if done + remaining > 0 else 0.5
+    return round(progress, 3), int(math.ceil(remaining)), stage_remaining
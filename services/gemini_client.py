@@ -0,0 +1,425 @@
+"""
+Gemini REST 异步客户端
+直接调用 generativelanguage REST 接口（Files API 上传 / 状态轮询 / 删除 / generateContent / streamGenerateContent），
+所有请求共享一个带连接池的 httpx.AsyncClient，运行在主事件循环上，
+不再在线程池里 asyncio.run 嵌套事件循环，也不依赖 SDK 的 discovery 与全局 URL 改写。
+"""
+import asyncio
+import json
+import logging
+import mimetypes
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+from urllib.parse import urlparse, urlunparse
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+GEMINI_API_KEY = os.getenv("GEMINI_API_KEY", "")
+DIRECT_BASE_URL = "https://generativelanguage.googleapis.com"
+
+# 连接池上限：所有分析任务共享，避免突发上传时无限制建连
+HTTP_MAX_CONNECTIONS = int(os.getenv("GEMINI_HTTP_MAX_CONNECTIONS", "32"))
+HTTP_MAX_KEEPALIVE = int(os.getenv("GEMINI_HTTP_MAX_KEEPALIVE", "16"))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("GEMINI_HTTP_CONNECT_TIMEOUT", "15"))
+# generateContent 长音频转写可能需要数分钟
+HTTP_READ_TIMEOUT = float(os.getenv("GEMINI_HTTP_READ_TIMEOUT", "600"))
+
+_UPLOAD_READ_CHUNK = 1024 * 1024
+# 分块上传：每块大小（resumable 协议要求非末块为 256KB 的整数倍）与单次上传允许的续传次数
+_UPLOAD_GRANULARITY = 256 * 1024
+UPLOAD_CHUNK_BYTES = max(
+    _UPLOAD_GRANULARITY,
+    int(float(os.getenv("GEMINI_UPLOAD_CHUNK_MB", "8")) * 1024 * 1024) // _UPLOAD_GRANULARITY * _UPLOAD_GRANULARITY,
+)
+UPLOAD_MAX_RESUMES = int(os.getenv("GEMINI_UPLOAD_MAX_RESUMES", "5"))
+
+_AUDIO_MIME_TYPES = {
+    ".m4a": "audio/mp4",
+    ".mp4": "audio/mp4",
+    ".mp3": "audio/mpeg",
+    ".wav": "audio/wav",
+    ".aac": "audio/aac",
+    ".ogg": "audio/ogg",
+    ".opus": "audio/ogg",
+    ".flac": "audio/flac",
+    ".aiff": "audio/aiff",
+}
+
+
+def _resolve_api_base() -> str:
+    """与 main 中 SDK 代理配置一致：USE_PROXY 时走 {PROXY_URL}（默认路径 /secret-channel），否则直连"""
+    override = os.getenv("GEMINI_BASE_URL", "").strip()
+    if override:
+        return override.rstrip("/")
+    use_proxy = os.getenv("USE_PROXY", "true").lower() == "true"
+    proxy_raw = os.getenv("PROXY_URL", "http://47.79.254.213/secret-channel")
+    if not (use_proxy and proxy_raw):
+        return DIRECT_BASE_URL
+    p = urlparse(proxy_raw)
+    host = p.hostname or "127.0.0.1"
+    if os.getenv("PROXY_FORCE_LOCALHOST", "true").lower() == "true":
+        host = "127.0.0.1"
+    netloc = f"{host}:{p.port}" if p.port else host
+    path = (p.path or "").rstrip("/") or "/secret-channel"
+    return urlunparse((p.scheme or "http", netloc, path, "", "", ""))
+
+
+API_BASE_URL = _resolve_api_base()
+# 兼容原 GEMINI_FILE_UPLOAD_NO_PROXY：仅文件上传直连 Google，按请求选择 base，不改全局状态
+UPLOAD_NO_PROXY = os.getenv("GEMINI_FILE_UPLOAD_NO_PROXY", "").lower() == "true"
+
+
+class GeminiAPIError(Exception):
+    """Gemini REST 调用失败；status_code 为 None 表示网络层错误"""
+
+    def __init__(self, message: str, status_code: Optional[int] = None, body: str = ""):
+        super().__init__(message)
+        self.status_code = status_code
+        self.body = body
+
+    @property
+    def retryable(self) -> bool:
+        return self.status_code is None or self.status_code in (408, 429, 500, 502, 503, 504)
+
+
+_client: Optional[httpx.AsyncClient] = None
+_client_loop: Optional[asyncio.AbstractEventLoop] = None
+_sync_client: Optional[httpx.Client] = None
+_sync_client_lock = threading.Lock()
+
+
+def _limits() -> httpx.Limits:
+    return httpx.Limits(max_connections=HTTP_MAX_CONNECTIONS, max_keepalive_connections=HTTP_MAX_KEEPALIVE)
+
+
+def get_async_client() -> httpx.AsyncClient:
+    """进程内共享的连接池客户端（绑定当前事件循环；循环变化时重建）"""
+    global _client, _client_loop
+    loop = asyncio.get_running_loop()
+    if _client is None or _client.is_closed or _client_loop is not loop:
+        _client = httpx.AsyncClient(
+            timeout=httpx.Timeout(HTTP_READ_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT),
+            limits=_limits(),
+        )
+        _client_loop = loop
+        logger.info(f"[GeminiREST] 创建连接池 base={API_BASE_URL} max_connections={HTTP_MAX_CONNECTIONS}")
+    return _client
+
+
+def get_sync_client() -> httpx.Client:
+    """同步调用方（线程中运行的生图等）共享的连接池客户端，线程安全"""
+    global _sync_client
+    if _sync_client is None or _sync_client.is_closed:
+        with _sync_client_lock:
+            if _sync_client is None or _sync_client.is_closed:
+                _sync_client = httpx.Client(
+                    timeout=httpx.Timeout(HTTP_READ_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT),
+                    limits=_limits(),
+                )
+    return _sync_client
+
+
+async def aclose() -> None:
+    global _client, _sync_client
+    if _client is not None and not _client.is_closed:
+        await _client.aclose()
+    _client = None
+    if _sync_client is not None:
+        _sync_client.close()
+        _sync_client = None
+
+
+def guess_mime_type(path_or_name: str) -> str:
+    ext = Path(path_or_name).suffix.lower()
+    if ext in _AUDIO_MIME_TYPES:
+        return _AUDIO_MIME_TYPES[ext]
+    mime, _ = mimetypes.guess_type(path_or_name)
+    return mime or "application/octet-stream"
+
+
+def _rebase(url: str, base: str) -> str:
+    """上传会话 URL 由 Google 返回（直连域名），按需改写到代理 base"""
+    if base == DIRECT_BASE_URL or "generativelanguage.googleapis.com" not in url:
+        return url
+    u, b = urlparse(url), urlparse(base)
+    return urlunparse((b.scheme, b.netloc, b.path.rstrip("/") + u.path, u.params, u.query, u.fragment))
+
+
+def _raise_for_status(resp: httpx.Response, what: str) -> None:
+    if resp.status_code in (200, 201):
+        return
+    body = resp.text[:500]
+    raise GeminiAPIError(f"{what} 失败: HTTP {resp.status_code}: {body}", resp.status_code, body)
+
+
+async def _request(method: str, url: str, what: str, **kwargs) -> httpx.Response:
+    client = get_async_client()
+    params = dict(kwargs.pop("params", None) or {})
+    params.setdefault("key", GEMINI_API_KEY)
+    try:
+        resp = await client.request(method, url, params=params, **kwargs)
+    except httpx.HTTPError as e:
+        raise GeminiAPIError(f"{what} 网络错误: {type(e).__name__}: {e}") from e
+    _raise_for_status(resp, what)
+    return resp
+
+
+def _request_sync(method: str, url: str, what: str, **kwargs) -> httpx.Response:
+    client = get_sync_client()
+    params = dict(kwargs.pop("params", None) or {})
+    params.setdefault("key", GEMINI_API_KEY)
+    try:
+        resp = client.request(method, url, params=params, **kwargs)
+    except httpx.HTTPError as e:
+        raise GeminiAPIError(f"{what} 网络错误: {type(e).__name__}: {e}") from e
+    _raise_for_status(resp, what)
+    return resp
+
+
+async def _aiter_range(path: str, offset: int, length: int) -> AsyncIterator[bytes]:
+    """按 1MB 分块读取文件 [offset, offset+length) 作为请求体（不整段读入内存）"""
+    f = open(path, "rb")
+    try:
+        await asyncio.to_thread(f.seek, offset)
+        remaining = length
+        while remaining > 0:
+            data = await asyncio.to_thread(f.read, min(_UPLOAD_READ_CHUNK, remaining))
+            if not data:
+                break
+            remaining -= len(data)
+            yield data
+    finally:
+        f.close()
+
+
+def _upload_start_kwargs(size: int, mime_type: str, display_name: Optional[str], name: Optional[str]) -> Dict[str, Any]:
+    file_meta: Dict[str, Any] = {}
+    if name:
+        file_meta["name"] = name
+    if display_name:
+        file_meta["displayName"] = display_name
+    return {
+        "params": {"uploadType": "resumable"},
+        "headers": {
+            "X-Goog-Upload-Protocol": "resumable",
+            "X-Goog-Upload-Command": "start",
+            "X-Goog-Upload-Header-Content-Length": str(size),
+            "X-Goog-Upload-Header-Content-Type": mime_type,
+            "Content-Type": "application/json",
+        },
+        "json": {"file": file_meta},
+    }
+
+
+def _upload_session_url(start: httpx.Response, base: str) -> str:
+    upload_url = start.headers.get("X-Goog-Upload-URL")
+    if not upload_url:
+        raise GeminiAPIError(f"初始化上传未返回 upload URL: {start.text[:200]}")
+    return _rebase(upload_url, base)
+
+
+def _chunk_headers(offset: int, length: int, final: bool) -> Dict[str, str]:
+    return {
+        "Content-Length": str(length),
+        "X-Goog-Upload-Offset": str(offset),
+        "X-Goog-Upload-Command": "upload, finalize" if final else "upload",
+    }
+
+
+def _file_info(resp: httpx.Response) -> Dict[str, Any]:
+    file_info = resp.json().get("file") or {}
+    if not file_info.get("name"):
+        raise GeminiAPIError(f"上传成功但未返回 file name: {resp.text[:200]}")
+    return file_info
+
+
+def _parse_query(resp: httpx.Response, size: int) -> Tuple[int, bool]:
+    """解析 query 响应：返回 (服务端已收字节数, 是否已 final)"""
+    status = (resp.headers.get("X-Goog-Upload-Status") or "").lower()
+    received = int(resp.headers.get("X-Goog-Upload-Size-Received") or 0)
+    if status == "final":
+        return size, True
+    if status and status != "active":
+        raise GeminiAPIError(f"上传会话已失效（status={status}），需重新上传", None)
+    return received, False
+
+
+def _check_resume(err: GeminiAPIError, resumes: int, offset: int, size: int, display_name: Optional[str]) -> None:
+    if not err.retryable or resumes > UPLOAD_MAX_RESUMES:
+        raise err
+    logger.warning(
+        f"[GeminiREST] 分块上传中断 {display_name} offset={offset}/{size}（第 {resumes}/{UPLOAD_MAX_RESUMES} 次续传）: {err}"
+    )
+
+
+async def upload_file(
+    path: str,
+    display_name: Optional[str] = None,
+    mime_type: Optional[str] = None,
+    direct: Optional[bool] = None,
+    name: Optional[str] = None,
+) -> Dict[str, Any]:
+    """
+    resumable 协议分块上传本地文件到 Files API，返回 File 资源（dict：name/uri/mimeType/state ...）
+    每块 UPLOAD_CHUNK_BYTES，边读边发；某块失败时 query 服务端已收偏移并从该处续传，不从零重来
+    """
+    base = DIRECT_BASE_URL if (UPLOAD_NO_PROXY if direct is None else direct) else API_BASE_URL
+    size = os.path.getsize(path)
+    mime_type = mime_type or guess_mime_type(path)
+    display_name = display_name or Path(path).name
+    start = await _request(
+        "POST", f"{base}/upload/v1beta/files", "初始化上传",
+        **_upload_start_kwargs(size, mime_type, display_name, name),
+    )
+    upload_url = _upload_session_url(start, base)
+
+    offset, resumes = 0, 0
+    while True:
+        length = min(UPLOAD_CHUNK_BYTES, size - offset)
+        final = offset + length >= size
+        try:
+            resp = await _request(
+                "POST", upload_url, "上传文件内容",
+                headers=_chunk_headers(offset, length, final),
+                content=_aiter_range(path, offset, length),
+            )
+            if final:
+                return _file_info(resp)
+            offset += length
+            continue
+        except GeminiAPIError as e:
+            resumes += 1
+            _check_resume(e, resumes, offset, size, display_name)
+        await asyncio.sleep(min(2 ** resumes, 30))
+        try:
+            q = await _request("POST", upload_url, "查询上传偏移", headers={"X-Goog-Upload-Command": "query"})
+        except GeminiAPIError as e:
+            resumes += 1
+            _check_resume(e, resumes, offset, size, display_name)
+            continue
+        offset, done = _parse_query(q, size)
+        if done:
+            return _file_info(q)
+        logger.info(f"[GeminiREST] 从服务端偏移续传 {display_name}: {offset}/{size}")
+
+
+async def get_file(name: str) -> Dict[str, Any]:
+    resp = await _request("GET", f"{API_BASE_URL}/v1beta/{name}", "获取文件状态")
+    return resp.json()
+
+
+async def delete_file(name: str) -> None:
+    await _request("DELETE", f"{API_BASE_URL}/v1beta/{name}", "删除文件")
+
+
+async def wait_for_file_active(file: Dict[str, Any], max_wait_time: float = 600, poll_interval: float = 2.0) -> Dict[str, Any]:
+    """异步轮询直到文件 ACTIVE（asyncio.sleep，不占线程）"""
+    started = time.monotonic()
+    while file.get("state") == "PROCESSING":
+        elapsed = time.monotonic() - started
+        if elapsed > max_wait_time:
+            raise GeminiAPIError(f"文件处理超时（超过 {max_wait_time:.0f} 秒）: {file.get('name')}")
+        await asyncio.sleep(poll_interval)
+        try:
+            file = await get_file(file["name"])
+            logger.info(f"[wait_for_file_active] {file.get('name')} 状态: {file.get('state')} (已等待 {int(elapsed)} 秒)")
+        except GeminiAPIError as e:
+            if not e.retryable:
+                raise
+            logger.warning(f"[wait_for_file_active] 获取文件状态时出错: {e}")
+    if file.get("state") not in (None, "ACTIVE"):
+        raise GeminiAPIError(f"文件处理失败，状态: {file.get('state')}")
+    return file
+
+
+def file_part(file: Dict[str, Any]) -> Dict[str, Any]:
+    return {"file_data": {"mime_type": file.get("mimeType"), "file_uri": file.get("uri")}}
+
+
+def text_part(text: str) -> Dict[str, Any]:
+    return {"text": text}
+
+
+def _generate_kwargs(parts, generation_config, timeout) -> Dict[str, Any]:
+    body: Dict[str, Any] = {"contents": [{"role": "user", "parts": parts}]}
+    if generation_config:
+        body["generationConfig"] = generation_config
+    kwargs: Dict[str, Any] = {"json": body}
+    if timeout:
+        kwargs["timeout"] = httpx.Timeout(timeout, connect=min(timeout, HTTP_CONNECT_TIMEOUT))
+    return kwargs
+
+
+async def generate_content(
+    model: str,
+    parts: List[Dict[str, Any]],
+    generation_config: Optional[Dict[str, Any]] = None,
+    timeout: Optional[float] = None,
+) -> Dict[str, Any]:
+    """调用 models/{model}:generateContent，返回原始响应 JSON"""
+    resp = await _request(
+        "POST", f"{API_BASE_URL}/v1beta/models/{model}:generateContent", "generateContent",
+        **_generate_kwargs(parts, generation_config, timeout),
+    )
+    return resp.json()
+
+
+def generate_content_sync(
+    model: str,
+    parts: List[Dict[str, Any]],
+    generation_config: Optional[Dict[str, Any]] = None,
+    timeout: Optional[float] = None,
+) -> Dict[str, Any]:
+    """generate_content 的同步版本（共享同步连接池），供线程中运行的调用方使用"""
+    resp = _request_sync(
+        "POST", f"{API_BASE_URL}/v1beta/models/{model}:generateContent", "generateContent",
+        **_generate_kwargs(parts, generation_config, timeout),
+    )
+    return resp.json()
+
+
+async def stream_generate_content(
+    model: str,
+    parts: List[Dict[str, Any]],
+    generation_config: Optional[Dict[str, Any]] = None,
+    timeout: Optional[float] = None,
+) -> AsyncIterator[Dict[str, Any]]:
+    """调用 models/{model}:streamGenerateContent?alt=sse，逐个产出响应分片 JSON（增量文本；usageMetadata 为累计值）"""
+    client = get_async_client()
+    url = f"{API_BASE_URL}/v1beta/models/{model}:streamGenerateContent"
+    try:
+        async with client.stream(
+            "POST", url, params={"alt": "sse", "key": GEMINI_API_KEY},
+            **_generate_kwargs(parts, generation_config, timeout),
+        ) as resp:
+            if resp.status_code != 200:
+                await resp.aread()
+                _raise_for_status(resp, "streamGenerateContent")
+            async for line in resp.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                data = line[5:].strip()
+                if not data:
+                    continue
+                try:
+                    chunk = json.loads(data)
+                except ValueError as e:
+                    raise GeminiAPIError(f"streamGenerateContent 分片解析失败: {data[:200]}") from e
+                yield chunk
+    except httpx.HTTPError as e:
+        raise GeminiAPIError(f"streamGenerateContent 网络错误: {type(e).__name__}: {e}") from e
+
+
+def response_text(resp: Dict[str, Any]) -> str:
+    """拼接首个候选的全部文本 part；无候选（如被安全策略拦截）时抛错"""
+    candidates = resp.get("candidates") or []
+    if not candidates:
+        feedback = resp.get("promptFeedback") or {}
+        raise GeminiAPIError(f"Gemini 未返回候选结果: {feedback or resp}")
+    parts = (candidates[0].get("content") or {}).get("parts") or []
+    return "".join(p.get("text", "") for p in parts if isinstance(p, dict))
@@ -0,0 +1,198 @@
+"""
+Gemini 文件句柄缓存：按内容 SHA-256 复用已上传到 Files API 的音频，替代「用完即删、下次重传」
+- lookup：同内容文件仍 ACTIVE 且剩余有效期足够时直接返回 File 资源，跳过上传与等待处理
+- store：上传完成后登记（Gemini 文件 48 小时后自动删除，缓存有效期略短）；登记后的文件归缓存所有，调用方不再删除
+- 后台清理：每 GEMINI_FILE_CACHE_SWEEP_SEC 秒批量摘除已过期条目（SKIP LOCKED，多 worker 不重复），并发删除远端文件
+- metrics_snapshot：本进程命中 / 未命中 / 失效 / 清理计数与命中率（管理接口使用）
+"""
+import asyncio
+import hashlib
+import logging
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+GEMINI_FILE_CACHE_ENABLED = os.getenv("GEMINI_FILE_CACHE_ENABLED", "false").lower() in ("true", "1", "yes")
+GEMINI_FILE_CACHE_TTL_SEC = int(os.getenv("GEMINI_FILE_CACHE_TTL_SEC", str(47 * 3600)))
+# 命中时文件至少还需有效多久（秒），避免 generate_content 途中文件过期
+GEMINI_FILE_CACHE_MIN_TTL_SEC = int(os.getenv("GEMINI_FILE_CACHE_MIN_TTL_SEC", "1800"))
+GEMINI_FILE_CACHE_SWEEP_SEC = int(os.getenv("GEMINI_FILE_CACHE_SWEEP_SEC", "600"))
+GEMINI_FILE_CACHE_SWEEP_BATCH = int(os.getenv("GEMINI_FILE_CACHE_SWEEP_BATCH", "50"))
+
+CACHE_KEY_FIELD = "_cache_sha256"  # 登记进缓存的 File 资源带此字段，调用方据此跳过删除
+
+_counters = {"hits": 0, "misses": 0, "stale": 0, "stores": 0, "evicted": 0, "delete_errors": 0}
+_sweeper_task: Optional[asyncio.Task] = None
+
+
+def file_sha256(path: str) -> str:
+    """文件内容 SHA-256（同步，调用方放线程中执行）"""
+    hasher = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            hasher.update(block)
+    return hasher.hexdigest()
+
+
+def is_cached(file: Dict[str, Any]) -> bool:
+    return bool(file.get(CACHE_KEY_FIELD))
+
+
+async def lookup(sha256: str, purpose: str = "transcribe") -> Optional[Dict[str, Any]]:
+    """命中且远端文件仍 ACTIVE 时返回 File 资源；过期 / 远端已不存在的条目顺带删除"""
+    from sqlalchemy import text
+    from database.connection import engine
+    from services import gemini_gateway
+
+    try:
+        async with engine.connect() as conn:
+            row = (await conn.execute(
+                text("SELECT file_name FROM gemini_file_cache WHERE sha256 = :sha AND expires_at > :min_exp"),
+                {"sha": sha256, "min_exp": datetime.now(timezone.utc) + timedelta(seconds=GEMINI_FILE_CACHE_MIN_TTL_SEC)},
+            )).first()
+    except Exception as e:
+        logger.warning(f"[文件缓存] 查询失败，按未命中处理: {e}")
+        row = None
+    if row is None:
+        _counters["misses"] += 1
+        return None
+    try:
+        file = await gemini_gateway.get_file(row.file_name, purpose=purpose)
+    except Exception as e:
+        file = None
+        logger.info(f"[文件缓存] 远端文件不可用 {row.file_name}: {e}")
+    if not file or file.get("state") != "ACTIVE":
+        _counters["stale"] += 1
+        _counters["misses"] += 1
+        await _forget(sha256)
+        return None
+    _counters["hits"] += 1
+    try:
+        async with engine.begin() as conn:
+            await conn.execute(
+                text("UPDATE gemini_file_cache SET hits = hits + 1, last_used_at = now() WHERE sha256 = :sha"),
+                {"sha": sha256},
+            )
+    except Exception as e:
+        logger.warning(f"[文件缓存] 更新命中计数失败: {e}")
+    return {**file, CACHE_KEY_FIELD: sha256}
+
+
+async def store(sha256: str, file: Dict[str, Any], size_bytes: Optional[int] = None) -> Dict[str, Any]:
+    """登记已 ACTIVE 的文件；成功时返回带缓存标记的 File 资源（归缓存所有），失败时原样返回（调用方照常删除）"""
+    from sqlalchemy import text
+    from database.connection import engine
+
+    expires_at = datetime.now(timezone.utc) + timedelta(seconds=GEMINI_FILE_CACHE_TTL_SEC)
+    try:
+        async with engine.begin() as conn:
+            replaced = (await conn.execute(
+                text("""
+                    INSERT INTO gemini_file_cache (sha256, file_name, mime_type, size_bytes, expires_at)
+                    VALUES (:sha, :name, :mime, :size, :exp)
+                    ON CONFLICT (sha256) DO UPDATE
+                    SET file_name = EXCLUDED.file_name, mime_type = EXCLUDED.mime_type, size_bytes = EXCLUDED.size_bytes,
+                        expires_at = EXCLUDED.expires_at, created_at = now(), last_used_at = now(), hits = 0
+                    RETURNING (xmax <> 0) AS replaced
+                """),
+                {"sha": sha256, "name": file["name"], "mime": file.get("mimeType"), "size": size_bytes, "exp": expires_at},
+            )).scalar()
+    except Exception as e:
+        logger.warning(f"[文件缓存] 登记失败，文件按原流程删除: {e}")
+        return file
+    _counters["stores"] += 1
+    if replaced:
+        logger.info(f"[文件缓存] 覆盖已有条目 sha256={sha256[:12]}（并发上传了相同内容，旧文件随 Gemini 过期删除）")
+    return {**file, CACHE_KEY_FIELD: sha256}
+
+
+async def _forget(sha256: str) -> None:
+    from sqlalchemy import text
+    from database.connection import engine
+    try:
+        async with engine.begin() as conn:
+            await conn.execute(text("DELETE FROM gemini_file_cache WHERE sha256 = :sha"), {"sha": sha256})
+    except Exception as e:
+        logger.warning(f"[文件缓存] 删除条目失败: {e}")
+
+
+async def sweep() -> int:
+    """摘除一批已过期的条目并并发删除远端文件，返回摘除条数（lookup 只发放剩余有效期 ≥ MIN_TTL 的文件，不会删到使用中的）"""
+    from sqlalchemy import text
+    from database.connection import engine
+    from services import gemini_gateway
+
+    async with engine.begin() as conn:
+        rows = (await conn.execute(
+            text("""
+                DELETE FROM gemini_file_cache WHERE sha256 IN (
+                    SELECT sha256 FROM gemini_file_cache WHERE expires_at <= now()
+                    ORDER BY expires_at LIMIT :batch FOR UPDATE SKIP LOCKED
+                ) RETURNING file_name
+            """),
+            {"batch": GEMINI_FILE_CACHE_SWEEP_BATCH},
+        )).all()
+    if not rows:
+        return 0
+
+    async def _delete(name: str) -> None:
+        try:
+            await gemini_gateway.delete_file(name, purpose="file_cache")
+        except Exception as e:
+            # 已被 Gemini 自动删除等：条目已摘除，远端文件最迟 48 小时后消失
+            _counters["delete_errors"] += 1
+            logger.info(f"[文件缓存] 删除远端文件失败（忽略）{name}: {e}")
+
+    await asyncio.gather(*[_delete(r.file_name) for r in rows])
+    _counters["evicted"] += len(rows)
+    logger.info(f"[文件缓存] 已清理 {len(rows)} 个过期文件")
+    return len(rows)
+
+
+async def _sweep_loop() -> None:
+    while True:
+        try:
+            # 一批删满说明积压，立即继续下一批
+            while await sweep() >= GEMINI_FILE_CACHE_SWEEP_BATCH:
+                pass
+        except Exception as e:
+            logger.warning(f"[文件缓存] 清理失败，下次重试: {e}")
+        await asyncio.sleep(GEMINI_FILE_CACHE_SWEEP_SEC)
+
+
+def start_sweeper() -> None:
+    global _sweeper_task
+    if GEMINI_FILE_CACHE_ENABLED and (_sweeper_task is None or _sweeper_task.done()):
+        _sweeper_task = asyncio.create_task(_sweep_loop())
+
+
+def stop_sweeper() -> None:
+    if _sweeper_task is not None:
+        _sweeper_task.cancel()
+
+
+def metrics_snapshot() -> Dict[str, Any]:
+    lookups = _counters["hits"] + _counters["misses"]
+    return {
+        "enabled": GEMINI_FILE_CACHE_ENABLED,
+        **_counters,
+        "hit_rate": round(_counters["hits"] / lookups, 4) if lookups else None,
+        "ttl_sec": GEMINI_FILE_CACHE_TTL_SEC,
+    }
+
+
+async def stats(db) -> Dict[str, Any]:
+    """缓存表现状（全部 worker 共享）：条目数、占用字节、累计命中"""
+    from sqlalchemy import text
+    row = (await db.execute(text(
+        "SELECT count(*) AS entries, COALESCE(sum(size_bytes), 0) AS total_bytes, COALESCE(sum(hits), 0) AS hits, "
+        "min(expires_at) AS next_expiry FROM gemini_file_cache"
+    ))).first()
+    return {
+        "entries": row.entries,
+        "total_bytes": int(row.total_bytes),
+        "hits": int(row.hits),
+        "next_expiry": row.next_expiry.isoformat() if row.next_expiry else None,
+    }
@@ -0,0 +1,491 @@
+"""
+Gemini 统一网关
+所有 Gemini 调用（转写、场景分类、技能、场景图、生图、会话总结、测试接口）都经由此处：
+- 模型对象按 (模型名, 生成配置) 缓存复用
+- 复用 gemini_client 的 keep-alive 连接池（经 /secret-channel 代理）
+- 指数退避 + 抖动重试；429 优先采用服务端给出的 retryDelay
+- deadline 预算沿调用链传递（contextvars，asyncio.to_thread 中同样生效），预算不足时不再重试
+- 按用途（transcribe / classify / skill:<id> / scene / image ...）记录延迟、重试次数与 token 用量
+- 流式 generateContent（GatewayStream）：逐块产出增量文本，首块到达前的失败同样退避重试
+"""
+import asyncio
+import base64
+import json
+import logging
+import os
+import random
+import re
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from services import gemini_client
+from services.gemini_client import GeminiAPIError
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MODEL = os.getenv("GEMINI_FLASH_MODEL", "gemini-3-flash-preview")
+RETRY_MAX_ATTEMPTS = max(1, int(os.getenv("GEMINI_RETRY_MAX_ATTEMPTS", "3")))
+RETRY_BASE_DELAY = float(os.getenv("GEMINI_RETRY_BASE_DELAY", "2"))
+RETRY_MAX_DELAY = float(os.getenv("GEMINI_RETRY_MAX_DELAY", "30"))
+
+# 每个 (purpose, op) 保留最近 N 次延迟用于分位数
+_LATENCY_WINDOW = 500
+
+
+class GeminiDeadlineExceeded(GeminiAPIError):
+    """调用链 deadline 预算耗尽（不再重试）"""
+
+    @property
+    def retryable(self) -> bool:
+        return False
+
+
+# ==================== deadline 预算 ====================
+
+_deadline_var: ContextVar[Optional[float]] = ContextVar("gemini_deadline", default=None)
+
+
+@contextmanager
+def deadline(seconds: float):
+    """为当前调用链设置总预算（秒）；嵌套时取更紧的那个"""
+    new_deadline = time.monotonic() + seconds
+    current = _deadline_var.get()
+    token = _deadline_var.set(min(current, new_deadline) if current else new_deadline)
+    try:
+        yield
+    finally:
+        _deadline_var.reset(token)
+
+
+def remaining_budget(timeout: Optional[float] = None) -> Optional[float]:
+    """剩余预算（秒）：取调用链 deadline 与本次 timeout 中更紧的；均未设置时返回 None"""
+    now = time.monotonic()
+    ends = [d for d in (_deadline_var.get(), now + timeout if timeout else None) if d]
+    return min(ends) - now if ends else None
+
+
+# ==================== 指标 ====================
+
+class _Stats:
+    __slots__ = ("calls", "errors", "retries", "latencies", "prompt_tokens", "output_tokens")
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.retries = 0
+        self.latencies = deque(maxlen=_LATENCY_WINDOW)
+        self.prompt_tokens = 0
+        self.output_tokens = 0
+
+
+_metrics: Dict[Tuple[str, str], _Stats] = {}
+_metrics_lock = threading.Lock()
+
+
+def _record(purpose: str, op: str, model: Optional[str], latency_ms: float, retries: int, ok: bool,
+            usage: Optional[dict] = None) -> None:
+    usage = usage or {}
+    prompt_tokens = int(usage.get("promptTokenCount") or 0)
+    output_tokens = int(usage.get("candidatesTokenCount") or 0) + int(usage.get("thoughtsTokenCount") or 0)
+    with _metrics_lock:
+        st = _metrics.setdefault((purpose, op), _Stats())
+        st.calls += 1
+        st.errors += 0 if ok else 1
+        st.retries += retries
+        st.latencies.append(latency_ms)
+        st.prompt_tokens += prompt_tokens
+        st.output_tokens += output_tokens
+    logger.info(
+        f"[Gemini] purpose={purpose} op={op} model={model or '-'} ok={ok} latency={latency_ms:.0f}ms "
+        f"retries={retries} tokens={prompt_tokens}/{output_tokens}"
+    )
+
+
+def _percentile(sorted_vals: List[float], q: float) -> Optional[float]:
+    if not sorted_vals:
+        return None
+    idx = min(len(sorted_vals) - 1, max(0, int(round(q * (len(sorted_vals) - 1)))))
+    return round(sorted_vals[idx], 1)
+
+
+def metrics_snapshot() -> Dict[str, Dict[str, Any]]:
+    """按用途 / 操作汇总：调用数、错误数、重试数、延迟分位、token 用量（进程内）"""
+    out: Dict[str, Dict[str, Any]] = {}
+    with _metrics_lock:
+        items = [(k, st.calls, st.errors, st.retries, sorted(st.latencies), st.prompt_tokens, st.output_tokens)
+                 for k, st in _metrics.items()]
+    for (purpose, op), calls, errors, retries, lats, pt, ot in items:
+        out.setdefault(purpose, {})[op] = {
+            "calls": calls,
+            "errors": errors,
+            "retries": retries,
+            "p50_ms": _percentile(lats, 0.50),
+            "p95_ms": _percentile(lats, 0.95),
+            "max_ms": round(lats[-1], 1) if lats else None,
+            "prompt_tokens": pt,
+            "output_tokens": ot,
+        }
+    return out
+
+
+@contextmanager
+def track(purpose: str, op: str = "call", model: Optional[str] = None):
+    """记录不经网关 HTTP 的调用（如 Mem0 内部的 Gemini 请求）的延迟与成败"""
+    started = time.monotonic()
+    ok = False
+    try:
+        yield
+        ok = True
+    finally:
+        _record(purpose, op, model, (time.monotonic() - started) * 1000, 0, ok)
+
+
+# ==================== 重试 ====================
+
+_RETRY_IN_RE = re.compile(r"retry in ([\d.]+)\s*s", re.IGNORECASE)
+_RETRY_DELAY_RE = re.compile(r'"retryDelay"\s*:\s*"([\d.]+)s"')
+
+
+def _retry_hint(err: Exception) -> Optional[float]:
+    text = f"{err} {getattr(err, 'body', '')}"
+    m = _RETRY_DELAY_RE.search(text) or _RETRY_IN_RE.search(text)
+    return float(m.group(1)) if m else None
+
+
+def _is_retryable(err: Exception) -> bool:
+    if isinstance(err, GeminiAPIError):
+        return err.retryable
+    return isinstance(err, (asyncio.TimeoutError, TimeoutError, ConnectionError))
+
+
+def _backoff_delay(attempt: int, err: Exception) -> float:
+    """指数退避 + 抖动（[d/2, d]）；429 等带 retryDelay 时至少等待服务端建议的时长"""
+    ceiling = min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * (2 ** (attempt - 1)))
+    delay = ceiling / 2 + random.uniform(0, ceiling / 2)
+    hint = _retry_hint(err)
+    if hint is not None:
+        delay = max(delay, hint + random.uniform(0.5, 2.0))
+    return delay
+
+
+def mid_stream_retry_delay(attempt: int, err: Exception) -> Optional[float]:
+    """
+    流式已产出部分文本后中断（GatewayStream 不重试）：调用方丢弃已消费结果、整体重启流之前询问，
+    可重试时返回退避秒数，否则 None。attempt 为已失败的流次数，与常规重试共用上限与 deadline 预算
+    """
+    if attempt >= RETRY_MAX_ATTEMPTS or not _is_retryable(err):
+        return None
+    delay = _backoff_delay(attempt, err)
+    budget = remaining_budget()
+    if budget is not None and budget <= delay:
+        return None
+    return delay
+
+
+def _next_attempt_timeout(timeout: Optional[float], purpose: str, op: str) -> Optional[float]:
+    budget = remaining_budget(timeout)
+    if budget is not None and budget <= 0:
+        raise GeminiDeadlineExceeded(f"[{purpose}/{op}] deadline 预算已耗尽")
+    return budget
+
+
+async def _call_async(purpose: str, op: str, model: Optional[str], fn: Callable[[Optional[float]], Awaitable[Any]],
+                      timeout: Optional[float] = None, max_attempts: Optional[int] = None) -> Tuple[Any, int]:
+    """异步执行 fn(attempt_timeout)，带退避重试与 deadline；返回 (结果, 重试次数)"""
+    max_attempts = max_attempts or RETRY_MAX_ATTEMPTS
+    hard_deadline = time.monotonic() + timeout if timeout else None
+    started = time.monotonic()
+    attempt = 0
+    while True:
+        attempt += 1
+        try:
+            attempt_timeout = _next_attempt_timeout(hard_deadline and hard_deadline - time.monotonic(), purpose, op)
+            if attempt_timeout is not None:
+                result = await asyncio.wait_for(fn(attempt_timeout), timeout=attempt_timeout)
+            else:
+                result = await fn(None)
+            usage = result.get("usageMetadata") if isinstance(result, dict) else None
+            _record(purpose, op, model, (time.monotonic() - started) * 1000, attempt - 1, True, usage)
+            return result, attempt - 1
+        except Exception as e:
+            retryable = _is_retryable(e) and attempt < max_attempts
+            delay = _backoff_delay(attempt, e) if retryable else 0
+            budget = remaining_budget(hard_deadline and hard_deadline - time.monotonic())
+            if retryable and budget is not None and budget <= delay:
+                retryable = False
+            if not retryable:
+                _record(purpose, op, model, (time.monotonic() - started) * 1000, attempt - 1, False)
+                if isinstance(e, asyncio.TimeoutError):
+                    raise GeminiAPIError(f"[{purpose}/{op}] 调用超时") from e
+                raise
+            logger.warning(f"[Gemini] purpose={purpose} op={op} 第 {attempt}/{max_attempts} 次失败，"
+                           f"{delay:.1f}s 后重试: {type(e).__name__}: {str(e)[:300]}")
+            await asyncio.sleep(delay)
+
+
+def _call_sync(purpose: str, op: str, model: Optional[str], fn: Callable[[Optional[float]], Any],
+               timeout: Optional[float] = None, max_attempts: Optional[int] = None) -> Tuple[Any, int]:
+    """_call_async 的同步版本（在线程中运行的调用方使用）"""
+    max_attempts = max_attempts or RETRY_MAX_ATTEMPTS
+    hard_deadline = time.monotonic() + timeout if timeout else None
+    started = time.monotonic()
+    attempt = 0
+    while True:
+        attempt += 1
+        try:
+            attempt_timeout = _next_attempt_timeout(hard_deadline and hard_deadline - time.monotonic(), purpose, op)
+            result = fn(attempt_timeout)
+            usage = result.get("usageMetadata") if isinstance(result, dict) else None
+            _record(purpose, op, model, (time.monotonic() - started) * 1000, attempt - 1, True, usage)
+            return result, attempt - 1
+        except Exception as e:
+            retryable = _is_retryable(e) and attempt < max_attempts
+            delay = _backoff_delay(attempt, e) if retryable else 0
+            budget = remaining_budget(hard_deadline and hard_deadline - time.monotonic())
+            if retryable and budget is not None and budget <= delay:
+                retryable = False
+            if not retryable:
+                _record(purpose, op, model, (time.monotonic() - started) * 1000, attempt - 1, False)
+                raise
+            logger.warning(f"[Gemini] purpose={purpose} op={op} 第 {attempt}/{max_attempts} 次失败，"
+                           f"{delay:.1f}s 后重试: {type(e).__name__}: {str(e)[:300]}")
+            time.sleep(delay)
+
+
+# ==================== 内容与响应 ====================
+
+def to_parts(contents: Any) -> List[Dict[str, Any]]:
+    """
+    统一内容格式 → REST parts：
+    str → text；{"mime_type", "data": bytes} → inline_data；Files API 资源（含 uri）→ file_data；
+    已是 part 形态（text / inline_data / file_data）的 dict 原样保留；list 逐项展开
+    """
+    if contents is None:
+        return []
+    if isinstance(contents, (list, tuple)):
+        parts: List[Dict[str, Any]] = []
+        for c in contents:
+            parts.extend(to_parts(c))
+        return parts
+    if isinstance(contents, str):
+        return [{"text": contents}]
+    if isinstance(contents, dict):
+        if "data" in contents and "mime_type" in contents:
+            data = contents["data"]
+            if isinstance(data, (bytes, bytearray)):
+                data = base64.b64encode(data).decode("ascii")
+            return [{"inline_data": {"mime_type": contents["mime_type"], "data": data}}]
+        if "uri" in contents and "name" in contents:
+            return [gemini_client.file_part(contents)]
+        return [contents]
+    raise TypeError(f"不支持的 Gemini 内容类型: {type(contents).__name__}")
+
+
+class GatewayResponse:
+    """generateContent 响应的轻量包装，接口与 SDK 响应的常用部分一致（.text / .parts）"""
+
+    def __init__(self, raw: Dict[str, Any], retries: int = 0):
+        self.raw = raw
+        self.retries = retries
+
+    @property
+    def text(self) -> str:
+        return gemini_client.response_text(self.raw)
+
+    @property
+    def parts(self) -> List[Dict[str, Any]]:
+        candidates = self.raw.get("candidates") or []
+        return ((candidates[0].get("content") or {}).get("parts") or []) if candidates else []
+
+    @property
+    def images(self) -> List[Tuple[bytes, str]]:
+        """响应中的 inline 图片 [(bytes, mime_type)]"""
+        out = []
+        for p in self.parts:
+            inline = p.get("inlineData") or p.get("inline_data")
+            if inline and inline.get("data"):
+                out.append((base64.b64decode(inline["data"]), inline.get("mimeType") or inline.get("mime_type") or "image/png"))
+        return out
+
+    @property
+    def usage(self) -> Dict[str, Any]:
+        return self.raw.get("usageMetadata") or {}
+
+
+class GatewayStream:
+    """
+    流式 generateContent：async for 逐块取增量文本；迭代结束后 .text / .retries / .usage 可用。
+    首块文本产出前的失败按常规退避重试；已产出文本后失败直接抛出（调用方已消费部分结果，由其决定如何处理）。
+    结束时记录一次指标（op=stream），延迟为整个流的耗时。
+    """
+
+    def __init__(self, model_name: str, parts: List[Dict[str, Any]], config: Optional[Dict[str, Any]],
+                 purpose: str, timeout: Optional[float], max_attempts: Optional[int]):
+        self.model_name = model_name
+        self.purpose = purpose
+        self.retries = 0
+        self.usage: Dict[str, Any] = {}
+        self._parts = parts
+        self._config = config
+        self._timeout = timeout
+        self._max_attempts = max_attempts or RETRY_MAX_ATTEMPTS
+        self._chunks: List[str] = []
+
+    @property
+    def text(self) -> str:
+        return "".join(self._chunks)
+
+    def __aiter__(self) -> AsyncIterator[str]:
+        return self._iterate()
+
+    async def _iterate(self) -> AsyncIterator[str]:
+        purpose, op = self.purpose, "stream"
+        hard_deadline = time.monotonic() + self._timeout if self._timeout else None
+        started = time.monotonic()
+        attempt = 0
+        while True:
+            attempt += 1
+            self.retries = attempt - 1
+            last: Dict[str, Any] = {}
+            stream = None
+            try:
+                attempt_timeout = _next_attempt_timeout(hard_deadline and hard_deadline - time.monotonic(), purpose, op)
+                stream = gemini_client.stream_generate_content(self.model_name, self._parts, self._config,
+                                                               timeout=attempt_timeout)
+                while True:
+                    budget = remaining_budget(hard_deadline and hard_deadline - time.monotonic())
+                    if budget is not None and budget <= 0:
+                        raise asyncio.TimeoutError()
+                    try:
+                        chunk = await asyncio.wait_for(stream.__anext__(), timeout=budget)
+                    except StopAsyncIteration:
+                        break
+                    last = chunk
+                    self.usage = chunk.get("usageMetadata") or self.usage
+                    text = gemini_client.response_text(chunk) if chunk.get("candidates") else ""
+                    if text:
+                        self._chunks.append(text)
+                        yield text
+                if not self._chunks:
+                    gemini_client.response_text(last)  # 全程无候选（如被安全策略拦截）时抛错
+                _record(purpose, op, self.model_name, (time.monotonic() - started) * 1000, attempt - 1, True, self.usage)
+                return
+            except Exception as e:
+                retryable = not self._chunks and _is_retryable(e) and attempt < self._max_attempts
+                delay = _backoff_delay(attempt, e) if retryable else 0
+                budget = remaining_budget(hard_deadline and hard_deadline - time.monotonic())
+                if retryable and budget is not None and budget <= delay:
+                    retryable = False
+                if not retryable:
+                    _record(purpose, op, self.model_name, (time.monotonic() - started) * 1000, attempt - 1, False)
+                    if isinstance(e, asyncio.TimeoutError):
+                        raise GeminiAPIError(f"[{purpose}/{op}] 调用超时") from e
+                    raise
+                logger.warning(f"[Gemini] purpose={purpose} op={op} 第 {attempt}/{self._max_attempts} 次失败，"
+                               f"{delay:.1f}s 后重试: {type(e).__name__}: {str(e)[:300]}")
+            finally:
+                if stream is not None:
+                    await stream.aclose()
+            await asyncio.sleep(delay)
+
+
+class GeminiModel:
+    """经网关调用的模型对象；由 get_model 缓存，线程 / 协程间共享"""
+
+    def __init__(self, model_name: str, generation_config: Optional[Dict[str, Any]] = None):
+        self.model_name = model_name
+        self.generation_config = generation_config or None
+
+    def _config(self, override: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        if not override:
+            return self.generation_config
+        return {**(self.generation_config or {}), **override}
+
+    async def generate_content_async(self, contents: Any, *, purpose: str = "general",
+                                     generation_config: Optional[Dict[str, Any]] = None,
+                                     timeout: Optional[float] = None,
+                                     max_attempts: Optional[int] = None) -> GatewayResponse:
+        parts = to_parts(contents)
+        config = self._config(generation_config)
+        raw, retries = await _call_async(
+            purpose, "generate", self.model_name,
+            lambda t: gemini_client.generate_content(self.model_name, parts, config, timeout=t),
+            timeout=timeout, max_attempts=max_attempts,
+        )
+        return GatewayResponse(raw, retries)
+
+    def generate_content(self, contents: Any, *, purpose: str = "general",
+                         generation_config: Optional[Dict[str, Any]] = None,
+                         timeout: Optional[float] = None,
+                         max_attempts: Optional[int] = None) -> GatewayResponse:
+        parts = to_parts(contents)
+        config = self._config(generation_config)
+        raw, retries = _call_sync(
+            purpose, "generate", self.model_name,
+            lambda t: gemini_client.generate_content_sync(self.model_name, parts, config, timeout=t),
+            timeout=timeout, max_attempts=max_attempts,
+        )
+        return GatewayResponse(raw, retries)
+
+    def generate_content_stream(self, contents: Any, *, purpose: str = "general",
+                                generation_config: Optional[Dict[str, Any]] = None,
+                                timeout: Optional[float] = None,
+                                max_attempts: Optional[int] = None) -> GatewayStream:
+        """流式版本：返回 GatewayStream（async for 逐块取文本），调用方可边生成边解析"""
+        return GatewayStream(self.model_name, to_parts(contents), self._config(generation_config),
+                             purpose, timeout, max_attempts)
+
+
+_models: Dict[Tuple[str, str], GeminiModel] = {}
+_models_lock = threading.Lock()
+
+
+def get_model(model_name: Optional[str] = None, generation_config: Optional[Dict[str, Any]] = None) -> GeminiModel:
+    """按 (模型名, 生成配置) 缓存模型对象"""
+    name = model_name or DEFAULT_MODEL
+    key = (name, json.dumps(generation_config or {}, sort_keys=True, ensure_ascii=False))
+    model = _models.get(key)
+    if model is None:
+        with _models_lock:
+            model = _models.get(key)
+            if model is None:
+                model = GeminiModel(name, generation_config)
+                _models[key] = model
+    return model
+
+
+# ==================== Files API ====================
+
+async def upload_file(path: str, display_name: Optional[str] = None, *, purpose: str = "transcribe",
+                      mime_type: Optional[str] = None, timeout: Optional[float] = None,
+                      max_attempts: Optional[int] = None) -> Dict[str, Any]:
+    file, _ = await _call_async(
+        purpose, "upload", None,
+        lambda t: gemini_client.upload_file(path, display_name=display_name, mime_type=mime_type),
+        timeout=timeout, max_attempts=max_attempts,
+    )
+    return file
+
+
+async def wait_for_file_active(file: Dict[str, Any], *, purpose: str = "transcribe",
+                               max_wait_time: float = 600) -> Dict[str, Any]:
+    budget = remaining_budget(max_wait_time)
+    file, _ = await _call_async(
+        purpose, "wait_active", None,
+        lambda t: gemini_client.wait_for_file_active(file, max_wait_time=budget if budget else max_wait_time),
+        max_attempts=1,
+    )
+    return file
+
+
+async def delete_file(name: str, *, purpose: str = "transcribe") -> None:
+    await _call_async(purpose, "delete", None, lambda t: gemini_client.delete_file(name), max_attempts=2)
+
+
+async def get_file(name: str, *, purpose: str = "transcribe") -> Dict[str, Any]:
+    file, _ = await _call_async(purpose, "get_file", None, lambda t: gemini_client.get_file(name), max_attempts=2)
+    return file
@@ -0,0 +1,345 @@
+"""
+持久化流水线任务队列：基于 PostgreSQL pipeline_jobs 表
+- 认领：SELECT ... FOR UPDATE SKIP LOCKED，多 worker / 多进程并发认领互不阻塞
+- 租约 + 心跳：执行中定期续约；进程崩溃或重启后租约过期的任务被自动回收重试
+- 每个 worker 以信号量限制并发，API 进程与独立 worker 进程（pipeline_worker.py）共用同一实现
+"""
+import asyncio
+import json
+import logging
+import os
+import socket
+import uuid
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from sqlalchemy import text
+
+logger = logging.getLogger(__name__)
+
+# 总开关：关闭时 main 回退为进程内 asyncio.create_task（旧行为）
+JOB_QUEUE_ENABLED = os.getenv("PIPELINE_QUEUE_ENABLED", "true").lower() == "true"
+# API 进程内是否同时消费任务；部署独立 worker 后设为 false
+JOB_EMBEDDED_WORKER = os.getenv("PIPELINE_EMBEDDED_WORKER", "true").lower() == "true"
+JOB_CONCURRENCY = max(1, int(os.getenv("PIPELINE_WORKER_CONCURRENCY", "2")))
+JOB_LEASE_SEC = max(15, int(os.getenv("PIPELINE_JOB_LEASE_SEC", "120")))
+JOB_POLL_SEC = float(os.getenv("PIPELINE_POLL_SEC", "2"))
+JOB_MAX_ATTEMPTS = max(1, int(os.getenv("PIPELINE_JOB_MAX_ATTEMPTS", "3")))
+JOB_RETRY_BASE_SEC = int(os.getenv("PIPELINE_JOB_RETRY_BASE_SEC", "30"))
+
+JOB_ANALYZE = "analyze"
+JOB_STRATEGY = "strategy"
+
+JobHandler = Callable[[Dict[str, Any]], Awaitable[None]]
+
+
+def _worker_identity() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+
+
+def _row_to_job(row) -> Dict[str, Any]:
+    payload = row.payload
+    if isinstance(payload, str):
+        try:
+            payload = json.loads(payload)
+        except Exception:
+            payload = {}
+    return {
+        "id": str(row.id),
+        "job_type": row.job_type,
+        "session_id": str(row.session_id) if row.session_id else None,
+        "user_id": str(row.user_id) if row.user_id else None,
+        "payload": payload or {},
+        "attempts": row.attempts,
+        "max_attempts": row.max_attempts,
+    }
+
+
+async def enqueue_job(
+    job_type: str,
+    session_id: Optional[str],
+    user_id: Optional[str],
+    payload: Optional[dict] = None,
+    db=None,
+    max_attempts: Optional[int] = None,
+) -> Optional[str]:
+    """
+    入队一个任务，返回 job_id；同一 session 同类型已有未完成任务时返回 None（幂等）。
+    传入 db 时在调用方事务内写入（由调用方 commit），否则自行开会话提交。
+    """
+    sql = text("""
+        INSERT INTO pipeline_jobs (id, job_type, session_id, user_id, payload, status, attempts, max_attempts, run_after)
+        VALUES (:id, :job_type, :session_id, :user_id, CAST(:payload AS JSONB), 'queued', 0, :max_attempts, now())
+        ON CONFLICT (job_type, session_id) WHERE status IN ('queued', 'running') DO NOTHING
+        RETURNING id
+    """)
+    params = {
+        "id": uuid.uuid4(),
+        "job_type": job_type,
+        "session_id": uuid.UUID(session_id) if session_id else None,
+        "user_id": uuid.UUID(user_id) if user_id else None,
+        "payload": json.dumps(payload or {}, ensure_ascii=False),
+        "max_attempts": max_attempts or JOB_MAX_ATTEMPTS,
+    }
+    if db is not None:
+        row = (await db.execute(sql, params)).first()
+    else:
+        from database.connection import AsyncSessionLocal
+        async with AsyncSessionLocal() as own_db:
+            row = (await own_db.execute(sql, params)).first()
+            await own_db.commit()
+    if row is None:
+        logger.info(f"[队列] 已有未完成任务，忽略重复入队 type={job_type} session_id={session_id}")
+        return None
+    logger.info(f"[队列] 已入队 type={job_type} session_id={session_id} job_id={row.id}")
+    return str(row.id)
+
+
+async def claim_jobs(worker_id: str, limit: int, job_types: Optional[list] = None) -> list:
+    """认领至多 limit 个到期的 queued 任务并持有租约（SKIP LOCKED，不等待其他 worker 的行锁）"""
+    from database.connection import AsyncSessionLocal
+    type_filter = "AND job_type = ANY(:job_types)" if job_types else ""
+    sql = text(f"""
+        WITH picked AS (
+            SELECT id FROM pipeline_jobs
+            WHERE status = 'queued' AND run_after <= now() {type_filter}
+            ORDER BY run_after, created_at
+            LIMIT :limit
+            FOR UPDATE SKIP LOCKED
+        )
+        UPDATE pipeline_jobs j
+        SET status = 'running',
+            attempts = j.attempts + 1,
+            lease_owner = :owner,
+            lease_expires_at = now() + make_interval(secs => :lease),
+            heartbeat_at = now(),
+            started_at = now(),
+            updated_at = now()
+        FROM picked
+        WHERE j.id = picked.id
+        RETURNING j.id, j.job_type, j.session_id, j.user_id, j.payload, j.attempts, j.max_attempts
+    """)
+    params = {"limit": limit, "owner": worker_id, "lease": JOB_LEASE_SEC}
+    if job_types:
+        params["job_types"] = list(job_types)
+    async with AsyncSessionLocal() as db:
+        rows = (await db.execute(sql, params)).all()
+        await db.commit()
+    return [_row_to_job(r) for r in rows]
+
+
+async def heartbeat_job(job_id: str, worker_id: str) -> bool:
+    """续约；返回 False 表示租约已丢失（已被回收给其他 worker）"""
+    from database.connection import AsyncSessionLocal
+    async with AsyncSessionLocal() as db:
+        res = await db.execute(
+            text("""
+                UPDATE pipeline_jobs
+                SET lease_expires_at = now() + make_interval(secs => :lease), heartbeat_at = now(), updated_at = now()
+                WHERE id = :id AND lease_owner = :owner AND status = 'running'
+            """),
+            {"id": uuid.UUID(job_id), "owner": worker_id, "lease": JOB_LEASE_SEC},
+        )
+        await db.commit()
+        return (res.rowcount or 0) > 0
+
+
+async def complete_job(job_id: str, worker_id: str) -> None:
+    from database.connection import AsyncSessionLocal
+    async with AsyncSessionLocal() as db:
+        await db.execute(
+            text("""
+                UPDATE pipeline_jobs
+                SET status = 'done', finished_at = now(), lease_owner = NULL, lease_expires_at = NULL, updated_at = now()
+                WHERE id = :id AND lease_owner = :owner
+            """),
+            {"id": uuid.UUID(job_id), "owner": worker_id},
+        )
+        await db.commit()
+
+
+async def fail_job(job: Dict[str, Any], worker_id: str, error: str) -> str:
+    """执行异常：未达上限则退避后重新排队，否则置 failed；返回新状态"""
+    from database.connection import AsyncSessionLocal
+    retry = job["attempts"] < job["max_attempts"]
+    delay = JOB_RETRY_BASE_SEC * (2 ** max(0, job["attempts"] - 1))
+    async with AsyncSessionLocal() as db:
+        await db.execute(
+            text("""
+                UPDATE pipeline_jobs
+                SET status = :status,
+                    run_after = now() + make_interval(secs => :delay),
+                    last_error = :error,
+                    finished_at = CASE WHEN :status = 'failed' THEN now() ELSE NULL END,
+                    lease_owner = NULL, lease_expires_at = NULL, updated_at = now()
+                WHERE id = :id AND lease_owner = :owner
+            """),
+            {
+                "id": uuid.UUID(job["id"]),
+                "owner": worker_id,
+                "status": "queued" if retry else "failed",
+                "delay": delay if retry else 0,
+                "error": (error or "")[:2000],
+            },
+        )
+        await db.commit()
+    return "queued" if retry else "failed"
+
+
+async def release_job(job_id: str, worker_id: str) -> None:
+    """优雅退出时交还未完成任务（不计入失败），其他 worker 可立即认领"""
+    from database.connection import AsyncSessionLocal
+    async with AsyncSessionLocal() as db:
+        await db.execute(
+            text("""
+                UPDATE pipeline_jobs
+                SET status = 'queued', attempts = GREATEST(attempts - 1, 0), run_after = now(),
+                    lease_owner = NULL, lease_expires_at = NULL, updated_at = now()
+                WHERE id = :id AND lease_owner = :owner AND status = 'running'
+            """),
+            {"id": uuid.UUID(job_id), "owner": worker_id},
+        )
+        await db.commit()
+
+
+async def reclaim_stale_jobs() -> list:
+    """回收租约过期的 running 任务：未达上限重新排队，否则置 failed；返回被置 failed 的任务"""
+    from database.connection import AsyncSessionLocal
+    async with AsyncSessionLocal() as db:
+        rows = (await db.execute(text("""
+            UPDATE pipeline_jobs
+            SET status = CASE WHEN attempts >= max_attempts THEN 'failed' ELSE 'queued' END,
+                last_error = CONCAT_WS(' | ', last_error, 'lease expired (owner=' || COALESCE(lease_owner, '?') || ')'),
+                finished_at = CASE WHEN attempts >= max_attempts THEN now() ELSE NULL END,
+                run_after = now(),
+                lease_owner = NULL, lease_expires_at = NULL, updated_at = now()
+            WHERE status = 'running' AND lease_expires_at < now()
+            RETURNING id, job_type, session_id, user_id, payload, attempts, max_attempts, status
+        """))).all()
+        await db.commit()
+    if rows:
+        logger.warning(f"[队列] 回收租约过期任务 {len(rows)} 个: "
+                       + ", ".join(f"{r.job_type}/{r.session_id}->{r.status}" for r in rows))
+    return [_row_to_job(r) for r in rows if r.status == "failed"]
+
+
+class JobWorker:
+    """
+    任务消费者：轮询认领 → 并发执行（信号量上限）→ 心跳续约 → 完成/失败回写
+    handlers: job_type -> async handler(job)
+    dead_handlers: job_type -> async handler(job)，任务最终失败（重试耗尽 / 回收耗尽）时调用，用于把 session 标记为失败
+    """
+
+    def __init__(
+        self,
+        handlers: Dict[str, JobHandler],
+        dead_handlers: Optional[Dict[str, JobHandler]] = None,
+        concurrency: int = JOB_CONCURRENCY,
+        worker_id: Optional[str] = None,
+    ):
+        self.handlers = handlers
+        self.dead_handlers = dead_handlers or {}
+        self.concurrency = max(1, concurrency)
+        self.worker_id = worker_id or _worker_identity()
+        self._running: Dict[str, asyncio.Task] = {}
+        self._stop = asyncio.Event()
+        self._wakeup = asyncio.Event()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._wakeup.set()
+
+    async def run(self) -> None:
+        logger.info(f"[队列] worker 启动 id={self.worker_id} concurrency={self.concurrency} lease={JOB_LEASE_SEC}s")
+        loop = asyncio.get_running_loop()
+        next_reclaim = 0.0
+        while not self._stop.is_set():
+            try:
+                now = loop.time()
+                if now >= next_reclaim:
+                    next_reclaim = now + JOB_LEASE_SEC / 2
+                    for dead in await reclaim_stale_jobs():
+                        await self._on_dead(dead)
+                free = self.concurrency - len(self._running)
+                if free > 0:
+                    for job in await claim_jobs(self.worker_id, free, list(self.handlers.keys())):
+                        task = asyncio.create_task(self._execute(job))
+                        self._running[job["id"]] = task
+                        task.add_done_callback(lambda _t, jid=job["id"]: self._on_task_done(jid))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"[队列] 轮询失败（稍后重试）: {e}")
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=JOB_POLL_SEC)
+            except asyncio.TimeoutError:
+                pass
+        await self._drain()
+
+    def _on_task_done(self, job_id: str) -> None:
+        self._running.pop(job_id, None)
+        self._wakeup.set()  # 空出槽位，立即尝试认领下一个
+
+    async def _drain(self, timeout: float = 20.0) -> None:
+        """退出：给执行中任务一个短暂收尾窗口，仍未完成的取消并交还队列"""
+        if not self._running:
+            return
+        logger.info(f"[队列] worker 退出，等待 {len(self._running)} 个执行中任务（最多 {timeout:.0f}s）")
+        tasks = dict(self._running)
+        _, pending = await asyncio.wait(tasks.values(), timeout=timeout)
+        for job_id, task in tasks.items():
+            if task in pending:
+                task.cancel()
+                try:
+                    await release_job(job_id, self.worker_id)
+                    logger.info(f"[队列] 已交还未完成任务 job_id={job_id}")
+                except Exception as e:
+                    logger.warning(f"[队列] 交还任务失败 job_id={job_id}: {e}（租约过期后将被回收）")
+
+    async def _heartbeat(self, job_id: str, task: asyncio.Task) -> None:
+        interval = max(5.0, JOB_LEASE_SEC / 3)
+        while not task.done():
+            await asyncio.sleep(interval)
+            try:
+                if not await heartbeat_job(job_id, self.worker_id):
+                    logger.error(f"[队列] 租约已丢失，取消执行 job_id={job_id}")
+                    task.cancel()
+                    return
+            except Exception as e:
+                logger.warning(f"[队列] 心跳失败 job_id={job_id}: {e}")
+
+    async def _execute(self, job: Dict[str, Any]) -> None:
+        job_id = job["id"]
+        handler = self.handlers.get(job["job_type"])
+        logger.info(f"[队列] 开始执行 type={job['job_type']} session_id={job['session_id']} "
+                    f"attempt={job['attempts']}/{job['max_attempts']} job_id={job_id}")
+        work = asyncio.create_task(handler(job))
+        beat = asyncio.create_task(self._heartbeat(job_id, work))
+        try:
+            await work
+            await complete_job(job_id, self.worker_id)
+            logger.info(f"[队列] 执行完成 type={job['job_type']} session_id={job['session_id']} job_id={job_id}")
+        except asyncio.CancelledError:
+            if not work.done():
+                work.cancel()
+            raise
+        except Exception as e:
+            logger.error(f"[队列] 执行失败 type={job['job_type']} session_id={job['session_id']} job_id={job_id}: "
+                         f"{type(e).__name__}: {e}", exc_info=True)
+            try:
+                status = await fail_job(job, self.worker_id, f"{type(e).__name__}: {e}")
+                if status == "failed":
+                    await self._on_dead(job)
+            except Exception as db_err:
+                logger.error(f"[队列] 回写失败状态出错 job_id={job_id}: {db_err}")
+        finally:
+            beat.cancel()
+
+    async def _on_dead(self, job: Dict[str, Any]) -> None:
+        handler = self.dead_handlers.get(job["job_type"])
+        if not handler:
+            return
+        try:
+            await handler(job)
+        except Exception as e:
+            logger.warning(f"[队列] 失败回调出错 job_id={job['id']}: {e}")
@@ -7,6 +7,8 @@ import logging
 from pathlib import Path
 from typing import Optional
 
+from services.gemini_gateway import track
+
 logger = logging.getLogger(__name__)
 
 # 加载 .env 中的 GEMINI_API_KEY
@@ -152,7 +154,9 @@ def add_memory(
     try:
         payload_preview = str(messages_or_text)[:200] + "..." if len(str(messages_or_text)) > 200 else str(messages_or_text)
         logger.info(f"[记忆] add_memory 调用: user_id={user_id} metadata={metadata} payload_len={len(str(messages_or_text))} preview={payload_preview}")
-        memory.add(messages_or_text, **add_kwargs)
+        # Mem0 内部自行调用 Gemini（LLM + embedding），网关只能在外层计时
+        with track("memory", "add"):
+            memory.add(messages_or_text, **add_kwargs)
         logger.info(f"[记忆] add_memory 成功: user_id={user_id} metadata={metadata}")
         return True
     except Exception as e:
@@ -179,7 +183,8 @@ def search_memory(
         if metadata_filter:
             kwargs["metadata_filter"] = metadata_filter
         logger.info(f"[记忆] search_memory 调用: user_id={user_id} query_preview={query[:100]}... limit={limit}")
-        result = memory.search(**kwargs)
+        with track("memory", "search"):
+            result = memory.search(**kwargs)
         results = result.get("results", [])
         memories = [r.get("memory", "") for r in results if r.get("memory")]
         logger.info(f"[记忆] search_memory 返回: user_id={user_id} 命中={len(memories)} 条")
@@ -0,0 +1,105 @@
+"""
+转写途中的部分结果落库：Call1 流式生成 / 分片 map 逐片完成时按批写入 analysis_results（is_partial=True），
+详情接口在 summary 等字段就绪前即可返回已转写部分（partial=true，与实时录音的部分转写共用同一行与标记）
+- 按窗口收集（整段 Call1 为单窗口，map-reduce 每个分片一个窗口），写入时合并重叠区并按 VAD 偏移换算回原音频时间
+- 每新增 TRANSCRIPT_PARTIAL_FLUSH_ITEMS 条且距上次写入 ≥ TRANSCRIPT_PARTIAL_FLUSH_SEC 秒时在后台写一次，
+  不阻塞流式解析；同一时刻最多一个写入，写入后发布 transcript 事件（/events 推送）
+- 完整结果落库时（analyze_audio_async）按 is_partial 删除替换；已有完整结果的会话不再写入部分结果
+"""
+import asyncio
+import logging
+import os
+import time
+import uuid
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+TRANSCRIPT_PARTIAL_ENABLED = os.getenv("TRANSCRIPT_PARTIAL_ENABLED", "true").lower() in ("true", "1", "yes")
+TRANSCRIPT_PARTIAL_FLUSH_ITEMS = max(1, int(os.getenv("TRANSCRIPT_PARTIAL_FLUSH_ITEMS", "20")))
+TRANSCRIPT_PARTIAL_FLUSH_SEC = float(os.getenv("TRANSCRIPT_PARTIAL_FLUSH_SEC", "3"))
+
+
+class PartialTranscriptWriter:
+    """一次转写的部分结果写入器；add 由解析循环调用，close 须在完整结果落库前 await"""
+
+    __slots__ = ("session_id", "offset_map", "_windows", "_pending", "_written", "_last_flush", "_task", "_closed")
+
+    def __init__(self, session_id: str, offset_map=None):
+        self.session_id = session_id
+        self.offset_map = offset_map  # utils.vad.OffsetMap：紧凑音频时间 → 原音频时间
+        self._windows: Dict[Any, Tuple[float, float, List[dict]]] = {}
+        self._pending = 0
+        self._written = 0
+        self._last_flush = 0.0
+        self._task: Optional[asyncio.Task] = None
+        self._closed = False
+
+    def add(self, window: Any, start_sec: float, end_sec: float, items: List[dict]) -> None:
+        """登记某窗口新完成的转写条目（时间戳已是紧凑音频的全局时间）；达到批量阈值时后台写入"""
+        if not items or self._closed:
+            return
+        self._windows.setdefault(window, (start_sec, end_sec, []))[2].extend(items)
+        self._pending += len(items)
+        if (self._pending >= TRANSCRIPT_PARTIAL_FLUSH_ITEMS
+                and time.monotonic() - self._last_flush >= TRANSCRIPT_PARTIAL_FLUSH_SEC
+                and (self._task is None or self._task.done())):
+            self._task = asyncio.create_task(self._write())
+
+    def reset(self, window: Any) -> None:
+        """流式中断后整体重启：丢弃该窗口已登记的条目，重新生成的条目从头再登记（下次写入即覆盖旧结果）"""
+        self._windows.pop(window, None)
+
+    async def flush(self) -> None:
+        """立即写入尚未落库的条目（如 map 全部完成、进入 reduce 之前）"""
+        if self._task is not None:
+            await asyncio.gather(self._task, return_exceptions=True)
+        if self._pending and not self._closed:
+            await self._write()
+
+    async def close(self) -> None:
+        """停止写入并等待进行中的写入完成，避免其晚于完整结果落库"""
+        self._closed = True
+        if self._task is not None:
+            await asyncio.gather(self._task, return_exceptions=True)
+
+    def _transcript(self) -> List[dict]:
+        from utils.transcript_time import merge_chunk_transcripts
+        transcript = merge_chunk_transcripts(sorted(self._windows.values(), key=lambda w: w[0]))
+        if self.offset_map is None:
+            return [dict(t) for t in transcript]
+        return [{**t, "timestamp": self.offset_map.remap_timestamp(t.get("timestamp"))} for t in transcript]
+
+    async def _write(self) -> None:
+        from sqlalchemy import select
+        from database.connection import AsyncSessionLocal
+        from database.models import AnalysisResult
+        from main import build_analysis_results
+        from services.progress import publish_event
+        from utils import transcript_codec
+
+        self._last_flush = time.monotonic()
+        self._pending = 0
+        transcript = self._transcript()
+        result, _ = build_analysis_results({"transcript": transcript})
+        try:
+            async with AsyncSessionLocal() as db:
+                q = await db.execute(
+                    select(AnalysisResult).where(AnalysisResult.session_id == uuid.UUID(self.session_id))
+                )
+                ar = q.scalar_one_or_none()
+                if ar is None:
+                    ar = AnalysisResult(session_id=uuid.UUID(self.session_id), is_partial=True)
+                    db.add(ar)
+                elif not ar.is_partial:
+                    self._closed = True  # 完整结果已落库（如并发重跑），不再覆盖
+                    return
+                transcript_codec.store(ar, transcript, [d.dict() for d in result.dialogues])
+                await db.commit()
+        except Exception as e:
+            logger.warning(f"[部分转写-{self.session_id}] 写入失败（不影响转写）: {e}")
+            return
+        if len(transcript) > self._written:
+            logger.info(f"[部分转写-{self.session_id}] 已写入 {len(transcript)} 条")
+        self._written = len(transcript)
+        await publish_event(self.session_id, {"type": "transcript", "count": len(transcript), "partial": True})
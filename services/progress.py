@@ -0,0 +1,210 @@
+"""
+会话进度推送：Postgres LISTEN/NOTIFY 跨 worker 广播 + 进程内订阅
+- sessions 表触发器（migrations/add_session_progress_notify.sql）在 status / analysis_stage /
+  image_status 变化时 pg_notify，所有写入阶段的代码路径（分析、策略、生图、直传、实时录音）无需改动即可推送
+- transition_stage：进度阶段切换的唯一入口，单条 UPDATE（顺带触发 NOTIFY 与上一阶段耗时记录）
+- publish_event：业务代码主动发布的补充事件（如单张场景图完成），独立短事务发送
+- ProgressHub：每进程一条 asyncpg LISTEN 连接，按 session_id 分发到各 SSE 订阅队列
+NOTIFY 载荷上限 8000 字节，事件只带 id / 状态 / URL，详情由订阅端按需回查数据库。
+"""
+import asyncio
+import json
+import logging
+import os
+import uuid
+from contextlib import asynccontextmanager
+from typing import Dict, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+PROGRESS_CHANNEL = "session_progress"  # 与触发器 notify_session_progress 中的通道名一致
+# 单个订阅队列上限；消费过慢时丢弃最旧事件（订阅端会定期回查数据库兜底）
+PROGRESS_QUEUE_MAX = int(os.getenv("PROGRESS_QUEUE_MAX", "100"))
+# LISTEN 连接断开后的重连间隔（秒）
+PROGRESS_RECONNECT_SEC = float(os.getenv("PROGRESS_RECONNECT_SEC", "3"))
+
+
+async def publish_event(session_id: str, event: dict) -> None:
+    """发布一条会话事件（失败只记日志，不影响业务流程）"""
+    from sqlalchemy import text
+    from database.connection import engine
+
+    payload = json.dumps({"session_id": str(session_id), **event}, ensure_ascii=False, default=str)
+    try:
+        async with engine.begin() as conn:
+            await conn.execute(text("SELECT pg_notify(:channel, :payload)"),
+                               {"channel": PROGRESS_CHANNEL, "payload": payload})
+    except Exception as e:
+        logger.warning(f"[进度] 发布事件失败 session_id={session_id}: {e}")
+
+
+class ProgressHub:
+    """进程内唯一的 LISTEN 连接，首次订阅时建立，断开后自动重连"""
+
+    def __init__(self):
+        self._subscribers: Dict[str, Set[asyncio.Queue]] = {}
+        self._conn = None
+        self._lock = asyncio.Lock()
+        self._reconnect_task: Optional[asyncio.Task] = None
+        self._closed = False
+
+    @staticmethod
+    def _dsn() -> str:
+        from database.connection import DATABASE_URL
+        return DATABASE_URL.replace("+asyncpg", "", 1)
+
+    async def _ensure_listening(self) -> None:
+        async with self._lock:
+            if self._closed or (self._conn is not None and not self._conn.is_closed()):
+                return
+            import asyncpg
+            from database.connection import connect_args
+
+            try:
+                conn = await asyncpg.connect(
+                    self._dsn(), ssl=connect_args.get("ssl"),
+                    server_settings={"application_name": "gemini_audio_service_progress"},
+                )
+                conn.add_termination_listener(self._on_terminated)
+                await conn.add_listener(PROGRESS_CHANNEL, self._on_notify)
+                self._conn = conn
+                logger.info(f"[进度] 已监听通道 {PROGRESS_CHANNEL}")
+            except Exception as e:
+                self._conn = None
+                logger.warning(f"[进度] LISTEN 连接失败，订阅端将退化为定期回查: {e}")
+                self._schedule_reconnect()
+
+    def _schedule_reconnect(self) -> None:
+        if self._closed or not self._subscribers:
+            return
+        if self._reconnect_task is None or self._reconnect_task.done():
+            self._reconnect_task = asyncio.create_task(self._reconnect())
+
+    async def _reconnect(self) -> None:
+        await asyncio.sleep(PROGRESS_RECONNECT_SEC)
+        await self._ensure_listening()
+
+    def _on_terminated(self, conn) -> None:
+        logger.warning("[进度] LISTEN 连接已断开，稍后重连")
+        self._conn = None
+        self._schedule_reconnect()
+
+    def _on_notify(self, conn, pid, channel, payload) -> None:
+        try:
+            event = json.loads(payload)
+        except (TypeError, ValueError):
+            return
+        for queue in self._subscribers.get(str(event.get("session_id")), ()):
+            if queue.full():
+                try:
+                    queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    pass
+            queue.put_nowait(event)
+
+    @asynccontextmanager
+    async def subscribe(self, session_id: str):
+        """订阅某会话事件，yield 一个 asyncio.Queue；退出时自动取消订阅"""
+        queue: asyncio.Queue = asyncio.Queue(maxsize=PROGRESS_QUEUE_MAX)
+        self._subscribers.setdefault(str(session_id), set()).add(queue)
+        try:
+            await self._ensure_listening()
+            yield queue
+        finally:
+            subs = self._subscribers.get(str(session_id))
+            if subs is not None:
+                subs.discard(queue)
+                if not subs:
+                    self._subscribers.pop(str(session_id), None)
+
+    async def close(self) -> None:
+        self._closed = True
+        if self._reconnect_task is not None:
+            self._reconnect_task.cancel()
+        conn, self._conn = self._conn, None
+        if conn is not None and not conn.is_closed():
+            try:
+                await conn.close()
+            except Exception as e:
+                logger.warning(f"[进度] 关闭 LISTEN 连接出错: {e}")
+
+
+progress_hub = ProgressHub()
+
+
+_UNSET = object()
+
+_TRANSITION_SQL = """
+    UPDATE sessions s
+    SET analysis_stage = :stage, analysis_stage_detail = :detail, updated_at = clock_timestamp(),
+        analysis_stage_started_at = CASE WHEN prev.analysis_stage IS DISTINCT FROM :stage
+                                         OR prev.analysis_stage_started_at IS NULL
+                                    THEN clock_timestamp() ELSE prev.analysis_stage_started_at END{extra}
+    FROM (SELECT id, analysis_stage, analysis_stage_started_at FROM sessions WHERE id = :id FOR UPDATE) prev
+    WHERE s.id = prev.id{cond}
+    RETURNING prev.analysis_stage AS prev_stage, prev.analysis_stage_started_at AS prev_at, s.updated_at AS now_at,
+              s.analysis_stage_started_at AS stage_started_at
+"""
+
+
+async def transition_stage(
+    db,
+    session_id: str,
+    stage: Optional[str],
+    detail: Optional[dict] = None,
+    *,
+    status: Optional[str] = None,
+    error_message=_UNSET,
+    only_if_status: Optional[str] = None,
+    timing: bool = True,
+    commit: bool = True,
+) -> bool:
+    """
+    进度阶段切换：一条 UPDATE 完成（不再 SELECT → 修改 → commit），返回是否命中行。
+    - 同一语句触发 sessions 进度 NOTIFY（触发器），SSE 订阅端即时收到
+    - 阶段变化时 analysis_stage_started_at 置为当前时间（同阶段仅更新详情时保持不变），/status 据此计算阶段已耗时
+    - timing=True 时由 RETURNING 拿到上一阶段及其开始时间（analysis_stage_started_at，不受无关写入刷新 updated_at 影响），
+      记为 stage:<上一阶段> 耗时（不额外查询）；存量会话无开始时间时不记
+    - only_if_status：仅当前 status 等于该值时更新（如失败兜底只改仍在 analyzing 的会话）
+    - 同一 AsyncSession 中已加载的 Session 对象同步为新值（不标脏），避免后续读到旧阶段
+    """
+    from sqlalchemy import bindparam, text
+    from sqlalchemy.dialects.postgresql import JSONB
+    from sqlalchemy.orm import identity_key
+    from sqlalchemy.orm.attributes import set_committed_value
+    from database.models import Session
+
+    sid = uuid.UUID(str(session_id))
+    params = {"id": sid, "stage": stage, "detail": detail}
+    values = {"analysis_stage": stage, "analysis_stage_detail": detail}
+    extra, cond = "", ""
+    if status is not None:
+        extra += ", status = :status"
+        params["status"] = values["status"] = status
+    if error_message is not _UNSET:
+        extra += ", error_message = :error_message"
+        params["error_message"] = values["error_message"] = error_message
+    if only_if_status is not None:
+        cond = " AND s.status = :only_if_status"
+        params["only_if_status"] = only_if_status
+    stmt = text(_TRANSITION_SQL.format(extra=extra, cond=cond)).bindparams(bindparam("detail", type_=JSONB))
+    row = (await db.execute(stmt, params)).first()
+    if commit:
+        await db.commit()
+    if row is None:
+        return False
+
+    obj = db.identity_map.get(identity_key(Session, sid))
+    if obj is not None:
+        for key, value in values.items():
+            set_committed_value(obj, key, value)
+        set_committed_value(obj, "updated_at", row.now_at)
+        set_committed_value(obj, "analysis_stage_started_at", row.stage_started_at)
+
+    if timing and row.prev_stage and row.prev_stage != stage and row.prev_at is not None:
+        from services import stage_timing
+        stage_timing.record(
+            f"stage:{row.prev_stage}", row.prev_at,
+            (row.stage_started_at - row.prev_at).total_seconds() * 1000, session_id=str(sid),
+        )
+    return True
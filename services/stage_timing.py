@@ -0,0 +1,237 @@
+"""
+流水线分阶段耗时（结构化落库，替代「[分析-{sid}-stepN] ... 耗时」日志行做统计）
+- bind_session：在任务入口绑定 session_id / 文件大小（contextvars，asyncio.to_thread 中同样生效）
+- timed / start+finish：记录一个阶段的开始时间、耗时、重试、模型与结果；阶段内抛异常记为 error
+- 记录先进进程内缓冲，后台每 STAGE_TIMING_FLUSH_SEC 秒批量写入 pipeline_stage_timings，不给流水线增加数据库往返
+- latency_report：按阶段 × 文件大小分桶汇总 p50 / p95 / p99（供管理接口使用）
+"""
+import asyncio
+import logging
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+STAGE_TIMING_ENABLED = os.getenv("STAGE_TIMING_ENABLED", "true").lower() in ("true", "1", "yes")
+STAGE_TIMING_FLUSH_SEC = float(os.getenv("STAGE_TIMING_FLUSH_SEC", "5"))
+STAGE_TIMING_RETENTION_DAYS = int(os.getenv("STAGE_TIMING_RETENTION_DAYS", "30"))
+# 文件大小分桶边界（MB，升序）：默认 0-10 / 10-30 / 30-60 / 60-120 / 120+
+STAGE_TIMING_SIZE_BUCKETS_MB = [
+    int(x) for x in os.getenv("STAGE_TIMING_SIZE_BUCKETS_MB", "10,30,60,120").split(",") if x.strip()
+]
+
+# 缓冲上限：数据库不可用时丢弃最旧记录，避免内存无限增长
+_BUFFER_MAX = 5000
+_PURGE_INTERVAL_SEC = 3600
+
+_ctx_var: ContextVar[Optional[Dict[str, Any]]] = ContextVar("stage_timing_ctx", default=None)
+_buffer: List[Dict[str, Any]] = []
+_buffer_lock = threading.Lock()
+_flusher_task: Optional[asyncio.Task] = None
+_last_purge = 0.0
+
+
+def bind_session(session_id: Optional[str], file_size: Optional[int] = None) -> None:
+    """
+    在任务入口绑定 session_id / 文件大小，之后同一任务（及其派生的 task / to_thread）内的 timed 自动带上。
+    流水线各入口均运行在独立 asyncio 任务中（队列 worker / create_task / 请求），上下文互不影响。
+    """
+    _ctx_var.set({"session_id": session_id, "file_size": file_size})
+
+
+class StageTimer:
+    """一个阶段的可写记录：阶段内可补充 retries / model / chunk_count / outcome，finish 时入缓冲"""
+    __slots__ = ("stage", "session_id", "file_size", "chunk_count", "retries", "model", "outcome",
+                 "started_at", "_t0", "_done")
+
+    def __init__(self, stage: str, session_id: Optional[str], file_size: Optional[int]):
+        self.stage = stage
+        self.session_id = session_id
+        self.file_size = file_size
+        self.chunk_count: Optional[int] = None
+        self.retries = 0
+        self.model: Optional[str] = None
+        self.outcome = "ok"
+        self.started_at = datetime.now(timezone.utc)
+        self._t0 = time.monotonic()
+        self._done = False
+
+    def finish(self, outcome: Optional[str] = None) -> None:
+        """结束计时并记录（重复调用只记第一次）"""
+        if self._done:
+            return
+        self._done = True
+        if outcome:
+            self.outcome = outcome
+        _record(self, (time.monotonic() - self._t0) * 1000)
+
+
+def start(stage: str, session_id: Optional[str] = None, file_size: Optional[int] = None, **attrs) -> StageTimer:
+    """开始一个阶段（跨多段代码时使用，结束时调用 finish）；未显式传入的 session_id / file_size 取自 bind_session"""
+    ctx = _ctx_var.get() or {}
+    timer = StageTimer(
+        stage,
+        session_id or ctx.get("session_id"),
+        file_size if file_size is not None else ctx.get("file_size"),
+    )
+    for k, v in attrs.items():
+        setattr(timer, k, v)
+    return timer
+
+
+@contextmanager
+def timed(stage: str, session_id: Optional[str] = None, file_size: Optional[int] = None, **attrs):
+    """记录一个阶段：with timed("generate", model=...) as t: ...; t.retries = resp.retries（异常记为 error 并原样抛出）"""
+    timer = start(stage, session_id, file_size, **attrs)
+    try:
+        yield timer
+    except BaseException:
+        timer.outcome = "error"
+        raise
+    finally:
+        timer.finish()
+
+
+def record(stage: str, started_at: datetime, duration_ms: float, session_id: Optional[str] = None,
+           outcome: str = "ok") -> None:
+    """记录一个已知起止时间的阶段（如进度阶段切换时由上一阶段的开始时间推得）"""
+    timer = start(stage, session_id)
+    timer.started_at = started_at
+    timer.outcome = outcome
+    timer._done = True
+    _record(timer, duration_ms)
+
+
+def _record(timer: StageTimer, duration_ms: float) -> None:
+    if not STAGE_TIMING_ENABLED:
+        return
+    try:
+        sid = uuid.UUID(str(timer.session_id)) if timer.session_id else None
+    except ValueError:
+        sid = None
+    row = {
+        "session_id": sid,
+        "stage": timer.stage[:64],
+        "started_at": timer.started_at,
+        "duration_ms": int(duration_ms),
+        "file_size": timer.file_size,
+        "chunk_count": timer.chunk_count,
+        "retries": int(timer.retries or 0),
+        "model": (timer.model or None) and str(timer.model)[:100],
+        "outcome": timer.outcome,
+    }
+    with _buffer_lock:
+        _buffer.append(row)
+        if len(_buffer) > _BUFFER_MAX:
+            del _buffer[: len(_buffer) - _BUFFER_MAX]
+    _ensure_flusher()
+
+
+def _ensure_flusher() -> None:
+    global _flusher_task
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        return  # 线程内记录：由事件循环侧下一次记录启动后台写入
+    if _flusher_task is None or _flusher_task.done():
+        _flusher_task = loop.create_task(_flush_loop())
+
+
+async def _flush_loop() -> None:
+    while True:
+        await asyncio.sleep(STAGE_TIMING_FLUSH_SEC)
+        await flush()
+
+
+async def flush() -> int:
+    """把缓冲区写入数据库，返回写入行数（失败时放回缓冲区等待下次）"""
+    global _last_purge
+    from sqlalchemy import delete, insert
+    from database.connection import AsyncSessionLocal
+    from database.models import PipelineStageTiming
+
+    with _buffer_lock:
+        rows = _buffer[:]
+        _buffer.clear()
+    try:
+        async with AsyncSessionLocal() as db:
+            if rows:
+                await db.execute(insert(PipelineStageTiming), rows)
+            if time.monotonic() - _last_purge > _PURGE_INTERVAL_SEC:
+                _last_purge = time.monotonic()
+                cutoff = datetime.now(timezone.utc) - timedelta(days=STAGE_TIMING_RETENTION_DAYS)
+                await db.execute(delete(PipelineStageTiming).where(PipelineStageTiming.started_at < cutoff))
+            await db.commit()
+    except Exception as e:
+        logger.warning(f"[耗时] 写入 pipeline_stage_timings 失败，{len(rows)} 条待重试: {e}")
+        with _buffer_lock:
+            _buffer[:0] = rows
+        return 0
+    return len(rows)
+
+
+async def shutdown() -> None:
+    """进程退出前停止后台写入并落库剩余记录"""
+    if _flusher_task is not None:
+        _flusher_task.cancel()
+    await flush()
+
+
+def _size_bucket_sql() -> str:
+    edges = sorted(STAGE_TIMING_SIZE_BUCKETS_MB)
+    cases = ["WHEN file_size IS NULL THEN 'unknown'"]
+    low = 0
+    for mb in edges:
+        cases.append(f"WHEN file_size < {mb * 1024 * 1024} THEN '{low}-{mb}MB'")
+        low = mb
+    return f"CASE {' '.join(cases)} ELSE '{low}MB+' END"
+
+
+async def latency_report(db, days: int = 7, stage: Optional[str] = None) -> List[Dict[str, Any]]:
+    """按阶段（size_bucket='all'）及阶段 × 文件大小分桶汇总耗时分位、错误数与平均重试"""
+    from sqlalchemy import text
+
+    where = "started_at >= :since"
+    params: Dict[str, Any] = {"since": datetime.now(timezone.utc) - timedelta(days=days)}
+    if stage:
+        where += " AND stage = :stage"
+        params["stage"] = stage
+    sql = f"""
+        SELECT stage,
+               COALESCE(size_bucket, 'all') AS size_bucket,
+               count(*) AS samples,
+               count(*) FILTER (WHERE outcome <> 'ok') AS errors,
+               percentile_cont(0.50) WITHIN GROUP (ORDER BY duration_ms) AS p50_ms,
+               percentile_cont(0.95) WITHIN GROUP (ORDER BY duration_ms) AS p95_ms,
+               percentile_cont(0.99) WITHIN GROUP (ORDER BY duration_ms) AS p99_ms,
+               max(duration_ms) AS max_ms,
+               avg(retries) AS avg_retries
+        FROM (
+            SELECT stage, duration_ms, retries, outcome, file_size, {_size_bucket_sql()} AS size_bucket
+            FROM pipeline_stage_timings
+            WHERE {where}
+        ) t
+        GROUP BY GROUPING SETS ((stage), (stage, size_bucket))
+        ORDER BY stage, GROUPING(size_bucket) DESC, min(file_size)
+    """
+    result = await db.execute(text(sql), params)
+    return [
+        {
+            "stage": r.stage,
+            "size_bucket": r.size_bucket,
+            "count": r.samples,
+            "errors": r.errors,
+            "p50_ms": round(r.p50_ms, 1) if r.p50_ms is not None else None,
+            "p95_ms": round(r.p95_ms, 1) if r.p95_ms is not None else None,
+            "p99_ms": round(r.p99_ms, 1) if r.p99_ms is not None else None,
+            "max_ms": r.max_ms,
+            "avg_retries": round(float(r.avg_retries), 2) if r.avg_retries is not None else None,
+        }
+        for r in result
+    ]
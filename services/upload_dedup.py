@@ -0,0 +1,114 @@
+"""
+上传去重
+- Idempotency-Key：客户端超时重试携带同一键时直接返回首次创建的 session（键存 PG，多 worker 共享，短期有效）
+- 内容哈希：同一用户在窗口期内重复上传相同音频，返回已有 session；
+  超出窗口的相同音频新建 session，但复用已存的 AnalysisResult（Call1 部分），不再调用 Gemini 转写
+"""
+import logging
+import os
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from sqlalchemy import or_, select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database.models import AnalysisResult, Session
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_DEDUP_WINDOW_SEC = int(os.getenv("UPLOAD_DEDUP_WINDOW_SEC", "600"))
+UPLOAD_IDEMPOTENCY_TTL_SEC = int(os.getenv("UPLOAD_IDEMPOTENCY_TTL_SEC", "86400"))
+UPLOAD_REUSE_ANALYSIS = os.getenv("UPLOAD_REUSE_ANALYSIS", "true").lower() == "true"
+
+
+async def find_idempotent_session(db: AsyncSession, user_id: str, idem_key: str) -> Optional[Session]:
+    """未过期的幂等键对应的 session"""
+    row = await db.execute(
+        text(
+            "SELECT session_id FROM upload_idempotency_keys "
+            "WHERE user_id = :uid AND idem_key = :k AND expires_at > now()"
+        ),
+        {"uid": uuid.UUID(user_id), "k": idem_key},
+    )
+    sid = row.scalar_one_or_none()
+    if sid is None:
+        return None
+    return await db.get(Session, sid)
+
+
+async def claim_idempotency_key(
+    db: AsyncSession, user_id: str, idem_key: str, session_id: str, audio_sha256: Optional[str]
+) -> Optional[uuid.UUID]:
+    """
+    在当前事务中登记幂等键（session 需已 flush）。
+    键不存在或已过期则归当前 session，返回 None；并发请求已占用且未过期时返回其 session_id。
+    """
+    expires_at = datetime.now(timezone.utc) + timedelta(seconds=UPLOAD_IDEMPOTENCY_TTL_SEC)
+    row = await db.execute(
+        text(
+            "INSERT INTO upload_idempotency_keys (user_id, idem_key, session_id, audio_sha256, expires_at) "
+            "VALUES (:uid, :k, :sid, :sha, :exp) "
+            "ON CONFLICT (user_id, idem_key) DO UPDATE SET "
+            "session_id = EXCLUDED.session_id, audio_sha256 = EXCLUDED.audio_sha256, "
+            "created_at = now(), expires_at = EXCLUDED.expires_at "
+            "WHERE upload_idempotency_keys.expires_at <= now() "
+            "RETURNING session_id"
+        ),
+        {"uid": uuid.UUID(user_id), "k": idem_key, "sid": uuid.UUID(session_id), "sha": audio_sha256, "exp": expires_at},
+    )
+    if row.scalar_one_or_none() is not None:
+        return None
+    owner = await db.execute(
+        text("SELECT session_id FROM upload_idempotency_keys WHERE user_id = :uid AND idem_key = :k"),
+        {"uid": uuid.UUID(user_id), "k": idem_key},
+    )
+    return owner.scalar_one_or_none()
+
+
+async def purge_expired_keys(db: AsyncSession, user_id: str) -> None:
+    """顺带清理该用户已过期的幂等键（走主键前缀 + expires_at，开销很小）"""
+    await db.execute(
+        text("DELETE FROM upload_idempotency_keys WHERE user_id = :uid AND expires_at <= now()"),
+        {"uid": uuid.UUID(user_id)},
+    )
+
+
+async def find_recent_duplicate(db: AsyncSession, user_id: str, audio_sha256: str) -> Optional[Session]:
+    """窗口期内同一用户、相同内容且未失败的 session"""
+    since = datetime.now(timezone.utc) - timedelta(seconds=UPLOAD_DEDUP_WINDOW_SEC)
+    q = await db.execute(
+        select(Session)
+        .where(
+            Session.user_id == uuid.UUID(user_id),
+            Session.audio_sha256 == audio_sha256,
+            Session.created_at >= since,
+            Session.status != "failed",
+        )
+        .order_by(Session.created_at.desc())
+        .limit(1)
+    )
+    return q.scalar_one_or_none()
+
+
+async def find_reusable_analysis(db: AsyncSession, session_id: str) -> Optional[AnalysisResult]:
+    """该 session 的音频此前已分析过（同一用户、相同哈希、有转写）时返回那次的 AnalysisResult"""
+    if not UPLOAD_REUSE_ANALYSIS:
+        return None
+    sess = await db.get(Session, uuid.UUID(session_id))
+    if sess is None or not sess.audio_sha256:
+        return None
+    q = await db.execute(
+        select(AnalysisResult)
+        .join(Session, Session.id == AnalysisResult.session_id)
+        .where(
+            Session.user_id == sess.user_id,
+            Session.audio_sha256 == sess.audio_sha256,
+            Session.id != sess.id,
+            or_(AnalysisResult.transcript.isnot(None), AnalysisResult.transcript_blob.isnot(None)),
+            AnalysisResult.is_partial.is_(False),
+        )
+        .order_by(AnalysisResult.created_at.desc())
+        .limit(1)
+    )
+    return q.scalar_one_or_none()
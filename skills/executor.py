@@ -8,9 +8,11 @@ import re
 import time
 import logging
 from typing import Dict, List, Optional
-import google.generativeai as genai
+
+from services.gemini_gateway import get_model
 
 from .loader import load_knowledge_base
+from schemas.gemini_schemas import json_config
 from schemas.strategy_schemas import parse_gemini_response, VisualData, StrategyItem, Call2Response
 
 logger = logging.getLogger(__name__)
@@ -65,7 +67,7 @@ async def _execute_emotion_skill(
 ) -> Dict:
     """执行情绪识别技能：提取用户话术，规则统计+LLM判断状态"""
     if model is None:
-        model = genai.GenerativeModel(GEMINI_FLASH_MODEL)
+        model = get_model(GEMINI_FLASH_MODEL)
     skill_id = skill.get("skill_id", "emotion_recognition")
     skill_name = skill.get("name", "情绪识别")
     prompt_template = skill.get("prompt_template", "")
@@ -95,7 +97,7 @@ async def _execute_emotion_skill(
             prompt = prompt.replace("{session_id}", context.get("session_id", ""))
             prompt = prompt.replace("{user_id}", context.get("user_id", ""))
             prompt = prompt.replace("{memory_context}", context.get("memory_context", ""))
-            response = model.generate_content(prompt)
+            response = await model.generate_content_async(prompt, purpose=f"skill:{skill_id}", generation_config=json_config())
             try:
                 data = parse_gemini_response(response.text)
                 if isinstance(data, dict):
@@ -148,7 +150,7 @@ async def _execute_depression_skill(
 ) -> Dict:
     """执行防抑郁监控技能：解析 LLM 返回的 JSON，输出 mental_health_insight"""
     if model is None:
-        model = genai.GenerativeModel(GEMINI_FLASH_MODEL)
+        model = get_model(GEMINI_FLASH_MODEL)
     skill_id = skill.get("skill_id", "depression_prevention")
     skill_name = skill.get("name", "防抑郁监控")
     prompt_template = skill.get("prompt_template", "")
@@ -183,7 +185,7 @@ async def _execute_depression_skill(
         prompt = prompt.replace("{session_id}", context.get("session_id", ""))
         prompt = prompt.replace("{user_id}", context.get("user_id", ""))
         prompt = prompt.replace("{memory_context}", context.get("memory_context", ""))
-        response = model.generate_content(prompt)
+        response = await model.generate_content_async(prompt, purpose=f"skill:{skill_id}", generation_config=json_config())
 
         # 3. 解析 JSON 响应
         data = parse_gemini_response(response.text)
@@ -259,7 +261,7 @@ async def execute_skill(
         return await _execute_depression_skill(skill, transcript, context, model)
     
     if model is None:
-        model = genai.GenerativeModel(GEMINI_FLASH_MODEL)
+        model = get_model(GEMINI_FLASH_MODEL)
     
     prompt_template = skill.get("prompt_template", "")
     
@@ -312,7 +314,7 @@ async def execute_skill(
         
         # 4. 调用 Gemini 生成策略
         logger.info(f"调用模型: {GEMINI_FLASH_MODEL}")
-        response = model.generate_content(prompt)
+        response = await model.generate_content_async(prompt, purpose=f"skill:{skill_id}", generation_config=json_config())
         
         logger.info(f"Gemini 响应长度: {len(response.text)} 字符")
         logger.debug(f"Gemini 响应内容: {response.text[:1000]}...")
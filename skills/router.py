@@ -7,6 +7,7 @@
 """
 import os
 import json
+import asyncio
 import copy
 import logging
 import uuid as _uuid_module
@@ -14,9 +15,11 @@ from typing import List, Dict, Optional, Tuple
 
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
-import google.generativeai as genai
 
 from database.models import UserSkillPreference, CustomSkill
+from services.gemini_gateway import get_model
+from schemas.gemini_schemas import classify_schema, json_config
+from utils.json_stream import loads_tolerant
 from .ios_skill_registry import (
     SYSTEM_SKILLS,
     CATEGORY_SCENE_DESCRIPTIONS,
@@ -237,7 +240,7 @@ def classify_and_score(
         }
     """
     if model is None:
-        model = genai.GenerativeModel(GEMINI_FLASH_MODEL)
+        model = get_model(GEMINI_FLASH_MODEL)
 
     # 构建技能描述列表（给 LLM 看的）
     skill_desc_lines = []
@@ -334,30 +337,19 @@ Conversation transcript:
 
     try:
         logger.info("[场景分类+打分] 开始 LLM 调用")
-        response = model.generate_content(prompt)
+        response = model.generate_content(
+            prompt, purpose="classify",
+            generation_config=json_config(classify_schema(_IOS_CATEGORIES, selected_skill_ids)),
+        )
         raw = response.text.strip()
         logger.info(f"[场景分类+打分] 响应长度={len(raw)}")
 
-        import re
-        parsed = None
         try:
-            parsed = json.loads(raw)
-        except json.JSONDecodeError:
-            m = re.search(r'```(?:json)?\s*\n?(.*?)\n?```', raw, re.DOTALL)
-            if m:
-                try:
-                    parsed = json.loads(m.group(1).strip())
-                except json.JSONDecodeError:
-                    pass
-        if parsed is None:
-            m2 = re.search(r'\{.*\}', raw, re.DOTALL)
-            if m2:
-                try:
-                    parsed = json.loads(m2.group(0))
-                except json.JSONDecodeError:
-                    pass
-
-        if not parsed:
+            parsed = loads_tolerant(raw, dict)
+        except ValueError:
+            parsed = None
+
+        if not parsed or not isinstance(parsed, dict):
             raise ValueError(f"无法解析 JSON: {raw[:200]}")
 
         primary = parsed.get("primary_category", "work_life")
@@ -453,7 +445,8 @@ async def match_skills_v2(
         f"[技能匹配] 自动模式：场景分类 + 打分，selected={len(selected_ids)}，"
         f"forced_cat={forced_cat}（档案/关键词）"
     )
-    scene_result = classify_and_score(transcript, selected_ids, model=model)
+    # 同步 LLM 调用放到线程中，避免阻塞事件循环
+    scene_result = await asyncio.to_thread(classify_and_score, transcript, selected_ids, model)
 
     primary_cat = forced_cat or scene_result["primary_category"]
     scores      = scene_result["skill_scores"]
@@ -665,7 +658,7 @@ def classify_scene(transcript: list, model=None) -> dict:
     """旧接口兼容层：只做场景分类，不打分"""
     # 无需打分时直接走 LLM 分类
     if model is None:
-        model = genai.GenerativeModel(GEMINI_FLASH_MODEL)
+        model = get_model(GEMINI_FLASH_MODEL)
     result = classify_and_score(transcript, [], model=model)
     return {
         "primary_scene": result["primary_category"],
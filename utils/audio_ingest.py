@@ -0,0 +1,108 @@
+"""
+上传音频落盘：异步写入 + 内容寻址存储，后续持久化只建硬链接不再复制。
+- ingest_upload：aiofiles 分块写入 AUDIO_BLOB_DIR/.incoming/*.part，同时计算 SHA-256，
+  写完 rename 到 AUDIO_BLOB_DIR/<sha 前两位>/<sha><ext>（同内容已存在则丢弃新写入）
+- link_into：从 blob 硬链接出队列输入文件 / 会话原音频（跨文件系统时回退为复制）
+- sweep_orphan_blobs：清理只剩 blob 自身一个链接（已无任何会话 / 队列文件引用）的 blob 与残留 .part
+UPLOAD_SPOOL_DIR、AUDIO_STORAGE_DIR 应与 AUDIO_BLOB_DIR 位于同一文件系统，否则硬链接会回退为复制。
+"""
+import hashlib
+import logging
+import os
+import shutil
+import time
+import uuid
+from typing import Tuple
+
+logger = logging.getLogger(__name__)
+
+AUDIO_BLOB_DIR = os.getenv("AUDIO_BLOB_DIR", "data/audio/blobs")
+# 孤儿 blob / 残留 .part 超过该时长（秒）才清理，避免与正在进行的上传竞争
+AUDIO_BLOB_ORPHAN_GRACE_SEC = int(os.getenv("AUDIO_BLOB_ORPHAN_GRACE_SEC", "3600"))
+
+_INGEST_CHUNK = 1024 * 1024  # 1 MB
+_INCOMING = ".incoming"
+
+
+def blob_path(sha256: str, ext: str) -> str:
+    return os.path.join(AUDIO_BLOB_DIR, sha256[:2], f"{sha256}{ext}")
+
+
+async def ingest_upload(upload, file_ext: str) -> Tuple[str, int, str]:
+    """
+    流式写入上传文件（aiofiles，不阻塞事件循环），返回 (blob 路径, 字节数, sha256)。
+    blob 为只读共享文件：调用方不得修改或删除，按需 link_into 出自己的路径。
+    """
+    import aiofiles
+
+    incoming_dir = os.path.join(AUDIO_BLOB_DIR, _INCOMING)
+    os.makedirs(incoming_dir, exist_ok=True)
+    part_path = os.path.join(incoming_dir, f"{uuid.uuid4().hex}.part")
+    hasher = hashlib.sha256()
+    size = 0
+    try:
+        async with aiofiles.open(part_path, "wb") as out:
+            while True:
+                chunk = await upload.read(_INGEST_CHUNK)
+                if not chunk:
+                    break
+                await out.write(chunk)
+                hasher.update(chunk)
+                size += len(chunk)
+        sha256 = hasher.hexdigest()
+        dest = blob_path(sha256, file_ext)
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        if os.path.exists(dest):
+            # 相同内容已存在：丢弃本次写入，刷新 mtime 防止被孤儿清理误删
+            os.unlink(part_path)
+            os.utime(dest)
+        else:
+            os.replace(part_path, dest)
+    except BaseException:
+        try:
+            os.unlink(part_path)
+        except OSError:
+            pass
+        raise
+    return dest, size, sha256
+
+
+def link_file(src: str, dest: str) -> str:
+    """dest 指向与 src 相同的内容：优先硬链接（零复制），跨文件系统 / 不支持时复制"""
+    if os.path.exists(dest):
+        os.unlink(dest)
+    try:
+        os.link(src, dest)
+    except OSError as e:
+        logger.info(f"[落盘] 硬链接失败，回退复制 {src} -> {dest}: {e}")
+        shutil.copyfile(src, dest)
+    return dest
+
+
+def link_into(src: str, directory: str, ext: str) -> str:
+    """在 directory 下新建一个指向 src 内容的唯一文件名，返回其路径"""
+    os.makedirs(directory, exist_ok=True)
+    return link_file(src, os.path.join(directory, f"{uuid.uuid4().hex}{ext}"))
+
+
+def sweep_orphan_blobs() -> int:
+    """删除已无引用（st_nlink == 1）且超过宽限期的 blob 及残留 .part，返回删除数"""
+    if not os.path.isdir(AUDIO_BLOB_DIR):
+        return 0
+    cutoff = time.time() - AUDIO_BLOB_ORPHAN_GRACE_SEC
+    removed = 0
+    for root, _dirs, files in os.walk(AUDIO_BLOB_DIR):
+        is_incoming = os.path.basename(root) == _INCOMING
+        for name in files:
+            path = os.path.join(root, name)
+            try:
+                st = os.stat(path)
+                if st.st_mtime > cutoff or (not is_incoming and st.st_nlink > 1):
+                    continue
+                os.unlink(path)
+                removed += 1
+            except OSError:
+                continue
+    if removed:
+        logger.info(f"[落盘] 已清理孤儿 blob / 残留分片 {removed} 个")
+    return removed
@@ -0,0 +1,112 @@
+"""
+上传前音频规整：降为单声道 16kHz 低码率 Opus / AAC 后再送 Gemini。
+语音分析不需要立体声 / 高码率，体积变小可缩短经代理上传的时间，也更少触发 18MB 分片。
+原音频仍由 persist_original_audio 保留用于回放与剪切，这里只产出送模型用的临时文件。
+ffmpeg 以异步子进程运行、stdout 流式落盘（内存恒定），并发由信号量限制。
+"""
+import asyncio
+import logging
+import os
+import tempfile
+import time
+from typing import Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+AUDIO_NORMALIZE_ENABLED = os.getenv("AUDIO_NORMALIZE_ENABLED", "false").lower() == "true"
+# opus（ogg 容器，默认）或 aac（ADTS）
+AUDIO_NORMALIZE_CODEC = os.getenv("AUDIO_NORMALIZE_CODEC", "opus").lower()
+AUDIO_NORMALIZE_BITRATE = os.getenv("AUDIO_NORMALIZE_BITRATE", "24k")
+AUDIO_NORMALIZE_SAMPLE_RATE = int(os.getenv("AUDIO_NORMALIZE_SAMPLE_RATE", "16000"))
+# 小于该大小（MB）的文件不处理：收益小于一次 ffmpeg 启动
+AUDIO_NORMALIZE_MIN_MB = float(os.getenv("AUDIO_NORMALIZE_MIN_MB", "1"))
+AUDIO_NORMALIZE_CONCURRENCY = max(1, int(os.getenv("AUDIO_NORMALIZE_CONCURRENCY", "2")))
+AUDIO_NORMALIZE_TIMEOUT = int(os.getenv("AUDIO_NORMALIZE_TIMEOUT", "600"))
+
+_CODECS = {
+    "opus": (["-c:a", "libopus", "-application", "voip", "-f", "ogg"], ".ogg"),
+    "aac": (["-c:a", "aac", "-f", "adts"], ".aac"),
+}
+_PIPE_READ = 256 * 1024
+
+_sem: Optional[asyncio.Semaphore] = None
+
+
+def _semaphore() -> asyncio.Semaphore:
+    global _sem
+    if _sem is None:
+        _sem = asyncio.Semaphore(AUDIO_NORMALIZE_CONCURRENCY)
+    return _sem
+
+
+async def _transcode(src: str, dst: str, codec_args: list) -> None:
+    proc = await asyncio.create_subprocess_exec(
+        "ffmpeg", "-hide_banner", "-nostats", "-loglevel", "error", "-nostdin",
+        "-i", src, "-vn", "-ac", "1", "-ar", str(AUDIO_NORMALIZE_SAMPLE_RATE),
+        "-b:a", AUDIO_NORMALIZE_BITRATE, *codec_args, "pipe:1",
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+    )
+
+    async def _drain_stdout():
+        with open(dst, "wb") as out:
+            while True:
+                data = await proc.stdout.read(_PIPE_READ)
+                if not data:
+                    break
+                await asyncio.to_thread(out.write, data)
+
+    try:
+        _, stderr, _ = await asyncio.wait_for(
+            asyncio.gather(_drain_stdout(), proc.stderr.read(), proc.wait()),
+            timeout=AUDIO_NORMALIZE_TIMEOUT,
+        )
+    except BaseException:
+        if proc.returncode is None:
+            proc.kill()
+            await proc.wait()
+        raise
+    if proc.returncode != 0:
+        raise RuntimeError(f"ffmpeg 转码失败 (code={proc.returncode}): {stderr.decode('utf-8', errors='replace')[-300:]}")
+
+
+async def normalize_for_gemini(src_path: str, file_filename: str, session_id: str = "?") -> Tuple[str, str, bool]:
+    """
+    将音频规整为单声道低码率文件供 Gemini 使用。
+    未启用、文件过小、转码失败或结果不比原文件小时原样返回。
+    Returns:
+        (path, filename, is_temp)：is_temp 为 True 时调用方需在用完后删除 path
+    """
+    if not AUDIO_NORMALIZE_ENABLED:
+        return src_path, file_filename, False
+    src_size = os.path.getsize(src_path)
+    if src_size < AUDIO_NORMALIZE_MIN_MB * 1024 * 1024:
+        return src_path, file_filename, False
+    codec_args, ext = _CODECS.get(AUDIO_NORMALIZE_CODEC, _CODECS["opus"])
+
+    tmp = tempfile.NamedTemporaryFile(delete=False, suffix=ext, prefix=f"norm_{session_id[:8]}_")
+    tmp.close()
+    t0 = time.time()
+    try:
+        async with _semaphore():
+            wait_sec = time.time() - t0
+            await _transcode(src_path, tmp.name, codec_args)
+    except Exception as e:
+        logger.warning(f"[规整-{session_id}] 转码失败，使用原文件: {e}")
+        os.unlink(tmp.name)
+        return src_path, file_filename, False
+
+    dst_size = os.path.getsize(tmp.name)
+    elapsed = time.time() - t0
+    if dst_size == 0 or dst_size >= src_size:
+        logger.info(f"[规整-{session_id}] 结果未变小（{src_size} → {dst_size} 字节），使用原文件，耗时 {elapsed:.2f}s")
+        os.unlink(tmp.name)
+        return src_path, file_filename, False
+    saved = src_size - dst_size
+    logger.info(
+        f"[规整-{session_id}] {AUDIO_NORMALIZE_CODEC} mono {AUDIO_NORMALIZE_SAMPLE_RATE}Hz {AUDIO_NORMALIZE_BITRATE}: "
+        f"{src_size / 1024 / 1024:.2f} MB → {dst_size / 1024 / 1024:.2f} MB，节省 {saved} 字节"
+        f"（{saved * 100 / src_size:.0f}%），耗时 {elapsed:.2f}s（排队 {wait_sec:.2f}s）"
+    )
+    name = os.path.splitext(file_filename or "audio")[0] + ext
+    return tmp.name, name, True
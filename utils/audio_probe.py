@@ -0,0 +1,313 @@
+"""
+纯 Python 音频容器头解析：直接从文件头读取时长、采样率、声道数与编码，无需启动 ffprobe。
+支持上传允许的格式：m4a/mp4（mvhd / mdhd / stsd）、WAV（RIFF fmt / data）、
+MP3（Xing / Info / VBRI 头，缺失时按帧扫描）、AAC ADTS。无法识别的容器返回 None，由调用方回退 ffprobe。
+"""
+import logging
+import mmap
+import os
+import struct
+from typing import Any, BinaryIO, Dict, Iterator, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+def _info(container: str, codec: Optional[str], duration: float, sample_rate: Optional[int],
+          channels: Optional[int]) -> Dict[str, Any]:
+    return {
+        "container": container,
+        "codec": codec,
+        "duration_sec": duration,
+        "sample_rate": sample_rate,
+        "channels": channels,
+    }
+
+
+# ==================== MP4 / M4A ====================
+
+_MP4_CONTAINERS = {b"moov", b"trak", b"mdia", b"minf", b"stbl"}
+
+
+def _iter_boxes(f: BinaryIO, start: int, end: int) -> Iterator[Tuple[bytes, int, int]]:
+    """遍历 [start, end) 内的 box，产出 (type, payload_offset, payload_size)；只 seek 不读 mdat"""
+    pos = start
+    while pos + 8 <= end:
+        f.seek(pos)
+        header = f.read(8)
+        if len(header) < 8:
+            return
+        size, box_type = struct.unpack(">I4s", header)
+        header_len = 8
+        if size == 1:
+            size = struct.unpack(">Q", f.read(8))[0]
+            header_len = 16
+        elif size == 0:
+            size = end - pos
+        if size < header_len:
+            return
+        yield box_type, pos + header_len, size - header_len
+        pos += size
+
+
+def _read_time_header(f: BinaryIO, offset: int) -> Tuple[int, int]:
+    """mvhd / mdhd：返回 (timescale, duration)"""
+    f.seek(offset)
+    version = f.read(1)[0]
+    if version == 1:
+        f.seek(offset + 4 + 16)
+        timescale, duration = struct.unpack(">IQ", f.read(12))
+    else:
+        f.seek(offset + 4 + 8)
+        timescale, duration = struct.unpack(">II", f.read(8))
+    return timescale, duration
+
+
+def _read_audio_sample_entry(f: BinaryIO, offset: int) -> Tuple[Optional[str], Optional[int], Optional[int]]:
+    """stsd 第一个 sample entry：返回 (codec, channels, sample_rate)"""
+    f.seek(offset + 8)  # version/flags + entry_count
+    entry = f.read(36)
+    if len(entry) < 36:
+        return None, None, None
+    codec = entry[4:8].decode("latin-1").strip()
+    channels, _sample_size = struct.unpack(">HH", entry[24:28])
+    sample_rate = struct.unpack(">I", entry[32:36])[0] >> 16
+    return {"mp4a": "aac"}.get(codec, codec), channels or None, sample_rate or None
+
+
+def _probe_mp4(f: BinaryIO, size: int) -> Optional[Dict[str, Any]]:
+    f.seek(4)
+    if f.read(4) != b"ftyp":
+        return None
+    movie_duration = None
+    track = None
+
+    def walk(start: int, end: int, ctx: Dict[str, Any]) -> None:
+        nonlocal movie_duration, track
+        for box_type, off, length in _iter_boxes(f, start, end):
+            if box_type == b"mvhd":
+                ts, dur = _read_time_header(f, off)
+                movie_duration = dur / ts if ts else None
+            elif box_type == b"trak":
+                t: Dict[str, Any] = {}
+                walk(off, off + length, t)
+                if t.get("handler") == b"soun" and track is None:
+                    track = t
+            elif box_type == b"mdhd":
+                ts, dur = _read_time_header(f, off)
+                ctx["duration"] = dur / ts if ts else None
+            elif box_type == b"hdlr":
+                f.seek(off + 8)
+                ctx["handler"] = f.read(4)
+            elif box_type == b"stsd":
+                ctx["codec"], ctx["channels"], ctx["sample_rate"] = _read_audio_sample_entry(f, off)
+            elif box_type in _MP4_CONTAINERS:
+                walk(off, off + length, ctx)
+
+    walk(0, size, {})
+    if track is None and movie_duration is None:
+        return None
+    track = track or {}
+    duration = track.get("duration") or movie_duration
+    if not duration:
+        return None
+    return _info("mp4", track.get("codec"), duration, track.get("sample_rate"), track.get("channels"))
+
+
+# ==================== WAV ====================
+
+_WAV_CODECS = {1: "pcm_s", 3: "pcm_f", 6: "pcm_alaw", 7: "pcm_mulaw", 0xFFFE: "pcm_s"}
+
+
+def _probe_wav(f: BinaryIO, size: int) -> Optional[Dict[str, Any]]:
+    f.seek(0)
+    header = f.read(12)
+    if len(header) < 12 or header[:4] not in (b"RIFF", b"RF64") or header[8:12] != b"WAVE":
+        return None
+    fmt = None
+    pos = 12
+    while pos + 8 <= size:
+        f.seek(pos)
+        chunk_id, chunk_size = struct.unpack("<4sI", f.read(8))
+        if chunk_id == b"fmt ":
+            fmt = struct.unpack("<HHIIHH", f.read(16))
+        elif chunk_id == b"data":
+            if fmt is None:
+                return None
+            audio_format, channels, sample_rate, byte_rate, _align, bits = fmt
+            # 流式写入的 wav data 大小可能为 0 / 0xFFFFFFFF，按文件剩余长度计算
+            data_size = chunk_size if 0 < chunk_size < 0xFFFFFFFF else size - pos - 8
+            data_size = min(data_size, size - pos - 8)
+            if not byte_rate:
+                return None
+            codec = _WAV_CODECS.get(audio_format, f"wav_0x{audio_format:x}")
+            if codec.endswith(("_s", "_f")):
+                codec = f"{codec}{bits}le"
+            return _info("wav", codec, data_size / byte_rate, sample_rate, channels)
+        pos += 8 + chunk_size + (chunk_size & 1)
+    return None
+
+
+# ==================== MP3 ====================
+
+_MP3_BITRATES = {
+    (1, 1): [0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448],
+    (1, 2): [0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384],
+    (1, 3): [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    (2, 1): [0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256],
+    (2, 2): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+    (2, 3): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+}
+_MP3_SAMPLE_RATES = {1: (44100, 48000, 32000), 2: (22050, 24000, 16000), 2.5: (11025, 12000, 8000)}
+# 起始若干帧码率一致时视为 CBR，按大小估算；否则逐帧扫描
+_MP3_CBR_CHECK_FRAMES = 8
+
+
+def _parse_mp3_header(b: bytes) -> Optional[Dict[str, Any]]:
+    if len(b) < 4 or b[0] != 0xFF or (b[1] & 0xE0) != 0xE0:
+        return None
+    version = {0: 2.5, 2: 2, 3: 1}.get((b[1] >> 3) & 0x3)
+    layer = {1: 3, 2: 2, 3: 1}.get((b[1] >> 1) & 0x3)
+    br_idx, sr_idx = (b[2] >> 4) & 0xF, (b[2] >> 2) & 0x3
+    if version is None or layer is None or br_idx in (0, 15) or sr_idx == 3:
+        return None
+    bitrate = _MP3_BITRATES[(1 if version == 1 else 2, layer)][br_idx] * 1000
+    sample_rate = _MP3_SAMPLE_RATES[version][sr_idx]
+    padding = (b[2] >> 1) & 0x1
+    if layer == 1:
+        samples, length = 384, (12 * bitrate // sample_rate + padding) * 4
+    else:
+        samples = 576 if (layer == 3 and version != 1) else 1152
+        length = samples // 8 * bitrate // sample_rate + padding
+    return {
+        "version": version,
+        "layer": layer,
+        "bitrate": bitrate,
+        "sample_rate": sample_rate,
+        "channels": 1 if (b[3] >> 6) == 3 else 2,
+        "samples": samples,
+        "length": length,
+    }
+
+
+def _skip_id3v2(f: BinaryIO) -> int:
+    f.seek(0)
+    head = f.read(10)
+    if len(head) == 10 and head[:3] == b"ID3":
+        size = (head[6] << 21) | (head[7] << 14) | (head[8] << 7) | head[9]
+        return 10 + size + (10 if head[5] & 0x10 else 0)
+    return 0
+
+
+def _probe_mp3(f: BinaryIO, size: int) -> Optional[Dict[str, Any]]:
+    start = _skip_id3v2(f)
+    f.seek(start)
+    buf = f.read(64 * 1024)
+    first = None
+    for i in range(len(buf) - 4):
+        if buf[i] == 0xFF:
+            h = _parse_mp3_header(buf[i:i + 4])
+            if h:
+                nxt = i + h["length"]
+                # 用下一帧头校验，避免误判同步字
+                if nxt + 4 > len(buf) or _parse_mp3_header(buf[nxt:nxt + 4]):
+                    first, start = h, start + i
+                    break
+    if first is None:
+        return None
+    codec = f"mp{first['layer']}"
+
+    # Xing / Info（VBR/CBR 帧数）或 VBRI 头
+    f.seek(start)
+    frame = f.read(first["length"] + 64)
+    side = (32 if first["channels"] == 2 else 17) if first["version"] == 1 else (17 if first["channels"] == 2 else 9)
+    xoff = 4 + side
+    frames = None
+    if frame[xoff:xoff + 4] in (b"Xing", b"Info"):
+        flags = struct.unpack(">I", frame[xoff + 4:xoff + 8])[0]
+        if flags & 0x1:
+            frames = struct.unpack(">I", frame[xoff + 8:xoff + 12])[0]
+    elif frame[36:40] == b"VBRI":
+        frames = struct.unpack(">I", frame[36 + 14:36 + 18])[0]
+    if frames:
+        return _info("mp3", codec, frames * first["samples"] / first["sample_rate"],
+                     first["sample_rate"], first["channels"])
+
+    end = size
+    f.seek(max(0, size - 128))
+    if f.read(3) == b"TAG":
+        end -= 128
+
+    with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        pos, frames, bitrates = start, 0, set()
+        while pos + 4 <= end:
+            h = _parse_mp3_header(mm[pos:pos + 4])
+            if not h:
+                break
+            frames += 1
+            if frames <= _MP3_CBR_CHECK_FRAMES:
+                bitrates.add(h["bitrate"])
+                if frames == _MP3_CBR_CHECK_FRAMES and len(bitrates) == 1:
+                    duration = (end - start) * 8 / first["bitrate"]
+                    return _info("mp3", codec, duration, first["sample_rate"], first["channels"])
+            pos += h["length"]
+    if not frames:
+        return None
+    return _info("mp3", codec, frames * first["samples"] / first["sample_rate"],
+                 first["sample_rate"], first["channels"])
+
+
+# ==================== AAC ADTS ====================
+
+_ADTS_SAMPLE_RATES = (96000, 88200, 64000, 48000, 44100, 32000, 24000, 22050, 16000, 12000, 11025, 8000, 7350)
+
+
+def _probe_adts(f: BinaryIO, size: int) -> Optional[Dict[str, Any]]:
+    start = _skip_id3v2(f)
+    f.seek(start)
+    head = f.read(7)
+    if len(head) < 7 or head[0] != 0xFF or (head[1] & 0xF6) != 0xF0:
+        return None
+    sr_idx = (head[2] >> 2) & 0xF
+    if sr_idx >= len(_ADTS_SAMPLE_RATES):
+        return None
+    sample_rate = _ADTS_SAMPLE_RATES[sr_idx]
+    channels = ((head[2] & 0x1) << 2) | (head[3] >> 6)
+    with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        pos, blocks = start, 0
+        while pos + 7 <= size:
+            if mm[pos] != 0xFF or (mm[pos + 1] & 0xF6) != 0xF0:
+                break
+            length = ((mm[pos + 3] & 0x3) << 11) | (mm[pos + 4] << 3) | (mm[pos + 5] >> 5)
+            if length < 7:
+                break
+            blocks += (mm[pos + 6] & 0x3) + 1
+            pos += length
+    if not blocks:
+        return None
+    return _info("adts", "aac", blocks * 1024 / sample_rate, sample_rate, channels or None)
+
+
+# ==================== 入口 ====================
+
+_PROBES = (_probe_mp4, _probe_wav, _probe_adts, _probe_mp3)
+
+
+def probe_audio(local_path: str) -> Optional[Dict[str, Any]]:
+    """
+    解析音频容器头。
+    Returns:
+        {"container", "codec", "duration_sec", "sample_rate", "channels"}；无法识别返回 None
+    """
+    size = os.path.getsize(local_path)
+    if size == 0:
+        return None
+    with open(local_path, "rb") as f:
+        for probe in _PROBES:
+            try:
+                info = probe(f, size)
+            except (struct.error, IndexError, ValueError, OSError) as e:
+                logger.debug("[audio_probe] %s 解析失败 %s: %s", probe.__name__, local_path, e)
+                continue
+            if info and info["duration_sec"] > 0:
+                return info
+    return None
@@ -13,13 +13,23 @@ logger = logging.getLogger(__name__)
 
 def get_audio_duration_sec(local_path: str) -> float:
     """
-    使用 ffprobe 获取音频总时长（秒）。
-    若 ffprobe 不可用或失败，抛出 RuntimeError。
-    大文件（如 60MB+ 长音频）可能需要较长时间扫描，超时可通过 FFPROBE_TIMEOUT 配置。
+    获取音频总时长（秒）。
+    优先在进程内解析容器头（utils.audio_probe，m4a/mp4/wav/mp3/aac），无需子进程；
+    无法识别的容器回退 ffprobe，若 ffprobe 不可用或失败，抛出 RuntimeError。
+    大文件（如 60MB+ 长音频）ffprobe 可能需要较长时间扫描，超时可通过 FFPROBE_TIMEOUT 配置。
     """
     import subprocess
+    from utils.audio_probe import probe_audio
     if not os.path.isfile(local_path):
         raise FileNotFoundError(f"文件不存在: {local_path}")
+    try:
+        info = probe_audio(local_path)
+    except Exception as e:
+        logger.warning("[audio_probe] 解析异常，回退 ffprobe: %s", e)
+        info = None
+    if info:
+        return info["duration_sec"]
+    logger.info("[audio_probe] 未识别容器，回退 ffprobe: %s", local_path)
     timeout_sec = int(os.getenv("FFPROBE_TIMEOUT", "120"))  # 默认 120s，适配 60MB+ 长音频
     try:
         result = subprocess.run(
@@ -45,82 +55,225 @@ def get_audio_duration_sec(local_path: str) -> float:
         raise RuntimeError(f"无法解析时长: {e}")
 
 
+# 切分参数：静音吸附（切点落在附近静音处，避免把一句话切成两半）与片段重叠（供转写拼接去重）
+_SEGMENT_SNAP_SILENCE = os.getenv("SEGMENT_SNAP_SILENCE", "true").lower() == "true"
+_SEGMENT_SNAP_WINDOW_SEC = float(os.getenv("SEGMENT_SNAP_WINDOW_SEC", "20"))
+_SEGMENT_SILENCE_DB = os.getenv("SEGMENT_SILENCE_DB", "-35dB")
+_SEGMENT_SILENCE_MIN_SEC = float(os.getenv("SEGMENT_SILENCE_MIN_SEC", "0.3"))
+_SEGMENT_OVERLAP_SEC = float(os.getenv("SEGMENT_OVERLAP_SEC", "0"))
+_SEGMENT_TIMEOUT = int(os.getenv("SEGMENT_TIMEOUT", "300"))
+
+# 可直接 -c copy 的容器：扩展名 -> ffmpeg 输出格式
+_COPY_FORMATS = {
+    ".m4a": "mp4",
+    ".mp4": "mp4",
+    ".mp3": "mp3",
+    ".aac": "adts",
+    ".wav": "wav",
+    ".flac": "flac",
+    ".ogg": "ogg",
+    ".opus": "ogg",
+}
+
+
+def _scan_silences(local_path: str) -> Tuple[float, List[Tuple[float, float]]]:
+    """
+    单次解码扫描静音区间（降为单声道 8kHz 再做 silencedetect，只解码不编码），
+    时长取自 ffmpeg 输入头信息，省去单独的 ffprobe。
+    Returns:
+        (duration_sec, [(silence_start, silence_end), ...])
+    """
+    import re
+    import subprocess
+
+    cmd = [
+        "ffmpeg", "-hide_banner", "-nostats", "-vn", "-i", local_path,
+        "-af", f"aformat=channel_layouts=mono,aresample=8000,"
+               f"silencedetect=noise={_SEGMENT_SILENCE_DB}:d={_SEGMENT_SILENCE_MIN_SEC}",
+        "-f", "null", "-",
+    ]
+    try:
+        result = subprocess.run(cmd, capture_output=True, timeout=_SEGMENT_TIMEOUT, check=False)
+    except subprocess.TimeoutExpired:
+        raise RuntimeError(f"静音扫描超时（{_SEGMENT_TIMEOUT}s）")
+    err = (result.stderr or b"").decode("utf-8", errors="replace")
+    if result.returncode != 0:
+        raise RuntimeError(f"静音扫描失败: {err[-300:]}")
+
+    duration = 0.0
+    m = re.search(r"Duration:\s*(\d+):(\d+):([\d.]+)", err)
+    if m:
+        duration = int(m.group(1)) * 3600 + int(m.group(2)) * 60 + float(m.group(3))
+    silences: List[Tuple[float, float]] = []
+    start = None
+    for line in err.splitlines():
+        ms = re.search(r"silence_start:\s*(-?[\d.]+)", line)
+        if ms:
+            start = max(0.0, float(ms.group(1)))
+            continue
+        me = re.search(r"silence_end:\s*([\d.]+)", line)
+        if me and start is not None:
+            silences.append((start, float(me.group(1))))
+            start = None
+    if duration <= 0:
+        duration = get_audio_duration_sec(local_path)
+    return duration, silences
+
+
+def _snap_cut(target: float, silences: List[Tuple[float, float]], window: float) -> float:
+    """在 target ± window 内找最近的静音区间，返回其中点；找不到则返回 target"""
+    best, best_dist = target, None
+    for s_start, s_end in silences:
+        if s_end < target - window:
+            continue
+        if s_start > target + window:
+            break
+        mid = (s_start + s_end) / 2
+        # 较长的静音区间允许吸附到离 target 最近的那一端内侧
+        point = min(max(target, s_start), s_end) if s_end - s_start > 1.0 else mid
+        dist = abs(point - target)
+        if best_dist is None or dist < best_dist:
+            best, best_dist = point, dist
+    return best
+
+
+def _read_segment_list(list_path: str, out_dir: str) -> List[Tuple[float, float, str]]:
+    """解析 segment muxer 的 csv 列表：filename,start,end"""
+    import csv
+    rows: List[Tuple[float, float, str]] = []
+    with open(list_path, newline="") as f:
+        for row in csv.reader(f):
+            if len(row) >= 3:
+                rows.append((float(row[1]), float(row[2]), os.path.join(out_dir, row[0])))
+    return rows
+
+
+def _run_ffmpeg(cmd: List[str], what: str) -> None:
+    import subprocess
+    try:
+        result = subprocess.run(cmd, capture_output=True, timeout=_SEGMENT_TIMEOUT, check=False)
+    except subprocess.TimeoutExpired:
+        raise RuntimeError(f"{what}超时（{_SEGMENT_TIMEOUT}s）")
+    if result.returncode != 0:
+        err = (result.stderr or b"").decode("utf-8", errors="replace")
+        raise RuntimeError(f"{what}失败: {err[-300:]}")
+
+
+def _remove_outputs(out_dir: str, prefix: str) -> None:
+    for name in os.listdir(out_dir):
+        if name.startswith(prefix):
+            try:
+                os.unlink(os.path.join(out_dir, name))
+            except OSError:
+                pass
+
+
 def split_audio_into_chunks(
     local_path: str,
     max_chunk_mb: float = 18.0,
     base_name: str = "chunk",
+    overlap_sec: Optional[float] = None,
 ) -> List[Tuple[float, float, str]]:
     """
-    将大音频按时长切分为多个小片段，使每个片段约 <= max_chunk_mb MB。
-    使用 ffmpeg 按时间区间剪切，返回 (start_sec, end_sec, temp_path) 列表。
+    将大音频切分为多个片段，使每个片段约 <= max_chunk_mb MB，返回 (start_sec, end_sec, temp_path) 列表。
     调用方需在完成后删除返回的临时文件。
 
+    - 只启动一次 ffmpeg：segment muxer 按切点一次性输出全部片段，编码允许时 -c copy 不重新编码；
+      copy 失败（容器 / 编码不兼容）时同样单次执行，转码为 AAC
+    - 切点吸附到目标位置附近的静音区间（SEGMENT_SNAP_SILENCE），静音扫描顺带给出时长，不再单独 ffprobe；
+      扫描失败或超时时按固定位置切分
+    - overlap_sec > 0（默认取 SEGMENT_OVERLAP_SEC）时相邻片段前后各多带 overlap_sec 秒，
+      此时用单进程多输出（-ss/-t）代替 segment muxer；相邻片段的分界为重叠区中点
+
     Args:
         local_path: 原音频路径
         max_chunk_mb: 每个片段最大约多少 MB（默认 18，留余量在 20MB 以下）
         base_name: 临时文件名前缀
+        overlap_sec: 片段重叠秒数
 
     Returns:
         [(start_sec, end_sec, temp_path), ...]
     """
     import math
-    import subprocess
-    import tempfile
+    import time
+    import uuid
 
+    t0 = time.time()
+    overlap = _SEGMENT_OVERLAP_SEC if overlap_sec is None else max(0.0, overlap_sec)
     file_size = os.path.getsize(local_path)
-    duration_sec = get_audio_duration_sec(local_path)
+    duration_sec, silences = 0.0, []
+    if _SEGMENT_SNAP_SILENCE:
+        try:
+            duration_sec, silences = _scan_silences(local_path)
+        except RuntimeError as e:
+            # 静音吸附只是优化：扫描失败 / 超时时退回固定切点
+            logger.warning("[切片] 静音扫描失败，按固定位置切分: %s", e)
+    if duration_sec <= 0:
+        duration_sec = get_audio_duration_sec(local_path)
     if duration_sec <= 0:
         raise ValueError("音频时长为 0")
 
-    # 按文件大小计算需要的片段数，使每片 <= max_chunk_mb
-    max_bytes = max_chunk_mb * 1024 * 1024
-    num_chunks = max(1, math.ceil(file_size / max_bytes))
-    chunk_duration_sec = duration_sec / num_chunks
+    # 按文件大小计算片段数；吸附与重叠会让单片略长，预留余量
+    bytes_per_sec = file_size / duration_sec
+    slack_sec = (_SEGMENT_SNAP_WINDOW_SEC if silences else 0) + 2 * overlap
+    max_bytes = max_chunk_mb * 1024 * 1024 - slack_sec * bytes_per_sec
+    num_chunks = max(1, math.ceil(file_size / max(max_bytes, 1)))
+
+    cuts: List[float] = []
+    for k in range(1, num_chunks):
+        cut = _snap_cut(duration_sec * k / num_chunks, silences, _SEGMENT_SNAP_WINDOW_SEC)
+        if cut > (cuts[-1] if cuts else 0) + 1.0 and cut < duration_sec - 1.0:
+            cuts.append(round(cut, 3))
+    bounds = [0.0] + cuts + [duration_sec]
 
     ext = os.path.splitext(local_path)[1].lower() or ".m4a"
-    out_fmt = "mp4" if ext in (".m4a", ".mp4") else "mp3"
-    codec = "aac" if out_fmt == "mp4" else "libmp3lame"
+    out_dir = tempfile.gettempdir()
+    prefix = f"{base_name}_{uuid.uuid4().hex[:8]}_"
+    copy_fmt = _COPY_FORMATS.get(ext)
+    attempts = ([("copy", copy_fmt, ext)] if copy_fmt else []) + [("aac", "mp4", ".m4a")]
 
-    chunks: List[Tuple[float, float, str]] = []
-    for i in range(num_chunks):
-        start_sec = i * chunk_duration_sec
-        end_sec = min((i + 1) * chunk_duration_sec, duration_sec)
-        if start_sec >= end_sec:
-            continue
-        tmp = tempfile.NamedTemporaryFile(delete=False, suffix=ext, prefix=f"{base_name}_{i}_")
-        tmp.close()
-        tmp_path = tmp.name
-
-        cmd = [
-            "ffmpeg", "-y",
-            "-ss", str(start_sec),
-            "-i", local_path,
-            "-t", str(end_sec - start_sec),
-            "-c:a", codec, "-vn", "-f", out_fmt,
-            tmp_path,
-        ]
+    last_err: Optional[Exception] = None
+    for codec, fmt, out_ext in attempts:
+        codec_args = ["-c", "copy"] if codec == "copy" else ["-c:a", "aac"]
         try:
-            result = subprocess.run(cmd, capture_output=True, timeout=120, check=False)
-            if result.returncode != 0:
-                err = (result.stderr or b"").decode("utf-8", errors="replace")
-                for c in chunks:
-                    try:
-                        os.unlink(c[2])
-                    except Exception:
-                        pass
-                raise RuntimeError(f"ffmpeg 切分失败 (chunk {i}): {err[:300]}")
-        except subprocess.TimeoutExpired:
-            for c in chunks:
-                try:
-                    os.unlink(c[2])
-                except Exception:
-                    pass
-            raise RuntimeError("ffmpeg 切分超时")
-
-        chunks.append((start_sec, end_sec, tmp_path))
-
-    logger.info("[split_audio] 切分完成: %d 个片段, 总时长 %.1fs", len(chunks), duration_sec)
-    return chunks
+            if overlap <= 0:
+                list_path = os.path.join(out_dir, f"{prefix}list.csv")
+                cmd = [
+                    "ffmpeg", "-y", "-hide_banner", "-nostats", "-i", local_path, "-vn", "-map", "0:a:0",
+                    *codec_args,
+                    "-f", "segment", "-segment_format", fmt, "-reset_timestamps", "1",
+                    "-segment_list", list_path, "-segment_list_type", "csv",
+                ]
+                if cuts:
+                    cmd += ["-segment_times", ",".join(f"{c:.3f}" for c in cuts)]
+                cmd.append(os.path.join(out_dir, f"{prefix}%03d{out_ext}"))
+                _run_ffmpeg(cmd, "ffmpeg 切分")
+                chunks = _read_segment_list(list_path, out_dir)
+                os.unlink(list_path)
+            else:
+                cmd = ["ffmpeg", "-y", "-hide_banner", "-nostats", "-i", local_path]
+                chunks = []
+                for i in range(len(bounds) - 1):
+                    start_sec = max(0.0, bounds[i] - overlap)
+                    end_sec = min(duration_sec, bounds[i + 1] + overlap)
+                    path = os.path.join(out_dir, f"{prefix}{i:03d}{out_ext}")
+                    cmd += ["-vn", "-map", "0:a:0", "-ss", f"{start_sec:.3f}", "-t", f"{end_sec - start_sec:.3f}",
+                            *codec_args, "-f", fmt, path]
+                    chunks.append((start_sec, end_sec, path))
+                _run_ffmpeg(cmd, "ffmpeg 切分")
+            chunks = [c for c in chunks if os.path.isfile(c[2]) and os.path.getsize(c[2]) > 0]
+            if not chunks:
+                raise RuntimeError("ffmpeg 切分未产出片段")
+            logger.info(
+                "[split_audio] 切分完成: %d 个片段 (%s) 总时长 %.1fs 静音点 %d 切点 %s 重叠 %.1fs 耗时 %.2fs",
+                len(chunks), codec, duration_sec, len(silences), cuts, overlap, time.time() - t0,
+            )
+            return chunks
+        except Exception as e:
+            last_err = e
+            _remove_outputs(out_dir, prefix)
+            logger.warning("[split_audio] %s 模式切分失败: %s", codec, e)
+    raise RuntimeError(f"ffmpeg 切分失败: {last_err}")
 
 
 # 从环境变量读取 OSS 配置（与 main 一致）
@@ -130,6 +283,45 @@ _OSS_ENDPOINT = os.getenv("OSS_ENDPOINT")
 _OSS_BUCKET_NAME = os.getenv("OSS_BUCKET_NAME")
 _AUDIO_STORAGE_DIR = os.getenv("AUDIO_STORAGE_DIR", "data/audio/sessions")
 _SEGMENTS_DIR = os.getenv("AUDIO_SEGMENTS_DIR", "data/audio/segments")
+# 自定义域名 / 本地 OSS 兼容服务（path 风格 URL，如 scripts/oss_standin.py）时设为 true
+_OSS_IS_CNAME = os.getenv("OSS_IS_CNAME", "false").lower() == "true"
+_OSS_POOL_SIZE = int(os.getenv("OSS_POOL_SIZE", "16"))
+
+_oss_bucket = None
+
+
+def get_oss_bucket():
+    """
+    进程级共享的 OSS Bucket（底层 requests 连接池复用，线程安全）。
+    未启用或配置不完整时返回 None。
+    """
+    global _oss_bucket
+    if _oss_bucket is not None:
+        return _oss_bucket
+    ak = os.getenv("OSS_ACCESS_KEY_ID")
+    sk = os.getenv("OSS_ACCESS_KEY_SECRET")
+    if not _USE_OSS or not all([ak, sk, _OSS_ENDPOINT, _OSS_BUCKET_NAME]):
+        return None
+    import oss2
+    oss2.defaults.connection_pool_size = _OSS_POOL_SIZE
+    _oss_bucket = oss2.Bucket(
+        oss2.Auth(ak, sk), _OSS_ENDPOINT, _OSS_BUCKET_NAME,
+        is_cname=_OSS_IS_CNAME, session=oss2.Session(),
+    )
+    return _oss_bucket
+
+
+def oss_object_url(oss_key: str) -> str:
+    """object key → 可访问 URL（CDN 优先；与 _oss_key_from_url 互逆）"""
+    if _OSS_CDN_DOMAIN:
+        return f"https://{_OSS_CDN_DOMAIN}/{oss_key}"
+    ep = (_OSS_ENDPOINT or "").rstrip("/")
+    if _OSS_IS_CNAME:
+        return f"{ep if ep.startswith('http') else 'https://' + ep}/{oss_key}"
+    if ep.startswith("http"):
+        scheme, host = ep.split("://", 1)
+        return f"{scheme}://{_OSS_BUCKET_NAME}.{host}/{oss_key}"
+    return f"https://{_OSS_BUCKET_NAME}.{ep}/{oss_key}"
 
 
 def _oss_key_from_url(audio_url: str) -> Optional[str]:
@@ -143,6 +335,10 @@ def _oss_key_from_url(audio_url: str) -> Optional[str]:
         if not path:
             return None
         # 仅当 URL 指向本 bucket 时才用 SDK 下载（避免误用 SDK 下载第三方 URL）
+        if _OSS_IS_CNAME and _OSS_ENDPOINT and p.netloc == urlparse(
+            _OSS_ENDPOINT if "://" in _OSS_ENDPOINT else f"https://{_OSS_ENDPOINT}"
+        ).netloc:
+            return path
         if _OSS_BUCKET_NAME not in (p.netloc or ""):
             return None
         return path
@@ -175,16 +371,10 @@ def get_session_audio_local_path(audio_url: Optional[str], audio_path: Optional[
     # 优先用 OSS SDK 下载（私有 bucket 必须）
     oss_key = _oss_key_from_url(audio_url)
     if oss_key and _USE_OSS:
-        ak = os.getenv("OSS_ACCESS_KEY_ID")
-        sk = os.getenv("OSS_ACCESS_KEY_SECRET")
-        ep = os.getenv("OSS_ENDPOINT")
-        bucket_name = os.getenv("OSS_BUCKET_NAME")
-        if all([ak, sk, ep, bucket_name]):
+        bucket = get_oss_bucket()
+        if bucket is not None:
             try:
                 logger.info("[get_session_audio] OSS 下载开始: key=%s", oss_key)
-                import oss2
-                auth = oss2.Auth(ak, sk)
-                bucket = oss2.Bucket(auth, ep, bucket_name)
                 bucket.get_object_to_file(oss_key, tmp.name)
                 size = os.path.getsize(tmp.name)
                 logger.info("[get_session_audio] OSS 下载成功: size=%d bytes", size)
@@ -273,15 +463,9 @@ def upload_segment_bytes(
     logger.info("[upload_segment] 开始: size=%d user=%s session=%s", len(segment_bytes), user_id, session_id)
     if _USE_OSS:
         try:
-            import oss2
-            ak = os.getenv("OSS_ACCESS_KEY_ID")
-            sk = os.getenv("OSS_ACCESS_KEY_SECRET")
-            ep = os.getenv("OSS_ENDPOINT")
-            bucket_name = os.getenv("OSS_BUCKET_NAME")
-            if not all([ak, sk, ep, bucket_name]):
+            bucket = get_oss_bucket()
+            if bucket is None:
                 raise ValueError("OSS 配置不完整")
-            auth = oss2.Auth(ak, sk)
-            bucket = oss2.Bucket(auth, ep, bucket_name)
             oss_key = f"sessions/{user_id}/{session_id}/segments/{segment_id}{ext}"
             # 仅设置 Content-Type，不设置 x-oss-object-acl（阿里云禁止时会导致 403）
             headers = {"Content-Type": "audio/mp4" if ext == ".m4a" else "application/octet-stream"}
@@ -289,10 +473,10 @@ def upload_segment_bytes(
             logger.info("[upload_segment] OSS 成功: key=%s size=%d 耗时=%.2fs", oss_key, len(segment_bytes), time.time() - t0)
             if _OSS_CDN_DOMAIN:
                 return f"https://{_OSS_CDN_DOMAIN}/{oss_key}"
-            if ep.startswith("http"):
-                base = ep.rstrip("/")
+            if _OSS_ENDPOINT.startswith("http"):
+                base = _OSS_ENDPOINT.rstrip("/")
             else:
-                base = f"https://{bucket_name}.{ep}"
+                base = f"https://{_OSS_BUCKET_NAME}.{_OSS_ENDPOINT}"
             return f"{base}/{oss_key}"
         except Exception as e:
             logger.exception("[upload_segment] OSS 失败: %s", e)
@@ -0,0 +1,372 @@
+"""
+容错 JSON 解析：修复 LLM 返回 JSON 的常见瑕疵，并支持流式响应边生成边解析
+- 有 Markdown 代码块时优先取代码块内容；跳过 JSON 之前的说明文字，忽略根值结束后的多余内容
+- 说明文字里的括号（如「分类结果[见下]」「see [1]」）不当作 JSON：根值内有被丢弃的字符或类型不符合 expect 时，
+  从该根值之后的下一个 { / [ 重新解析
+- 删除尾随逗号，字符串内的裸换行 / 制表符转义，非法字面量替换为 null
+- 截断修复：未闭合的字符串值补引号，截断在半截的键 / 数字 / 字面量丢弃，未闭合的数组 / 对象补全
+  （如 transcript 数组最后一条说到一半时，保留已生成的部分，整次调用不再白费）
+- IncrementalJSONParser：逐块 feed，随时取修复后的部分结果（partial），
+  或取顶层数组字段中已完整生成的元素（pop_items，如 transcript 逐条完成）
+扫描为单遍增量状态机，feed 只处理新到的文本，整体 O(n)。
+"""
+import json
+import logging
+import re
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+_WS = " \t\r\n"
+_SCALAR_START = set("-0123456789tfn")
+_SCALAR_CHARS = set("+-.0123456789eEtruefalsn")
+_CLOSER = {"{": "}", "[": "]"}
+_STRING_ESCAPES = {"\n": "\\n", "\r": "\\r", "\t": "\\t"}
+_PARTIAL_UNICODE_RE = re.compile(r"\\u[0-9a-fA-F]{0,3}$")
+_FENCE_RE = re.compile(r"```[A-Za-z0-9_-]*[ \t]*\r?\n?(.*?)(?:```|$)", re.S)
+_OPENER_RE = re.compile(r"[{\[]")
+
+
+class _Frame:
+    """一层未闭合的数组 / 对象；key 仅对根对象下的数组字段有值（用于收集已完成元素）"""
+    __slots__ = ("kind", "state", "key", "elem_start")
+
+    def __init__(self, kind: str, key: Optional[str] = None):
+        self.kind = kind
+        # 对象：key → colon → value → comma；数组：value → comma
+        self.state = "key" if kind == "{" else "value"
+        self.key = key
+        self.elem_start = 0
+
+
+class _Scanner:
+    """增量扫描器：边读边输出规范化后的 JSON 文本，并记录最近一个可安全截断的位置"""
+
+    def __init__(self):
+        self.out: List[str] = []
+        self.stack: List[_Frame] = []
+        self.started = False
+        self.done = False
+        self.in_string = False
+        self.string_is_key = False
+        self.escape = False
+        self.in_scalar = False
+        self.token_start = 0
+        self.root_key: Optional[str] = None
+        self.safe_len = 0
+        self.safe_closers = ""
+        self.items: Dict[str, List[str]] = {}
+        self.consumed = 0  # 已读字符数（根值闭合后停止计数）
+        self.root_start = -1  # 根值起始位置
+        self.dirty = False  # 根值内有被丢弃的字符（多半是说明文字里的括号，而非 JSON）
+
+    def feed(self, text: str) -> None:
+        for c in text:
+            if self.done:
+                return
+            self.consumed += 1
+            if self.in_string:
+                self._string_char(c)
+                continue
+            if self.in_scalar:
+                if c in _SCALAR_CHARS:
+                    self.out.append(c)
+                    continue
+                self._finish_scalar()
+                if self.done:
+                    return
+            self._char(c)
+
+    def _closers(self) -> str:
+        return "".join(_CLOSER[f.kind] for f in reversed(self.stack))
+
+    def _mark_safe(self) -> None:
+        self.safe_len = len(self.out)
+        self.safe_closers = self._closers()
+
+    def _string_char(self, c: str) -> None:
+        if self.escape:
+            self.escape = False
+            self.out.append(c)
+        elif c == "\\":
+            self.escape = True
+            self.out.append(c)
+        elif c == '"':
+            self.out.append(c)
+            self.in_string = False
+            if self.string_is_key:
+                self._key_done()
+            else:
+                self._value_done()
+        else:
+            self.out.append(_STRING_ESCAPES.get(c, c))
+
+    def _key_done(self) -> None:
+        self.stack[-1].state = "colon"
+        if len(self.stack) == 1:
+            raw = "".join(self.out[self.token_start:])
+            try:
+                self.root_key = json.loads(raw, strict=False)
+            except ValueError:
+                self.root_key = raw.strip('"')
+
+    def _finish_scalar(self) -> None:
+        self.in_scalar = False
+        try:
+            json.loads("".join(self.out[self.token_start:]))
+        except ValueError:
+            del self.out[self.token_start:]
+            self.out.extend("null")
+            self.dirty = True
+        self._value_done()
+
+    def _value_done(self) -> None:
+        if not self.stack:
+            self.done = True
+            self._mark_safe()
+            return
+        top = self.stack[-1]
+        top.state = "comma"
+        if top.key is not None:
+            self.items.setdefault(top.key, []).append("".join(self.out[top.elem_start:]))
+        self._mark_safe()
+
+    def _expect_value(self, top: Optional[_Frame]) -> bool:
+        """当前位置能否开始一个值；缺少的冒号 / 数组逗号顺带补上"""
+        if top is None:
+            return not self.out
+        if top.state == "value":
+            return True
+        if top.state == "colon":
+            self.out.append(":")
+            top.state = "value"
+            return True
+        if top.state == "comma" and top.kind == "[":
+            self.out.append(",")
+            top.state = "value"
+            return True
+        return False
+
+    def _begin_value(self, top: Optional[_Frame]) -> None:
+        if top is not None:
+            top.elem_start = len(self.out)
+
+    def _char(self, c: str) -> None:
+        if c in _WS:
+            return
+        if not self.started:
+            if c not in _CLOSER:
+                return  # JSON 之前的代码块标记 / 说明文字
+            self.started = True
+            self.root_start = self.consumed - 1
+        top = self.stack[-1] if self.stack else None
+        if c in _CLOSER:
+            if not self._expect_value(top):
+                self.dirty = True
+                return
+            self._begin_value(top)
+            self.out.append(c)
+            key = self.root_key if c == "[" and len(self.stack) == 1 and top.kind == "{" else None
+            self.stack.append(_Frame(c, key))
+            self._mark_safe()
+        elif c in "}]":
+            if top is None or _CLOSER[top.kind] != c:
+                self.dirty = True
+                return
+            if self.out[-1] == ",":
+                self.out.pop()  # 尾随逗号
+            elif top.state == "colon":
+                self.out.extend(":null")
+            elif top.kind == "{" and top.state == "value":
+                self.out.extend("null")
+            self.out.append(c)
+            self.stack.pop()
+            self._value_done()
+        elif c == ",":
+            if top is not None and top.state == "comma":
+                self.out.append(c)
+                top.state = "key" if top.kind == "{" else "value"
+            else:
+                self.dirty = True
+        elif c == ":":
+            if top is not None and top.kind == "{" and top.state == "colon":
+                self.out.append(c)
+                top.state = "value"
+            else:
+                self.dirty = True
+        elif c == '"':
+            if top is None:
+                self.dirty = True
+                return
+            if top.kind == "{" and top.state in ("key", "comma"):
+                if top.state == "comma":
+                    self.out.append(",")
+                    top.state = "key"
+                is_key = True
+            elif self._expect_value(top):
+                is_key = False
+                self._begin_value(top)
+            else:
+                self.dirty = True
+                return
+            self.token_start = len(self.out)
+            self.out.append(c)
+            self.in_string = True
+            self.string_is_key = is_key
+        elif c in _SCALAR_START and self._expect_value(top):
+            self._begin_value(top)
+            self.token_start = len(self.out)
+            self.out.append(c)
+            self.in_scalar = True
+        else:
+            self.dirty = True
+
+    def snapshot(self) -> Optional[str]:
+        """当前已读内容修复为合法 JSON 文本；尚未遇到 JSON 时返回 None"""
+        if not self.started:
+            return None
+        if self.done:
+            return "".join(self.out)
+        if self.in_string and not self.string_is_key:
+            text = "".join(self.out[:-1] if self.escape else self.out)
+            return _PARTIAL_UNICODE_RE.sub("", text) + '"' + self._closers()
+        if self.in_scalar:
+            try:
+                json.loads("".join(self.out[self.token_start:]))
+                return "".join(self.out) + self._closers()
+            except ValueError:
+                pass
+        return "".join(self.out[:self.safe_len]) + self.safe_closers
+
+
+class IncrementalJSONParser:
+    """
+    流式响应逐块 feed；parser.partial() 取当前修复后的部分结果，
+    parser.pop_items("transcript") 取根对象下该数组字段自上次以来新完成的元素，
+    流结束后 parser.close() 返回完整（或截断修复后）的结果
+    """
+
+    def __init__(self):
+        self._scanner = _Scanner()
+        self._chunks: List[str] = []
+
+    def feed(self, chunk: str) -> None:
+        self._chunks.append(chunk)
+        self._scanner.feed(chunk)
+
+    @property
+    def done(self) -> bool:
+        """根值是否已完整闭合"""
+        return self._scanner.done
+
+    @property
+    def text(self) -> str:
+        return "".join(self._chunks)
+
+    def pop_items(self, key: str) -> List[Any]:
+        items = []
+        for raw in self._scanner.items.pop(key, None) or []:
+            try:
+                items.append(json.loads(raw, strict=False))
+            except ValueError:
+                logger.debug(f"[JSON修复] 跳过无法解析的 {key} 元素: {raw[:100]}")
+        return items
+
+    def partial(self) -> Any:
+        snap = self._scanner.snapshot()
+        if snap is None:
+            return None
+        try:
+            return json.loads(snap, strict=False)
+        except ValueError:
+            return None
+
+    def close(self, expect: Optional[type] = None) -> Any:
+        """
+        返回最终结果：原文合法时直接解析，否则按修复后的文本解析；仍无法得到 JSON 时抛 ValueError
+        expect（如 dict）：根值类型不符时继续找下一个候选，而不是返回说明文字里的 [1] 之类
+        """
+        text = self.text
+        try:
+            value = json.loads(text)
+            if expect is None or isinstance(value, expect):
+                return value
+        except ValueError:
+            pass
+        scanner = self._scanner
+        # 常见情况：流式解析的根值本身干净且类型符合，且之前没有代码块（否则应优先取代码块内容）
+        if scanner.started and not scanner.dirty and "```" not in text[:scanner.root_start]:
+            value = _value_of(scanner)
+            if value is not _MISSING and (expect is None or isinstance(value, expect)):
+                if not scanner.done:
+                    logger.warning(f"[JSON修复] 响应截断（{len(text)} 字符），已补全未闭合的结构")
+                return value
+        return loads_tolerant(text, expect)
+
+
+_MISSING = object()
+
+
+def _value_of(scanner: _Scanner) -> Any:
+    snap = scanner.snapshot()
+    if snap is None:
+        return _MISSING
+    try:
+        return json.loads(snap, strict=False)
+    except ValueError:
+        return _MISSING
+
+
+def _best_root(text: str, expect: Optional[type]) -> Any:
+    """
+    依次从每个 { / [ 开始解析：返回第一个干净且类型符合的根值；都不干净时返回第一个类型符合的修复结果。
+    下一个候选从上一个根值结束之后找（不进入其内部，避免返回嵌套的子对象）；根值未闭合（截断）即停止
+    """
+    fallback = _MISSING
+    pos = 0
+    while True:
+        m = _OPENER_RE.search(text, pos)
+        if m is None:
+            break
+        scanner = _Scanner()
+        scanner.feed(text[m.start():])
+        value = _value_of(scanner)
+        if value is not _MISSING and (expect is None or isinstance(value, expect)):
+            if not scanner.dirty:
+                if not scanner.done:
+                    logger.warning(f"[JSON修复] 响应截断（{len(text)} 字符），已补全未闭合的结构")
+                return value
+            if fallback is _MISSING:
+                fallback = value
+        if not scanner.done:
+            break
+        pos = m.start() + scanner.consumed
+    return fallback
+
+
+def repair_json(text: str) -> Optional[str]:
+    """修复后的 JSON 文本；text 中没有 JSON 时返回 None"""
+    scanner = _Scanner()
+    scanner.feed(text)
+    return scanner.snapshot()
+
+
+def loads_tolerant(text: str, expect: Optional[type] = None) -> Any:
+    """
+    容错解析 LLM 返回的 JSON（见模块说明）；有代码块时先解析代码块内容，再解析全文；
+    expect 为期望的根类型（如 dict），类型不符的候选跳过；无法得到 JSON 时抛 ValueError
+    """
+    text = text or ""
+    candidates = [m.group(1) for m in _FENCE_RE.finditer(text)] if "```" in text else []
+    for candidate in candidates + [text]:
+        try:
+            value = json.loads(candidate)
+            if expect is None or isinstance(value, expect):
+                return value
+        except ValueError:
+            pass
+        value = _best_root(candidate, expect)
+        if value is not _MISSING:
+            return value
+    kind = f" {expect.__name__}" if expect is not None else ""
+    raise ValueError(f"响应中没有{kind} JSON: {text[:200]!r}")
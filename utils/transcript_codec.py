@@ -0,0 +1,182 @@
+"""
+转写存储格式 v2：每个会话只存一份紧凑转写（analysis_results.transcript_blob），其余形态读取时按需派生
+- v1：transcript（JSON 字符串）、dialogues（JSONB）、call1_result.transcript（JSONB）各存一份完整对话
+- v2：transcript_blob = zlib(列式 JSON)：说话人表 + 每行说话人下标 / 秒级时间戳 / is_me / 文本，
+  语气仅在存在非默认值时才存一列；transcript 与 dialogues 置空，call1_result 不再内嵌 transcript
+- 读取统一走 row_transcript / row_dialogues / row_call1（或一次解码两者的 load_views），v1 / v2 行透明兼容
+- 写入统一走 storage_columns：派生结果与原数据不一致（如旧格式只有 dialogues）时自动退回 v1，保证无损
+"""
+import json
+import logging
+import os
+import zlib
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+STORAGE_V1 = 1
+STORAGE_V2 = 2
+# 新写入使用的格式；设为 1 可回退到三份 JSON 的旧格式（读取始终兼容两者）
+TRANSCRIPT_STORAGE_VERSION = int(os.getenv("TRANSCRIPT_STORAGE_VERSION", "2"))
+
+DEFAULT_TONE = "未知"
+_FIELDS = ("speaker", "text", "timestamp", "is_me")
+
+
+def encode(transcript: List[dict], tones: Optional[List[Any]] = None) -> bytes:
+    """转写条目 → 压缩列式 blob；无法按秒数还原的时间戳、额外字段原样存入覆盖表，解码结果与输入一致"""
+    from utils.transcript_time import format_timestamp, parse_timestamp
+
+    speakers: List[Any] = []
+    speaker_index: Dict[Any, int] = {}
+    cols: Dict[str, Any] = {"v": STORAGE_V2, "speakers": speakers, "s": [], "t": [], "m": [], "x": []}
+    raw_ts: Dict[str, Any] = {}
+    extra: Dict[str, Dict[str, Any]] = {}
+    for i, item in enumerate(transcript):
+        speaker = item.get("speaker")
+        if speaker not in speaker_index:
+            speaker_index[speaker] = len(speakers)
+            speakers.append(speaker)
+        cols["s"].append(speaker_index[speaker])
+        ts = item.get("timestamp")
+        sec = parse_timestamp(ts) if isinstance(ts, str) else None
+        if sec is not None and format_timestamp(sec) == ts:
+            cols["t"].append(int(round(sec)))
+        else:
+            cols["t"].append(None)
+            if ts is not None:
+                raw_ts[str(i)] = ts
+        cols["m"].append(1 if item.get("is_me") else 0)
+        cols["x"].append(item.get("text"))
+        rest = {k: v for k, v in item.items() if k not in _FIELDS}
+        if rest:
+            extra[str(i)] = rest
+    if raw_ts:
+        cols["traw"] = raw_ts
+    if extra:
+        cols["extra"] = extra
+    if tones and any(t != DEFAULT_TONE for t in tones):
+        cols["tone"] = list(tones)
+    payload = json.dumps(cols, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    return zlib.compress(payload, 6)
+
+
+def decode(blob: bytes) -> Tuple[List[dict], Optional[List[Any]]]:
+    """blob → (转写条目, 语气列表或 None)"""
+    from utils.transcript_time import format_timestamp
+
+    cols = json.loads(zlib.decompress(blob).decode("utf-8"))
+    speakers = cols["speakers"]
+    raw_ts = cols.get("traw") or {}
+    extra = cols.get("extra") or {}
+    transcript = [
+        {"speaker": speakers[s], "text": x, "timestamp": format_timestamp(t) if t is not None else None, "is_me": m == 1}
+        for s, t, m, x in zip(cols["s"], cols["t"], cols["m"], cols["x"])
+    ]
+    for i, ts in raw_ts.items():
+        transcript[int(i)]["timestamp"] = ts
+    for i, rest in extra.items():
+        transcript[int(i)].update(rest)
+    return transcript, cols.get("tone")
+
+
+def to_dialogues(transcript: List[dict], tones: Optional[List[Any]] = None) -> List[dict]:
+    """转写条目 → dialogues（DialogueItem 形态，与 build_analysis_results 的转换一致）"""
+    return [
+        {
+            "speaker": item.get("speaker"),
+            "content": item.get("text"),
+            "tone": tones[i] if tones else DEFAULT_TONE,
+            "timestamp": item.get("timestamp"),
+            "is_me": item.get("is_me", False),
+        }
+        for i, item in enumerate(transcript)
+    ]
+
+
+def transcript_chars(transcript: List[dict]) -> int:
+    """与 v1 的 length(transcript) 口径一致（ETA 模型特征）"""
+    return len(json.dumps(transcript, ensure_ascii=False))
+
+
+def storage_columns(transcript: Optional[List[dict]], dialogues: Optional[List[dict]] = None,
+                    call1: Optional[dict] = None, version: Optional[int] = None) -> Dict[str, Any]:
+    """写入 analysis_results 的转写相关列；可直接作为 AnalysisResult(...) 关键字参数或逐列 setattr"""
+    transcript = transcript or []
+    dialogues = dialogues if dialogues is not None else to_dialogues(transcript)
+    if (version or TRANSCRIPT_STORAGE_VERSION) >= STORAGE_V2 and transcript:
+        tones = [d.get("tone") for d in dialogues] if len(dialogues) == len(transcript) else None
+        try:
+            blob = encode(transcript, tones)
+            decoded, decoded_tones = decode(blob)
+            lossless = decoded == transcript and to_dialogues(decoded, decoded_tones) == dialogues
+        except (TypeError, ValueError) as e:
+            logger.warning(f"[转写存储] 编码失败，按 v1 存储: {e}")
+            lossless = False
+        if lossless:
+            return {
+                "storage_version": STORAGE_V2,
+                "transcript_blob": blob,
+                "transcript_chars": transcript_chars(transcript),
+                "transcript": None,
+                "dialogues": None,
+                "call1_result": {k: v for k, v in call1.items() if k != "transcript"} if call1 else None,
+            }
+    return {
+        "storage_version": STORAGE_V1,
+        "transcript_blob": None,
+        "transcript_chars": transcript_chars(transcript) if transcript else None,
+        "transcript": json.dumps(transcript, ensure_ascii=False) if transcript else None,
+        "dialogues": dialogues,
+        "call1_result": call1,
+    }
+
+
+def store(ar, transcript: Optional[List[dict]], dialogues: Optional[List[dict]] = None,
+          call1: Optional[dict] = None) -> None:
+    """按当前存储格式写入已有的 AnalysisResult 行"""
+    for column, value in storage_columns(transcript, dialogues, call1).items():
+        setattr(ar, column, value)
+
+
+def _v1_transcript(ar) -> List[dict]:
+    raw = ar.transcript
+    if raw:
+        try:
+            transcript = json.loads(raw) if isinstance(raw, str) else raw
+            if transcript:
+                return transcript
+        except Exception as e:
+            logger.warning(f"[转写存储] 解析 transcript 失败，回退 call1_result: {e}")
+    call1 = ar.call1_result
+    if isinstance(call1, dict):
+        return call1.get("transcript") or []
+    return []
+
+
+def load_views(ar) -> Tuple[List[dict], List[dict]]:
+    """一次取出 (transcript, dialogues)；v2 只解码一次 blob"""
+    if getattr(ar, "storage_version", STORAGE_V1) == STORAGE_V2 and ar.transcript_blob:
+        transcript, tones = decode(ar.transcript_blob)
+        return transcript, to_dialogues(transcript, tones)
+    return _v1_transcript(ar), ar.dialogues if isinstance(ar.dialogues, list) else []
+
+
+def row_transcript(ar) -> List[dict]:
+    if getattr(ar, "storage_version", STORAGE_V1) == STORAGE_V2 and ar.transcript_blob:
+        return decode(ar.transcript_blob)[0]
+    return _v1_transcript(ar)
+
+
+def row_dialogues(ar) -> List[dict]:
+    return load_views(ar)[1]
+
+
+def row_call1(ar) -> Optional[dict]:
+    """旧形态的 call1_result（含 transcript）；无 Call1 结果时返回 None"""
+    call1 = ar.call1_result
+    if not isinstance(call1, dict):
+        return None
+    if getattr(ar, "storage_version", STORAGE_V1) == STORAGE_V2:
+        return {**call1, "transcript": row_transcript(ar)}
+    return call1
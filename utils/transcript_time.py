@@ -0,0 +1,72 @@
+"""
+转写时间戳工具：解析 / 格式化 / 平移 "MM:SS" 时间戳。
+分片转写时每片的时间戳相对片段起点，由服务端按已知的 (start_sec, end_sec) 平移为全局时间，
+不再依赖模型自行换算。输出统一为 "MM:SS"（分钟可超过 59），与下游按两段解析的逻辑保持一致。
+"""
+from typing import Any, Dict, List, Optional, Tuple
+
+
+def parse_timestamp(ts: Any) -> Optional[float]:
+    """解析 "MM:SS" / "HH:MM:SS" / "SS(.ms)" 为秒数；无法解析返回 None"""
+    if ts is None:
+        return None
+    if isinstance(ts, (int, float)):
+        return float(ts)
+    parts = str(ts).strip().split(":")
+    try:
+        if len(parts) == 1:
+            return float(parts[0])
+        if len(parts) == 2:
+            return int(parts[0]) * 60 + float(parts[1])
+        if len(parts) == 3:
+            return int(parts[0]) * 3600 + int(parts[1]) * 60 + float(parts[2])
+    except ValueError:
+        pass
+    return None
+
+
+def format_timestamp(seconds: float) -> str:
+    """秒数 → "MM:SS"（分钟不折算为小时）"""
+    total = max(0, int(round(seconds)))
+    return f"{total // 60:02d}:{total % 60:02d}"
+
+
+def shift_timestamp(ts: Any, offset_sec: float) -> Any:
+    """将片段内时间戳平移 offset_sec 秒；无法解析时原样返回"""
+    sec = parse_timestamp(ts)
+    if sec is None:
+        return ts
+    return format_timestamp(sec + offset_sec)
+
+
+def shift_transcript(items: List[Dict[str, Any]], offset_sec: float) -> List[Dict[str, Any]]:
+    """返回时间戳整体平移后的转写副本（不修改入参）"""
+    shifted = []
+    for item in items:
+        item = dict(item)
+        if item.get("timestamp") is not None:
+            item["timestamp"] = shift_timestamp(item["timestamp"], offset_sec)
+        shifted.append(item)
+    return shifted
+
+
+def merge_chunk_transcripts(chunks: List[Tuple[float, float, List[Dict[str, Any]]]]) -> List[Dict[str, Any]]:
+    """
+    合并各分片（已平移为全局时间）的转写。
+    相邻分片有重叠时以重叠区中点为分界：每片只保留起始时间落在 [左分界, 右分界) 内的句子，
+    跨分界的句子由开始于其所在一侧的分片完整保留，重叠区内的重复句子被去掉。
+    chunks: [(start_sec, end_sec, items), ...]，按时间顺序
+    """
+    merged: List[Dict[str, Any]] = []
+    for i, (start_sec, end_sec, items) in enumerate(chunks):
+        lo = hi = None
+        if i > 0 and chunks[i - 1][1] > start_sec:
+            lo = (chunks[i - 1][1] + start_sec) / 2
+        if i + 1 < len(chunks) and end_sec > chunks[i + 1][0]:
+            hi = (end_sec + chunks[i + 1][0]) / 2
+        for item in items:
+            sec = parse_timestamp(item.get("timestamp"))
+            if sec is not None and ((lo is not None and sec < lo) or (hi is not None and sec >= hi)):
+                continue
+            merged.append(item)
+    return merged
@@ -0,0 +1,217 @@
+"""
+能量 + 过零率 VAD：转写前剔除长静音 / 背景噪声段。
+- ffmpeg 解码为 16kHz 单声道 PCM，边读边落盘并按块向量化计算帧能量与过零率（NumPy）
+- 自适应噪声门限 + hangover 平滑得到语音段，短于 VAD_MIN_SILENCE_SEC 的静音保留
+- 只把语音段重新编码为紧凑音频送 Gemini，同时返回偏移映射，
+  转写时间戳由 OffsetMap.to_original 换算回原音频时间（剪切 / 回放 / 声纹仍按原音频）
+"""
+import bisect
+import logging
+import os
+import subprocess
+import tempfile
+import threading
+import time
+from typing import List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+VAD_ENABLED = os.getenv("VAD_ENABLED", "false").lower() == "true"
+VAD_SAMPLE_RATE = 16000
+VAD_FRAME_MS = int(os.getenv("VAD_FRAME_MS", "30"))
+# 噪声底（能量第 10 百分位）之上多少 dB 视为语音
+VAD_THRESHOLD_DB = float(os.getenv("VAD_THRESHOLD_DB", "12"))
+# 语音段前后各延长（hangover）多少秒，避免吞掉字头字尾
+VAD_HANGOVER_SEC = float(os.getenv("VAD_HANGOVER_SEC", "0.5"))
+# 只剔除长于此值的静音段
+VAD_MIN_SILENCE_SEC = float(os.getenv("VAD_MIN_SILENCE_SEC", "2.0"))
+# 可剔除总时长低于此值（秒）时不生成紧凑音频
+VAD_MIN_REMOVED_SEC = float(os.getenv("VAD_MIN_REMOVED_SEC", "15"))
+VAD_TIMEOUT = int(os.getenv("VAD_TIMEOUT", "600"))
+
+_READ_FRAMES = 2000  # 每次读取 2000 帧（30ms 帧约 1 分钟音频）
+
+
+class OffsetMap:
+    """紧凑音频时间 ↔ 原音频时间；segments 为保留的原音频区间 [(start, end), ...]"""
+
+    def __init__(self, segments: List[Tuple[float, float]]):
+        self.segments = segments
+        self._compact_starts: List[float] = []
+        acc = 0.0
+        for start, end in segments:
+            self._compact_starts.append(acc)
+            acc += end - start
+        self.compact_duration = acc
+
+    def to_original(self, compact_sec: float) -> float:
+        if not self.segments:
+            return compact_sec
+        i = max(0, bisect.bisect_right(self._compact_starts, compact_sec) - 1)
+        start, end = self.segments[i]
+        return min(end, start + max(0.0, compact_sec - self._compact_starts[i]))
+
+    def remap_timestamp(self, ts):
+        """"MM:SS" 紧凑时间 → 原音频 "MM:SS"；无法解析原样返回"""
+        from utils.transcript_time import format_timestamp, parse_timestamp
+        sec = parse_timestamp(ts)
+        if sec is None:
+            return ts
+        return format_timestamp(self.to_original(sec))
+
+    def to_dict(self) -> dict:
+        return {"segments": [[round(s, 3), round(e, 3)] for s, e in self.segments]}
+
+
+def _frame_features(pcm, frame_len: int):
+    """int16 PCM → (帧能量 dB, 过零率)，整块向量化计算"""
+    import numpy as np
+    n = len(pcm) // frame_len
+    frames = pcm[: n * frame_len].astype(np.float32).reshape(n, frame_len)
+    energy_db = 10 * np.log10(np.mean(frames * frames, axis=1) + 1e-6)
+    signs = np.signbit(frames)
+    zcr = np.mean(signs[:, 1:] != signs[:, :-1], axis=1)
+    return energy_db, zcr
+
+
+def _speech_mask(energy_db, zcr, frame_sec: float):
+    import numpy as np
+    noise_floor = np.percentile(energy_db, 10)
+    loud = energy_db > noise_floor + VAD_THRESHOLD_DB
+    # 清辅音（擦音）能量低但过零率高：略高于噪声底且过零率在语音范围内也算语音
+    fricative = (energy_db > noise_floor + VAD_THRESHOLD_DB / 2) & (zcr > 0.25) & (zcr < 0.6)
+    mask = loud | fricative
+    hang = max(1, int(round(VAD_HANGOVER_SEC / frame_sec)))
+    # hangover：语音帧前后各扩展 hang 帧（卷积实现的膨胀）
+    return np.convolve(mask.astype(np.int32), np.ones(2 * hang + 1, dtype=np.int32), mode="same") > 0
+
+
+def _segments_from_mask(mask, frame_sec: float, duration: float) -> List[Tuple[float, float]]:
+    """语音掩码 → 保留区间；短静音并入前后语音段"""
+    import numpy as np
+    padded = np.concatenate(([False], mask, [False]))
+    edges = np.flatnonzero(padded[1:] != padded[:-1])
+    raw = [(s * frame_sec, min(duration, e * frame_sec)) for s, e in zip(edges[::2], edges[1::2])]
+    segments: List[Tuple[float, float]] = []
+    for start, end in raw:
+        if segments and start - segments[-1][1] < VAD_MIN_SILENCE_SEC:
+            segments[-1] = (segments[-1][0], end)
+        else:
+            segments.append((start, end))
+    return segments
+
+
+def _decode_to_raw(src_path: str, raw_path: str):
+    """ffmpeg 解码为 16kHz 单声道 s16le，流式写入 raw_path 并计算帧特征"""
+    import numpy as np
+    frame_len = VAD_SAMPLE_RATE * VAD_FRAME_MS // 1000
+    proc = subprocess.Popen(
+        ["ffmpeg", "-hide_banner", "-nostats", "-loglevel", "error", "-nostdin", "-i", src_path,
+         "-vn", "-ac", "1", "-ar", str(VAD_SAMPLE_RATE), "-f", "s16le", "pipe:1"],
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+    )
+    timer = threading.Timer(VAD_TIMEOUT, proc.kill)
+    timer.start()
+    energies, zcrs = [], []
+    carry = b""
+    try:
+        with open(raw_path, "wb") as raw:
+            while True:
+                data = proc.stdout.read(_READ_FRAMES * frame_len * 2)
+                if not data:
+                    break
+                raw.write(data)
+                data = carry + data
+                usable = len(data) // (frame_len * 2) * frame_len * 2
+                carry = data[usable:]
+                if usable:
+                    e, z = _frame_features(np.frombuffer(data[:usable], dtype="<i2"), frame_len)
+                    energies.append(e)
+                    zcrs.append(z)
+        stderr = proc.stderr.read()
+        proc.wait()
+    finally:
+        timer.cancel()
+    if proc.returncode != 0:
+        raise RuntimeError(f"ffmpeg 解码失败: {stderr.decode('utf-8', errors='replace')[-300:]}")
+    if not energies:
+        raise RuntimeError("解码结果为空")
+    return np.concatenate(energies), np.concatenate(zcrs)
+
+
+def _encode_segments(raw_path: str, segments: List[Tuple[float, float]], out_path: str) -> None:
+    """按保留区间从 raw PCM 读取并经 stdin 送 ffmpeg 编码为 AAC（ADTS）"""
+    proc = subprocess.Popen(
+        ["ffmpeg", "-hide_banner", "-nostats", "-loglevel", "error", "-y",
+         "-f", "s16le", "-ar", str(VAD_SAMPLE_RATE), "-ac", "1", "-i", "pipe:0",
+         "-c:a", "aac", "-b:a", "32k", "-f", "adts", out_path],
+        stdin=subprocess.PIPE, stderr=subprocess.PIPE,
+    )
+    timer = threading.Timer(VAD_TIMEOUT, proc.kill)
+    timer.start()
+    try:
+        with open(raw_path, "rb") as raw:
+            for start, end in segments:
+                offset = int(start * VAD_SAMPLE_RATE) * 2
+                remaining = int(end * VAD_SAMPLE_RATE) * 2 - offset
+                raw.seek(offset)
+                while remaining > 0:
+                    data = raw.read(min(1024 * 1024, remaining))
+                    if not data:
+                        break
+                    proc.stdin.write(data)
+                    remaining -= len(data)
+        proc.stdin.close()
+        stderr = proc.stderr.read()
+        proc.wait()
+    finally:
+        timer.cancel()
+    if proc.returncode != 0:
+        raise RuntimeError(f"ffmpeg 编码失败: {stderr.decode('utf-8', errors='replace')[-300:]}")
+
+
+def compact_silence(src_path: str, session_id: str = "?") -> Optional[Tuple[str, OffsetMap, dict]]:
+    """
+    生成剔除长静音后的紧凑音频。
+    Returns:
+        (compact_path, offset_map, stats)；可剔除时长不足 VAD_MIN_REMOVED_SEC 时返回 None。
+        compact_path 为临时文件，调用方用完后删除。
+    """
+    t0 = time.time()
+    raw = tempfile.NamedTemporaryFile(delete=False, suffix=".pcm", prefix=f"vad_{session_id[:8]}_")
+    raw.close()
+    try:
+        energy_db, zcr = _decode_to_raw(src_path, raw.name)
+        frame_sec = VAD_FRAME_MS / 1000
+        duration = os.path.getsize(raw.name) / 2 / VAD_SAMPLE_RATE
+        segments = _segments_from_mask(_speech_mask(energy_db, zcr, frame_sec), frame_sec, duration)
+        kept = sum(e - s for s, e in segments)
+        removed = duration - kept
+        stats = {
+            "duration_sec": round(duration, 2),
+            "kept_sec": round(kept, 2),
+            "removed_sec": round(removed, 2),
+            "segments": len(segments),
+            "analyze_sec": round(time.time() - t0, 2),
+        }
+        if not segments or removed < VAD_MIN_REMOVED_SEC:
+            logger.info(f"[VAD-{session_id}] 可剔除 {removed:.1f}s 不足 {VAD_MIN_REMOVED_SEC}s，跳过 {stats}")
+            return None
+        out = tempfile.NamedTemporaryFile(delete=False, suffix=".aac", prefix=f"vad_{session_id[:8]}_")
+        out.close()
+        try:
+            _encode_segments(raw.name, segments, out.name)
+        except Exception:
+            os.unlink(out.name)
+            raise
+        stats["total_sec"] = round(time.time() - t0, 2)
+        logger.info(
+            f"[VAD-{session_id}] 剔除静音 {removed:.1f}s / {duration:.1f}s（{removed * 100 / duration:.0f}%），"
+            f"保留 {len(segments)} 段，耗时 {stats['total_sec']}s"
+        )
+        return out.name, OffsetMap(segments), stats
+    finally:
+        try:
+            os.unlink(raw.name)
+        except OSError:
+            pass